@@ -2,24 +2,33 @@ from typing import Any, Text, Dict, List
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
-import datetime
-import json
-import os
+from patient_data_manager import PatientDataManager
+from patient_index import AmbiguousPatientError
+from appointment_scheduler import SchedulingError
+from reminders import CHECKIN_REMINDER_TEXT
 
 # File to store patient data
 PATIENT_DATA_FILE = "patient_data.json"
 
-def load_patient_data():
-    """Load patient data from file"""
-    if os.path.exists(PATIENT_DATA_FILE):
-        with open(PATIENT_DATA_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+def load_patient_manager():
+    """Load the shared patient data used by the other front ends"""
+    return PatientDataManager(PATIENT_DATA_FILE)
 
-def save_patient_data(data):
-    """Save patient data to file"""
-    with open(PATIENT_DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def resolve_patient(manager, dispatcher, patient_name):
+    """Get the patient ID for the name in the conversation, or None if it is ambiguous"""
+    try:
+        return manager.resolve_patient(patient_name)
+    except AmbiguousPatientError:
+        dispatcher.utter_message(
+            text=f"Ada beberapa pasien bernama {patient_name}. "
+                 "Mohon hubungi klinik agar data Anda dapat dicocokkan."
+        )
+        raise
+
+def request_key(tracker, action):
+    """Idempotency key of an action run for the latest user message, so a redelivered run changes nothing again"""
+    message_id = tracker.latest_message.get("message_id")
+    return f"{tracker.sender_id}:{message_id}:{action}" if message_id else None
 
 class ActionGenerateTreatmentPlan(Action):
     """Action to generate initial treatment plan based on symptoms"""
@@ -34,22 +43,25 @@ class ActionGenerateTreatmentPlan(Action):
         # Get patient information
         patient_name = tracker.get_slot("patient_name")
         symptoms = tracker.get_slot("symptoms") or []
-        body_part = tracker.get_slot("body_part")
-        severity = tracker.get_slot("severity")
+        body_part = tracker.get_slot("body_part") or ""
+        severity = tracker.get_slot("severity") or "sedang"
         
         # Create treatment plan based on symptoms
         treatment_plan = self._create_treatment_plan(symptoms, body_part, severity)
         
         # Save patient data
-        patient_data = load_patient_data()
-        patient_data[patient_name] = {
-            "symptoms": symptoms,
-            "body_part": body_part,
-            "severity": severity,
-            "treatment_plan": treatment_plan,
-            "last_updated": datetime.datetime.now().isoformat()
-        }
-        save_patient_data(patient_data)
+        manager = load_patient_manager()
+        try:
+            patient_id = resolve_patient(manager, dispatcher, patient_name)
+        except AmbiguousPatientError:
+            return []
+        
+        def save():
+            saved_id = patient_id or manager.register_patient(patient_name)
+            manager.add_symptom_report(saved_id, symptoms, body_part, severity)
+            manager.add_treatment_plan(saved_id, treatment_plan, symptoms, body_part, severity)
+        manager.run_idempotent(request_key(tracker, self.name()), self.name(),
+                               [patient_name, symptoms, body_part, severity], save)
         
         # Set the treatment plan slot
         return [SlotSet("treatment_plan", treatment_plan)]
@@ -101,49 +113,48 @@ class ActionReviseTreatmentPlan(Action):
         # Get patient information
         patient_name = tracker.get_slot("patient_name")
         symptoms = tracker.get_slot("symptoms") or []
-        body_part = tracker.get_slot("body_part")
-        severity = tracker.get_slot("severity")
+        body_part = tracker.get_slot("body_part") or ""
+        severity = tracker.get_slot("severity") or "sedang"
         
         # Load existing patient data
-        patient_data = load_patient_data()
-        
-        if patient_name in patient_data:
-            # Update patient data with latest symptoms
-            patient_data[patient_name].update({
-                "symptoms": symptoms,
-                "body_part": body_part,
-                "severity": severity,
-                "last_updated": datetime.datetime.now().isoformat()
-            })
-            
+        manager = load_patient_manager()
+        try:
+            patient_id = resolve_patient(manager, dispatcher, patient_name)
+        except AmbiguousPatientError:
+            return []
+        
+        # The plan is worked out from the saved one, so a redelivered run gets the plan of the first
+        return [SlotSet("treatment_plan", manager.run_idempotent(
+            request_key(tracker, self.name()), self.name(), [patient_name, symptoms, body_part, severity],
+            lambda: self._update_plan(manager, patient_id, patient_name, symptoms, body_part, severity)))]
+
+    def _update_plan(self, manager, patient_id, patient_name, symptoms, body_part, severity):
+        """Revise and save the patient's plan, or start one, and get it"""
+        current_plan = manager.get_latest_treatment_plan(patient_id) if patient_id else None
+        
+        if current_plan:
             # Revise treatment plan
-            current_plan = patient_data[patient_name]["treatment_plan"]
             revised_plan = self._revise_treatment_plan(
                 current_plan, 
                 symptoms, 
                 body_part, 
                 severity,
-                patient_data[patient_name]
+                manager.get_patient_data(patient_id)
             )
             
             # Update treatment plan
-            patient_data[patient_name]["treatment_plan"] = revised_plan
-            save_patient_data(patient_data)
-            
-            # Set the treatment plan slot
-            return [SlotSet("treatment_plan", revised_plan)]
+            plans = manager.get_patient_data(patient_id)["treatment_plans"]
+            manager.add_treatment_plan(patient_id, revised_plan, symptoms, body_part, severity,
+                                       revision_of=len(plans) - 1)
+            return revised_plan
         else:
             # Create new treatment plan if patient not found
             treatment_plan = self._create_initial_plan(symptoms, body_part, severity)
-            patient_data[patient_name] = {
-                "symptoms": symptoms,
-                "body_part": body_part,
-                "severity": severity,
-                "treatment_plan": treatment_plan,
-                "last_updated": datetime.datetime.now().isoformat()
-            }
-            save_patient_data(patient_data)
-            return [SlotSet("treatment_plan", treatment_plan)]
+            if patient_id is None:
+                patient_id = manager.register_patient(patient_name)
+            manager.add_symptom_report(patient_id, symptoms, body_part, severity)
+            manager.add_treatment_plan(patient_id, treatment_plan, symptoms, body_part, severity)
+            return treatment_plan
 
     def _create_initial_plan(self, symptoms, body_part, severity):
         """Create initial treatment plan"""
@@ -219,9 +230,23 @@ class ActionScheduleAppointment(Action):
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
-        # In a real implementation, this would connect to a scheduling system
+        patient_name = tracker.get_slot("patient_name")
+        manager = load_patient_manager()
+        try:
+            patient_id = resolve_patient(manager, dispatcher, patient_name)
+        except AmbiguousPatientError:
+            return []
+        
+        # Book the earliest free slot with the clinic scheduler
+        try:
+            result = manager.schedule_appointment(patient_id or patient_name,
+                                                  idempotency_key=request_key(tracker, self.name()))
+        except SchedulingError as e:
+            dispatcher.utter_message(text=f"Maaf, jadwal tidak dapat dibuat: {e}")
+            return []
+        
         dispatcher.utter_message(
-            text="Kunjungan Anda telah dijadwalkan untuk besok pukul 10:00 pagi. "
+            text=f"{result} "
                  "Silakan datang 15 menit sebelum waktu yang dijadwalkan. "
                  "Bawa kartu identitas dan riwayat pengobatan Anda."
         )
@@ -229,7 +254,7 @@ class ActionScheduleAppointment(Action):
         return []
 
 class ActionSendDailyCheckin(Action):
-    """Action to send daily checkin reminder (placeholder)"""
+    """Action to send the daily checkin reminder in an open conversation"""
 
     def name(self) -> Text:
         return "action_send_daily_checkin"
@@ -238,10 +263,8 @@ class ActionSendDailyCheckin(Action):
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
-        # In a real implementation, this would send a message via SMS, email, or app notification
-        dispatcher.utter_message(
-            text="Halo! Ini reminder untuk update kondisi kesehatan Anda hari ini. "
-                 "Bagaimana perasaan Anda? Apakah ada perubahan gejala?"
-        )
+        # Patients without an open conversation get it via SMS, email or push from
+        # the reminder pipeline: python admin_cli.py send-reminders
+        dispatcher.utter_message(text=CHECKIN_REMINDER_TEXT)
         
         return []
\ No newline at end of file
@@ -0,0 +1,280 @@
+"""
+Staff Command Line Interface for CareLoopAI Clinic
+Clinic-wide reports for staff, as opposed to the patient-facing cli_chatbot.py.
+
+Usage:
+  python admin_cli.py cohort --symptom demam --days 7 --by severity trend --unique-patients
+  python admin_cli.py appointments --tomorrow
+  python admin_cli.py appointments --week 2026-10-19 --status scheduled cancelled
+  python admin_cli.py compact --horizon-days 90 --codec lzma
+  python admin_cli.py migrate
+  python admin_cli.py prune-trackers --db trackers.db --retention-days 7 --archive-dir tracker_archive
+  python admin_cli.py send-reminders --outbox reminder_outbox --smtp localhost:1025
+  python admin_cli.py search 'rencana:paracetamol gejala:diare@3d'
+  python admin_cli.py triage --top 20
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from patient_data_manager import PatientDataManager
+
+
+def _print_timing(label, started):
+    print(f"[{label}: {(time.perf_counter() - started) * 1000:.1f} ms]")
+
+
+def cohort_report(args):
+    """Print a cohort breakdown of reported symptoms"""
+    from cohort_analytics import CohortAnalytics
+
+    started = time.perf_counter()
+    manager = PatientDataManager(args.data_file)
+    _print_timing("load", started)
+
+    analytics = CohortAnalytics(manager)
+    started = time.perf_counter()
+    analytics.frame
+    _print_timing("frame build", started)
+
+    since = None
+    if args.days:
+        since = datetime.datetime.now() - datetime.timedelta(days=args.days)
+
+    started = time.perf_counter()
+    counts = analytics.group_counts(
+        args.by, freq=args.freq, unique_patients=args.unique_patients,
+        symptom=args.symptom, body_part=args.body_part, severity=args.severity, since=since
+    )
+    _print_timing("query", started)
+
+    if counts.empty:
+        print("Tidak ada data yang cocok.")
+    else:
+        print(counts.to_string())
+
+
+def appointments_report(args):
+    """Print the appointments of a day or week across all patients"""
+    from appointment_index import day_range, week_range
+
+    started = time.perf_counter()
+    manager = PatientDataManager(args.data_file)
+    _print_timing("load", started)
+
+    if args.week:
+        start, end = week_range(args.week)
+    elif args.day:
+        start, end = day_range(args.day)
+    else:
+        start, end = day_range(datetime.date.today() + datetime.timedelta(days=1 if args.tomorrow else 0))
+    status = None if "all" in args.status else args.status
+
+    started = time.perf_counter()
+    total = manager.count_appointments(start, end, status)
+    appointments, next_cursor = manager.get_appointments(start, end, status, args.cursor, args.limit)
+    _print_timing("query", started)
+
+    print(f"Janji temu {start:%Y-%m-%d} s/d {end - datetime.timedelta(days=1):%Y-%m-%d}: {total}")
+    if not appointments:
+        print("Tidak ada janji temu.")
+    for appointment in appointments:
+        print(f"{appointment['date_time']}  {appointment.get('doctor') or '-':<12} "
+              f"{appointment.get('room') or '-':<8} {appointment['status']:<10} "
+              f"{appointment['patient_name']} ({appointment['patient_id']})")
+    if next_cursor:
+        print(f"Halaman berikutnya: --cursor '{next_cursor}'")
+
+
+def compact(args):
+    """Move old and resolved history into the compressed archive, reporting progress"""
+    manager = PatientDataManager(args.data_file)
+    job = manager.compact_history(args.horizon_days, args.codec, background=True)
+    while not job.wait(timeout=0.5):
+        progress = job.progress()
+        print(f"  {progress['scanned']}/{progress['total']} pasien ({progress['percent']:.0f}%), "
+              f"{progress['entries_moved']} entri dipindahkan")
+
+    progress = job.progress()
+    if progress["state"] == "failed":
+        raise ValueError(f"Kompaksi gagal: {progress['error']}")
+    print(f"{progress['patients_compacted']} pasien, {progress['entries_moved']} entri diarsipkan "
+          f"({progress['bytes_written']:,} byte terkompresi) dalam {progress['elapsed_seconds']:.2f} s")
+    print(f"File data: {progress['hot_bytes_before']:,} -> {progress['hot_bytes_after']:,} byte")
+
+
+def migrate(args):
+    """Rewrite the data file in the current format, keyed by patient ID"""
+    from patient_data_manager import migrate_data_file
+
+    started = time.perf_counter()
+    count = migrate_data_file(args.data_file)
+    _print_timing("migrate", started)
+    print(f"{count} pasien disimpan dalam format terbaru di {args.data_file}")
+
+
+def prune_trackers(args):
+    """Move old Rasa conversation events out of the SQLite tracker store"""
+    from tracker_store import TrackerEventLog
+
+    started = time.perf_counter()
+    log = TrackerEventLog(args.db)
+    try:
+        stats = log.prune(args.retention_days, args.archive_dir)
+    finally:
+        log.close()
+    _print_timing("prune-trackers", started)
+    print(f"{stats['events']} event dari {stats['conversations']} percakapan dipangkas"
+          + (f" ke {args.archive_dir}" if args.archive_dir else ""))
+
+
+def send_reminders(args):
+    """Send today's check-in reminder to patients who have not checked in yet"""
+    from reminders import DeliveryPipeline, FileSink, SmtpChannel, daily_reminders
+
+    started = time.perf_counter()
+    manager = PatientDataManager(args.data_file)
+    reminders = daily_reminders(manager)
+    _print_timing("load", started)
+
+    if args.smtp:
+        host, _, port = args.smtp.partition(":")
+        email = SmtpChannel(host, int(port or 25))
+    else:
+        email = FileSink(args.outbox, "email", batch_size=50, rate_per_second=20)
+    channels = [FileSink(args.outbox, "sms", batch_size=100, rate_per_second=10),
+                FileSink(args.outbox, "push", batch_size=500, rate_per_second=500), email]
+    pipeline = DeliveryPipeline(channels, args.state_file, max_attempts=args.max_attempts,
+                                base_backoff=args.base_backoff)
+    started = time.perf_counter()
+    queued = pipeline.enqueue(reminders)
+    counts = pipeline.run()
+    _print_timing("send-reminders", started)
+    print(f"{queued} reminder dikirim hari ini: {counts['sent']} terkirim, "
+          f"{counts['dead']} gagal (lihat {pipeline.dead_letter_file})")
+
+
+def search(args):
+    """Print the patients whose plans, symptom reports or check-ins match a query"""
+    started = time.perf_counter()
+    manager = PatientDataManager(args.data_file)
+    _print_timing("load", started)
+
+    since = None
+    if args.days:
+        since = datetime.datetime.now() - datetime.timedelta(days=args.days)
+    started = time.perf_counter()
+    patient_ids = manager.search(args.query, since=since)
+    _print_timing("search", started)
+
+    if not patient_ids:
+        print("Tidak ada pasien yang cocok.")
+        return
+    for patient_id in patient_ids[:args.limit]:
+        print(f"{patient_id}  {manager.patients[patient_id]['personal_info']['name']}")
+    if len(patient_ids) > args.limit:
+        print(f"... dan {len(patient_ids) - args.limit} pasien lainnya")
+
+
+def triage(args):
+    """Print the patients who most urgently need a clinician's attention"""
+    started = time.perf_counter()
+    manager = PatientDataManager(args.data_file)
+    _print_timing("load", started)
+
+    started = time.perf_counter()
+    entries = manager.get_triage(args.top)
+    _print_timing("triage", started)
+
+    if not entries:
+        print("Tidak ada pasien dengan episode aktif.")
+        return
+    print(f"{'#':>3}  {'skor':>5}  {'pasien':<24}  alasan")
+    for rank, entry in enumerate(entries, 1):
+        print(f"{rank:>3}  {entry['score']:>5.0f}  {entry['name'][:24]:<24}  {'; '.join(entry['reasons'])}")
+    print(f"\n{len(manager.triage)} pasien dengan episode aktif")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Laporan klinik CareLoopAI untuk staf")
+    parser.add_argument("--data-file", default="patient_data.json", help="File data pasien")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cohort = subparsers.add_parser("cohort", help="Ringkasan gejala seluruh pasien")
+    cohort.add_argument("--symptom", help="Filter gejala, contoh: demam")
+    cohort.add_argument("--body-part", help="Filter bagian tubuh")
+    cohort.add_argument("--severity", choices=["ringan", "sedang", "berat"])
+    cohort.add_argument("--days", type=int, help="Hanya N hari terakhir")
+    cohort.add_argument("--by", nargs="*", default=["symptom"],
+                        help="Kunci pengelompokan: symptom body_part severity trend "
+                             "section date_bucket recovery_time")
+    cohort.add_argument("--freq", default="W", help="Ukuran date_bucket (D, W, M)")
+    cohort.add_argument("--unique-patients", action="store_true",
+                        help="Hitung pasien unik, bukan jumlah laporan")
+    cohort.set_defaults(handler=cohort_report)
+
+    appointments = subparsers.add_parser("appointments", help="Daftar janji temu per hari atau minggu")
+    when = appointments.add_mutually_exclusive_group()
+    when.add_argument("--day", help="Tanggal (YYYY-MM-DD), default hari ini")
+    when.add_argument("--tomorrow", action="store_true", help="Janji temu besok")
+    when.add_argument("--week", help="Minggu (Senin-Minggu) yang memuat tanggal ini")
+    appointments.add_argument("--status", nargs="*", default=["scheduled"],
+                              help="Status: scheduled cancelled, atau all")
+    appointments.add_argument("--limit", type=int, default=50, help="Jumlah per halaman")
+    appointments.add_argument("--cursor", help="Lanjutkan dari halaman sebelumnya")
+    appointments.set_defaults(handler=appointments_report)
+
+    compact_parser = subparsers.add_parser("compact", help="Arsipkan riwayat lama ke file terkompresi")
+    compact_parser.add_argument("--horizon-days", type=int, default=90,
+                                help="Arsipkan entri yang lebih lama dari N hari")
+    compact_parser.add_argument("--codec", choices=["gzip", "lzma"], default="gzip")
+    compact_parser.set_defaults(handler=compact)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Ubah file data lama ke format ID pasien")
+    migrate_parser.set_defaults(handler=migrate)
+
+    prune_parser = subparsers.add_parser("prune-trackers", help="Pangkas event lama percakapan Rasa")
+    prune_parser.add_argument("--db", default="trackers.db", help="File SQLite tracker store")
+    prune_parser.add_argument("--retention-days", type=float, default=7,
+                              help="Simpan event N hari terakhir selain ekor percakapan")
+    prune_parser.add_argument("--archive-dir", help="Arsipkan event yang dipangkas ke folder ini")
+    prune_parser.set_defaults(handler=prune_trackers)
+
+    reminders_parser = subparsers.add_parser("send-reminders", help="Kirim reminder checkin harian")
+    reminders_parser.add_argument("--outbox", default="reminder_outbox",
+                                  help="Folder tujuan SMS dan push (dan email tanpa --smtp)")
+    reminders_parser.add_argument("--smtp", help="Server SMTP untuk email, contoh: localhost:1025")
+    reminders_parser.add_argument("--state-file", default="reminder_state.json",
+                                  help="File status pengiriman per pasien")
+    reminders_parser.add_argument("--max-attempts", type=int, default=5)
+    reminders_parser.add_argument("--base-backoff", type=float, default=30,
+                                  help="Jeda (detik) sebelum percobaan ulang pertama")
+    reminders_parser.set_defaults(handler=send_reminders)
+
+    search_parser = subparsers.add_parser("search", help="Cari pasien dari rencana, gejala, dan checkin")
+    search_parser.add_argument("query", help="Contoh: 'rencana:paracetamol gejala:diare@3d', "
+                                             "'\"sakit kepala\" ATAU demam', 'gejala:berat -checkin:membaik'")
+    search_parser.add_argument("--days", type=int, help="Hanya entri N hari terakhir")
+    search_parser.add_argument("--limit", type=int, default=50, help="Jumlah pasien yang ditampilkan")
+    search_parser.set_defaults(handler=search)
+
+    triage_parser = subparsers.add_parser("triage", help="Pasien yang paling perlu diperhatikan")
+    triage_parser.add_argument("--top", type=int, default=20, help="Jumlah pasien yang ditampilkan")
+    triage_parser.set_defaults(handler=triage)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.handler(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
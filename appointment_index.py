@@ -0,0 +1,172 @@
+"""
+Clinic-wide Appointment Index
+This module keeps every appointment of every patient in date order, with one
+sorted list per status, so day and week views ("who is coming tomorrow") are
+answered with a binary search plus the matching entries instead of a scan of
+all patient records.
+"""
+
+import bisect
+import datetime
+import heapq
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from appointment_scheduler import SchedulingError, format_date_time, parse_date_time
+
+TimeBound = Union[datetime.date, datetime.datetime, str, None]
+
+
+def day_range(day: Union[datetime.date, str]) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Get the start and (exclusive) end of a day"""
+    if isinstance(day, str):
+        day = datetime.date.fromisoformat(day)
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    start = datetime.datetime.combine(day, datetime.time(0))
+    return start, start + datetime.timedelta(days=1)
+
+
+def week_range(day: Union[datetime.date, str]) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Get the start (Monday) and exclusive end of the week containing a day"""
+    start, _ = day_range(day)
+    start -= datetime.timedelta(days=start.weekday())
+    return start, start + datetime.timedelta(days=7)
+
+
+def _bound(value: TimeBound) -> Optional[str]:
+    """Turn a range bound into the sortable form appointment times are stored in"""
+    if value is None:
+        return None
+    if isinstance(value, str) and len(value) == 16 and value[4] == "-" and value[10] == " ":
+        # Already stored as 'YYYY-MM-DD HH:MM'; skip strptime on index builds
+        return value
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time(0))
+    return format_date_time(parse_date_time(value))
+
+
+def _range_iter(keys: List, low: int, high: int) -> Iterator:
+    # Index the list directly; islice would walk the skipped prefix
+    for position in range(low, high):
+        yield keys[position]
+
+
+class AppointmentIndex:
+    def __init__(self):
+        # Sorted (date_time, appointment_id) keys, one list per status
+        self._by_status: Dict[str, List[Tuple[str, str]]] = {}
+        # appointment_id -> (key, status, patient_id, appointment record)
+        self._entries: Dict[str, Tuple[Tuple[str, str], str, str, Dict]] = {}
+
+    @classmethod
+    def from_patients(cls, patients: Dict) -> "AppointmentIndex":
+        """Build the index from the appointments of every patient"""
+        index = cls()
+        for patient_id, record in patients.items():
+            for position, appointment in enumerate(record.get("appointments", [])):
+                index._insert(patient_id, appointment, position, sort=False)
+        for keys in index._by_status.values():
+            keys.sort()
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, appointment_id: str) -> bool:
+        return appointment_id in self._entries
+
+    def _insert(self, patient_id: str, appointment: Dict, position: int, sort: bool = True) -> None:
+        # Appointments from before the scheduler have no ID; key them by position
+        appointment_id = appointment.get("appointment_id") or f"{patient_id}#{position}"
+        try:
+            date_time = _bound(appointment["date_time"])
+        except (KeyError, SchedulingError):
+            return
+
+        key = (date_time, appointment_id)
+        status = appointment.get("status", "scheduled")
+        keys = self._by_status.setdefault(status, [])
+        if sort:
+            bisect.insort(keys, key)
+        else:
+            keys.append(key)
+        self._entries[appointment_id] = (key, status, patient_id, appointment)
+
+    def add(self, patient_id: str, appointment: Dict, position: int = 0) -> None:
+        """Index an appointment; call again after its time or status changed"""
+        appointment_id = appointment.get("appointment_id")
+        if appointment_id in self._entries:
+            self.remove(appointment_id)
+        self._insert(patient_id, appointment, position)
+
+    def remove(self, appointment_id: str) -> None:
+        """Drop an appointment from the index"""
+        entry = self._entries.pop(appointment_id, None)
+        if entry is None:
+            return
+        key, status, _, _ = entry
+        keys = self._by_status[status]
+        del keys[bisect.bisect_left(keys, key)]
+
+    def _status_lists(self, status: Union[str, Iterable[str], None]) -> List[List[Tuple[str, str]]]:
+        if status is None:
+            return list(self._by_status.values())
+        if isinstance(status, str):
+            status = [status]
+        return [self._by_status[name] for name in status if self._by_status.get(name)]
+
+    def _slices(self, start: Optional[str], end: Optional[str],
+                status: Union[str, Iterable[str], None], after: Optional[Tuple[str, str]]) -> List[Iterator]:
+        """Get an iterator over the matching keys of each selected status list"""
+        slices = []
+        for keys in self._status_lists(status):
+            low = 0 if start is None else bisect.bisect_left(keys, (start,))
+            if after is not None:
+                low = max(low, bisect.bisect_right(keys, after))
+            high = len(keys) if end is None else bisect.bisect_left(keys, (end,))
+            slices.append(_range_iter(keys, low, high))
+        return slices
+
+    def _entry(self, key: Tuple[str, str]) -> Dict:
+        _, _, patient_id, appointment = self._entries[key[1]]
+        return dict(appointment, patient_id=patient_id, appointment_id=key[1])
+
+    def iter(self, start: TimeBound = None, end: TimeBound = None,
+             status: Union[str, Iterable[str], None] = None) -> Iterator[Dict]:
+        """Iterate over appointments in [start, end) in date order"""
+        for key in heapq.merge(*self._slices(_bound(start), _bound(end), status, None)):
+            yield self._entry(key)
+
+    def count(self, start: TimeBound = None, end: TimeBound = None,
+              status: Union[str, Iterable[str], None] = None) -> int:
+        """Count appointments in [start, end) without visiting them"""
+        start, end = _bound(start), _bound(end)
+        total = 0
+        for keys in self._status_lists(status):
+            low = 0 if start is None else bisect.bisect_left(keys, (start,))
+            high = len(keys) if end is None else bisect.bisect_left(keys, (end,))
+            total += max(0, high - low)
+        return total
+
+    def page(self, start: TimeBound = None, end: TimeBound = None,
+             status: Union[str, Iterable[str], None] = None, cursor: Optional[str] = None,
+             limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        """Get up to limit appointments after a cursor, plus the cursor of the next page.
+
+        The cursor is the date and ID of the last appointment returned, so a
+        page costs a binary search no matter how deep into the range it is,
+        and bookings made meanwhile do not shift later pages.
+        """
+        after = None
+        if cursor:
+            date_time, _, appointment_id = cursor.partition("|")
+            after = (date_time, appointment_id)
+
+        # Take one extra key to learn whether another page follows
+        merged = heapq.merge(*self._slices(_bound(start), _bound(end), status, after))
+        keys = [key for _, key in zip(range(limit + 1), merged)]
+        next_cursor = None
+        if len(keys) > limit:
+            keys = keys[:limit]
+            next_cursor = "|".join(keys[-1])
+        return [self._entry(key) for key in keys], next_cursor
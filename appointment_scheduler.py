@@ -0,0 +1,336 @@
+"""
+Appointment Scheduling Engine
+This module books clinic visits against opening hours, doctors, rooms and
+per-slot capacity. Each day keeps a sorted index of slots that still have
+room, so conflict checks are O(1) per slot and the earliest free slot is
+found with a binary search instead of scanning every booking.
+"""
+
+import bisect
+import datetime
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DATE_TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class SchedulingError(ValueError):
+    """Raised when an appointment cannot be booked at the requested time"""
+
+
+def parse_date_time(value) -> datetime.datetime:
+    """Parse an appointment time given as 'YYYY-MM-DD HH:MM', ISO string or datetime"""
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.strptime(value.strip(), DATE_TIME_FORMAT)
+    except ValueError:
+        try:
+            return datetime.datetime.fromisoformat(value.strip())
+        except ValueError:
+            raise SchedulingError(f"Format waktu tidak dikenali: {value}") from None
+
+
+def format_date_time(value: datetime.datetime) -> str:
+    """Format an appointment time the way appointments are stored"""
+    return value.strftime(DATE_TIME_FORMAT)
+
+
+class ClinicHours:
+    def __init__(self, open_time: datetime.time = datetime.time(8, 0),
+                 close_time: datetime.time = datetime.time(16, 0), slot_minutes: int = 30,
+                 working_days: Iterable[int] = (0, 1, 2, 3, 4, 5),
+                 breaks: Iterable[Tuple[datetime.time, datetime.time]] = ((datetime.time(12, 0), datetime.time(13, 0)),)):
+        self.slot_minutes = slot_minutes
+        self.working_days = frozenset(working_days)
+
+        # Start times of the bookable slots of a working day, as minutes after midnight
+        breaks = [(b.hour * 60 + b.minute, e.hour * 60 + e.minute) for b, e in breaks]
+        start = open_time.hour * 60 + open_time.minute
+        end = close_time.hour * 60 + close_time.minute
+        self.slot_starts: List[int] = [
+            minute for minute in range(start, end - slot_minutes + 1, slot_minutes)
+            if not any(b < minute + slot_minutes and minute < e for b, e in breaks)
+        ]
+        self._slot_of_minute = {minute: slot for slot, minute in enumerate(self.slot_starts)}
+
+    def is_open(self, day: datetime.date) -> bool:
+        return day.weekday() in self.working_days
+
+    def workday_number(self, day: datetime.date) -> int:
+        """Number working days consecutively; a closed day maps to the next working day"""
+        weekdays = sorted(self.working_days)
+        week, weekday = divmod(day.toordinal() - 1, 7)
+        return week * len(weekdays) + bisect.bisect_left(weekdays, weekday)
+
+    def workday_date(self, number: int) -> datetime.date:
+        """Get the date of a working day number"""
+        weekdays = sorted(self.working_days)
+        week, rank = divmod(number, len(weekdays))
+        return datetime.date.fromordinal(week * 7 + weekdays[rank] + 1)
+
+    def slot_index(self, when: datetime.datetime) -> Optional[int]:
+        """Get the slot starting exactly at a time, or None"""
+        return self._slot_of_minute.get(when.hour * 60 + when.minute) if when.second == 0 else None
+
+    def first_slot_at_or_after(self, when: datetime.datetime) -> int:
+        """Get the index of the first slot starting at or after a time of day"""
+        minute = when.hour * 60 + when.minute + (1 if when.second or when.microsecond else 0)
+        return bisect.bisect_left(self.slot_starts, minute)
+
+    def slot_time(self, day: datetime.date, slot: int) -> datetime.datetime:
+        minutes = self.slot_starts[slot]
+        return datetime.datetime.combine(day, datetime.time(minutes // 60, minutes % 60))
+
+    def contiguous(self, slot: int, count: int) -> bool:
+        """Check whether count slots starting at slot follow each other without a break"""
+        last = slot + count - 1
+        if last >= len(self.slot_starts):
+            return False
+        return self.slot_starts[last] - self.slot_starts[slot] == (count - 1) * self.slot_minutes
+
+
+class Booking:
+    __slots__ = ("appointment_id", "patient_id", "start", "slots", "doctor", "room")
+
+    def __init__(self, appointment_id, patient_id, start, slots, doctor, room):
+        self.appointment_id = appointment_id
+        self.patient_id = patient_id
+        self.start = start
+        self.slots = slots
+        self.doctor = doctor
+        self.room = room
+
+
+class _DaySchedule:
+    """Slot usage of one day plus the sorted index of slots with free capacity"""
+
+    def __init__(self, slot_count: int, doctors: List[str], rooms: List[str]):
+        self.doctor_load = {doctor: [0] * slot_count for doctor in doctors}
+        # The doctor seeing patients in each room per slot
+        self.room_doctor = {room: [None] * slot_count for room in rooms}
+        self.free_slots = list(range(slot_count))
+
+
+class AppointmentScheduler:
+    def __init__(self, hours: Optional[ClinicHours] = None,
+                 doctors: Iterable[str] = ("dr. Sari", "dr. Andi", "dr. Putri"),
+                 rooms: Iterable[str] = ("Ruang 1", "Ruang 2", "Ruang 3"),
+                 slot_capacity: int = 1, horizon_days: int = 365):
+        self.hours = hours or ClinicHours()
+        self.doctors = list(doctors)
+        self.rooms = list(rooms)
+        self.slot_capacity = slot_capacity
+        self.horizon_days = horizon_days
+        self._days: Dict[datetime.date, _DaySchedule] = {}
+        # Sorted working day numbers of days without any free slot, skipped by
+        # searches; closed days are left out so full weeks form a single run
+        self._full_days: List[int] = []
+        self._bookings: Dict[str, Booking] = {}
+
+    @classmethod
+    def from_patients(cls, patients: Dict, **options) -> "AppointmentScheduler":
+        """Rebuild the schedule from the scheduled appointments of every patient"""
+        scheduler = cls(**options)
+        for patient_id, record in patients.items():
+            for appointment in record.get("appointments", []):
+                if appointment.get("status") == "scheduled" and appointment.get("appointment_id"):
+                    try:
+                        scheduler.book(patient_id, appointment["date_time"],
+                                       appointment.get("duration_minutes"), appointment.get("doctor"),
+                                       appointment.get("room"), appointment["appointment_id"],
+                                       allow_past=True)
+                    except SchedulingError:
+                        # Kept in the record; the clinic configuration changed since
+                        continue
+        return scheduler
+
+    def __len__(self) -> int:
+        return len(self._bookings)
+
+    def get_booking(self, appointment_id: str) -> Optional[Booking]:
+        return self._bookings.get(appointment_id)
+
+    def _slot_count(self, duration_minutes: Optional[int]) -> int:
+        if not duration_minutes:
+            return 1
+        return max(1, -(-duration_minutes // self.hours.slot_minutes))
+
+    def _day(self, day: datetime.date) -> _DaySchedule:
+        schedule = self._days.get(day)
+        if schedule is None:
+            schedule = self._days[day] = _DaySchedule(len(self.hours.slot_starts), self.doctors, self.rooms)
+        return schedule
+
+    def _pick(self, schedule: Optional[_DaySchedule], slot: int, count: int,
+              doctor: Optional[str], room: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Find a doctor and room free for count slots starting at slot"""
+        doctors = [doctor] if doctor else self.doctors
+        rooms = [room] if room else self.rooms
+        if schedule is None:
+            return doctors[0], rooms[0]
+
+        span = range(slot, slot + count)
+        for candidate in doctors:
+            load = schedule.doctor_load[candidate]
+            if any(load[s] >= self.slot_capacity for s in span):
+                continue
+            # Prefer the room the doctor already uses, so patients share it
+            for candidate_room in sorted(rooms, key=lambda r: schedule.room_doctor[r][slot] != candidate):
+                owners = schedule.room_doctor[candidate_room]
+                if all(owners[s] in (None, candidate) for s in span):
+                    return candidate, candidate_room
+        return None
+
+    def _refresh_free(self, day: datetime.date, schedule: _DaySchedule, slots: Iterable[int]) -> None:
+        for slot in slots:
+            has_room = any(load[slot] < self.slot_capacity for load in schedule.doctor_load.values())
+            position = bisect.bisect_left(schedule.free_slots, slot)
+            listed = position < len(schedule.free_slots) and schedule.free_slots[position] == slot
+            if has_room and not listed:
+                schedule.free_slots.insert(position, slot)
+            elif not has_room and listed:
+                del schedule.free_slots[position]
+
+        number = self.hours.workday_number(day)
+        position = bisect.bisect_left(self._full_days, number)
+        listed = position < len(self._full_days) and self._full_days[position] == number
+        if not schedule.free_slots and not listed:
+            self._full_days.insert(position, number)
+        elif schedule.free_slots and listed:
+            del self._full_days[position]
+
+    def _full_run_length(self, number: int) -> int:
+        """Get the number of consecutive full working days starting at a working day number"""
+        full_days = self._full_days
+        start = bisect.bisect_left(full_days, number)
+        if start == len(full_days) or full_days[start] != number:
+            return 0
+        # Numbers are sorted and unique, so the run ends where the offset
+        # from the first entry stops matching the offset in the list
+        low, high = start, len(full_days) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if full_days[middle] - number == middle - start:
+                low = middle
+            else:
+                high = middle - 1
+        return low - start + 1
+
+    def is_available(self, when, duration_minutes: Optional[int] = None,
+                     doctor: Optional[str] = None, room: Optional[str] = None) -> bool:
+        """Check whether a visit can be booked at a time"""
+        when = parse_date_time(when)
+        slot = self.hours.slot_index(when)
+        count = self._slot_count(duration_minutes)
+        if slot is None or not self.hours.is_open(when.date()) or not self.hours.contiguous(slot, count):
+            return False
+        return self._pick(self._days.get(when.date()), slot, count, doctor, room) is not None
+
+    def find_earliest_slot(self, after: Optional[datetime.datetime] = None,
+                           duration_minutes: Optional[int] = None,
+                           doctor: Optional[str] = None) -> Optional[Tuple[datetime.datetime, str, str]]:
+        """Find the earliest free (time, doctor, room) at or after a time"""
+        after = after or datetime.datetime.now()
+        count = self._slot_count(duration_minutes)
+        last_day = after.date() + datetime.timedelta(days=self.horizon_days)
+        number = self.hours.workday_number(after.date())
+        first_slot = self.hours.first_slot_at_or_after(after) if self.hours.is_open(after.date()) else 0
+
+        while True:
+            skip = self._full_run_length(number)
+            if skip:
+                number += skip
+                first_slot = 0
+                continue
+
+            day = self.hours.workday_date(number)
+            if day > last_day:
+                return None
+            schedule = self._days.get(day)
+            free_slots = schedule.free_slots if schedule else range(len(self.hours.slot_starts))
+            for slot in free_slots[bisect.bisect_left(free_slots, first_slot):]:
+                if not self.hours.contiguous(slot, count):
+                    continue
+                picked = self._pick(schedule, slot, count, doctor, None)
+                if picked:
+                    return (self.hours.slot_time(day, slot),) + picked
+
+            number += 1
+            first_slot = 0
+
+    def book(self, patient_id: str, when, duration_minutes: Optional[int] = None,
+             doctor: Optional[str] = None, room: Optional[str] = None,
+             appointment_id: Optional[str] = None, allow_past: bool = False) -> Booking:
+        """Book a visit, raising SchedulingError if the time is not available"""
+        when = parse_date_time(when)
+        if not allow_past and when < datetime.datetime.now():
+            raise SchedulingError("Waktu yang diminta sudah lewat")
+        if not self.hours.is_open(when.date()):
+            raise SchedulingError("Klinik tutup pada hari tersebut")
+        slot = self.hours.slot_index(when)
+        count = self._slot_count(duration_minutes)
+        if slot is None or not self.hours.contiguous(slot, count):
+            raise SchedulingError("Waktu tersebut di luar jam praktik klinik")
+        if doctor and doctor not in self.doctors:
+            raise SchedulingError(f"Dokter tidak dikenal: {doctor}")
+        if room and room not in self.rooms:
+            raise SchedulingError(f"Ruangan tidak dikenal: {room}")
+
+        schedule = self._day(when.date())
+        picked = self._pick(schedule, slot, count, doctor, room)
+        if picked is None:
+            raise SchedulingError("Jadwal pada waktu tersebut sudah penuh")
+
+        doctor, room = picked
+        for s in range(slot, slot + count):
+            schedule.doctor_load[doctor][s] += 1
+            schedule.room_doctor[room][s] = doctor
+        self._refresh_free(when.date(), schedule, range(slot, slot + count))
+
+        booking = Booking(appointment_id or f"A{uuid.uuid4().hex[:12]}", patient_id, when, count, doctor, room)
+        self._bookings[booking.appointment_id] = booking
+        return booking
+
+    def cancel(self, appointment_id: str) -> Booking:
+        """Release the slots of a booking"""
+        booking = self._bookings.pop(appointment_id, None)
+        if booking is None:
+            raise SchedulingError(f"Janji temu tidak ditemukan: {appointment_id}")
+
+        day = booking.start.date()
+        schedule = self._days[day]
+        slot = self.hours.slot_index(booking.start)
+        for s in range(slot, slot + booking.slots):
+            load = schedule.doctor_load[booking.doctor]
+            load[s] -= 1
+            if load[s] == 0:
+                schedule.room_doctor[booking.room][s] = None
+        self._refresh_free(day, schedule, range(slot, slot + booking.slots))
+        return booking
+
+    def reschedule(self, appointment_id: str, when, duration_minutes: Optional[int] = None,
+                   doctor: Optional[str] = None) -> Booking:
+        """Move a booking to a new time, keeping the old one if the new time is taken"""
+        old = self.cancel(appointment_id)
+        try:
+            return self.book(old.patient_id, when, duration_minutes or old.slots * self.hours.slot_minutes,
+                             doctor, None, appointment_id)
+        except SchedulingError:
+            self.book(old.patient_id, old.start, old.slots * self.hours.slot_minutes,
+                      old.doctor, old.room, appointment_id, allow_past=True)
+            raise
+
+# Example usage
+if __name__ == "__main__":
+    scheduler = AppointmentScheduler()
+
+    earliest = scheduler.find_earliest_slot()
+    print(f"Slot terdekat: {format_date_time(earliest[0])} dengan {earliest[1]} di {earliest[2]}")
+
+    booking = scheduler.book("P-contoh", earliest[0])
+    print(f"Dijadwalkan: {booking.appointment_id} {format_date_time(booking.start)} {booking.doctor}")
+
+    next_day = booking.start + datetime.timedelta(days=1)
+    moved = scheduler.reschedule(booking.appointment_id, scheduler.find_earliest_slot(next_day)[0])
+    print(f"Dipindah ke: {format_date_time(moved.start)}")
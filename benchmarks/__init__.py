@@ -0,0 +1,5 @@
+"""
+Benchmarks for CareLoopAI Clinic Chatbot
+Run individual benchmarks from the project root, e.g.
+python -m benchmarks.bench_symptom_store
+"""
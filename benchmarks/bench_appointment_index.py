@@ -0,0 +1,87 @@
+"""
+Benchmark for the clinic-wide appointment index.
+Answers "who is coming on this day" over many patients, once by scanning
+every patient's appointments and once through AppointmentIndex.
+
+Usage: python -m benchmarks.bench_appointment_index [--appointments 200000]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from appointment_index import AppointmentIndex, day_range, week_range
+from appointment_scheduler import format_date_time
+
+
+def _report(label, count, seconds):
+    print(f"{label:<28} {count:>8,} ops  {seconds * 1e6 / max(count, 1):10.1f} us/op")
+
+
+def make_patients(appointment_count, per_patient, rng):
+    """Generate patient records with appointments spread over two years"""
+    start = datetime.datetime(2026, 1, 5, 8, 0)
+    patients = {}
+    for i in range(appointment_count):
+        patient_id = f"P{i // per_patient:012d}"
+        record = patients.setdefault(patient_id, {"appointments": []})
+        when = start + datetime.timedelta(days=rng.randrange(730), minutes=30 * rng.randrange(16))
+        record["appointments"].append({
+            "appointment_id": f"A{i:012d}",
+            "date_time": format_date_time(when),
+            "status": "cancelled" if rng.random() < 0.1 else "scheduled"
+        })
+    return patients
+
+
+def scan_day(patients, start, end):
+    start, end = format_date_time(start), format_date_time(end)
+    return sorted(
+        (appointment["date_time"], patient_id)
+        for patient_id, record in patients.items()
+        for appointment in record["appointments"]
+        if appointment["status"] == "scheduled" and start <= appointment["date_time"] < end
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--appointments", type=int, default=200_000)
+    parser.add_argument("--per-patient", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    patients = make_patients(args.appointments, args.per_patient, rng)
+    days = [datetime.date(2026, 1, 5) + datetime.timedelta(days=rng.randrange(730)) for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    index = AppointmentIndex.from_patients(patients)
+    _report("build index", 1, time.perf_counter() - started)
+
+    scan_queries = max(1, args.queries // 20)
+    started = time.perf_counter()
+    for day in days[:scan_queries]:
+        scan_day(patients, *day_range(day))
+    _report("day view, full scan", scan_queries, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for day in days:
+        list(index.iter(*day_range(day), status="scheduled"))
+    _report("day view, index", len(days), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for day in days:
+        index.page(*week_range(day), status=None, limit=50)
+    _report("week page of 50, index", len(days), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(args.queries):
+        appointment = patients[f"P{i:012d}"]["appointments"][0]
+        appointment["status"] = "cancelled"
+        index.add(f"P{i:012d}", appointment)
+    _report("status update", args.queries, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
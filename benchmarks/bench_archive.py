@@ -0,0 +1,96 @@
+"""
+Benchmark for hot/cold history tiering.
+Builds a data file where every patient has months of history spread over
+several episodes, then compares the hot file size and save_data() time
+before and after compaction, and times reads that reach into the archive.
+
+Usage: python -m benchmarks.bench_archive [--patients 5000] [--codec gzip]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from history_archive import archive_directory
+from patient_data_manager import PatientDataManager
+
+SYMPTOMS = ["demam", "batuk", "pilek", "sakit kepala", "diare", "mual", "membaik", "memburuk"]
+SEVERITIES = ["ringan", "sedang", "berat"]
+
+
+def make_record(rng, patient_id, now):
+    """Generate a year of episodes, each with a report, daily check-ins and plans"""
+    record = {
+        "personal_info": {"name": f"Pasien {patient_id}", "phone": "", "email": "",
+                          "registration_date": (now - datetime.timedelta(days=365)).isoformat(),
+                          "patient_id": patient_id},
+        "symptoms_history": [], "treatment_plans": [], "checkin_history": [], "appointments": []
+    }
+    day = now - datetime.timedelta(days=365)
+    while day < now:
+        symptoms = rng.sample(SYMPTOMS, 2)
+        severity = rng.choice(SEVERITIES)
+        record["symptoms_history"].append({"date": day.isoformat(), "symptoms": symptoms,
+                                           "body_part": "umum", "severity": severity})
+        for offset in range(1, rng.randint(3, 8)):
+            date = (day + datetime.timedelta(days=offset)).isoformat()
+            record["checkin_history"].append({"date": date, "symptoms": symptoms, "body_part": "umum",
+                                              "severity": rng.choice(SEVERITIES), "type": "daily_checkin"})
+            record["treatment_plans"].append({"date": date, "plan": "Istirahat yang cukup. " * 10,
+                                              "based_on_symptoms": symptoms, "body_part": "umum",
+                                              "severity": severity})
+        day += datetime.timedelta(days=rng.randint(20, 60))
+    return record
+
+
+def _timed(label, action, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = action()
+    print(f"{label:<34} {(time.perf_counter() - started) * 1000 / repeat:10.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=5_000)
+    parser.add_argument("--codec", choices=["gzip", "lzma"], default="gzip")
+    parser.add_argument("--horizon-days", type=int, default=90)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    now = datetime.datetime.now()
+    directory = tempfile.mkdtemp(prefix="careloop-archive-")
+    try:
+        manager = PatientDataManager(os.path.join(directory, "patients.json"))
+        manager.patients = {f"P{i:012d}": make_record(rng, f"P{i:012d}", now) for i in range(args.patients)}
+
+        _timed("save_data, before", manager.save_data)
+        before = os.path.getsize(manager.data_file)
+
+        job = _timed("compaction", lambda: manager.compact_history(args.horizon_days, args.codec))
+        progress = job.progress()
+        after = os.path.getsize(manager.data_file)
+        cold = sum(os.path.getsize(os.path.join(archive_directory(manager.data_file), name))
+                   for name in os.listdir(archive_directory(manager.data_file)))
+
+        _timed("save_data, after", manager.save_data)
+        _timed("load, after", lambda: PatientDataManager(manager.data_file))
+        print(f"hot file {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB, "
+              f"cold segments {cold / 2**20:.1f} MiB ({args.codec}), "
+              f"{progress['entries_moved']:,} entries moved")
+
+        patient_ids = rng.sample(list(manager.patients), 200)
+        _timed("200 histories, 7 days (hot)",
+               lambda: [manager.get_symptom_history(p, 7) for p in patient_ids], 1)
+        _timed("200 histories, 365 days (cold)",
+               lambda: [manager.get_symptom_history(p, 365) for p in patient_ids], 1)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
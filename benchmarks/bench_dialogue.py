@@ -0,0 +1,55 @@
+"""
+Benchmark for the compiled dialogue state machine.
+Compiles the stories and rules, then runs random turns for many sessions
+whose dialogue states are kept in one compact array, and reports the compile
+time, the time per turn and the memory per session. The intents of each
+turn are drawn from those the session's state expects, with some that it
+does not, so rules and fallbacks are exercised too.
+
+Usage: python -m benchmarks.bench_dialogue [--sessions 1000000] [--turns 2000000]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from array import array
+
+from dialogue_fsm import DialogueMachine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--turns", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    machine = DialogueMachine.from_files()
+    print(f"compile:          {(time.perf_counter() - started) * 1000:8.2f} ms, {machine.state_count} state")
+
+    tracemalloc.start()
+    states = array("B" if machine.state_count < 256 else "H", [0]) * args.sessions
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"state per sesi:   {memory / args.sessions:8.2f} byte ({args.sessions:,} sesi)")
+
+    rng = random.Random(1)
+    intents = sorted({intent for table in machine.tables for intent in table})
+    plan = [(rng.randrange(args.sessions), rng.random(), rng.choice(intents)) for _ in range(args.turns)]
+    expected = [sorted(names) or intents for names in machine.expected]
+
+    step = machine.step
+    started = time.perf_counter()
+    for session, draw, other in plan:
+        state = states[session]
+        options = expected[state]
+        intent = options[int(draw * len(options))] if draw < 0.8 else other
+        turn = step(state, intent)
+        if turn is not None:
+            states[session] = turn.next_state
+    elapsed = time.perf_counter() - started
+    print(f"per giliran:      {elapsed / args.turns * 1e9:8.1f} ns ({args.turns / elapsed:,.0f} giliran/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark for idempotency keys on chat turns.
+Runs daily check-in turns of the clinic on a generated population without a
+key, with a new key and again with the key of an earlier turn (a retry),
+saving every change as the CLI does. Reports the median time of each and
+the saves it made, and that a retry adds no check-in or plan revision.
+
+Usage: python -m benchmarks.bench_idempotency [--patients 2000] [--turns 20]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.suite import generate_population
+from careloopai_clinic import CareLoopAIClinic
+from patient_data_manager import PatientDataManager
+
+
+def timed_turns(manager, clinic, turns, key=None):
+    """Run check-in turns and get the median milliseconds and the saves per turn"""
+    saves = []
+    save_data = manager.save_data
+    manager.save_data = lambda: saves.append(1) or save_data()
+    timings = []
+    try:
+        for number in range(turns):
+            started = time.perf_counter()
+            clinic.daily_checkin(["batuk", "membaik"], "dada", "ringan",
+                                 idempotency_key=key(number) if key else None)
+            timings.append(time.perf_counter() - started)
+    finally:
+        del manager.save_data
+    return statistics.median(timings) * 1000, len(saves) / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="careloop-idempotency-")
+    try:
+        manager = PatientDataManager(os.path.join(directory, "patient_data.json"))
+        manager.patients = generate_population(args.patients)
+        clinic = CareLoopAIClinic(manager)
+        clinic.register_patient("Pasien Uji Idempotensi")
+        clinic.report_symptoms(["batuk"], "dada")
+
+        print(f"Check-in harian ({args.patients:,} pasien, {args.turns} giliran)")
+        print(f"{'giliran':<22}{'median':>10}{'simpan/giliran':>16}")
+        for label, key in (("tanpa kunci", None),
+                           ("kunci baru", lambda number: f"turn-{number}"),
+                           ("ulangan kunci", lambda number: f"turn-{number}")):
+            median, saves = timed_turns(manager, clinic, args.turns, key)
+            print(f"{label:<22}{median:>8.2f}ms{saves:>16.1f}")
+
+        record = manager.get_patient_data(clinic.current_patient_id)
+        print(f"\nCheck-in tersimpan: {len(record['checkin_history'])} (diharapkan {2 * args.turns}), "
+              f"rencana: {len(record['treatment_plans'])} (diharapkan {2 * args.turns + 1})")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
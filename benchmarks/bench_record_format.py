@@ -0,0 +1,97 @@
+"""
+Benchmark for the binary record format.
+Compares file size, save time and load time of the pretty-printed JSON data
+file with the binary format, including loads that only need personal_info
+and saves where only a few records changed. Then loads both files through
+PatientDataManager, adds one check-in and times the save, counting the
+records the binary save copied as stored.
+
+Usage: python -m benchmarks.bench_record_format [--patients 2000]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.bench_archive import make_record
+from patient_data_manager import PatientDataManager
+from record_format import json_default, read_file, write_file
+
+
+def _timed(label, action):
+    started = time.perf_counter()
+    result = action()
+    print(f"{label:<40} {(time.perf_counter() - started) * 1000:10.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=2_000)
+    parser.add_argument("--changed", type=float, default=0.01, help="Share of records changed before resaving")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    now = datetime.datetime.now()
+    data = {
+        "schema_version": 2,
+        "patients": {f"P{i:012d}": make_record(rng, f"P{i:012d}", now) for i in range(args.patients)},
+        "indexes": {}
+    }
+
+    directory = tempfile.mkdtemp(prefix="careloop-format-")
+    json_path = os.path.join(directory, "patients.json")
+    binary_path = os.path.join(directory, "patients.clpr")
+    try:
+        def save_json(content):
+            with open(json_path, "w") as f:
+                json.dump(content, f, indent=2, default=json_default)
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        _timed("JSON save", lambda: save_json(data))
+        _timed("binary save", lambda: write_file(binary_path, data))
+        json_size, binary_size = os.path.getsize(json_path), os.path.getsize(binary_path)
+        print(f"size: JSON {json_size / 2**20:.1f} MiB, binary {binary_size / 2**20:.1f} MiB "
+              f"({100 * binary_size / json_size:.0f}%)")
+
+        loaded_json = _timed("JSON load", load_json)
+        _timed("binary load (lazy)", lambda: read_file(binary_path))
+        _timed("binary load + personal_info of all",
+               lambda: [r["personal_info"]["name"] for r in read_file(binary_path)["patients"].values()])
+        _timed("binary load + decode every field",
+               lambda: [dict(r) for r in read_file(binary_path)["patients"].values()])
+
+        # Resave after a check-in on a few patients
+        loaded_binary = read_file(binary_path)
+        changed = rng.sample(list(data["patients"]), max(1, int(args.patients * args.changed)))
+        entry = {"date": now.isoformat(), "symptoms": ["batuk"], "body_part": "dada", "severity": "ringan"}
+        for patient_id in changed:
+            loaded_json["patients"][patient_id]["checkin_history"].append(entry)
+            record = loaded_binary["patients"][patient_id]
+            record["checkin_history"] = record["checkin_history"] + [entry]
+        _timed(f"JSON save, {len(changed)} records changed", lambda: save_json(loaded_json))
+        _timed(f"binary save, {len(changed)} records changed", lambda: write_file(binary_path, loaded_binary))
+
+        # The same through the manager, which reads every history on load
+        save_json(data)
+        write_file(binary_path, data)
+        patient_id = changed[0]
+        for path in (json_path, binary_path):
+            manager = _timed(f"manager load, {os.path.basename(path)}", lambda: PatientDataManager(path))
+            _timed(f"manager check-in + save, {os.path.basename(path)}",
+                   lambda: manager.add_daily_checkin(patient_id, ["batuk"], "dada", "ringan"))
+        copied = sum(getattr(record, "unchanged", False) for record in manager.patients.values())
+        print(f"binary records copied as stored: {copied} of {len(manager.patients)}")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
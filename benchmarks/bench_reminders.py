@@ -0,0 +1,78 @@
+"""
+Benchmark for the reminder delivery pipeline.
+Sends a morning burst of check-in reminders to a generated population over
+SMS, email and push file sinks. Each sink call waits a fixed latency, like
+a request to a gateway, and a share of messages fail transiently and are
+retried. The burst is sent once in batches and once one message per call,
+and the throughput, batches, retries and dead letters of each are reported.
+
+Rate limits are set high enough that the gateway latency, not the token
+buckets, bounds the unbatched run.
+
+Usage: python -m benchmarks.bench_reminders [--patients 5000] [--latency-ms 5] [--failure-rate 0.02]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from reminders import DeliveryPipeline, FileSink, Reminder
+
+# Channel: (batch size, messages per second, share of patients)
+CHANNELS = {
+    "sms": (100, 5000, 0.5),
+    "email": (50, 2000, 0.3),
+    "push": (500, 20000, 0.2),
+}
+
+
+def burst(patients):
+    reminders = []
+    start = 0
+    for name, (_, _, share) in CHANNELS.items():
+        end = min(patients, start + round(patients * share))
+        reminders += [Reminder(f"2026-10-19:P{number}", f"P{number}", name, f"P{number}", "Halo")
+                      for number in range(start, end)]
+        start = end
+    return reminders
+
+
+def run(patients, batched, latency, failure_rate):
+    directory = tempfile.mkdtemp(prefix="careloop-reminders-")
+    try:
+        channels = [FileSink(directory, name, batch_size if batched else 1, rate, failure_rate,
+                             latency=latency, seed=number)
+                    for number, (name, (batch_size, rate, _)) in enumerate(CHANNELS.items())]
+        pipeline = DeliveryPipeline(channels, os.path.join(directory, "state.json"), base_backoff=0.05,
+                                    max_backoff=0.5, seed=1)
+        reminders = burst(patients)
+        started = time.perf_counter()
+        pipeline.enqueue(reminders)
+        counts = pipeline.run()
+        elapsed = time.perf_counter() - started
+        retries = sum(entry["attempts"] - 1 for entry in pipeline.state.values())
+        return elapsed, counts, sum(pipeline.batches.values()), retries
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'pesan':>8}{'detik':>9}{'pesan/s':>10}{'batch':>8}{'ulang':>7}"
+          f"{'terkirim':>10}{'gagal':>7}")
+    for batched in (True, False):
+        elapsed, counts, batches, retries = run(args.patients, batched, args.latency_ms / 1000,
+                                                args.failure_rate)
+        print(f"{'batch' if batched else 'satuan':<10}{args.patients:>8,}{elapsed:>9.2f}"
+              f"{args.patients / elapsed:>10,.0f}{batches:>8,}{retries:>7,}"
+              f"{counts['sent']:>10,}{counts['dead']:>7,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark for the appointment scheduling engine.
+Books tens of thousands of appointments (earliest-slot and explicit-time
+requests), then cancels and reschedules a share of them.
+
+Usage: python -m benchmarks.bench_scheduler [--bookings 50000]
+"""
+
+import argparse
+import datetime
+import random
+import time
+
+from appointment_scheduler import AppointmentScheduler, SchedulingError
+
+
+def _report(label, count, seconds):
+    print(f"{label:<28} {count:>8,} ops  {seconds * 1e6 / max(count, 1):8.1f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bookings", type=int, default=50_000)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--capacity", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    scheduler = AppointmentScheduler(
+        doctors=[f"dr. {i}" for i in range(args.doctors)],
+        rooms=[f"Ruang {i}" for i in range(args.doctors)],
+        slot_capacity=args.capacity, horizon_days=3650,
+    )
+    start = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time(0))
+
+    # Half of the requests ask for the earliest slot, half for a random time
+    booked, failed = [], 0
+    started = time.perf_counter()
+    for i in range(args.bookings):
+        if i % 2 == 0:
+            when, doctor, _ = scheduler.find_earliest_slot(start)
+            booked.append(scheduler.book(f"P{i}", when, doctor=doctor))
+        else:
+            slot = rng.choice(scheduler.hours.slot_starts)
+            when = start + datetime.timedelta(days=rng.randint(0, 365), minutes=slot)
+            try:
+                booked.append(scheduler.book(f"P{i}", when))
+            except SchedulingError:
+                failed += 1
+    _report("book (earliest + explicit)", args.bookings, time.perf_counter() - started)
+    print(f"{'':<28} {len(scheduler):>8,} booked, {failed:,} explicit requests rejected")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        scheduler.find_earliest_slot(start)
+    _report("find_earliest_slot", 1000, time.perf_counter() - started)
+
+    sample = rng.sample(booked, min(5000, len(booked)))
+    started = time.perf_counter()
+    for booking in sample[: len(sample) // 2]:
+        scheduler.cancel(booking.appointment_id)
+    _report("cancel", len(sample) // 2, time.perf_counter() - started)
+
+    moved = 0
+    started = time.perf_counter()
+    for booking in sample[len(sample) // 2:]:
+        when, _, _ = scheduler.find_earliest_slot(start)
+        try:
+            scheduler.reschedule(booking.appointment_id, when)
+            moved += 1
+        except SchedulingError:
+            pass
+    _report("reschedule to earliest", len(sample) - len(sample) // 2, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
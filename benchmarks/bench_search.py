@@ -0,0 +1,99 @@
+"""
+Benchmark for the full-text search index.
+Indexes a generated population and reports the time to build the index, to
+write and load its checkpoint, and to index one new check-in. Then times
+staff queries against the index and against a scan of every record that
+answers the same question.
+
+Usage: python -m benchmarks.bench_search [--patients 10000] [--runs 5]
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from benchmarks.suite import generate_population
+from search_index import SearchIndex, stem, tokenize
+
+NOW = datetime.datetime(2026, 10, 19, 9, 0)
+
+
+def scan(patients, plan_word, symptom, days):
+    """Patients with a plan mentioning a word and a symptom reported in the last days, by scanning"""
+    cutoff = (NOW - datetime.timedelta(days=days)).isoformat()
+    word = stem(plan_word)
+    found = []
+    for patient_id, record in patients.items():
+        if not any(entry["date"] >= cutoff and symptom in entry["symptoms"]
+                   for entry in record["symptoms_history"]):
+            continue
+        if any(word in (term for term, _ in tokenize(entry["plan"])) for entry in record["treatment_plans"]):
+            found.append(patient_id)
+    return sorted(found)
+
+
+def _median_ms(function, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    patients = generate_population(args.patients, now=NOW)
+    started = time.perf_counter()
+    index = SearchIndex.build(patients)
+    print(f"bangun indeks:    {(time.perf_counter() - started) * 1000:10.1f} ms "
+          f"({len(index.docs):,} dokumen, {len(index.postings):,} kata)")
+
+    directory = tempfile.mkdtemp(prefix="careloop-search-")
+    try:
+        path = os.path.join(directory, "patient_data_search.json")
+        started = time.perf_counter()
+        index.save(path)
+        print(f"tulis checkpoint: {(time.perf_counter() - started) * 1000:10.1f} ms "
+              f"({os.path.getsize(path) / 1e6:.1f} MB)")
+        started = time.perf_counter()
+        index = SearchIndex.load(path)
+        index.sync(patients)
+        print(f"muat checkpoint:  {(time.perf_counter() - started) * 1000:10.1f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+    patient_id = next(iter(patients))
+
+    def add_checkin():
+        old = patients[patient_id]
+        entry = {"date": NOW.isoformat(), "symptoms": ["diare", "memburuk"], "body_part": "perut",
+                 "severity": "berat"}
+        new = dict(old, checkin_history=old["checkin_history"] + [entry], version=old["version"] + 1)
+        index.update(patient_id, old, new)
+        patients[patient_id] = new
+    print(f"indeks 1 checkin: {_median_ms(add_checkin, args.runs * 20):10.3f} ms")
+
+    print(f"\n{'query':<42}{'pasien':>8}{'indeks ms':>11}{'scan ms':>10}")
+    for plan_word, symptom, days in [("istirahat", "diare", 3), ("istirahat", "diare", 30), ("tidur", "mual", 365)]:
+        query = f"rencana:{plan_word} gejala:{symptom}@{days}d"
+        found = index.search(query, now=NOW)
+        if found != scan(patients, plan_word, symptom, days):
+            raise SystemExit(f"Hasil indeks berbeda dengan scan untuk {query}")
+        index_ms = _median_ms(lambda: index.search(query, now=NOW), args.runs)
+        scan_ms = _median_ms(lambda: scan(patients, plan_word, symptom, days), args.runs)
+        print(f"{query:<42}{len(found):>8,}{index_ms:>11.2f}{scan_ms:>10.1f}")
+    for query in ['gejala:"sakit kepala" checkin:berat@30d', "(demam ATAU flu) -checkin:ringan"]:
+        index_ms = _median_ms(lambda: index.search(query, now=NOW), args.runs)
+        print(f"{query:<42}{len(index.search(query, now=NOW)):>8,}{index_ms:>11.2f}{'-':>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark for sharding patients over storage node processes.
+Spreads a generated population over 1 to N storage nodes behind the shard
+router and runs daily check-ins on random patients from several threads,
+reporting the throughput per node count. Then adds one more node while the
+check-ins go on, and reports how many patients moved and how long it took.
+
+Every node is its own process with its own data file, so saves and the
+work of the managers run in parallel, across cores, as nodes are added.
+
+Usage: python -m benchmarks.bench_sharding [--patients 2000] [--nodes 1 2 4] [--threads 8] [--ops 200]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.suite import generate_population
+from shard_router import HashRing, ShardedPatientStore
+from storage_node import NodeProcess, new_cluster_key
+
+
+def seed_nodes(directory, population, names):
+    """Write each node's share of the population to its data file"""
+    ring = HashRing(names)
+    shares = {name: {} for name in names}
+    for patient_id, record in population.items():
+        shares[ring.node_for(patient_id)][patient_id] = record
+    from patient_data_manager import PatientDataManager
+    for name, patients in shares.items():
+        manager = PatientDataManager(os.path.join(directory, f"{name}.json"))
+        manager.patients = patients
+        manager.save_data()
+
+
+def checkins(store, patient_ids, threads, ops, stop=None):
+    """Run check-ins from threads and get the check-ins per second"""
+    def worker(seed):
+        rng = random.Random(seed)
+        for number in range(ops):
+            if stop is not None and stop.is_set():
+                return
+            store.add_daily_checkin(rng.choice(patient_ids), ["batuk", "membaik"], "dada", "ringan")
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=200)
+    args = parser.parse_args()
+
+    population = generate_population(args.patients)
+    patient_ids = list(population)
+    print(f"{'node':>5}{'checkin/s':>12}{'pindah':>9}{'rebalance s':>13}")
+    for count in args.nodes:
+        directory = tempfile.mkdtemp(prefix="careloop-shards-")
+        names = [f"node{number}" for number in range(count + 1)]
+        nodes = {}
+        try:
+            seed_nodes(directory, population, names[:count])
+            key = new_cluster_key()
+            nodes = {name: NodeProcess(os.path.join(directory, f"{name}.json"), key) for name in names}
+            store = ShardedPatientStore({name: nodes[name].address for name in names[:count]}, key)
+            throughput = checkins(store, patient_ids, args.threads, args.ops)
+
+            stop = threading.Event()
+            load = threading.Thread(target=checkins, args=(store, patient_ids, 2, 10 ** 9, stop))
+            load.start()
+            started = time.perf_counter()
+            moved = store.add_node(names[count], nodes[names[count]].address)
+            elapsed = time.perf_counter() - started
+            stop.set()
+            load.join()
+            store.close()
+            print(f"{count:>5}{throughput:>12,.0f}{moved:>9,}{elapsed:>13.2f}")
+        finally:
+            for node in nodes.values():
+                node.stop()
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark for chatbot startup time.
+Starts cli_chatbot.py as a patient would, against data files of several
+sizes, and measures the time until the greeting is on screen and until the
+reply to the patient's name. The reply is sent after a pause standing in for
+the patient typing, which is when the warm-up thread loads the data file.
+
+Runs with the background warm-up (the CLI default) and without it, where the
+data file is loaded on the first message. The in-process load time is what
+constructing the clinic used to add before the greeting.
+
+Usage: python -m benchmarks.bench_startup [--sizes 0 1000 10000] [--think-ms 500]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.suite import generate_population
+from patient_data_manager import PatientDataManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GREETING = "Boleh tahu nama Anda?"
+
+
+def _read_until(process, marker):
+    for line in process.stdout:
+        if marker in line:
+            return
+    raise RuntimeError(f"cli_chatbot.py berhenti sebelum menampilkan '{marker}'")
+
+
+def run_session(directory, name, think, warm_up):
+    """Run one CLI session, return (ms until the greeting, ms until the first reply)"""
+    env = dict(os.environ, PYTHONPATH=ROOT, CARELOOP_WARM_UP="1" if warm_up else "0")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-u", os.path.join(ROOT, "cli_chatbot.py")],
+                               cwd=directory, env=env, text=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        _read_until(process, GREETING)
+        greeting = time.perf_counter() - started
+        time.sleep(think)
+        sent = time.perf_counter()
+        process.stdin.write(f"Nama saya {name}\n")
+        process.stdin.flush()
+        _read_until(process, "Bot:")
+        reply = time.perf_counter() - sent
+        process.stdin.write("keluar\n")
+        process.stdin.flush()
+        process.wait(30)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    return greeting * 1000, reply * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 1_000, 10_000])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--think-ms", type=float, default=500, help="Jeda sebelum pasien mengirim nama")
+    args = parser.parse_args()
+
+    print(f"{'pasien':>8} {'mode':<10} {'sapaan ms':>10} {'balasan ms':>11} {'load ms':>9}")
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix="careloop-startup-")
+        try:
+            data_file = os.path.join(directory, "patient_data.json")
+            manager = PatientDataManager(data_file)
+            manager.patients = generate_population(size)
+            manager.save_data()
+            started = time.perf_counter()
+            PatientDataManager(data_file)
+            load = (time.perf_counter() - started) * 1000
+
+            # An existing patient, so the reply does not include a save
+            name = "Pasien 0" if size else "Pasien Baru"
+            for warm_up in (True, False):
+                runs = [run_session(directory, name, args.think_ms / 1000, warm_up) for _ in range(args.runs)]
+                greeting = statistics.median(run[0] for run in runs)
+                reply = statistics.median(run[1] for run in runs)
+                print(f"{size:>8,} {'warm-up' if warm_up else 'on-demand':<10} "
+                      f"{greeting:>10.1f} {reply:>11.1f} {load:>9.1f}")
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark for streamed chat replies.
+Serves a generated population with the clinic server and sends the same
+chat turns through POST /chat, which answers once the whole reply is
+ready, and POST /chat/stream, which sends each section of the reply as it
+is ready. Reports the median time to the first byte of the reply and to
+its end, with every change saved before the reply goes on (as the CLI
+does) and with the server's background flusher.
+
+Usage: python -m benchmarks.bench_streaming [--patients 2000] [--runs 10]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.suite import generate_population
+from clinic_server import create_server
+from patient_data_manager import PatientDataManager
+
+TURNS = [
+    ("laporkan gejala", "laporkan gejala demam, batuk, sakit kepala"),
+    ("checkin harian", "checkin harian batuk membaik"),
+    ("ringkasan", "ringkasan"),
+]
+
+
+def chat(port, path, session, message):
+    """Send one turn and get the session, the seconds to the first byte of the reply and to its end"""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    started = time.perf_counter()
+    connection.request("POST", path, json.dumps({"session": session, "message": message}),
+                       {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    if path == "/chat":
+        first = response.read(1)
+        first_byte = time.perf_counter() - started
+        session = json.loads(first + response.read())["session"]
+    else:
+        line = response.readline()
+        while not line.startswith(b"data: "):
+            line = response.readline()
+        first_byte = time.perf_counter() - started
+        for line in response:
+            if line.startswith(b"data: {"):
+                session = json.loads(line[6:])["session"]
+    total = time.perf_counter() - started
+    connection.close()
+    return session, first_byte, total
+
+
+def run(data_file, population, runs, flush_interval):
+    manager = PatientDataManager(data_file, flush_interval=flush_interval)
+    manager.patients = dict(population)
+    manager.save_data()
+    server = create_server(port=0, patient_manager=manager)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    timings = {(name, path): ([], []) for name, _ in TURNS for path in ("/chat", "/chat/stream")}
+    try:
+        for number in range(runs):
+            for path in ("/chat", "/chat/stream"):
+                session, _, _ = chat(server.server_port, path, None, f"Nama saya Pasien Uji {path} {number}")
+                for name, message in TURNS:
+                    session, first_byte, total = chat(server.server_port, path, session, message)
+                    timings[name, path][0].append(first_byte)
+                    timings[name, path][1].append(total)
+    finally:
+        server.shutdown()
+        server.server_close()
+        manager.close()
+    return {key: (statistics.median(first) * 1000, statistics.median(total) * 1000)
+            for key, (first, total) in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    population = generate_population(args.patients)
+    directory = tempfile.mkdtemp(prefix="careloop-streaming-")
+    try:
+        data_file = os.path.join(directory, "patient_data.json")
+        for label, flush_interval in (("simpan tiap perubahan", None), ("flusher 0.2 s", 0.2)):
+            results = run(data_file, population, args.runs, flush_interval)
+            print(f"\n{label} ({args.patients:,} pasien)")
+            print(f"{'pesan':<18}{'TTFB utuh':>11}{'TTFB stream':>13}{'selesai utuh':>14}{'selesai stream':>16}")
+            for name, _ in TURNS:
+                buffered, streamed = results[name, "/chat"], results[name, "/chat/stream"]
+                print(f"{name:<18}{buffered[0]:>9.1f}ms{streamed[0]:>11.1f}ms"
+                      f"{buffered[1]:>12.1f}ms{streamed[1]:>14.1f}ms")
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
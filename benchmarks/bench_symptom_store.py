@@ -0,0 +1,82 @@
+"""
+Memory benchmark for the columnar symptom history store.
+Compares the dict-of-lists representation kept by PatientDataManager with
+ColumnarHistoryStore for a synthetic patient population.
+
+Usage: python -m benchmarks.bench_symptom_store [--patients 100000]
+"""
+
+import argparse
+import datetime
+import gc
+import random
+import time
+import tracemalloc
+
+from symptom_store import ColumnarHistoryStore
+
+SYMPTOMS = ["demam", "batuk", "pilek", "sakit kepala", "diare", "mual", "muntah",
+            "flu", "membaik", "memburuk", "kemerahan", "pembengkakan"]
+BODY_PARTS = ["kepala", "dada", "perut", "tenggorokan", "umum", "area_terdampak"]
+SEVERITIES = ["ringan", "sedang", "berat"]
+
+
+def _fresh(word: str) -> str:
+    # json.load creates a new string object for every value it decodes
+    return word.encode("utf-8").decode("utf-8")
+
+
+def _entry(rng: random.Random, date: datetime.datetime) -> dict:
+    return {
+        "date": date.isoformat(),
+        "symptoms": [_fresh(s) for s in rng.sample(SYMPTOMS, rng.randint(1, 3))],
+        "body_part": _fresh(rng.choice(BODY_PARTS)),
+        "severity": _fresh(rng.choice(SEVERITIES)),
+    }
+
+
+def generate_histories(patients: int, seed: int = 42) -> dict:
+    """Generate symptom and checkin histories in the PatientDataManager shape"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    data = {}
+    for i in range(patients):
+        onset = start + datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 300))
+        data[f"Pasien {i}"] = {
+            "symptoms_history": [_entry(rng, onset + datetime.timedelta(hours=h))
+                                 for h in range(rng.randint(1, 4))],
+            "checkin_history": [_entry(rng, onset + datetime.timedelta(days=d))
+                                for d in range(1, rng.randint(2, 10))],
+        }
+    return data
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=100_000)
+    args = parser.parse_args()
+
+    data, dict_bytes, dict_seconds = _measure(lambda: generate_histories(args.patients))
+    entries = sum(len(r["symptoms_history"]) + len(r["checkin_history"]) for r in data.values())
+    store, store_bytes, store_seconds = _measure(lambda: ColumnarHistoryStore.from_patients(data))
+
+    print(f"Patients: {args.patients:,}  entries: {entries:,}")
+    print(f"dict representation:   {dict_bytes / 2**20:8.1f} MiB  (generated in {dict_seconds:.2f}s)")
+    print(f"columnar store:        {store_bytes / 2**20:8.1f} MiB  (built in {store_seconds:.2f}s)")
+    print(f"column buffers only:   {store.memory_usage() / 2**20:8.1f} MiB")
+    print(f"reduction:             {dict_bytes / store_bytes:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark for multithreaded serving of PatientDataManager.
+Runs a mixed workload (patient summaries, symptom history reads and daily
+checkins on random patients) from 1 to N threads and reports throughput and
+write latency percentiles per thread count, in two modes:
+
+- global: every operation holds one manager-wide lock and each checkin saves
+  the file itself, which is how concurrent callers had to use the manager
+- striped: no caller lock; checkins hold only their patient's stripe and the
+  background flusher saves the changes of each interval at once
+
+The interpreter lock keeps the striped mode's throughput near one core's;
+what it removes is writers waiting on the file and on other patients'
+writes, which shows in the write latency tail as threads are added. Each
+run reloads the file to check that every checkin was saved.
+
+Usage: python -m benchmarks.bench_threads [--patients 500] [--threads 1 2 4 8] [--ops 200]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+from benchmarks.suite import generate_population
+from patient_data_manager import PatientDataManager
+
+
+def run(data_file, population, threads, ops, write_ratio, mode, flush_interval):
+    manager = PatientDataManager(data_file, flush_interval=flush_interval if mode == "striped" else None)
+    # Records are replaced, not changed, so a shallow copy keeps the population intact for the next run
+    manager.patients = dict(population)
+    manager.save_data()
+    lock = threading.Lock() if mode == "global" else nullcontext()
+    patient_ids = list(population)
+    write_latencies = []
+    start = threading.Barrier(threads + 1)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        latencies = []
+        start.wait()
+        for _ in range(ops):
+            patient_id = rng.choice(patient_ids)
+            if rng.random() < write_ratio:
+                started = time.perf_counter()
+                with lock:
+                    manager.add_daily_checkin(patient_id, ["batuk", "membaik"], "dada", "ringan")
+                latencies.append(time.perf_counter() - started)
+            elif rng.random() < 0.5:
+                with lock:
+                    manager.get_patient_summary(patient_id)
+            else:
+                with lock:
+                    manager.get_symptom_history(patient_id)
+        write_latencies.extend(latencies)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    manager.close()
+
+    latencies = sorted(write_latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    checkins = sum(len(record["checkin_history"]) for record in PatientDataManager(data_file).patients.values())
+    return {
+        "ops_per_second": threads * ops / elapsed,
+        "write_p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "write_p99_ms": p99 * 1000,
+        "saved_checkins": checkins,
+        "expected_checkins": sum(len(record["checkin_history"]) for record in population.values()) + len(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=200, help="Operasi per thread")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args()
+
+    population = generate_population(args.patients)
+    print(f"{'mode':<9}{'thread':>7}{'ops/s':>10}{'tulis p50 ms':>14}{'tulis p99 ms':>14}  tersimpan")
+    for mode in ("global", "striped"):
+        for threads in args.threads:
+            directory = tempfile.mkdtemp(prefix="careloop-threads-")
+            try:
+                result = run(os.path.join(directory, "patients.json"), population, threads, args.ops,
+                             args.write_ratio, mode, args.flush_interval)
+            finally:
+                shutil.rmtree(directory)
+            saved = "ya" if result["saved_checkins"] == result["expected_checkins"] else "TIDAK"
+            print(f"{mode:<9}{threads:>7}{result['ops_per_second']:>10,.0f}{result['write_p50_ms']:>14.2f}"
+                  f"{result['write_p99_ms']:>14.2f}  {saved}")
+
+if __name__ == "__main__":
+    main()
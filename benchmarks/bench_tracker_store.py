@@ -0,0 +1,101 @@
+"""
+Benchmark for the SQLite tracker store.
+Builds daily check-in conversations of growing length (one session per day,
+as with session_expiration_time in domain.yml, with slots carried over) and
+times loading the tail that retrieve() uses against loading every stored
+event, as a store without tail loading does. Also times appending one turn
+and pruning the conversation down to its tail.
+
+Times cover reading and decoding the events; building the Rasa tracker from
+them grows with the number of events in the same way.
+
+Usage: python -m benchmarks.bench_tracker_store [--days 10 100 1000] [--turns-per-day 4]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from tracker_store import TrackerEventLog
+
+SLOTS = ("patient_name", "symptoms", "body_part", "severity", "last_checkin")
+
+
+def turn_events(number, timestamp):
+    """Events of one check-in turn: listen, user message, slots set, bot reply"""
+    return [
+        {"event": "action", "name": "action_listen", "timestamp": timestamp},
+        {"event": "user", "text": f"checkin harian batuk membaik {number}", "timestamp": timestamp,
+         "parse_data": {"intent": {"name": "daily_checkin", "confidence": 0.98}, "entities": []}},
+        {"event": "slot", "name": "severity", "value": "ringan", "timestamp": timestamp},
+        {"event": "slot", "name": "last_checkin", "value": f"hari {number}", "timestamp": timestamp},
+        {"event": "action", "name": "action_revise_treatment_plan", "timestamp": timestamp},
+        {"event": "bot", "text": "Rencana pengobatan diperbarui", "timestamp": timestamp},
+    ]
+
+
+def conversation(days, turns_per_day, started):
+    events = []
+    for day in range(days):
+        timestamp = started + day * 86400
+        events.append({"event": "action", "name": "action_session_start", "timestamp": timestamp})
+        events.append({"event": "session_started", "timestamp": timestamp})
+        events += [{"event": "slot", "name": name, "value": f"{name} {day}", "timestamp": timestamp}
+                   for name in SLOTS]
+        for turn in range(turns_per_day):
+            events += turn_events(day * turns_per_day + turn, timestamp + turn * 60)
+    return events
+
+
+def _median_ms(function, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--turns-per-day", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'hari':>6}{'event':>9}{'ekor':>7}{'muat ekor ms':>14}{'muat semua ms':>15}"
+          f"{'tambah giliran ms':>19}{'pangkas ms':>12}{'ekor setelah ms':>17}")
+    for days in args.days:
+        directory = tempfile.mkdtemp(prefix="careloop-trackers-")
+        try:
+            log = TrackerEventLog(os.path.join(directory, "trackers.db"))
+            started = time.time() - days * 86400
+            log.append("pasien", conversation(days, args.turns_per_day, started))
+            stored = log.count("pasien")
+            tail_events = log.tail("pasien")[1]
+
+            tail_ms = _median_ms(lambda: log.tail("pasien"), args.runs)
+            full_ms = _median_ms(lambda: log.all_events("pasien"), args.runs)
+            number = [days * args.turns_per_day]
+
+            def append_turn():
+                log.stored_in_tail("pasien")
+                log.append("pasien", turn_events(number[0], time.time()))
+                number[0] += 1
+            append_ms = _median_ms(append_turn, args.runs)
+
+            prune_started = time.perf_counter()
+            log.prune(retention_days=0)
+            prune_ms = (time.perf_counter() - prune_started) * 1000
+            pruned_tail_ms = _median_ms(lambda: log.tail("pasien"), args.runs)
+            log.close()
+        finally:
+            shutil.rmtree(directory)
+        print(f"{days:>6}{stored:>9,}{tail_events:>7}{tail_ms:>14.2f}{full_ms:>15.2f}"
+              f"{append_ms:>19.2f}{prune_ms:>12.1f}{pruned_tail_ms:>17.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark for the triage queue.
+Builds the follow-up statistics of a generated population, scores the
+patients with an active episode into the triage queue and reports the time
+to build it, to rescore a patient after a check-in, and to get the most
+urgent patients. Getting them is compared with scoring every patient and
+sorting, as a view without the queue has to.
+
+Usage: python -m benchmarks.bench_triage [--patients 100000] [--top 20] [--updates 10000]
+"""
+
+import argparse
+import datetime
+import heapq
+import random
+import time
+
+from benchmarks.suite import SEVERITIES, generate_population
+from followup_engine import FollowupEngine
+from triage import TriageQueue, triage_score
+
+NOW = datetime.datetime(2026, 10, 19, 9, 0)
+
+
+def scan_top(engine, k, now):
+    """The k most urgent patients, by scoring every patient"""
+    scored = []
+    for patient_id in engine.patients():
+        score, changes = triage_score(engine.get_progress(patient_id), now)
+        if changes is not None:
+            scored.append((score, patient_id))
+    return [(patient_id, score) for score, patient_id in heapq.nlargest(k, scored)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    engine = FollowupEngine.from_patients(generate_population(args.patients, now=NOW))
+    # Everyone checked in during the last three days, so every patient has an active episode
+    for patient_id in engine.patients():
+        engine.record_checkin(patient_id, ["demam"], rng.choice(SEVERITIES),
+                              NOW - datetime.timedelta(minutes=rng.randrange(3 * 24 * 60)))
+    started = time.perf_counter()
+    queue = TriageQueue.from_engine(engine, now=NOW)
+    print(f"bangun antrean:     {(time.perf_counter() - started) * 1000:9.1f} ms "
+          f"({len(queue):,} pasien aktif dari {args.patients:,})")
+
+    active = engine.patients()
+    plan = [(rng.choice(active), rng.choice(SEVERITIES), rng.random() < 0.3) for _ in range(args.updates)]
+    now = NOW
+    started = time.perf_counter()
+    for patient_id, severity, worse in plan:
+        now += datetime.timedelta(seconds=1)
+        engine.record_checkin(patient_id, ["demam", "memburuk" if worse else "membaik"], severity, now)
+        queue.update(patient_id, now)
+    elapsed = time.perf_counter() - started
+    print(f"checkin + skor:     {elapsed / args.updates * 1e6:9.1f} us per checkin")
+
+    def median_ms(function, runs=20):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[runs // 2] * 1000
+
+    if [patient_id for patient_id, _ in queue.scores.top(args.top)] != \
+            [patient_id for patient_id, _ in scan_top(engine, args.top, now)]:
+        # Equal scores may be ordered differently; compare the scores
+        assert [score for _, score in queue.scores.top(args.top)] == \
+            [score for _, score in scan_top(engine, args.top, now)]
+    print(f"top {args.top} antrean:     {median_ms(lambda: queue.top(args.top, now)):9.3f} ms")
+    print(f"top {args.top} scan semua:  {median_ms(lambda: scan_top(engine, args.top, now), 5):9.3f} ms")
+
+    later = now + datetime.timedelta(days=2)
+    started = time.perf_counter()
+    queue.top(args.top, later)
+    print(f"2 hari kemudian:    {(time.perf_counter() - started) * 1000:9.1f} ms "
+          f"(checkin terlewat dihitung ulang, {len(queue):,} pasien aktif)")
+
+if __name__ == "__main__":
+    main()
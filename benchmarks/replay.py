@@ -0,0 +1,299 @@
+"""
+Conversation Replay Load Generator
+Synthesizes multi-day patient journeys from the Rasa stories and rules
+(register -> report symptoms -> N daily check-ins -> photo -> summary) and
+replays them concurrently through the CLI router (cli_chatbot.process_user_input
+on CareLoopAIClinic sessions sharing one PatientDataManager) or through
+ClinicChatbotSimulator.
+
+Each simulated day runs the turns every journey has on that day, spread over
+worker threads, then records the size of the stored data. The report gives
+throughput, latency percentiles per turn type and storage growth per day.
+Entry timestamps are real time; the days are simulated rounds.
+
+Turns against PatientDataManager run in parallel; the manager's background
+flusher saves their changes, so the latencies do not include file writes.
+
+Usage:
+  python -m benchmarks.replay --journeys 200 --concurrency 8
+  python -m benchmarks.replay --target simulator --json replay.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from careloopai_clinic import CareLoopAIClinic
+from cli_chatbot import process_user_input
+from clinic_chatbot_simulator import ClinicChatbotSimulator
+from patient_data_manager import PatientDataManager
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+SYMPTOMS = ["demam", "batuk", "pilek", "sakit kepala", "diare", "mual", "flu"]
+CONDITIONS = ["membaik", "stabil", "memburuk"]
+
+# Journey phases and the stories or rules their intents come from
+JOURNEY_PHASES = [
+    ("register", "patient registration"),
+    ("report", "symptom reporting"),
+    ("checkin", "daily checkin"),
+    ("photo", "Handle photo submission"),
+]
+
+
+def load_story_intents(data_dir: str = DATA_DIR) -> Dict[str, List[str]]:
+    """Get the user intents of every story and rule, by name"""
+    intents = {}
+    for path, key, name_key in [(os.path.join(data_dir, "stories", "clinic_stories.yml"), "stories", "story"),
+                                (os.path.join(data_dir, "rules", "clinic_rules.yml"), "rules", "rule")]:
+        with open(path, encoding="utf-8") as f:
+            for item in yaml.safe_load(f).get(key, []):
+                intents[item[name_key]] = [step["intent"] for step in item["steps"] if "intent" in step]
+    return intents
+
+
+class Journey:
+    """One synthetic patient: a name, symptoms and the intents of each simulated day"""
+
+    def __init__(self, number: int, days: List[List[str]], rng: random.Random):
+        self.number = number
+        self.name = f"Pasien Uji {number}"
+        self.symptoms = rng.sample(SYMPTOMS, rng.randint(1, 3))
+        self.conditions = [rng.choice(CONDITIONS) for _ in days]
+        self.days = days
+        self.session = None
+
+
+def build_journeys(count: int, min_checkins: int, max_checkins: int, appointment_rate: float,
+                   seed: int = 1, data_dir: str = DATA_DIR) -> List[Journey]:
+    """Synthesize journeys from the story intents"""
+    intents = load_story_intents(data_dir)
+    phases = {}
+    for phase, story in JOURNEY_PHASES:
+        if story not in intents:
+            raise ValueError(f"Story atau rule '{story}' tidak ditemukan di {data_dir}")
+        phases[phase] = intents[story]
+
+    rng = random.Random(seed)
+    journeys = []
+    for number in range(count):
+        days = [phases["register"] + phases["report"]]
+        days += [list(phases["checkin"]) for _ in range(rng.randint(min_checkins, max_checkins))]
+        last_day = phases["photo"] + ["ask_summary"]
+        if rng.random() < appointment_rate:
+            last_day.append("request_appointment")
+        days.append(last_day)
+        journeys.append(Journey(number, days, rng))
+    return journeys
+
+
+class CliTarget:
+    """Replays turns through cli_chatbot.process_user_input"""
+
+    name = "cli"
+
+    def __init__(self, data_file: str, flush_interval: float = 0.05):
+        # Journeys run on concurrent threads; the flusher batches their saves
+        self.patient_manager = PatientDataManager(data_file, flush_interval=flush_interval)
+
+    def start(self, journey: Journey) -> None:
+        journey.session = CareLoopAIClinic(self.patient_manager)
+
+    def turn(self, journey: Journey, intent: str, day: int) -> Optional[Callable[[], str]]:
+        clinic = journey.session
+        utterances = {
+            "inform_name": f"Nama saya {journey.name}",
+            "inform_symptoms": "laporkan gejala " + ", ".join(journey.symptoms),
+            "daily_checkin": f"checkin harian {journey.symptoms[0]} {journey.conditions[day]}",
+            "inform_photo": "foto gejala",
+            "ask_summary": "ringkasan",
+            "request_appointment": "jadwal janji",
+            "ask_treatment": "rencana pengobatan",
+        }
+        if intent == "greet":
+            return clinic.greet_patient
+        if intent not in utterances:
+            return None
+
+        def run():
+            return process_user_input(clinic, utterances[intent])
+        return run
+
+    def storage(self) -> Dict:
+        manager = self.patient_manager
+        manager.flush()
+        with manager.snapshot() as patients:
+            return {
+                "bytes": os.path.getsize(manager.data_file) if os.path.exists(manager.data_file) else 0,
+                "patients": len(patients),
+                "entries": sum(len(record[section]) for record in patients.values()
+                               for section in ("symptoms_history", "checkin_history", "treatment_plans"))
+            }
+
+    def close(self) -> None:
+        self.patient_manager.close()
+
+
+class SimulatorTarget:
+    """Replays turns through ClinicChatbotSimulator sessions sharing one patient_data dict"""
+
+    name = "simulator"
+
+    def __init__(self, data_file: str):
+        self.data_file = data_file
+        self.patient_data = {}
+
+    def start(self, journey: Journey) -> None:
+        journey.session = ClinicChatbotSimulator()
+        journey.session.patient_data = self.patient_data
+
+    def turn(self, journey: Journey, intent: str, day: int) -> Optional[Callable[[], str]]:
+        bot = journey.session
+        turns = {
+            "greet": bot.greet,
+            "inform_name": lambda: bot.set_patient_name(journey.name),
+            "inform_symptoms": lambda: bot.report_symptoms(journey.symptoms),
+            "daily_checkin": lambda: bot.daily_checkin([journey.symptoms[0], journey.conditions[day]]),
+            "ask_treatment": bot.ask_treatment,
+        }
+        return turns.get(intent)
+
+    def storage(self) -> Dict:
+        # The simulator keeps only the latest report per patient
+        writer = ClinicChatbotSimulator()
+        writer.patient_data = self.patient_data
+        writer.save_data(self.data_file)
+        return {"bytes": os.path.getsize(self.data_file), "patients": len(self.patient_data),
+                "entries": len(self.patient_data)}
+
+    def close(self) -> None:
+        pass
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def replay(journeys: List[Journey], target, concurrency: int = 8) -> Dict:
+    """Replay the journeys day by day and collect latencies and storage growth"""
+    latencies: Dict[str, List[float]] = {}
+    skipped: Dict[str, int] = {}
+    growth = []
+    for journey in journeys:
+        target.start(journey)
+
+    def run_day(journey: Journey, day: int) -> List[Tuple[str, float]]:
+        timings = []
+        for intent in journey.days[day]:
+            action = target.turn(journey, intent, day)
+            if action is None:
+                timings.append((intent, None))
+                continue
+            started = time.perf_counter()
+            action()
+            timings.append((intent, (time.perf_counter() - started) * 1000))
+        return timings
+
+    started = time.perf_counter()
+    days = max(len(journey.days) for journey in journeys)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for day in range(days):
+            active = [journey for journey in journeys if day < len(journey.days)]
+            day_started = time.perf_counter()
+            for timings in executor.map(lambda journey: run_day(journey, day), active):
+                for intent, elapsed in timings:
+                    if elapsed is None:
+                        skipped[intent] = skipped.get(intent, 0) + 1
+                    else:
+                        latencies.setdefault(intent, []).append(elapsed)
+            growth.append(dict(target.storage(), day=day, journeys=len(active),
+                               seconds=round(time.perf_counter() - day_started, 3)))
+    elapsed = time.perf_counter() - started
+
+    turns = sum(len(values) for values in latencies.values())
+    return {
+        "target": target.name,
+        "journeys": len(journeys),
+        "concurrency": concurrency,
+        "turns": turns,
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(turns / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            intent: {
+                "count": len(values),
+                "p50": round(statistics.median(values), 3),
+                "p90": round(_percentile(values, 0.90), 3),
+                "p99": round(_percentile(values, 0.99), 3),
+                "max": round(max(values), 3)
+            }
+            for intent, values in latencies.items()
+        },
+        "skipped": skipped,
+        "storage_growth": growth
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"Target {report['target']}: {report['journeys']} perjalanan pasien, "
+          f"{report['turns']} giliran dalam {report['seconds']:.2f} s "
+          f"({report['turns_per_second']:.1f} giliran/s, {report['concurrency']} thread)")
+    print(f"\n{'giliran':<22}{'jumlah':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for intent, stats in report["latency_ms"].items():
+        print(f"{intent:<22}{stats['count']:>8}{stats['p50']:>10.2f}{stats['p90']:>10.2f}"
+              f"{stats['p99']:>10.2f}{stats['max']:>10.2f}")
+    if report["skipped"]:
+        print("\nTidak didukung target ini: " + ", ".join(f"{k} ({v})" for k, v in report["skipped"].items()))
+    print(f"\n{'hari':<6}{'aktif':>8}{'pasien':>8}{'entri':>10}{'byte':>14}{'detik':>9}")
+    for day in report["storage_growth"]:
+        print(f"{day['day']:<6}{day['journeys']:>8}{day['patients']:>8}{day['entries']:>10}"
+              f"{day['bytes']:>14,}{day['seconds']:>9.2f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generator beban percakapan CareLoopAI")
+    parser.add_argument("--target", choices=["cli", "simulator"], default="cli")
+    parser.add_argument("--journeys", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--min-checkins", type=int, default=3)
+    parser.add_argument("--max-checkins", type=int, default=7)
+    parser.add_argument("--appointment-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-file", help="File data (default: file sementara); .clpr untuk format biner")
+    parser.add_argument("--json", help="Simpan laporan sebagai JSON")
+    args = parser.parse_args(argv)
+
+    journeys = build_journeys(args.journeys, args.min_checkins, args.max_checkins,
+                              args.appointment_rate, args.seed)
+    directory = None
+    data_file = args.data_file
+    if data_file is None:
+        directory = tempfile.mkdtemp(prefix="careloop-replay-")
+        data_file = os.path.join(directory, "patients.json")
+    target = (CliTarget if args.target == "cli" else SimulatorTarget)(data_file)
+    try:
+        report = replay(journeys, target, args.concurrency)
+    finally:
+        target.close()
+        if directory:
+            shutil.rmtree(directory)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Stress Test for Concurrent Writers of One Data File
+Starts several processes that each open their own PatientDataManager on the
+same data file and, in parallel, register a patient and add daily check-ins
+to it and to a set of shared patients. Every write merges what the other
+processes saved meanwhile, so at the end the file must hold every check-in
+of every process.
+
+Usage: python -m benchmarks.stress_writers [--processes 8] [--ops 25] [--binary]
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from patient_data_manager import PatientDataManager
+
+
+def writer(data_file: str, worker: int, ops: int, shared_ids: List[str]) -> None:
+    """One writer process: its own patient plus check-ins on the shared ones"""
+    manager = PatientDataManager(data_file)
+    own_id = manager.register_patient(f"Penulis {worker}", phone=f"0812000{worker:05d}")
+    for op in range(ops):
+        manager.add_daily_checkin(own_id, ["batuk", f"w{worker}-op{op}"], "dada", "ringan")
+        shared_id = shared_ids[(worker + op) % len(shared_ids)]
+        manager.add_daily_checkin(shared_id, ["demam", f"w{worker}-op{op}"], "kepala", "sedang")
+
+
+def run_stress(data_file: str, processes: int = 8, ops: int = 25, shared: int = 3) -> Dict:
+    """Run the writers and check that no check-in was lost"""
+    setup = PatientDataManager(data_file)
+    shared_ids = [setup.register_patient(f"Pasien Bersama {i}") for i in range(shared)]
+
+    started = time.perf_counter()
+    workers = [multiprocessing.Process(target=writer, args=(data_file, worker, ops, shared_ids))
+               for worker in range(processes)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    result = PatientDataManager(data_file)
+    expected = {f"w{worker}-op{op}" for worker in range(processes) for op in range(ops)}
+    own, shared_marks = set(), set()
+    for record in result.patients.values():
+        marks = [entry["symptoms"][1] for entry in record["checkin_history"]]
+        if record["personal_info"]["name"].startswith("Penulis"):
+            own.update(marks)
+        else:
+            shared_marks.update(marks)
+    return {
+        "processes": processes,
+        "writes": 2 * processes * ops,
+        "seconds": round(elapsed, 3),
+        "writes_per_second": round(2 * processes * ops / elapsed, 1),
+        "patients": len(result.patients),
+        "expected_patients": shared + processes,
+        "lost_own_checkins": len(expected - own),
+        "lost_shared_checkins": len(expected - shared_marks),
+        "failed_processes": sum(1 for process in workers if process.exitcode != 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=25, help="Check-in per proses per pasien")
+    parser.add_argument("--shared", type=int, default=3, help="Jumlah pasien yang ditulis semua proses")
+    parser.add_argument("--binary", action="store_true", help="Gunakan format biner .clpr")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="careloop-stress-")
+    try:
+        data_file = os.path.join(directory, "patients.clpr" if args.binary else "patients.json")
+        report = run_stress(data_file, args.processes, args.ops, args.shared)
+    finally:
+        shutil.rmtree(directory)
+
+    for key, value in report.items():
+        print(f"{key:<22} {value}")
+    ok = (report["patients"] == report["expected_patients"] and not report["lost_own_checkins"]
+          and not report["lost_shared_checkins"] and not report["failed_processes"])
+    print("OK: tidak ada pembaruan yang hilang" if ok else "GAGAL: ada pembaruan yang hilang")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
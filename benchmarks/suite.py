@@ -0,0 +1,218 @@
+"""
+Storage Benchmark Suite with Regression Thresholds
+Generates synthetic patient populations (1k, 10k and 100k patients by
+default) with realistic history lengths, times the PatientDataManager
+operations the chatbot uses on every turn, and compares the results with a
+JSON baseline.
+
+Mutating operations include the save_data() they trigger, since that is
+what a patient waits for. Every such write rewrites the whole data file, so
+at 100k patients they are repeated only a few times (see mutation_runs).
+The run exits with status 1 when an operation is slower than its baseline
+by more than the threshold.
+
+Usage:
+  python -m benchmarks.suite --save-baseline               # record benchmarks/baseline.json
+  python -m benchmarks.suite --sizes 1000 10000            # compare with the baseline
+  python -m benchmarks.suite --threshold 0.5 --format binary
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from patient_data_manager import PatientDataManager
+from record_format import BINARY_EXTENSION
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SYMPTOMS = ["demam", "batuk", "pilek", "sakit kepala", "diare", "mual", "muntah", "flu"]
+BODY_PARTS = ["kepala", "dada", "perut", "tenggorokan", "umum"]
+SEVERITIES = ["ringan", "sedang", "berat"]
+PLAN_TEXT = ("1. Istirahat yang cukup (minimal 8 jam tidur per hari)\n"
+             "2. Minum air putih minimal 2-3 liter per hari\n"
+             "\nUmum:\n- Monitor kondisi setiap hari dan laporkan perubahan\n")
+
+
+def generate_population(size: int, seed: int = 1, now: Optional[datetime.datetime] = None) -> Dict[str, Dict]:
+    """Generate patient records shaped like PatientDataManager's.
+
+    Most patients have one episode: one to three symptom reports, a plan per
+    report and up to a week of daily check-ins each revising the plan. One
+    in five has a second, older episode.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.datetime.now()
+    patients = {}
+    for i in range(size):
+        patient_id = f"P{i:012x}"
+        registered = now - datetime.timedelta(days=rng.randint(1, 365))
+        record = {
+            "personal_info": {"patient_id": patient_id, "name": f"Pasien {i}",
+                              "phone": f"08{rng.randrange(10**9, 10**10)}", "email": "",
+                              "registration_date": registered.isoformat()},
+            "symptoms_history": [], "treatment_plans": [], "checkin_history": [], "appointments": [],
+            "version": 1
+        }
+        episodes = 2 if rng.random() < 0.2 else 1
+        for episode in range(episodes):
+            start = registered + datetime.timedelta(days=40 * episode, hours=rng.randint(0, 23))
+            symptoms = rng.sample(SYMPTOMS, rng.randint(1, 3))
+            body_part = rng.choice(BODY_PARTS)
+            for report in range(rng.randint(1, 3)):
+                date = (start + datetime.timedelta(hours=report)).isoformat()
+                severity = rng.choice(SEVERITIES)
+                record["symptoms_history"].append({"date": date, "symptoms": symptoms,
+                                                   "body_part": body_part, "severity": severity})
+                record["treatment_plans"].append({"date": date, "plan": f"Rencana pengobatan untuk Pasien {i}:\n" + PLAN_TEXT,
+                                                  "based_on_symptoms": symptoms, "body_part": body_part,
+                                                  "severity": severity})
+            for day in range(1, rng.randint(1, 8)):
+                date = (start + datetime.timedelta(days=day)).isoformat()
+                severity = rng.choice(SEVERITIES)
+                record["checkin_history"].append({"date": date, "symptoms": symptoms, "body_part": body_part,
+                                                  "severity": severity, "type": "daily_checkin"})
+                record["treatment_plans"].append({"date": date,
+                                                  "plan": record["treatment_plans"][-1]["plan"] + "\n\nUpdate: Kondisi stabil, lanjutkan pengobatan.",
+                                                  "based_on_symptoms": symptoms, "body_part": body_part,
+                                                  "severity": severity,
+                                                  "revision_of": len(record["treatment_plans"]) - 1})
+        patients[patient_id] = record
+    return patients
+
+
+def _time_runs(action: Callable[[int], object], runs: int) -> Dict:
+    timings = []
+    for run in range(runs):
+        started = time.perf_counter()
+        action(run)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4)
+    }
+
+
+def mutation_runs(size: int, ops: int) -> int:
+    """Scale down the repetitions of writes, which cost a full save each"""
+    return max(3, min(ops, ops * 10_000 // size))
+
+
+def run_size(size: int, ops: int, load_runs: int, directory: str, data_format: str = "json") -> Dict[str, Dict]:
+    """Time every operation against a population of the given size"""
+    extension = BINARY_EXTENSION if data_format == "binary" else ".json"
+    data_file = os.path.join(directory, f"population-{size}{extension}")
+    manager = PatientDataManager(data_file)
+    manager.patients = generate_population(size)
+    manager.save_data()
+
+    rng = random.Random(size)
+    patient_ids = rng.sample(list(manager.patients), min(size, ops))
+    pick = lambda run: patient_ids[run % len(patient_ids)]
+    symptoms = ["demam", "batuk"]
+
+    writes = mutation_runs(size, ops)
+    results = {}
+    results["register_patient"] = _time_runs(
+        lambda run: manager.register_patient(f"Pasien Baru {run}"), writes)
+    results["add_symptom_report"] = _time_runs(
+        lambda run: manager.add_symptom_report(pick(run), symptoms, "kepala", "sedang"), writes)
+    results["generate_treatment_plan"] = _time_runs(
+        lambda run: manager.generate_treatment_plan(pick(run), symptoms, "kepala", "sedang"), writes)
+    results["revise_treatment_plan"] = _time_runs(
+        lambda run: manager.revise_treatment_plan(pick(run), ["batuk", "membaik"], "dada", "ringan"), writes)
+    results["get_symptom_history"] = _time_runs(
+        lambda run: manager.get_symptom_history(pick(run), 30), ops)
+    # Summaries were invalidated by the writes above, so each call rebuilds one
+    results["get_patient_summary"] = _time_runs(
+        lambda run: manager.get_patient_summary(pick(run)), ops)
+    results["load_data"] = _time_runs(lambda run: PatientDataManager(data_file), load_runs)
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float,
+            min_delta_ms: float = 0.05) -> List[str]:
+    """List the operations that got slower than the baseline by more than the threshold.
+
+    Keys are "<size>/<operation>". Differences below min_delta_ms are
+    ignored, so sub-millisecond lookups do not fail the run on timer noise.
+    """
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        current, previous = result["median_ms"], reference["median_ms"]
+        if current > previous * (1 + threshold) and current - previous > min_delta_ms:
+            regressions.append(f"{key}: {previous:.3f} ms -> {current:.3f} ms "
+                               f"(+{100 * (current / previous - 1):.0f}%)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark penyimpanan data pasien CareLoopAI")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--ops", type=int, default=20, help="Jumlah pengulangan per operasi")
+    parser.add_argument("--load-runs", type=int, default=3, help="Jumlah pengulangan load_data")
+    parser.add_argument("--format", choices=["json", "binary"], default="json", dest="data_format")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="File baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Tulis hasil sebagai baseline baru")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Regresi yang diizinkan terhadap baseline, 0.25 = 25%%")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05,
+                        help="Abaikan selisih di bawah nilai ini (ms)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    directory = tempfile.mkdtemp(prefix="careloop-bench-")
+    try:
+        for size in args.sizes:
+            print(f"== {size:,} pasien ==")
+            for operation, result in run_size(size, args.ops, args.load_runs, directory, args.data_format).items():
+                results[f"{size}/{operation}"] = result
+                print(f"  {operation:<26} median {result['median_ms']:10.3f} ms   "
+                      f"p95 {result['p95_ms']:10.3f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+    if args.save_baseline:
+        baseline = {
+            "created": datetime.datetime.now().isoformat(),
+            "format": args.data_format,
+            "results": results
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline disimpan di {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Belum ada baseline di {args.baseline}; jalankan dengan --save-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("format", "json") != args.data_format:
+        print(f"Baseline memakai format {baseline.get('format')}, bukan {args.data_format}")
+        return 1
+
+    regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"Regresi lebih dari {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("Tidak ada regresi terhadap baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
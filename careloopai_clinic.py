@@ -1,59 +1,169 @@
 """
 Main Application for CareLoopAI Clinic Chatbot
 This file integrates all components of the clinic chatbot system.
+
+The patient data manager (which loads the whole data file) and the image
+processor (which will load vision models) are created on first use, so a
+session can greet the patient before either is ready. Pass warm_up=True to
+build them in a background thread while the patient types.
+
+The replies that wait on saves (symptom reports, check-ins) and the plan and
+summary views also come as generators, stream_*, that yield each section
+of the reply once it is ready; the web front end sends these as they come.
+
+The methods that change patient data take an optional idempotency_key, kept
+in the manager's dedupe index (see idempotency.py): a repeat returns the
+original reply, and the changes of one keyed turn are saved at once.
 """
 
-import json
-import datetime
-from patient_data_manager import PatientDataManager
-from image_processor import SymptomImageProcessor
+import threading
+import metrics
+import profiling
+from patient_index import DuplicatePatientError
+from appointment_scheduler import SchedulingError, format_date_time
+from idempotency import idempotent
 
 class CareLoopAIClinic:
-    def __init__(self):
-        self.patient_manager = PatientDataManager()
-        self.image_processor = SymptomImageProcessor()
+    def __init__(self, patient_manager=None, warm_up=False):
+        # Sessions can share one manager, e.g. the load generator's
+        self._patient_manager = patient_manager
+        self._image_processor = None
+        self._component_lock = threading.Lock()
         self.current_patient = None
+        self.current_patient_id = None
+        # State of the conversation in dialogue_fsm's machine; None until the patient first writes
+        self.dialogue_state = None
+        if warm_up:
+            self.start_warm_up()
+    
+    @property
+    def patient_manager(self):
+        if self._patient_manager is None:
+            with self._component_lock:
+                if self._patient_manager is None:
+                    from patient_data_manager import PatientDataManager
+                    self._patient_manager = PatientDataManager()
+        return self._patient_manager
+    
+    @patient_manager.setter
+    def patient_manager(self, patient_manager):
+        self._patient_manager = patient_manager
+    
+    @property
+    def image_processor(self):
+        if self._image_processor is None:
+            with self._component_lock:
+                if self._image_processor is None:
+                    from image_processor import SymptomImageProcessor
+                    self._image_processor = SymptomImageProcessor()
+        return self._image_processor
+    
+    def start_warm_up(self):
+        """Build the heavy components in a daemon thread; first use waits for it"""
+        def warm_up():
+            try:
+                self.patient_manager
+                self.image_processor
+            except Exception:
+                pass  # first use builds it again and reports the error there
+        thread = threading.Thread(target=warm_up, name="clinic-warm-up", daemon=True)
+        thread.start()
+        return thread
+    
+    def run_idempotent(self, key, operation, arguments, call):
+        """Run a keyed call through the manager's dedupe index, scoped to the current patient"""
+        return self.patient_manager.run_idempotent(key, operation, [self.current_patient_id, arguments], call)
     
     def greet_patient(self):
         """Greet the patient and ask for their name"""
         return "Halo! Selamat datang di klinik CareLoopAI. Saya asisten virtual Anda yang akan membantu memantau kondisi kesehatan Anda. Boleh tahu nama Anda?"
     
-    def register_patient(self, name, phone="", email=""):
-        """Register a new patient"""
-        self.patient_manager.register_patient(name, phone, email)
-        self.current_patient = name
-        return f"Terima kasih, {name}. Sekarang, bolehkah Anda menjelaskan gejala yang Anda alami?"
+    def register_patient(self, name, phone="", email="", idempotency_key=None):
+        """Register a new patient, or recognize a returning one by phone, email or name.
+        
+        A retried registration with the same idempotency key gets the patient the first one made.
+        """
+        patient_id = (self.patient_manager.find_by_phone(phone)
+                      or self.patient_manager.find_by_email(email))
+        if patient_id is None and not phone and not email:
+            matches = self.patient_manager.find_by_name(name)
+            if len(matches) > 1:
+                return (f"Ada beberapa pasien bernama {name}. "
+                        "Mohon sebutkan nomor telepon atau email Anda agar kami dapat menemukan data Anda.")
+            if matches:
+                patient_id = matches[0]
+        
+        if patient_id is None:
+            try:
+                patient_id = self.patient_manager.register_patient(name, phone, email,
+                                                                   idempotency_key=idempotency_key)
+            except DuplicatePatientError:
+                return "Maaf, nomor telepon atau email tersebut sudah terdaftar atas nama pasien lain."
+        
+        self.current_patient = self.patient_manager.patients[patient_id]["personal_info"]["name"]
+        self.current_patient_id = patient_id
+        return f"Terima kasih, {self.current_patient}. Sekarang, bolehkah Anda menjelaskan gejala yang Anda alami?"
     
+    @idempotent
     def report_symptoms(self, symptoms, body_part="", severity="sedang"):
         """Handle symptom reporting and generate initial treatment plan"""
+        return "".join(self.stream_report_symptoms(symptoms, body_part, severity))
+    
+    def stream_report_symptoms(self, symptoms, body_part="", severity="sedang"):
+        """Like report_symptoms, yielding each section of the reply as soon as it is ready"""
         if not self.current_patient:
-            return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            yield "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            return
+        
+        # The opening needs nothing saved, so the patient sees it while the report is written
+        yield "Berdasarkan gejala yang Anda alami, berikut rencana pengobatan:\n\n"
         
         # Add symptom report
-        self.patient_manager.add_symptom_report(self.current_patient, symptoms, body_part, severity)
+        self.patient_manager.add_symptom_report(self.current_patient_id, symptoms, body_part, severity)
         
         # Generate treatment plan
-        treatment_plan = self.patient_manager.generate_treatment_plan(
-            self.current_patient, symptoms, body_part, severity
+        yield self.patient_manager.generate_treatment_plan(
+            self.current_patient_id, symptoms, body_part, severity
         )
         
-        return f"Berdasarkan gejala yang Anda alami, berikut rencana pengobatan:\n\n{treatment_plan}\n\nSaya akan mengirimkan update rencana pengobatan setiap hari berdasarkan laporan Anda."
+        yield "\n\nSaya akan mengirimkan update rencana pengobatan setiap hari berdasarkan laporan Anda."
     
+    @idempotent
     def daily_checkin(self, symptoms, body_part="", severity="sedang"):
         """Handle daily checkin and revise treatment plan"""
+        return "".join(self.stream_daily_checkin(symptoms, body_part, severity))
+    
+    def stream_daily_checkin(self, symptoms, body_part="", severity="sedang"):
+        """Like daily_checkin, yielding each section of the reply as soon as it is ready"""
         if not self.current_patient:
-            return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            yield "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            return
+        
+        yield "Terima kasih atas update harian Anda. Berikut rencana pengobatan yang telah diperbarui:\n\n"
         
         # Add daily checkin
-        self.patient_manager.add_daily_checkin(self.current_patient, symptoms, body_part, severity)
+        self.patient_manager.add_daily_checkin(self.current_patient_id, symptoms, body_part, severity)
         
         # Revise treatment plan
-        revised_plan = self.patient_manager.revise_treatment_plan(
-            self.current_patient, symptoms, body_part, severity
+        yield self.patient_manager.revise_treatment_plan(
+            self.current_patient_id, symptoms, body_part, severity
         )
         
-        return f"Terima kasih atas update harian Anda. Berikut rencana pengobatan yang telah diperbarui:\n\n{revised_plan}\n\nBerdasarkan perkembangan Anda, kunjungan ulang ke klinik tidak diperlukan saat ini."
+        decision = self.patient_manager.check_followup_needed(self.current_patient_id)
+        
+        yield f"\n\n{self._format_followup(decision)}"
     
+    def _format_followup(self, decision):
+        """Turn a follow-up decision into a message for the patient"""
+        if not decision.needed:
+            return "Berdasarkan perkembangan Anda, kunjungan ulang ke klinik tidak diperlukan saat ini."
+        
+        reasons = "\n".join(f"- {reason}" for reason in decision.reasons)
+        return ("Berdasarkan perkembangan Anda, kami menyarankan kunjungan langsung ke klinik:\n"
+                f"{reasons}\n"
+                "Ketik 'jadwal janji' untuk menjadwalkan kunjungan.")
+    
+    @idempotent
     def process_symptom_photo(self, image_data):
         """Process a symptom photo and update treatment plan"""
         # Process the image
@@ -65,8 +175,11 @@ class CareLoopAIClinic:
         
         # Add to symptom history
         if self.current_patient:
+            self.patient_manager.record_photo(
+                self.current_patient_id, result['findings']['tingkat_keparahan']
+            )
             self.patient_manager.add_symptom_report(
-                self.current_patient, symptoms, "area_terdampak", "sedang"
+                self.current_patient_id, symptoms, "area_terdampak", "sedang"
             )
         
         return (f"{result['message']}\n"
@@ -75,63 +188,90 @@ class CareLoopAIClinic:
     
     def get_treatment_plan(self):
         """Get the current treatment plan for the patient"""
+        return "".join(self.stream_treatment_plan())
+    
+    def stream_treatment_plan(self):
+        """Like get_treatment_plan, yielding each section of the reply as soon as it is ready"""
         if not self.current_patient:
-            return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            yield "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            return
         
-        plan = self.patient_manager.get_latest_treatment_plan(self.current_patient)
+        plan = self.patient_manager.get_latest_treatment_plan(self.current_patient_id)
         if plan:
-            return f"Rencana pengobatan Anda saat ini:\n\n{plan}"
+            yield "Rencana pengobatan Anda saat ini:\n\n"
+            yield plan
         else:
-            return "Saya belum memiliki rencana pengobatan untuk Anda. Silakan laporkan gejala Anda terlebih dahulu."
+            yield "Saya belum memiliki rencana pengobatan untuk Anda. Silakan laporkan gejala Anda terlebih dahulu."
     
-    def schedule_appointment(self, date_time, reason="Perlu pemeriksaan langsung"):
-        """Schedule an appointment for the patient"""
+    @idempotent
+    def schedule_appointment(self, date_time=None, reason="Perlu pemeriksaan langsung"):
+        """Schedule an appointment for the patient, at the earliest free slot if no time is given"""
         if not self.current_patient:
             return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
         
-        result = self.patient_manager.schedule_appointment(self.current_patient, date_time, reason)
+        try:
+            result = self.patient_manager.schedule_appointment(self.current_patient_id, date_time, reason)
+        except SchedulingError as e:
+            earliest = self.patient_manager.scheduler.find_earliest_slot()
+            suggestion = f" Jadwal kosong terdekat: {format_date_time(earliest[0])}." if earliest else ""
+            return f"Maaf, {str(e)[0].lower()}{str(e)[1:]}.{suggestion}"
         return f"{result} Silakan datang 15 menit sebelum waktu yang dijadwalkan. Bawa kartu identitas dan riwayat pengobatan Anda."
     
+    @idempotent
+    def cancel_appointment(self, appointment_id=None):
+        """Cancel an appointment of the patient, the latest scheduled one if no ID is given"""
+        if not self.current_patient:
+            return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+        
+        if appointment_id is None:
+            appointments = self.patient_manager.get_patient_data(self.current_patient_id)["appointments"]
+            scheduled = [a for a in appointments if a["status"] == "scheduled" and a.get("appointment_id")]
+            if not scheduled:
+                return "Anda tidak memiliki jadwal kunjungan yang aktif."
+            appointment_id = scheduled[-1]["appointment_id"]
+        
+        try:
+            return self.patient_manager.cancel_appointment(self.current_patient_id, appointment_id)
+        except SchedulingError as e:
+            return f"Maaf, {str(e)[0].lower()}{str(e)[1:]}."
+    
     def check_followup_needed(self):
         """Check if a follow-up visit is needed"""
         if not self.current_patient:
             return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
         
-        # In a real implementation, this would analyze the patient's progress
-        # For now, we'll return a generic response
-        return "Berdasarkan perkembangan Anda, kunjungan ulang ke klinik tidak diperlukan saat ini. Rencana pengobatan telah diperbarui secara otomatis."
+        decision = self.patient_manager.check_followup_needed(self.current_patient_id)
+        if decision.needed:
+            return self._format_followup(decision)
+        
+        return f"{self._format_followup(decision)} Rencana pengobatan telah diperbarui secara otomatis."
     
     def get_patient_summary(self):
         """Get a summary of the patient's condition and treatment"""
+        return "".join(self.stream_patient_summary())
+    
+    def stream_patient_summary(self):
+        """Like get_patient_summary, yielding the heading before the summary is built"""
         if not self.current_patient:
-            return "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
-        
-        patient_data = self.patient_manager.get_patient_data(self.current_patient)
-        if not patient_data:
-            return "Data pasien tidak ditemukan."
-        
-        # Get latest treatment plan
-        treatment_plan = self.patient_manager.get_latest_treatment_plan(self.current_patient)
-        
-        # Get recent symptom history
-        symptom_history = self.patient_manager.get_symptom_history(self.current_patient, 7)
-        
-        summary = f"Ringkasan kondisi Anda, {self.current_patient}:\n\n"
-        
-        if treatment_plan:
-            summary += f"Rencana Pengobatan:\n{treatment_plan[:200]}...\n\n"
+            yield "Maaf, saya belum tahu nama Anda. Boleh tahu nama Anda terlebih dahulu?"
+            return
         
-        if symptom_history:
-            summary += "Riwayat Gejala (7 hari terakhir):\n"
-            for entry in symptom_history[-3:]:  # Show last 3 entries
-                date = datetime.datetime.fromisoformat(entry['date']).strftime('%d %b %Y')
-                symptoms = ', '.join(entry['symptoms'])
-                summary += f"- {date}: {symptoms} ({entry['severity']})\n"
+        record = self.patient_manager.get_patient_data(self.current_patient_id)
+        if not record:
+            yield "Data pasien tidak ditemukan."
+            return
         
-        return summary
+        # The summary text starts with this heading
+        heading = f"Ringkasan kondisi Anda, {record['personal_info']['name']}:\n\n"
+        yield heading
+        summary = self.patient_manager.get_patient_summary(self.current_patient_id)
+        if summary:
+            yield summary["text"][len(heading):]
 
 # Example usage and testing
+@profiling.profiled("careloopai_clinic")
 def main():
+    metrics.configure_from_env()
     clinic = CareLoopAIClinic()
     
     print("=== CareLoopAI Clinic Chatbot ===")
@@ -157,7 +297,7 @@ def main():
     print("\nBot:", clinic.get_patient_summary())
     
     # Schedule appointment
-    print("\nBot:", clinic.schedule_appointment("2023-06-15 10:00"))
+    print("\nBot:", clinic.schedule_appointment())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
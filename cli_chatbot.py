@@ -2,11 +2,19 @@
 Command Line Interface for CareLoopAI Clinic Chatbot
 """
 
+import os
+import re
 import sys
+import dialogue_fsm
+import metrics
+import profiling
 from careloopai_clinic import CareLoopAIClinic
 
+@profiling.profiled("cli_chatbot")
 def main():
-    clinic = CareLoopAIClinic()
+    metrics.configure_from_env()
+    # Load patient data in the background while the patient types their name
+    clinic = CareLoopAIClinic(warm_up=os.environ.get("CARELOOP_WARM_UP", "1") != "0")
     
     print("=== CareLoopAI Clinic Chatbot ===")
     print("Selamat datang di asisten kesehatan virtual kami!")
@@ -31,7 +39,8 @@ def main():
                 print("- laporkan gejala [gejala] - Laporkan gejala yang Anda alami")
                 print("- checkin harian [kondisi] - Update kondisi harian Anda")
                 print("- rencana pengobatan - Lihat rencana pengobatan Anda")
-                print("- jadwal janji - Jadwalkan kunjungan ke klinik")
+                print("- jadwal janji [YYYY-MM-DD HH:MM] - Jadwalkan kunjungan ke klinik")
+                print("- batalkan janji - Batalkan jadwal kunjungan terakhir")
                 print("- ringkasan - Lihat ringkasan kondisi Anda")
                 print("- foto gejala - Kirim foto gejala (simulasi)")
                 print("- bantuan - Tampilkan bantuan ini")
@@ -48,34 +57,100 @@ def main():
         except Exception as e:
             print(f"Bot: Maaf, terjadi kesalahan: {str(e)}")
 
+DEFAULT_REPLY = ("Maaf, saya belum memahami permintaan Anda. "
+                 "Anda bisa mencoba perintah seperti:\n"
+                 "- 'Nama saya [nama Anda]'\n"
+                 "- 'laporkan gejala [gejala Anda]'\n"
+                 "- 'checkin harian [kondisi Anda]'\n"
+                 "- 'rencana pengobatan'\n"
+                 "- 'jadwal janji'\n"
+                 "- 'bantuan' untuk melihat semua perintah")
+
+NAME_PROMPT = "Silakan beri tahu saya nama Anda dengan format: 'Nama saya [nama Anda]'"
+
+
+def _revise_treatment_plan(clinic, intent, values):
+    if intent == "daily_checkin":
+        return clinic.daily_checkin(values["symptoms"])
+    if intent == "ask_followup":
+        return clinic.check_followup_needed()
+    return clinic.get_treatment_plan()
+
+
+def _stream_revised_treatment_plan(clinic, intent, values):
+    if intent == "daily_checkin":
+        return clinic.stream_daily_checkin(values["symptoms"])
+    if intent == "ask_followup":
+        return clinic.check_followup_needed()
+    return clinic.stream_treatment_plan()
+
+
+# How the CLI runs the steps of the stories and rules. The clinic's replies
+# already say what the utterance after each action says, so those are silent.
+STEPS = {
+    "utter_greet": lambda clinic, intent, values: clinic.greet_patient(),
+    "patient_name": lambda clinic, intent, values: (clinic.register_patient(values["name"])
+                                                    if values.get("name") else NAME_PROMPT),
+    "utter_ask_symptoms": None,
+    "action_generate_treatment_plan": lambda clinic, intent, values: clinic.report_symptoms(values["symptoms"]),
+    "action_revise_treatment_plan": _revise_treatment_plan,
+    "utter_provide_treatment": None,
+    "utter_followup_not_needed": None,
+    "action_schedule_appointment": lambda clinic, intent, values: clinic.schedule_appointment(values.get("date_time")),
+    "utter_appointment_scheduled": None,
+    "action_process_symptom_photo": lambda clinic, intent, values: clinic.process_symptom_photo("simulated_image.jpg"),
+    # The patient summary is a CLI command, not a step of the stories
+    "patient_summary": lambda clinic, intent, values: clinic.get_patient_summary(),
+}
+
+# The same steps with the replies the web front end streams section by section
+STREAM_STEPS = dict(
+    STEPS,
+    action_generate_treatment_plan=lambda clinic, intent, values: clinic.stream_report_symptoms(values["symptoms"]),
+    action_revise_treatment_plan=_stream_revised_treatment_plan,
+    patient_summary=lambda clinic, intent, values: clinic.stream_patient_summary(),
+)
+
+
 def process_user_input(clinic, user_input):
     """Process user input and generate appropriate response"""
+    return "".join(_route(clinic, user_input, STEPS))
+
+
+def stream_user_input(clinic, user_input):
+    """Process user input and yield the sections of the response as they are ready"""
+    return _route(clinic, user_input, STREAM_STEPS)
+
+
+def _route(clinic, user_input, steps):
+    """Answer the input with the given steps, as an iterable of sections"""
     lower_input = user_input.lower()
+    intents = ()
+    values = {}
     
     # Registration
     if "nama saya" in lower_input:
-        name = user_input.split("nama saya", 1)[1].strip()
-        if name:
-            return clinic.register_patient(name)
-        else:
-            return "Silakan beri tahu saya nama Anda dengan format: 'Nama saya [nama Anda]'"
+        # Slice the original input so "Nama saya" works and the name keeps its case
+        name = user_input[lower_input.index("nama saya") + len("nama saya"):].strip()
+        if not name:
+            return [NAME_PROMPT]
+        intents, values = ("inform_name",), {"name": name}
+    
+    # Photo submission (simulated); checked before symptom reporting since
+    # "foto gejala" also mentions "gejala"
+    elif "foto" in lower_input:
+        intents = ("inform_photo",)
     
     # Symptom reporting
-    if "laporkan gejala" in lower_input or "gejala" in lower_input:
-        # Extract symptoms (simplified)
-        if "gejala" in lower_input:
-            symptoms_text = lower_input.split("gejala", 1)[1].strip()
-        else:
-            symptoms_text = lower_input
-        
+    elif "laporkan gejala" in lower_input or "gejala" in lower_input:
+        symptoms_text = lower_input.split("gejala", 1)[1].strip()
         symptoms = [s.strip() for s in symptoms_text.split(",") if s.strip()]
-        if symptoms:
-            return clinic.report_symptoms(symptoms)
-        else:
-            return "Silakan laporkan gejala yang Anda alami, contoh: 'laporkan gejala demam, batuk, sakit kepala'"
+        if not symptoms:
+            return ["Silakan laporkan gejala yang Anda alami, contoh: 'laporkan gejala demam, batuk, sakit kepala'"]
+        intents, values = ("inform_symptoms",), {"symptoms": symptoms}
     
     # Daily checkin
-    if "checkin harian" in lower_input or "kondisi hari ini" in lower_input:
+    elif "checkin harian" in lower_input or "kondisi hari ini" in lower_input:
         # Extract condition description
         if "checkin harian" in lower_input:
             condition_text = lower_input.split("checkin harian", 1)[1].strip()
@@ -83,37 +158,51 @@ def process_user_input(clinic, user_input):
             condition_text = lower_input
         
         symptoms = [s.strip() for s in condition_text.split(",") if s.strip()]
-        if symptoms:
-            return clinic.daily_checkin(symptoms)
-        else:
-            return "Silakan update kondisi harian Anda, contoh: 'checkin harian batuk membaik, tidak demam'"
+        if not symptoms:
+            return ["Silakan update kondisi harian Anda, contoh: 'checkin harian batuk membaik, tidak demam'"]
+        intents, values = ("daily_checkin",), {"symptoms": symptoms}
     
     # Treatment plan
-    if "rencana pengobatan" in lower_input or "pengobatan" in lower_input:
-        return clinic.get_treatment_plan()
+    elif "rencana pengobatan" in lower_input or "pengobatan" in lower_input:
+        intents = ("ask_treatment",)
+    
+    # Appointment cancellation is a CLI command outside the Rasa domain
+    elif "batalkan janji" in lower_input:
+        return [clinic.cancel_appointment()]
     
     # Appointment scheduling
-    if "jadwal janji" in lower_input or "janji temu" in lower_input:
-        # In a real implementation, we would extract date/time
-        return clinic.schedule_appointment("2023-06-15 10:00")
+    elif "jadwal janji" in lower_input or "janji temu" in lower_input:
+        # Use the requested date/time if given, otherwise the earliest free slot
+        match = re.search(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}", user_input)
+        intents, values = ("request_appointment",), {"date_time": match.group(0) if match else None}
     
-    # Patient summary
-    if "ringkasan" in lower_input:
-        return clinic.get_patient_summary()
+    # Patient summary, also a CLI command
+    elif "ringkasan" in lower_input:
+        reply = steps["patient_summary"](clinic, None, values)
+        return [reply] if isinstance(reply, str) else reply
     
-    # Photo submission (simulated)
-    if "foto" in lower_input:
-        return clinic.process_symptom_photo("simulated_image.jpg")
+    # Anything else said exactly as in the NLU training examples
+    else:
+        intents = dialogue_fsm.default_examples().get(dialogue_fsm.normalize(user_input), ())
+        values = {"symptoms": [lower_input.strip()]}
     
-    # Default response
-    return ("Maaf, saya belum memahami permintaan Anda. "
-            "Anda bisa mencoba perintah seperti:\n"
-            "- 'Nama saya [nama Anda]'\n"
-            "- 'laporkan gejala [gejala Anda]'\n"
-            "- 'checkin harian [kondisi Anda]'\n"
-            "- 'rencana pengobatan'\n"
-            "- 'jadwal janji'\n"
-            "- 'bantuan' untuk melihat semua perintah")
+    # The conversation flow comes from the Rasa stories and rules
+    machine = dialogue_fsm.default_machine()
+    state = clinic.dialogue_state if clinic.dialogue_state is not None else machine.opening_state()
+    intent = machine.choose(state, intents)
+    if intent is None:
+        return [DEFAULT_REPLY]
+    clinic.dialogue_state, sections = machine.stream(state, intent, steps, clinic, values)
+    return _or_default(sections)
+
+
+def _or_default(sections):
+    said = False
+    for section in sections:
+        said = True
+        yield section
+    if not said:
+        yield DEFAULT_REPLY
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
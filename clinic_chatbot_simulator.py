@@ -7,11 +7,39 @@ without requiring Rasa to be installed.
 
 import json
 import datetime
+import dialogue_fsm
+from file_sync import FileLock, atomic_write, read_bytes
+
+
+def _revise_treatment_plan(bot, intent, values):
+    if intent == "daily_checkin":
+        return bot.daily_checkin(values["symptoms"])
+    if intent == "ask_treatment":
+        return bot.ask_treatment()
+    return None
+
+
+# How the simulator runs the steps of the stories and rules; photos and
+# appointments need the full clinic (careloopai_clinic.py)
+STEPS = {
+    "utter_greet": lambda bot, intent, values: bot.greet(),
+    "patient_name": lambda bot, intent, values: bot.set_patient_name(values.get("name", "Pasien")),
+    "utter_ask_symptoms": None,
+    "action_generate_treatment_plan": lambda bot, intent, values: bot.report_symptoms(values["symptoms"]),
+    "action_revise_treatment_plan": _revise_treatment_plan,
+    "utter_provide_treatment": None,
+    "utter_followup_not_needed": lambda bot, intent, values: (
+        None if intent == "daily_checkin" else dialogue_fsm.default_machine().responses["utter_followup_not_needed"]),
+    "action_process_symptom_photo": lambda bot, intent, values: "Maaf, analisis foto belum tersedia di simulator.",
+    "action_schedule_appointment": lambda bot, intent, values: "Maaf, penjadwalan kunjungan belum tersedia di simulator.",
+    "utter_appointment_scheduled": None,
+}
 
 class ClinicChatbotSimulator:
     def __init__(self):
         self.patient_data = {}
         self.current_patient = None
+        self.dialogue_state = dialogue_fsm.START
         
     def greet(self):
         return "Halo! Selamat datang di klinik CareLoopAI. Saya asisten virtual Anda yang akan membantu memantau kondisi kesehatan Anda. Boleh tahu nama Anda?"
@@ -104,9 +132,45 @@ class ClinicChatbotSimulator:
         
         return f"Rencana pengobatan Anda saat ini:\n\n{self.patient_data[self.current_patient]['treatment_plan']}"
     
+    def respond(self, user_input):
+        """Reply to a message, following the flow of the Rasa stories and rules"""
+        lower_input = user_input.lower()
+        values = {"symptoms": lower_input.split()}
+        
+        # Simple intent recognition
+        if "halo" in lower_input or "hai" in lower_input:
+            intents = ("greet",)
+        elif lower_input.startswith("nama saya"):
+            intents = ("inform_name",)
+            values["name"] = user_input.split(" ", 2)[2] if len(user_input.split(" ")) > 2 else "Pasien"
+        elif "demam" in lower_input or "batuk" in lower_input:
+            intents = ("inform_symptoms",)
+        elif "membaik" in lower_input or "memburuk" in lower_input:
+            intents = ("daily_checkin",)
+        elif "pengobatan" in lower_input:
+            intents = ("ask_treatment",)
+        else:
+            intents = dialogue_fsm.default_examples().get(dialogue_fsm.normalize(user_input), ())
+        
+        machine = dialogue_fsm.default_machine()
+        intent = machine.choose(self.dialogue_state, intents)
+        if intent is not None:
+            self.dialogue_state, reply = machine.respond(self.dialogue_state, intent, STEPS, self, values)
+            if reply:
+                return reply
+        return "Maaf, saya belum memahami permintaan Anda. Bisa jelaskan lagi?"
+    
     def save_data(self, filename="patient_data.json"):
-        with open(filename, 'w') as f:
-            json.dump(self.patient_data, f, indent=2)
+        # Other processes may have saved since we loaded: keep their patients,
+        # and the newer record where both updated the same one
+        with FileLock(filename):
+            content, _ = read_bytes(filename)
+            saved = json.loads(content) if content else {}
+            for name, record in self.patient_data.items():
+                theirs = saved.get(name)
+                if not isinstance(theirs, dict) or theirs.get("last_updated", "") <= record.get("last_updated", ""):
+                    saved[name] = record
+            atomic_write(filename, json.dumps(saved, indent=2).encode("utf-8"))
     
     def load_data(self, filename="patient_data.json"):
         try:
@@ -123,6 +187,7 @@ def main():
     print("Ketik 'quit' untuk keluar\n")
     
     print(bot.greet())
+    bot.dialogue_state = dialogue_fsm.default_machine().opening_state()
     
     while True:
         user_input = input("\nAnda: ").strip()
@@ -130,22 +195,7 @@ def main():
         if user_input.lower() == 'quit':
             break
             
-        # Simple intent recognition
-        if "halo" in user_input.lower() or "hai" in user_input.lower():
-            print("Bot:", bot.greet())
-        elif user_input.lower().startswith("nama saya"):
-            name = user_input.split(" ", 2)[2] if len(user_input.split(" ")) > 2 else "Pasien"
-            print("Bot:", bot.set_patient_name(name))
-        elif "demam" in user_input.lower() or "batuk" in user_input.lower():
-            symptoms = user_input.lower().split()
-            print("Bot:", bot.report_symptoms(symptoms))
-        elif "membaik" in user_input.lower() or "memburuk" in user_input.lower():
-            symptoms = user_input.lower().split()
-            print("Bot:", bot.daily_checkin(symptoms))
-        elif "pengobatan" in user_input.lower():
-            print("Bot:", bot.ask_treatment())
-        else:
-            print("Bot: Maaf, saya belum memahami permintaan Anda. Bisa jelaskan lagi?")
+        print("Bot:", bot.respond(user_input))
     
     # Save data before exiting
     bot.save_data()
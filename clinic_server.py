@@ -0,0 +1,250 @@
+"""
+HTTP Server for CareLoopAI Clinic
+A small JSON API over PatientDataManager for dashboards and the web front end.
+
+Endpoints:
+  GET /patients/<id>/summary     Materialized patient summary (a unique patient
+                                 name is accepted too). Responses carry an
+                                 ETag; send it back as If-None-Match to get a
+                                 304 Not Modified while nothing has changed.
+  GET /metrics                   Operation latencies and storage I/O in the
+                                 Prometheus text format (start with --metrics).
+  GET /                          The chat page, clinic_chatbot.html.
+  POST /chat                     One chat turn, {"session": ..., "message": ...};
+                                 answers {"session": ..., "reply": ...} once the
+                                 whole reply is ready. Leave out the session to
+                                 start one.
+  POST /chat/stream              The same turn as Server-Sent Events: a "chunk"
+                                 event per section of the reply as soon as it is
+                                 ready, then "done" with the session (or "error").
+
+A chat turn sent with an Idempotency-Key header is run once: a retry with
+the same key gets the original reply (streamed as one chunk) instead of
+reporting the symptoms or checking in again. Reusing a key for another
+message is answered with 409 Conflict (an "error" event on /chat/stream).
+
+Usage: python clinic_server.py [--port 8000] [--metrics]
+"""
+
+import argparse
+import json
+import os
+import threading
+import uuid
+import metrics
+import profiling
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from careloopai_clinic import CareLoopAIClinic
+from cli_chatbot import process_user_input, stream_user_input
+from idempotency import IdempotencyKeyReused
+from patient_data_manager import PatientDataManager
+from patient_index import AmbiguousPatientError
+
+CHAT_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clinic_chatbot.html")
+# Chat sessions kept in memory; the least recently used is dropped beyond this
+MAX_CHAT_SESSIONS = 10000
+
+
+class ChatSessions:
+    """The chat sessions of the web front end, each a CareLoopAIClinic on the shared manager"""
+
+    def __init__(self, patient_manager, max_sessions=MAX_CHAT_SESSIONS):
+        self.patient_manager = patient_manager
+        self.max_sessions = max_sessions
+        # session ID -> (clinic, lock held while a turn of the session runs)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id=None, new_session_id=None):
+        """Get a session's ID, clinic and lock, starting a new session (new_session_id if given) for an unknown ID"""
+        with self._lock:
+            for known in (session_id, new_session_id):
+                if known in self._sessions:
+                    self._sessions.move_to_end(known)
+                    return (known,) + self._sessions[known]
+            session_id = new_session_id or uuid.uuid4().hex
+            self._sessions[session_id] = (CareLoopAIClinic(self.patient_manager), threading.Lock())
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return (session_id,) + self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class ClinicRequestHandler(BaseHTTPRequestHandler):
+    # Set by create_server
+    patient_manager = None
+    chat_sessions = None
+    # Send each streamed event at once instead of waiting to fill a packet
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        parts = [unquote(part) for part in urlparse(self.path).path.strip("/").split("/")]
+        if len(parts) == 3 and parts[0] == "patients" and parts[2] == "summary":
+            self.send_summary(parts[1])
+        elif parts == ["metrics"]:
+            self.send_metrics()
+        elif parts in ([""], ["clinic_chatbot.html"]):
+            self.send_chat_page()
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path not in ("/chat", "/chat/stream"):
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            body = None
+        message = body.get("message") if isinstance(body, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            self.send_json(400, {"error": "Pesan tidak boleh kosong"})
+            return
+
+        key = self.headers.get("Idempotency-Key")
+        arguments = [body.get("session"), message]
+        # A retried turn that started a session gets the session the first one started
+        new_session_id = uuid.uuid5(uuid.NAMESPACE_OID, key).hex if key else None
+        session_id, clinic, lock = self.chat_sessions.get(body.get("session"), new_session_id)
+        # One turn at a time per session, so the dialogue state stays in order
+        with lock:
+            if path == "/chat":
+                self.send_chat_reply(session_id, lambda: self.patient_manager.run_idempotent(
+                    key, "chat", arguments, lambda: process_user_input(clinic, message.strip())))
+            else:
+                self.send_chat_stream(session_id, self.patient_manager.stream_idempotent(
+                    key, "chat", arguments, lambda: stream_user_input(clinic, message.strip())))
+
+    def send_chat_reply(self, session_id, turn):
+        """Send the reply of a chat turn as JSON, or the error the turn raised"""
+        try:
+            reply = turn()
+        except IdempotencyKeyReused as e:
+            self.send_json(409, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"Maaf, terjadi kesalahan: {str(e)}"})
+            return
+        self.send_json(200, {"session": session_id, "reply": reply})
+
+    def send_chat_stream(self, session_id, sections):
+        """Send the sections of a reply as Server-Sent Events as they are yielded"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        # No Content-Length: the body ends when the connection closes
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for section in sections:
+                self.send_event("chunk", section)
+            self.send_event("done", {"session": session_id})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client left; closing the generator below stops the reply
+        except Exception as e:
+            self.send_event("error", f"Maaf, terjadi kesalahan: {str(e)}")
+        finally:
+            if hasattr(sections, "close"):
+                sections.close()
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def send_chat_page(self):
+        with open(CHAT_PAGE, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_summary(self, patient_id):
+        """Send a patient summary, honoring If-None-Match"""
+        try:
+            summary = self.patient_manager.get_patient_summary(patient_id)
+        except AmbiguousPatientError as e:
+            self.send_json(409, {"error": str(e)})
+            return
+        if summary is None:
+            self.send_json(404, {"error": "Pasien tidak ditemukan"})
+            return
+
+        if self.headers.get("If-None-Match") == summary["etag"]:
+            self.send_response(304)
+            self.send_header("ETag", summary["etag"])
+            self.end_headers()
+            return
+
+        self.send_json(200, summary, {"ETag": summary["etag"], "Cache-Control": "no-cache"})
+
+    def send_metrics(self):
+        """Send the recorded metrics in the Prometheus text format"""
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; dashboards poll frequently
+        pass
+
+
+def create_server(host="127.0.0.1", port=8000, patient_manager=None):
+    """Create an HTTP server bound to a PatientDataManager"""
+    patient_manager = patient_manager or PatientDataManager()
+    handler = type("BoundClinicRequestHandler", (ClinicRequestHandler,), {
+        "patient_manager": patient_manager,
+        "chat_sessions": ChatSessions(patient_manager),
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+@profiling.profiled("clinic_server")
+def main():
+    parser = argparse.ArgumentParser(description="Server HTTP CareLoopAI Clinic")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-file", default="patient_data.json")
+    parser.add_argument("--metrics", action="store_true", help="Catat metrik untuk GET /metrics")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profil CPU dan alokasi memori sampai server dihentikan")
+    parser.add_argument("--flush-interval", type=float, default=0.2,
+                        help="Detik perubahan dikumpulkan sebelum disimpan ke file data")
+    args = parser.parse_args()
+    
+    metrics.configure_from_env()
+    if args.metrics:
+        metrics.enable()
+
+    patient_manager = PatientDataManager(args.data_file, flush_interval=args.flush_interval)
+    server = create_server(args.host, args.port, patient_manager)
+    print(f"CareLoopAI Clinic server berjalan di http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        patient_manager.close()
+
+if __name__ == "__main__":
+    main()
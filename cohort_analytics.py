@@ -0,0 +1,202 @@
+"""
+Clinic-wide Cohort Analytics
+This module builds a pandas frame from the symptom and checkin histories kept
+by PatientDataManager and answers group-by questions over the whole clinic,
+such as how many patients reported "demam" this week by severity and trend.
+The frame is extended incrementally: only entries added since the last query
+are converted.
+
+Progress is kept as the absolute position in each history, counting the
+entries compacted into the cold archive (the record's archive counts), so a
+compaction that shortens the hot lists does not hide the entries appended
+after it. Entries archived before they were converted are read back from the
+record's archive blocks.
+"""
+
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from history_archive import HistoryArchive, archive_directory
+
+HISTORY_SECTIONS = ("symptoms_history", "checkin_history")
+SEVERITY_RANK = {"ringan": 0, "sedang": 1, "berat": 2}
+RECOVERY_BINS = [-1, 3, 7, 14, float("inf")]
+RECOVERY_LABELS = ["0-3 hari", "4-7 hari", "8-14 hari", ">14 hari"]
+FRAME_COLUMNS = ["patient", "section", "date", "symptom", "body_part", "severity", "trend"]
+# Typed so an empty clinic's frame still has a datetime date column
+FRAME_DTYPES = {column: "datetime64[ns]" if column == "date" else "object" for column in FRAME_COLUMNS}
+GROUP_KEYS = ("symptom", "body_part", "severity", "trend", "section", "date_bucket", "recovery_time")
+
+
+def _empty_frame() -> pd.DataFrame:
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in FRAME_DTYPES.items()})
+
+
+class CohortAnalytics:
+    def __init__(self, patient_manager):
+        self.patient_manager = patient_manager
+        self._frame = _empty_frame()
+        self._pending: List[Dict] = []
+        # Number of entries already converted per (patient, section), archived ones included
+        self._consumed: Dict[tuple, int] = {}
+        # Running per-patient state used to derive trend and recovery time
+        self._last_severity: Dict[str, int] = {}
+        self._onset: Dict[str, datetime.datetime] = {}
+        self._recovered: Dict[str, datetime.datetime] = {}
+
+    def refresh(self) -> int:
+        """Convert history entries added since the last refresh, return the number of entries"""
+        with self.patient_manager.snapshot() as patients:
+            added = self._consume(patients)
+            if added is None:
+                # History was replaced or compacted underneath us
+                self.rebuild()
+                added = self._consume(patients)
+        return added
+
+    def _consume(self, patients) -> Optional[int]:
+        """Convert the new entries of a snapshot, or return None if a history shrank"""
+        added = 0
+        for patient, record in patients.items():
+            new_entries = []
+            archived = None
+            archive = record.get("archive") or {}
+            for section in HISTORY_SECTIONS:
+                entries = record.get(section, [])
+                offset = archive.get("counts", {}).get(section, 0)
+                start = self._consumed.get((patient, section), 0)
+                if offset + len(entries) < start:
+                    return None
+                if start < offset:
+                    # Compacted before they were converted
+                    if archived is None:
+                        archived = self._archive().read_patient(archive.get("blocks", []))
+                    new_entries.extend((entry["date"], section, entry) for entry in archived[section][start:offset])
+                new_entries.extend((entry["date"], section, entry) for entry in entries[max(start - offset, 0):])
+                self._consumed[(patient, section)] = offset + len(entries)
+
+            # Trends compare against the previous entry across both sections
+            new_entries.sort(key=lambda item: item[0])
+            for _, section, entry in new_entries:
+                self._add_entry(patient, section, entry)
+            added += len(new_entries)
+        return added
+
+    def _archive(self) -> HistoryArchive:
+        return HistoryArchive(archive_directory(self.patient_manager.data_file))
+
+    def rebuild(self) -> None:
+        """Drop the frame and all running state"""
+        self._frame = _empty_frame()
+        self._pending = []
+        self._consumed = {}
+        self._last_severity = {}
+        self._onset = {}
+        self._recovered = {}
+
+    def _add_entry(self, patient: str, section: str, entry: Dict) -> None:
+        date = datetime.datetime.fromisoformat(entry["date"])
+        severity = entry.get("severity", "sedang")
+        symptoms = entry.get("symptoms", [])
+        rank = SEVERITY_RANK.get(severity, 1)
+        previous = self._last_severity.get(patient)
+
+        if "memburuk" in symptoms or (previous is not None and rank > previous):
+            trend = "memburuk"
+        elif "membaik" in symptoms or (previous is not None and rank < previous):
+            trend = "membaik"
+        else:
+            trend = "stabil"
+
+        self._last_severity[patient] = rank
+        self._onset.setdefault(patient, date)
+        if patient not in self._recovered and (trend == "membaik" or "sembuh" in symptoms) \
+                and severity == "ringan":
+            self._recovered[patient] = date
+
+        for symptom in symptoms or [""]:
+            self._pending.append({
+                "patient": patient,
+                "section": section,
+                "date": date,
+                "symptom": symptom,
+                "body_part": entry.get("body_part", ""),
+                "severity": severity,
+                "trend": trend,
+            })
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """Get the up-to-date frame with one row per reported symptom"""
+        self.refresh()
+        if self._pending:
+            chunk = pd.DataFrame(self._pending, columns=FRAME_COLUMNS)
+            self._frame = chunk if self._frame.empty else pd.concat([self._frame, chunk], ignore_index=True)
+            self._pending = []
+        return self._frame
+
+    def recovery_days(self) -> pd.Series:
+        """Get days from onset to first recovery per patient (NaN if not recovered)"""
+        self.refresh()
+        onset = pd.Series(self._onset, dtype="datetime64[ns]")
+        recovered = pd.Series(self._recovered, dtype="datetime64[ns]").reindex(onset.index)
+        return (recovered - onset).dt.days.rename("recovery_days")
+
+    def select(self, symptom: Optional[str] = None, body_part: Optional[str] = None,
+               severity: Optional[str] = None, section: Optional[str] = None,
+               since: Optional[datetime.datetime] = None,
+               until: Optional[datetime.datetime] = None) -> pd.DataFrame:
+        """Filter the frame with vectorized masks"""
+        frame = self.frame
+        mask = pd.Series(True, index=frame.index)
+        for column, value in (("symptom", symptom), ("body_part", body_part),
+                              ("severity", severity), ("section", section)):
+            if value is not None:
+                mask &= frame[column] == value
+        if since is not None:
+            mask &= frame["date"] >= since
+        if until is not None:
+            mask &= frame["date"] < until
+        return frame[mask]
+
+    def group_counts(self, by: Iterable[str] = ("symptom",), freq: str = "W",
+                     unique_patients: bool = False, **filters) -> pd.Series:
+        """Count reports (or distinct patients) grouped by the given keys.
+
+        Keys can be any of GROUP_KEYS; date_bucket uses the pandas period
+        frequency given by freq (D, W or M) and recovery_time bins patients by
+        days to recovery.
+        """
+        by = list(by)
+        unknown = [key for key in by if key not in GROUP_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown group keys: {', '.join(unknown)}")
+
+        frame = self.select(**filters)
+        if "date_bucket" in by:
+            frame = frame.assign(date_bucket=frame["date"].dt.to_period(freq))
+        if "recovery_time" in by:
+            buckets = pd.cut(self.recovery_days(), RECOVERY_BINS, labels=RECOVERY_LABELS)
+            recovery = buckets.astype(object).where(buckets.notna(), "belum pulih")
+            frame = frame.assign(recovery_time=frame["patient"].map(recovery))
+
+        if not by:
+            return pd.Series({"total": frame["patient"].nunique() if unique_patients else len(frame)})
+        grouped = frame.groupby(by, observed=True)["patient"]
+        counts = grouped.nunique() if unique_patients else grouped.size()
+        return counts.rename("patients" if unique_patients else "reports")
+
+# Example usage
+if __name__ == "__main__":
+    from patient_data_manager import PatientDataManager
+
+    analytics = CohortAnalytics(PatientDataManager())
+    week_ago = datetime.datetime.now() - datetime.timedelta(days=7)
+
+    print("Laporan per gejala dan tingkat keparahan:")
+    print(analytics.group_counts(["symptom", "severity"]))
+    print("\nPasien dengan demam minggu ini per tren:")
+    print(analytics.group_counts(["severity", "trend"], unique_patients=True,
+                                 symptom="demam", since=week_ago))
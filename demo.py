@@ -2,13 +2,17 @@
 Demonstration script for CareLoopAI Clinic Chatbot
 """
 
+import metrics
+import profiling
 from careloopai_clinic import CareLoopAIClinic
 
+@profiling.profiled("demo")
 def main():
     print("=== CareLoopAI Clinic Chatbot Demo ===")
     print("Menunjukkan cara kerja chatbot dalam skenario nyata\n")
     
     # Create clinic instance
+    metrics.configure_from_env()
     clinic = CareLoopAIClinic()
     
     # 1. Greeting
@@ -0,0 +1,284 @@
+"""
+Dialogue State Machine Compiled from the Rasa Stories and Rules
+The CLI and ClinicChatbotSimulator run without Rasa. This module compiles
+data/stories and data/rules into a table-driven state machine, so those
+front ends follow the same conversation flow as the Rasa bot.
+
+Compilation merges the stories into a prefix tree. Each node where the bot
+waits for the user is a state. A transition maps an intent to the steps the
+bot takes (slots set and actions run) and the state it waits in afterwards.
+A story that ends goes back to the start state. Every state's table is
+filled in advance, in Rasa's order of precedence:
+
+1. the rules, which apply in any state and keep the state
+2. the continuations of the stories at this state
+3. the stories that begin with the intent
+4. the first place in the stories where the intent occurs
+
+A turn is then one dict lookup, and a session's dialogue state is one
+small int.
+
+Story steps with checkpoints, OR or forms, and rules with conditions, are
+not supported. The compiler rejects them, and also stories that disagree on
+what follows an intent.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(ROOT, "data")
+DOMAIN_FILE = os.path.join(ROOT, "domain.yml")
+
+START = 0
+
+# Step kinds of a transition
+SLOT = "slot"
+ACTION = "action"
+
+Step = Tuple[str, str]
+
+# A front end's implementation of a step: (session, intent, values) -> message or None
+Handler = Callable[[object, str, Dict], Union[None, str, Iterable[str]]]
+
+# An entity annotation in an NLU example: [Budi](name)
+ENTITY_PATTERN = re.compile(r"\[([^\]]+)\]\([^)]+\)")
+
+
+class DialogueCompileError(ValueError):
+    """Stories or rules that cannot be compiled into a state machine"""
+
+
+class Turn(NamedTuple):
+    """What the bot does after an intent, and the state it waits in afterwards"""
+    next_state: int
+    steps: Tuple[Step, ...]
+
+    @property
+    def actions(self) -> Tuple[str, ...]:
+        return tuple(name for kind, name in self.steps if kind == ACTION)
+
+
+def _load_yaml(path: str) -> Dict:
+    import yaml
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_stories(data_dir: str = DATA_DIR) -> Tuple[List[Dict], List[Dict]]:
+    """Get the stories and rules in the training data"""
+    stories = _load_yaml(os.path.join(data_dir, "stories", "clinic_stories.yml")).get("stories", [])
+    rules = _load_yaml(os.path.join(data_dir, "rules", "clinic_rules.yml")).get("rules", [])
+    return stories, rules
+
+
+def split_turns(name: str, steps: List[Dict]) -> List[Tuple[str, Tuple[Step, ...]]]:
+    """Split story steps into (intent, steps the bot takes) pairs"""
+    turns = []
+    for step in steps:
+        if "intent" in step:
+            turns.append((step["intent"], []))
+        elif not turns:
+            raise DialogueCompileError(f"'{name}' harus diawali intent")
+        elif "action" in step:
+            turns[-1][1].append((ACTION, step["action"]))
+        elif "slot_was_set" in step:
+            for slot in step["slot_was_set"]:
+                turns[-1][1].append((SLOT, next(iter(slot)) if isinstance(slot, dict) else slot))
+        else:
+            raise DialogueCompileError(f"Langkah {sorted(step)} di '{name}' tidak didukung")
+    return [(intent, tuple(bot_steps)) for intent, bot_steps in turns]
+
+
+class DialogueMachine:
+    """Conversation flow as per-state transition tables"""
+
+    def __init__(self, tables: List[Dict[str, Turn]], expected: Optional[List[frozenset]] = None,
+                 responses: Optional[Dict[str, str]] = None):
+        self.tables = tables
+        # Intents that continue a story in each state
+        self.expected = expected or [frozenset() for _ in tables]
+        self.responses = responses or {}
+
+    @classmethod
+    def compile(cls, stories: List[Dict], rules: List[Dict],
+                responses: Optional[Dict[str, str]] = None) -> "DialogueMachine":
+        # Prefix tree of the stories: node -> intent -> (steps, child node, story name)
+        children: List[Dict[str, Tuple[Tuple[Step, ...], int, str]]] = [{}]
+        first_seen: Dict[str, Tuple[Tuple[Step, ...], int]] = {}
+        for story in stories:
+            node = START
+            for intent, steps in split_turns(story["story"], story["steps"]):
+                if intent in children[node]:
+                    known_steps, child, known_name = children[node][intent]
+                    if known_steps != steps:
+                        raise DialogueCompileError(
+                            f"'{story['story']}' dan '{known_name}' berbeda setelah intent {intent}")
+                else:
+                    children.append({})
+                    child = len(children) - 1
+                    children[node][intent] = (steps, child, story["story"])
+                first_seen.setdefault(intent, (steps, child))
+                node = child
+
+        # Nodes where no story continues hand the conversation back to the start state
+        waiting = [node for node in range(len(children)) if node == START or children[node]]
+        state_of = {node: number for number, node in enumerate(waiting)}
+
+        def target(node):
+            return state_of.get(node, START)
+
+        rule_steps = {}
+        for rule in rules:
+            if rule.get("condition") or rule.get("conversation_start"):
+                raise DialogueCompileError(f"Kondisi pada rule '{rule['rule']}' tidak didukung")
+            turns = split_turns(rule["rule"], rule["steps"])
+            if len(turns) != 1:
+                raise DialogueCompileError(f"Rule '{rule['rule']}' harus berisi tepat satu intent")
+            intent, steps = turns[0]
+            if rule_steps.get(intent, steps) != steps:
+                raise DialogueCompileError(f"Beberapa rule untuk intent {intent} saling bertentangan")
+            rule_steps[intent] = steps
+
+        tables = []
+        expected = []
+        for node in waiting:
+            state = state_of[node]
+            table = {intent: Turn(target(child), steps) for intent, (steps, child) in first_seen.items()}
+            table.update({intent: Turn(target(child), steps)
+                          for intent, (steps, child, _) in children[START].items()})
+            table.update({intent: Turn(target(child), steps)
+                          for intent, (steps, child, _) in children[node].items()})
+            for intent, steps in rule_steps.items():
+                story = children[node].get(intent)
+                if story is not None and story[0] != steps:
+                    raise DialogueCompileError(f"Rule untuk intent {intent} bertentangan dengan '{story[2]}'")
+                table[intent] = Turn(state, steps)
+            tables.append(table)
+            expected.append(frozenset(children[node]))
+        return cls(tables, expected, responses)
+
+    @classmethod
+    def from_files(cls, data_dir: str = DATA_DIR, domain_file: str = DOMAIN_FILE) -> "DialogueMachine":
+        stories, rules = load_stories(data_dir)
+        return cls.compile(stories, rules, load_responses(domain_file))
+
+    @property
+    def state_count(self) -> int:
+        return len(self.tables)
+
+    def step(self, state: int, intent: str) -> Optional[Turn]:
+        """Get the transition for an intent, or None if no story or rule has it"""
+        return self.tables[state].get(intent)
+
+    def choose(self, state: int, intents: Tuple[str, ...]) -> Optional[str]:
+        """Pick the candidate intent that continues a story here, else the first one with a transition"""
+        for intent in intents:
+            if intent in self.expected[state]:
+                return intent
+        return next((intent for intent in intents if intent in self.tables[state]), None)
+
+    def opening_state(self) -> int:
+        """Get the state after the bot has greeted, for front ends that open the conversation"""
+        turn = self.tables[START].get("greet")
+        return turn.next_state if turn is not None else START
+
+    def respond(self, state: int, intent: str, handlers: Dict[str, Optional[Handler]],
+                session=None, values: Optional[Dict] = None) -> Tuple[int, Optional[str]]:
+        """Run the steps for an intent and get the next state and the bot's reply.
+
+        A step's handler gets the session, the intent and the values parsed
+        from the message, and returns a message or None; a step mapped to
+        None says nothing. Actions without a handler use their response from
+        domain.yml, slots without one are skipped. The reply is None if no
+        story or rule has the intent.
+        """
+        next_state, sections = self.stream(state, intent, handlers, session, values)
+        return next_state, "".join(sections) if sections is not None else None
+
+    def stream(self, state: int, intent: str, handlers: Dict[str, Optional[Handler]],
+               session=None, values: Optional[Dict] = None) -> Tuple[int, Optional[Iterator[str]]]:
+        """Like respond, but get the reply as sections yielded while the steps run.
+
+        A handler may also return an iterable of sections, e.g. a generator
+        that yields each part of its message as soon as it is ready.
+        """
+        turn = self.tables[state].get(intent)
+        if turn is None:
+            return state, None
+        return turn.next_state, self._run_steps(turn, intent, handlers, session, values or {})
+
+    def _run_steps(self, turn: Turn, intent: str, handlers: Dict[str, Optional[Handler]], session,
+                   values: Dict) -> Iterator[str]:
+        # Messages are separated by a blank line, sent with the first section of the next message
+        said = False
+        for kind, name in turn.steps:
+            if name in handlers:
+                handler = handlers[name]
+                message = handler(session, intent, values) if handler is not None else None
+            else:
+                message = self.responses.get(name) if kind == ACTION else None
+            if not message:
+                continue
+            separator = "\n\n" if said else ""
+            for section in ([message] if isinstance(message, str) else message):
+                if section:
+                    yield separator + section
+                    separator = ""
+                    said = True
+
+
+def load_responses(domain_file: str = DOMAIN_FILE) -> Dict[str, str]:
+    """Get the first text of every response in the domain"""
+    responses = _load_yaml(domain_file).get("responses", {})
+    return {name: variants[0]["text"] for name, variants in responses.items() if variants}
+
+
+def load_nlu_examples(data_dir: str = DATA_DIR) -> Dict[str, Tuple[str, ...]]:
+    """Map each NLU example, lowercased and without entity markup, to its intents"""
+    examples: Dict[str, Tuple[str, ...]] = {}
+    for item in _load_yaml(os.path.join(data_dir, "nlu", "clinic_nlu.yml")).get("nlu", []):
+        for line in item.get("examples", "").splitlines():
+            text = normalize(ENTITY_PATTERN.sub(r"\1", line.strip().lstrip("- ")))
+            if text and item["intent"] not in examples.get(text, ()):
+                examples[text] = examples.get(text, ()) + (item["intent"],)
+    return examples
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().strip(" ?!.").split())
+
+
+def check_stories(machine: DialogueMachine, stories: List[Dict], rules: List[Dict]) -> List[str]:
+    """List where the machine does not do what a story or rule says"""
+    problems = []
+    for story in stories:
+        state = START
+        for intent, steps in split_turns(story["story"], story["steps"]):
+            turn = machine.step(state, intent)
+            if turn is None or turn.steps != steps:
+                problems.append(f"{story['story']}: setelah {intent} diharapkan {steps}, "
+                                f"didapat {turn.steps if turn else None}")
+                break
+            state = turn.next_state
+    for rule in rules:
+        intent, steps = split_turns(rule["rule"], rule["steps"])[0]
+        for state in range(machine.state_count):
+            turn = machine.step(state, intent)
+            if turn is None or turn.steps != steps or turn.next_state != state:
+                problems.append(f"{rule['rule']}: tidak berlaku di state {state}")
+                break
+    return problems
+
+
+@lru_cache(maxsize=None)
+def default_machine() -> DialogueMachine:
+    """The machine compiled from this project's stories, rules and domain"""
+    return DialogueMachine.from_files()
+
+
+@lru_cache(maxsize=None)
+def default_examples() -> Dict[str, Tuple[str, ...]]:
+    return load_nlu_examples()
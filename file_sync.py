@@ -0,0 +1,206 @@
+"""
+Cross-process Coordination for the Shared Patient Data File
+The CLI, the simulator, the Rasa action server and the HTTP server each
+keep the data file in memory and write it back after every change. This
+module gives them the pieces to do that without losing each other's work:
+
+- FileLock: an exclusive OS lock (fcntl, or msvcrt on Windows) on a
+  "<data file>.lock" file next to the data file, held only while writing
+- atomic_write: write to a temporary file in the same directory, fsync, and
+  rename over the data file, so readers never see a partial file
+- merge_patients / merge_record: a three-way merge of the records in
+  memory, the records on disk and the records as this process last read or
+  wrote them, used when the file changed on disk in between
+
+A writer takes the lock, checks whether the file's signature (inode, size,
+mtime) still matches the one it last synced, and if not merges the records
+changed on both sides before writing. Each record's "version" is bumped by
+every change, so comparing it with the version last synced tells which side
+changed a patient. Appended history entries from both sides are kept; an
+entry removed by either side (e.g. moved to the archive) stays removed.
+"""
+
+import json
+import os
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Record sections that only grow by appending (or shrink from the front when archived)
+HISTORY_SECTIONS = ("symptoms_history", "checkin_history", "treatment_plans")
+
+FileSignature = Tuple[int, int, int]
+
+
+def lock_path(data_file: str) -> str:
+    return data_file + ".lock"
+
+
+class FileLock:
+    """Exclusive lock shared by every process writing the same data file"""
+
+    def __init__(self, data_file: str):
+        self.path = lock_path(data_file)
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._file = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def file_signature(path: str) -> Optional[FileSignature]:
+    """Get (inode, size, mtime) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def read_bytes(path: str) -> Tuple[Optional[bytes], Optional[FileSignature]]:
+    """Read a file and the signature of exactly the version that was read"""
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            return f.read(), (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        return None, None
+
+
+def atomic_write(path: str, content: bytes) -> FileSignature:
+    """Replace a file with new content in one rename, return the new file's signature"""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                            dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _entry_key(entry) -> str:
+    return json.dumps(entry, sort_keys=True, default=str)
+
+
+def merge_history(base: List, ours: List, theirs: List) -> List:
+    """Merge an append-only list: entries kept by both sides, then new entries of either by date"""
+    base_counts = Counter(_entry_key(entry) for entry in base)
+    removed = (base_counts - Counter(_entry_key(entry) for entry in ours)) | \
+              (base_counts - Counter(_entry_key(entry) for entry in theirs))
+
+    merged = []
+    for entry in base:
+        key = _entry_key(entry)
+        if removed[key]:
+            removed[key] -= 1
+        else:
+            merged.append(entry)
+
+    added = []
+    for side in (ours, theirs):
+        remaining = Counter(base_counts)
+        for entry in side:
+            key = _entry_key(entry)
+            if remaining[key]:
+                remaining[key] -= 1
+            else:
+                added.append(entry)
+    added.sort(key=lambda entry: entry.get("date", "") if isinstance(entry, dict) else "")
+    return merged + added
+
+
+def merge_appointments(base: List[Dict], ours: List[Dict], theirs: List[Dict]) -> List[Dict]:
+    """Merge appointments by ID; an appointment changed on both sides keeps our change"""
+    def by_id(appointments):
+        return {a.get("appointment_id") or _entry_key(a): a for a in appointments}
+
+    base_map, our_map, their_map = by_id(base), by_id(ours), by_id(theirs)
+    merged = []
+    for key in list(our_map) + [key for key in their_map if key not in our_map]:
+        ours_entry, theirs_entry = our_map.get(key), their_map.get(key)
+        if key in base_map and (ours_entry is None or theirs_entry is None):
+            continue  # removed on one side
+        if ours_entry is None or (ours_entry == base_map.get(key) and theirs_entry is not None):
+            merged.append(theirs_entry)
+        else:
+            merged.append(ours_entry)
+    return merged
+
+
+def merge_record(base: Optional[Dict], ours: Dict, theirs: Dict) -> Dict:
+    """Three-way merge of one patient record changed both here and on disk"""
+    base = base or {}
+    merged = {}
+    for key in list(ours) + [key for key in theirs if key not in ours]:
+        if key == "version":
+            continue
+        base_value, our_value, their_value = base.get(key), ours.get(key), theirs.get(key)
+        if key in HISTORY_SECTIONS:
+            merged[key] = merge_history(base_value or [], our_value or [], their_value or [])
+        elif key == "appointments":
+            merged[key] = merge_appointments(base_value or [], our_value or [], their_value or [])
+        elif key not in ours or (our_value == base_value and key in theirs):
+            merged[key] = their_value
+        else:
+            merged[key] = our_value
+    merged["version"] = max(ours.get("version", 0), theirs.get("version", 0)) + 1
+    return merged
+
+
+def merge_patients(ours: Dict[str, Dict], theirs: Dict[str, Dict],
+                   base: Dict[str, Dict]) -> Tuple[Dict[str, Dict], int]:
+    """Merge our patient records with the ones on disk, given the records as last synced.
+
+    A patient changed on one side only takes that side's record; one changed
+    on both is merged by merge_record. A patient we removed (moved to another
+    storage node) stays removed unless they changed it meanwhile. Returns the
+    merged records and the number of three-way merges.
+    """
+    merged = {}
+    conflicts = 0
+    for patient_id, their_record in theirs.items():
+        our_record = ours.get(patient_id)
+        base_record = base.get(patient_id)
+        base_version = base_record.get("version", 0) if base_record is not None else None
+        if our_record is None:
+            if their_record.get("version", 0) != base_version:
+                merged[patient_id] = their_record
+        elif their_record.get("version", 0) == base_version:
+            merged[patient_id] = our_record
+        elif our_record.get("version", 0) == base_version:
+            merged[patient_id] = their_record
+        else:
+            merged[patient_id] = merge_record(base_record, our_record, their_record)
+            conflicts += 1
+    for patient_id, our_record in ours.items():
+        if patient_id not in theirs:
+            merged[patient_id] = our_record
+    return merged, conflicts
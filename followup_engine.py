@@ -0,0 +1,214 @@
+"""
+Follow-up Decision Engine
+This module decides whether a patient needs an in-person follow-up visit.
+It keeps running statistics per patient (severity trajectory, days since
+onset, worsening streak and photo change score) that are updated in O(1) for
+every new report, so a decision never has to rescan the patient's history.
+
+An episode ends EPISODE_GAP after its last report; a patient whose episode
+ended needs no follow-up visit until they report again.
+"""
+
+import datetime
+from collections import deque
+from typing import Dict, List, Optional
+
+SEVERITY_RANK = {"ringan": 0, "sedang": 1, "berat": 2}
+# A new report this long after the last one starts a new episode
+EPISODE_GAP = datetime.timedelta(days=14)
+
+
+def _as_datetime(value) -> datetime.datetime:
+    if value is None:
+        return datetime.datetime.now()
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+class PatientProgress:
+    """Running statistics for one patient's current episode"""
+
+    __slots__ = ("onset", "last_report", "last_severity", "peak_severity", "trajectory",
+                 "worsening_streak", "improving_streak", "checkins",
+                 "last_photo_severity", "photo_change_score")
+
+    def __init__(self, onset: datetime.datetime, trajectory_length: int = 7):
+        self.onset = onset
+        self.last_report = onset
+        self.last_severity: Optional[int] = None
+        self.peak_severity = 0
+        self.trajectory = deque(maxlen=trajectory_length)
+        self.worsening_streak = 0
+        self.improving_streak = 0
+        self.checkins = 0
+        self.last_photo_severity: Optional[int] = None
+        self.photo_change_score = 0.0
+
+    def is_active(self, now: datetime.datetime) -> bool:
+        """Whether the episode is still open, i.e. the last report is at most EPISODE_GAP old"""
+        return now - self.last_report <= EPISODE_GAP
+
+    def to_dict(self) -> Dict:
+        """Get the statistics as plain values"""
+        return {
+            "onset": self.onset.isoformat(),
+            "last_report": self.last_report.isoformat(),
+            "severity_trajectory": list(self.trajectory),
+            "peak_severity": self.peak_severity,
+            "worsening_streak": self.worsening_streak,
+            "improving_streak": self.improving_streak,
+            "checkins": self.checkins,
+            "photo_change_score": self.photo_change_score,
+        }
+
+
+class FollowupDecision:
+    """A follow-up recommendation together with the reasons behind it"""
+
+    def __init__(self, patient: str, needed: bool, reasons: List[str]):
+        self.patient = patient
+        self.needed = needed
+        self.reasons = reasons
+
+    def to_dict(self) -> Dict:
+        return {"patient": self.patient, "needed": self.needed, "reasons": self.reasons}
+
+    def __repr__(self) -> str:
+        return f"FollowupDecision({self.patient!r}, needed={self.needed}, reasons={self.reasons!r})"
+
+
+class FollowupEngine:
+    def __init__(self, worsening_streak_limit: int = 2, max_days_without_improvement: int = 7,
+                 photo_change_threshold: float = 0.5):
+        self.worsening_streak_limit = worsening_streak_limit
+        self.max_days_without_improvement = max_days_without_improvement
+        self.photo_change_threshold = photo_change_threshold
+        self._progress: Dict[str, PatientProgress] = {}
+
+    @classmethod
+    def from_patients(cls, patients: Dict, **options) -> "FollowupEngine":
+        """Build running statistics from stored histories, replayed in date order"""
+        engine = cls(**options)
+        for patient, record in patients.items():
+            reports = [(entry["date"], False, entry) for entry in record.get("symptoms_history", [])]
+            reports += [(entry["date"], True, entry) for entry in record.get("checkin_history", [])]
+            for date, is_checkin, entry in sorted(reports, key=lambda item: item[0]):
+                engine.record_report(patient, entry.get("symptoms", []),
+                                     entry.get("severity", "sedang"), date, is_checkin)
+        return engine
+
+    def record_report(self, patient: str, symptoms: List[str], severity: str = "sedang",
+                      date=None, is_checkin: bool = False) -> PatientProgress:
+        """Update a patient's statistics with a symptom report or daily checkin"""
+        date = _as_datetime(date)
+        progress = self._progress.get(patient)
+        if progress is None or date - progress.last_report > EPISODE_GAP:
+            progress = self._progress[patient] = PatientProgress(date)
+
+        rank = SEVERITY_RANK.get(severity, 1)
+        previous = progress.last_severity
+        if "memburuk" in symptoms or (previous is not None and rank > previous):
+            progress.worsening_streak += 1
+            progress.improving_streak = 0
+        elif "membaik" in symptoms or (previous is not None and rank < previous):
+            progress.improving_streak += 1
+            progress.worsening_streak = 0
+
+        progress.last_severity = rank
+        progress.peak_severity = max(progress.peak_severity, rank)
+        progress.trajectory.append(rank)
+        progress.last_report = max(progress.last_report, date)
+        if is_checkin:
+            progress.checkins += 1
+        return progress
+
+    def record_checkin(self, patient: str, symptoms: List[str], severity: str = "sedang",
+                       date=None) -> PatientProgress:
+        """Update a patient's statistics with a daily checkin"""
+        return self.record_report(patient, symptoms, severity, date, is_checkin=True)
+
+    def record_photo(self, patient: str, severity: str, date=None) -> None:
+        """Update the photo change score with the severity seen in a new photo.
+
+        Photo findings are not stored by PatientDataManager, so the score
+        starts from zero again after a restart.
+        """
+        date = _as_datetime(date)
+        progress = self._progress.get(patient)
+        if progress is None:
+            progress = self._progress[patient] = PatientProgress(date)
+
+        rank = SEVERITY_RANK.get(severity, 1)
+        if progress.last_photo_severity is not None:
+            # Normalized change between consecutive photos, worsening weighs double
+            change = (rank - progress.last_photo_severity) / (len(SEVERITY_RANK) - 1)
+            progress.photo_change_score = change * 2 if change > 0 else abs(change)
+        progress.last_photo_severity = rank
+
+    def forget(self, patient: str) -> None:
+        """Drop the statistics of a patient"""
+        self._progress.pop(patient, None)
+
+    def patients(self) -> List[str]:
+        """Get the patients with running statistics"""
+        return list(self._progress)
+
+    def get_progress(self, patient: str) -> Optional[PatientProgress]:
+        """Get the running statistics of a patient"""
+        return self._progress.get(patient)
+
+    def evaluate(self, patient: str, now: Optional[datetime.datetime] = None) -> FollowupDecision:
+        """Decide whether a patient needs a follow-up visit, in constant time"""
+        progress = self._progress.get(patient)
+        if progress is None:
+            return FollowupDecision(patient, False, ["Belum ada laporan gejala"])
+
+        now = now or datetime.datetime.now()
+        if not progress.is_active(now):
+            return FollowupDecision(patient, False, ["Episode gejala terakhir sudah selesai"])
+        days = (now - progress.onset).days
+        reasons = []
+
+        if progress.last_severity == SEVERITY_RANK["berat"]:
+            reasons.append("Tingkat keparahan gejala terakhir berat")
+        if progress.worsening_streak >= self.worsening_streak_limit:
+            reasons.append(f"Kondisi memburuk {progress.worsening_streak} kali berturut-turut")
+        if days >= self.max_days_without_improvement and progress.last_severity != SEVERITY_RANK["ringan"]:
+            reasons.append(f"Gejala belum membaik setelah {days} hari")
+        if progress.photo_change_score >= self.photo_change_threshold:
+            reasons.append("Foto gejala menunjukkan perubahan yang signifikan")
+
+        if reasons:
+            return FollowupDecision(patient, True, reasons)
+
+        if progress.improving_streak:
+            reasons.append("Kondisi membaik")
+        else:
+            reasons.append("Kondisi stabil")
+        return FollowupDecision(patient, False, reasons)
+
+    def evaluate_all(self, now: Optional[datetime.datetime] = None,
+                     only_needed: bool = False) -> Dict[str, FollowupDecision]:
+        """Evaluate every patient with an active episode"""
+        now = now or datetime.datetime.now()
+        decisions = {}
+        for patient, progress in self._progress.items():
+            if not progress.is_active(now):
+                continue
+            decision = self.evaluate(patient, now)
+            if decision.needed or not only_needed:
+                decisions[patient] = decision
+        return decisions
+
+# Example usage
+if __name__ == "__main__":
+    engine = FollowupEngine()
+    engine.record_report("Budi Santoso", ["demam", "batuk"], "sedang")
+    engine.record_checkin("Budi Santoso", ["demam", "memburuk"], "berat")
+    engine.record_checkin("Budi Santoso", ["demam", "memburuk"], "berat")
+
+    decision = engine.evaluate("Budi Santoso")
+    print(f"Perlu kunjungan: {decision.needed}")
+    for reason in decision.reasons:
+        print(f"- {reason}")
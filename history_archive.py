@@ -0,0 +1,290 @@
+"""
+Cold Archive for Patient History
+This module moves old check-in, symptom and treatment plan entries out of
+the hot patient records into compressed, append-only segment files.
+
+Each compaction run writes one new segment. Inside a segment every patient's
+entries are compressed as an independent gzip member (or xz stream), so a
+read decompresses only that patient's blocks while the segment as a whole
+stays a valid .gz/.xz file. Hot records keep references to their blocks.
+"""
+
+import datetime
+import gzip
+import json
+import lzma
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from followup_engine import EPISODE_GAP
+
+ARCHIVED_SECTIONS = ("symptoms_history", "checkin_history", "treatment_plans")
+
+CODECS = {
+    "gzip": (".jsonl.gz", gzip.compress, gzip.decompress),
+    "lzma": (".jsonl.xz", lzma.compress, lzma.decompress),
+}
+
+
+def archive_directory(data_file: str) -> str:
+    """Get the archive directory that belongs to a data file"""
+    return os.path.splitext(data_file)[0] + "_archive"
+
+
+def archivable_counts(record: Dict, now: datetime.datetime,
+                      horizon_days: int = 90) -> Dict[str, int]:
+    """Count the leading entries of each section that can move to the archive.
+
+    Entries are archivable when older than the horizon or when they belong
+    to a resolved case: an episode followed by a gap of more than
+    EPISODE_GAP without reports, as the follow-up engine sees it. A last
+    case that ended on a severe report is kept hot, since that patient
+    still needs following up. The latest treatment plan always stays hot.
+    """
+    cutoff = now - datetime.timedelta(days=horizon_days)
+
+    reports = sorted(
+        (datetime.datetime.fromisoformat(entry["date"]), entry.get("severity"))
+        for section in ("symptoms_history", "checkin_history")
+        for entry in record.get(section, [])
+    )
+    if reports:
+        last_date, last_severity = reports[-1]
+        if now - last_date > EPISODE_GAP and last_severity != "berat":
+            # The latest case is resolved as well
+            cutoff = max(cutoff, last_date + datetime.timedelta(microseconds=1))
+        else:
+            # Everything before the open episode belongs to resolved cases
+            episode_start = last_date
+            for earlier, _ in reversed(reports[:-1]):
+                if episode_start - earlier > EPISODE_GAP:
+                    break
+                episode_start = earlier
+            cutoff = max(cutoff, episode_start)
+
+    counts = {}
+    for section in ARCHIVED_SECTIONS:
+        entries = record.get(section, [])
+        keep_last = 1 if section == "treatment_plans" else 0
+        count = 0
+        # Entries are appended in date order, so the archivable ones form a
+        # prefix; stop at the first newer entry
+        for entry in entries[:len(entries) - keep_last]:
+            if datetime.datetime.fromisoformat(entry["date"]) >= cutoff:
+                break
+            count += 1
+        if count:
+            counts[section] = count
+    return counts
+
+
+class HistoryArchive:
+    def __init__(self, directory: str, codec: str = "gzip"):
+        if codec not in CODECS:
+            raise ValueError(f"Codec tidak dikenal: {codec}")
+        self.directory = directory
+        self.codec = codec
+
+    def segments(self) -> List[str]:
+        """Get the names of the segment files, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        suffixes = tuple(suffix for suffix, _, _ in CODECS.values())
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(suffixes))
+
+    def _next_segment_name(self) -> str:
+        sequence = 0
+        for name in self.segments():
+            try:
+                sequence = max(sequence, int(name.split("-")[1].split(".")[0]))
+            except (IndexError, ValueError):
+                continue
+        return f"segment-{sequence + 1:06d}{CODECS[self.codec][0]}"
+
+    def write_segment(self, chunks: Iterable[Tuple[str, Dict[str, List]]]) -> Dict[str, Dict]:
+        """Write one compressed block per patient into a new segment.
+
+        Returns a reference to the block of each patient. The segment is
+        written to a temporary file and renamed, so readers never see a
+        partial segment.
+        """
+        name = self._next_segment_name()
+        compress = CODECS[self.codec][1]
+        path = os.path.join(self.directory, name)
+        refs = {}
+        f = None
+        try:
+            offset = 0
+            for patient_id, entries in chunks:
+                if f is None:
+                    # Only create a segment once there is something to archive
+                    os.makedirs(self.directory, exist_ok=True)
+                    f = open(path + ".tmp", "wb")
+                block = compress(json.dumps(
+                    {"patient_id": patient_id, "entries": entries}, ensure_ascii=False, default=str
+                ).encode("utf-8"))
+                f.write(block)
+                refs[patient_id] = {"segment": name, "offset": offset, "length": len(block)}
+                offset += len(block)
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if f is not None:
+                f.close()
+        if f is not None:
+            os.replace(path + ".tmp", path)
+        return refs
+
+    def read_block(self, ref: Dict) -> Dict[str, List]:
+        """Decompress the archived entries of one block"""
+        name = ref["segment"]
+        decompress = next(codec[2] for codec in CODECS.values() if name.endswith(codec[0]))
+        with open(os.path.join(self.directory, name), "rb") as f:
+            f.seek(ref["offset"])
+            block = f.read(ref["length"])
+        return json.loads(decompress(block).decode("utf-8"))["entries"]
+
+    def read_patient(self, refs: List[Dict]) -> Dict[str, List]:
+        """Get all archived entries of a patient, oldest first"""
+        history = {section: [] for section in ARCHIVED_SECTIONS}
+        for ref in refs:
+            for section, entries in self.read_block(ref).items():
+                history.setdefault(section, []).extend(entries)
+        return history
+
+    def size(self) -> int:
+        """Get the total size of the segment files in bytes"""
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in self.segments())
+
+
+class CompactionJob:
+    """Moves archivable history of every patient into a new cold segment.
+
+    Run it with run() in the caller's thread or start() in a background
+    thread; progress() can be polled from any thread meanwhile.
+    """
+
+    def __init__(self, patient_manager, horizon_days: int = 90, codec: str = "gzip",
+                 now: Optional[datetime.datetime] = None):
+        self.patient_manager = patient_manager
+        self.horizon_days = horizon_days
+        self.archive = HistoryArchive(archive_directory(patient_manager.data_file), codec)
+        self.now = now
+        self.state = "pending"
+        self.error: Optional[BaseException] = None
+        self.total = 0
+        self.scanned = 0
+        self.patients_compacted = 0
+        self.entries_moved = 0
+        self.bytes_written = 0
+        self.hot_bytes_before = 0
+        self.hot_bytes_after = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "CompactionJob":
+        """Run the compaction in a background thread"""
+        self._thread = threading.Thread(target=self.run, name="history-compaction", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a background compaction, return whether it has finished"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.state in ("done", "failed")
+
+    def progress(self) -> Dict:
+        """Get a snapshot of the job's progress"""
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return {
+            "state": self.state,
+            "scanned": self.scanned,
+            "total": self.total,
+            "percent": 100.0 * self.scanned / self.total if self.total else 100.0,
+            "patients_compacted": self.patients_compacted,
+            "entries_moved": self.entries_moved,
+            "bytes_written": self.bytes_written,
+            "hot_bytes_before": self.hot_bytes_before,
+            "hot_bytes_after": self.hot_bytes_after,
+            "elapsed_seconds": elapsed,
+            "error": str(self.error) if self.error else None
+        }
+
+    def run(self) -> "CompactionJob":
+        """Compact all patients and save the smaller hot store"""
+        self.state = "running"
+        self.started_at = time.perf_counter()
+        try:
+            self._compact()
+            self.state = "done"
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+        finally:
+            self.finished_at = time.perf_counter()
+        return self
+
+    def _compact(self) -> None:
+        manager = self.patient_manager
+        now = self.now or datetime.datetime.now()
+        self.hot_bytes_before = _file_size(manager.data_file)
+
+        # Phase 1: pick the archivable prefixes and write them to a segment.
+        # The hot records are read from a snapshot, so the clinic keeps serving.
+        planned: Dict[str, Dict[str, int]] = {}
+
+        def chunks(snapshot):
+            for patient_id, record in snapshot.items():
+                self.scanned += 1
+                counts = archivable_counts(record, now, self.horizon_days)
+                if counts:
+                    planned[patient_id] = counts
+                    yield patient_id, {section: record[section][:count] for section, count in counts.items()}
+
+        with manager.snapshot() as snapshot:
+            self.total = len(snapshot)
+            refs = self.archive.write_segment(chunks(snapshot))
+        if not refs:
+            self.hot_bytes_after = self.hot_bytes_before
+            return
+        self.bytes_written = sum(ref["length"] for ref in refs.values())
+
+        # Phase 2: drop the archived prefixes from the hot records. Writers
+        # only append, so deleting a prefix keeps concurrent new entries.
+        for patient_id, counts in planned.items():
+            with manager._patient_lock(patient_id):
+                record = manager._edit(patient_id, *counts)
+                archive = record.get("archive", {"blocks": [], "counts": {}})
+                archive = record["archive"] = {
+                    "blocks": archive["blocks"] + [refs[patient_id]],
+                    "counts": dict(archive["counts"]),
+                    "newest": dict(archive.get("newest", {})),
+                    "compacted_date": now.isoformat()
+                }
+                for section, count in counts.items():
+                    # The newest archived date lets readers of recent entries skip the archive
+                    dates = [entry["date"] for entry in record[section][:count] if "date" in entry]
+                    if dates:
+                        archive["newest"][section] = max(dates + [archive["newest"].get(section, "")])
+                    del record[section][:count]
+                    self.entries_moved += count
+                    archive["counts"][section] = archive["counts"].get(section, 0) + count
+                manager._touch(patient_id, record)
+            self.patients_compacted += 1
+
+        manager.save_data()
+        self.hot_bytes_after = _file_size(manager.data_file)
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
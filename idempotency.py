@@ -0,0 +1,182 @@
+"""
+Idempotency Keys for Mutating Calls
+Lets front ends and the action server retry a write safely: a mutating call
+made with an idempotency key runs once, and a repeat of it with the same key
+within WINDOW returns the original result without changing anything.
+
+DedupeIndex keeps the keys, scoped by operation, with a fingerprint of the
+call's arguments and its result, in an LRU of at most MAX_ENTRIES entries
+and MAX_BYTES of results that also forgets keys older than the window.
+PatientDataManager saves the most recently used keys, up to SAVED_BYTES of
+results, in the data file in the same save as the changes the calls made,
+so a retry after a restart, or to another process sharing the file, is
+caught too; an older key is only remembered by the process that ran it.
+
+A repeat that arrives while the first call still runs waits for it and gets
+its result; a call that raised leaves no entry, so it can be retried.
+Sending a key again with other arguments raises IdempotencyKeyReused.
+
+Results are saved as JSON, so keyed calls return strings, numbers, lists,
+dicts or None.
+"""
+
+import datetime
+import functools
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+# Keys remembered at most; the least recently used is dropped beyond this
+MAX_ENTRIES = 10000
+# How long a key is remembered
+WINDOW = datetime.timedelta(hours=24)
+# Size of the remembered results at most, in bytes of JSON
+MAX_BYTES = 16 * 1024 * 1024
+# Size of the results saved with the data at most; the most recently used go first
+SAVED_BYTES = 256 * 1024
+
+
+class IdempotencyKeyReused(ValueError):
+    """Raised when an idempotency key is sent again with different arguments"""
+    pass
+
+
+def fingerprint(arguments) -> str:
+    """Hash the arguments of a call, to tell a retry from a reused key"""
+    encoded = json.dumps(arguments, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+class DedupeIndex:
+    """Bounded, time-windowed LRU of the idempotency keys of completed calls"""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, window: datetime.timedelta = WINDOW,
+                 max_bytes: int = MAX_BYTES, saved_bytes: int = SAVED_BYTES):
+        self.max_entries = max_entries
+        self.window = window
+        self.max_bytes = max_bytes
+        self.saved_bytes = saved_bytes
+        # "operation:key" -> [completed at, fingerprint, result, size], least recently used first
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._bytes = 0
+        # Keys of the calls running now
+        self._running = set()
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, slot: str) -> bool:
+        return slot in self._entries
+
+    def claim(self, slot: str, digest: str,
+              now: Optional[datetime.datetime] = None) -> Tuple[bool, object]:
+        """Get (True, original result) for a repeat, or claim the key for this call and get (False, None).
+
+        slot is "operation:key". Waits while a call with the key runs. A
+        claimed key must be completed, or released if the call failed.
+        """
+        now = now or datetime.datetime.now()
+        with self._condition:
+            self._condition.wait_for(lambda: slot not in self._running)
+            entry = self._entries.get(slot)
+            if entry is not None and now - entry[0] > self.window:
+                self._drop(slot)
+                entry = None
+            if entry is None:
+                self._running.add(slot)
+                return False, None
+            if entry[1] != digest:
+                raise IdempotencyKeyReused(f"Kunci idempotensi sudah dipakai untuk permintaan lain: {slot}")
+            self._entries.move_to_end(slot)
+            return True, entry[2]
+
+    def complete(self, slot: str, digest: str, result,
+                 now: Optional[datetime.datetime] = None) -> None:
+        """Remember the result of a claimed call"""
+        now = now or datetime.datetime.now()
+        with self._condition:
+            self._running.discard(slot)
+            self._add(slot, now, digest, result)
+            self._evict(now)
+            self._condition.notify_all()
+
+    def release(self, slot: str) -> None:
+        """Give up a claimed key, so the call can be retried"""
+        with self._condition:
+            self._running.discard(slot)
+            self._condition.notify_all()
+
+    def _add(self, slot: str, completed: datetime.datetime, digest: str, result) -> None:
+        if slot in self._entries:
+            self._drop(slot)
+        size = len(slot) + len(json.dumps(result, default=str))
+        self._entries[slot] = [completed, digest, result, size]
+        self._bytes += size
+
+    def _drop(self, slot: str) -> None:
+        self._bytes -= self._entries.pop(slot)[3]
+
+    def _evict(self, now: datetime.datetime) -> None:
+        entries = self._entries
+        while entries and (len(entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(entries)))
+        # Expired keys are mostly at the least recently used end; the rest
+        # are dropped when they are looked up
+        while entries and now - next(iter(entries.values()))[0] > self.window:
+            self._drop(next(iter(entries)))
+
+    def to_dict(self, now: Optional[datetime.datetime] = None) -> Dict:
+        """Serialize the most recently used unexpired entries, up to saved_bytes, least recently used first.
+
+        Only these go to the data file on every save, so a save costs the
+        same however many keys are remembered; the rest are kept in memory.
+        """
+        now = now or datetime.datetime.now()
+        saved, budget = [], self.saved_bytes
+        with self._condition:
+            for slot, (completed, digest, result, size) in reversed(self._entries.items()):
+                if size > budget:
+                    break
+                if now - completed <= self.window:
+                    saved.append([slot, completed.isoformat(), digest, result])
+                    budget -= size
+        saved.reverse()
+        return {"entries": saved}
+
+    def merge(self, data: Optional[Dict]) -> int:
+        """Add the entries of a serialized index that are not here, e.g. another process's; count them"""
+        added = 0
+        with self._condition:
+            for slot, completed, digest, result in (data or {}).get("entries", []):
+                if slot not in self._entries:
+                    self._add(slot, datetime.datetime.fromisoformat(completed), digest, result)
+                    added += 1
+            if added:
+                self._evict(datetime.datetime.now())
+        return added
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict], **options) -> "DedupeIndex":
+        index = cls(**options)
+        index.merge(data)
+        return index
+
+
+def idempotent(method: Callable) -> Callable:
+    """Let a mutating method take idempotency_key=...
+
+    The instance runs the keyed call through its run_idempotent(key,
+    operation, arguments, call); calls without a key run as before.
+    """
+    operation = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, idempotency_key: Optional[str] = None, **kwargs):
+        if idempotency_key is None:
+            return method(self, *args, **kwargs)
+        return self.run_idempotent(idempotency_key, operation, [args, kwargs],
+                                   lambda: method(self, *args, **kwargs))
+    return wrapper
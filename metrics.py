@@ -0,0 +1,265 @@
+"""
+Metrics Instrumentation for CareLoopAI Clinic
+Latency histograms and counters around the public methods of CareLoopAIClinic,
+PatientDataManager and SymptomImageProcessor, plus bytes read and written by
+the data file, rendered in the Prometheus text format.
+
+Instrumentation is installed by replacing the methods on their classes when
+enabled and restoring the originals when disabled, so a disabled process
+runs the plain methods with no wrapper in between.
+
+Enable it with enable(), the clinic server's --metrics flag, or the
+environment (see configure_from_env):
+  CARELOOP_METRICS=1           instrument the clinic classes
+  CARELOOP_METRICS_PORT=9464   also serve GET /metrics on this local port
+"""
+
+import bisect
+import functools
+import importlib
+import inspect
+import os
+import threading
+import time
+import types
+from typing import Callable, Dict, List, Tuple
+
+# Latency buckets in seconds, from a dict lookup to a full save of a large file
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (module, class, component label) of the instrumented classes
+INSTRUMENTED_CLASSES = [
+    ("careloopai_clinic", "CareLoopAIClinic", "clinic"),
+    ("patient_data_manager", "PatientDataManager", "patient_data"),
+    ("image_processor", "SymptomImageProcessor", "image"),
+]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: Tuple[str, ...] = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, labels: Tuple[str, ...]) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucket_labels = _format_labels(self.label_names + ("le",), labels + (le,))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                label_text = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_text} {total:.6f}")
+                lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+operation_duration = Histogram(
+    "careloop_operation_duration_seconds", "Duration of instrumented clinic operations",
+    ("component", "method"))
+operation_errors = Counter(
+    "careloop_operation_errors_total", "Instrumented operations that raised an exception",
+    ("component", "method"))
+storage_bytes_written = Counter(
+    "careloop_storage_bytes_written_total", "Bytes written to the patient data file by save_data")
+storage_bytes_read = Counter(
+    "careloop_storage_bytes_read_total", "Bytes of the patient data file read by load_data")
+
+REGISTRY = [operation_duration, operation_errors, storage_bytes_written, storage_bytes_read]
+
+
+def render() -> str:
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _data_file_size(manager) -> int:
+    try:
+        return os.path.getsize(manager.data_file)
+    except OSError:
+        return 0
+
+
+# Extra accounting after specific methods, given the instance
+AFTER_HOOKS: Dict[Tuple[str, str], Callable] = {
+    ("patient_data", "save_data"): lambda manager: storage_bytes_written.inc(amount=_data_file_size(manager)),
+    ("patient_data", "load_data"): lambda manager: storage_bytes_read.inc(amount=_data_file_size(manager)),
+}
+
+
+def _wrap(component: str, name: str, method: Callable) -> Callable:
+    labels = (component, name)
+    after = AFTER_HOOKS.get(labels)
+    clock = time.perf_counter
+
+    if inspect.isgeneratorfunction(method):
+        # Time a streamed reply until its last section, not just the creation of the generator
+        @functools.wraps(method)
+        def instrumented_stream(self, *args, **kwargs):
+            started = clock()
+            try:
+                return (yield from method(self, *args, **kwargs))
+            except Exception:
+                operation_errors.inc(labels)
+                raise
+            finally:
+                operation_duration.observe(labels, clock() - started)
+                if after is not None:
+                    after(self)
+        return instrumented_stream
+
+    @functools.wraps(method)
+    def instrumented(self, *args, **kwargs):
+        started = clock()
+        try:
+            return method(self, *args, **kwargs)
+        except Exception:
+            operation_errors.inc(labels)
+            raise
+        finally:
+            operation_duration.observe(labels, clock() - started)
+            if after is not None:
+                after(self)
+    return instrumented
+
+
+# class -> {method name: original function}, for the instrumented classes
+_originals: Dict[type, Dict[str, Callable]] = {}
+_state_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return bool(_originals)
+
+
+def enable() -> None:
+    """Instrument the public methods of the clinic classes"""
+    with _state_lock:
+        if _originals:
+            return
+        for module_name, class_name, component in INSTRUMENTED_CLASSES:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            originals = _originals[cls] = {}
+            for name, member in list(vars(cls).items()):
+                if name.startswith("_") or not isinstance(member, types.FunctionType):
+                    continue
+                originals[name] = member
+                setattr(cls, name, _wrap(component, name, member))
+
+
+def disable() -> None:
+    """Restore the original methods; recorded values are kept"""
+    with _state_lock:
+        for cls, originals in _originals.items():
+            for name, member in originals.items():
+                setattr(cls, name, member)
+        _originals.clear()
+
+
+def reset() -> None:
+    """Drop all recorded values"""
+    for metric in REGISTRY:
+        metric.clear()
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    """Serve GET /metrics from a daemon thread, for processes without an HTTP server"""
+    # Imported here so the CLI does not pay for http.server at startup
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def configure_from_env():
+    """Enable metrics and the local endpoint as requested by the environment"""
+    port = os.environ.get("CARELOOP_METRICS_PORT")
+    if os.environ.get("CARELOOP_METRICS") == "1" or port:
+        enable()
+    if port:
+        return serve(int(port))
+    return None
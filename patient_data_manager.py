@@ -1,34 +1,491 @@
 """
 Patient Data Management System
 This module handles patient data storage and retrieval for the clinic chatbot.
+
+Patients are keyed by generated patient IDs. Secondary indexes on normalized
+phone, email and name are kept in sync by the mutation methods and saved
+alongside the records, so returning patients are found without a scan.
+
+Old history entries can be compacted into a compressed cold archive next to
+the data file (see history_archive.py); the read methods here merge archived
+entries back in when a query reaches past the hot records.
+get_symptom_history() filters longer hot histories on the integer timestamps
+of a columnar copy of the ones it has read (see symptom_store.py).
+
+A data file ending in .clpr is stored in the binary record format of
+record_format.py instead of JSON; its records decode fields on first access.
+
+Records are copy-on-write: mutations edit a copy (_edit) and publish it
+with _touch, so snapshot() readers see a consistent point-in-time view (see
+snapshot.py) while writers carry on.
+
+Threads can share one manager. Mutations of a patient's record hold one of
+STRIPES locks chosen by patient ID, so different patients are changed in
+parallel; registration and the clinic-wide scheduler and appointment index
+have their own locks, and reads need none. With flush_interval set, saves
+are left to a background flusher thread that writes all changes made in
+that interval at once, instead of every mutation rewriting the file.
+
+get_triage() ranks the patients with an active episode by urgency from the
+triage queue of triage.py, which each symptom report and check-in rescores.
+
+search() answers full-text queries over plans, symptom reports and
+check-ins from the inverted index of search_index.py. It is loaded from its
+checkpoint (or built) on the first search and then kept up to date by
+_touch.
+
+Several processes can share one data file. Saves hold the file lock of
+file_sync.py and replace the file atomically; if another process saved in
+between, its changes are merged in first (by per-patient version, keeping
+the appended history of both), so no process overwrites another's updates.
+
+The mutating methods take an optional idempotency_key. A repeat of a keyed
+call returns the original result without changing anything again; the keys
+are kept in the bounded dedupe index of idempotency.py, whose most recent
+keys are saved in the same save as the changes of the call (up to
+SAVED_BYTES of results). run_idempotent() and stream_idempotent()
+give the same to writes made of several calls, like a chat turn.
 """
 
+import atexit
 import json
 import datetime
-from typing import Dict, List, Optional
+import hashlib
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from followup_engine import FollowupEngine, FollowupDecision
+from patient_index import PatientIndex, AmbiguousPatientError, DuplicatePatientError
+from appointment_scheduler import AppointmentScheduler, SchedulingError, format_date_time
+from appointment_index import AppointmentIndex
+from record_format import BINARY_EXTENSION, decode_any, encode_file, json_default
+from file_sync import FileLock, atomic_write, file_signature, merge_patients, read_bytes
+from history_archive import ARCHIVED_SECTIONS, CompactionJob, HistoryArchive, archive_directory
+from snapshot import PatientSnapshot, SnapshotRegistry
+from search_index import SearchIndex, search_index_file
+from triage import TriageQueue
+from symptom_store import ColumnarHistoryStore
+from idempotency import DedupeIndex, fingerprint, idempotent
+
+SCHEMA_VERSION = 2
+
+# Number of per-patient mutation locks
+STRIPES = 64
+# Hot symptom histories longer than this are read through the columnar store
+COLUMNAR_HISTORY_MIN = 16
 
 class PatientDataManager:
-    def __init__(self, data_file: str = "patient_data.json"):
+    def __init__(self, data_file: str = "patient_data.json", scheduler_options: Optional[Dict] = None,
+                 flush_interval: Optional[float] = None):
         self.data_file = data_file
+        self.scheduler_options = scheduler_options or {}
+        self._loaded_indexes = None
+        self._loaded_dedupe = None
+        # Signature and content of the file as this process last read or wrote it
+        self._synced_signature = None
+        self._synced_content = None
+        self._snapshots = SnapshotRegistry()
+        # Lock order: _save_lock, stripes, _registry_lock, _schedule_lock
+        self._stripes = [threading.Lock() for _ in range(STRIPES)]
+        self._registry_lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._search: Optional[SearchIndex] = None
+        self._history = ColumnarHistoryStore()
         self.patients = self.load_data()
+        self.dedupe = DedupeIndex.from_dict(self._loaded_dedupe)
+        self._loaded_dedupe = None
+        # Per thread: depth of _deferred_saves blocks, and whether a save waits for the outermost
+        self._deferred = threading.local()
+        
+        self.flush_interval = flush_interval
+        self._flusher: Optional[threading.Thread] = None
+        self._flush_condition = threading.Condition()
+        self._dirty = False
+        self._closing = False
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="patient-data-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+    
+    @property
+    def patients(self) -> Dict:
+        return self._patients
+    
+    @patients.setter
+    def patients(self, patients: Dict) -> None:
+        """Replace all patient records and rebuild the state derived from them"""
+        self._patients = patients
+        loaded, self._loaded_indexes = self._loaded_indexes, None
+        if loaded is not None and loaded.patient_count == len(patients):
+            self.indexes = loaded
+        else:
+            self.indexes = PatientIndex.build(patients)
+        self.followup_engine = FollowupEngine.from_patients(patients)
+        self.triage = TriageQueue.from_engine(self.followup_engine)
+        self.scheduler = AppointmentScheduler.from_patients(patients, **self.scheduler_options)
+        self.appointment_index = AppointmentIndex.from_patients(patients)
+        if self._search is not None:
+            self._search.sync(patients)
+        self._history.sync(patients)
+        # Materialized patient summaries, dropped by _touch on every mutation
+        self._summaries: Dict[str, Dict] = {}
     
     def load_data(self) -> Dict:
-        """Load patient data from file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
+        """Load patient data from file, re-keying files saved by older versions"""
+        content, self._synced_signature = read_bytes(self.data_file)
+        self._synced_content = content
+        if content is None:
             return {}
+        data = decode_any(content)
+        
+        if data.get("schema_version") != SCHEMA_VERSION:
+            return migrate_legacy_patients(data)
+        
+        # Reuse the persisted indexes; the patients setter rebuilds them if
+        # they do not cover every record
+        self._loaded_indexes = PatientIndex.from_dict(data.get("indexes", {}))
+        self._loaded_dedupe = data.get("idempotency")
+        return data["patients"]
     
     def save_data(self) -> None:
-        """Save patient data to file"""
-        with open(self.data_file, 'w') as f:
-            json.dump(self.patients, f, indent=2, default=str)
+        """Save patient data to file, merging in what other processes saved meanwhile"""
+        with self._save_lock, FileLock(self.data_file):
+            if file_signature(self.data_file) != self._synced_signature:
+                self._merge_from_disk()
+            with self.snapshot() as patients:
+                with self._registry_lock:
+                    indexes = self.indexes.to_dict()
+                data = {
+                    "schema_version": SCHEMA_VERSION,
+                    "patients": patients,
+                    "indexes": indexes,
+                    "idempotency": self.dedupe.to_dict()
+                }
+                if self.data_file.endswith(BINARY_EXTENSION):
+                    content = encode_file(data)
+                else:
+                    content = json.dumps(data, indent=2, default=json_default).encode("utf-8")
+            self._synced_signature = atomic_write(self.data_file, content)
+            self._synced_content = content
+            self._checkpoint_search()
+    
+    def refresh(self) -> bool:
+        """Merge in changes other processes saved since the last load or save, if any"""
+        if file_signature(self.data_file) == self._synced_signature:
+            return False
+        with self._save_lock, FileLock(self.data_file):
+            self._merge_from_disk()
+        return True
+    
+    def _merge_from_disk(self) -> None:
+        """Merge the records on disk into ours; the caller holds the save and file locks"""
+        content, signature = read_bytes(self.data_file)
+        if content is None:
+            return
+        data = self._decode_data(content)
+        theirs = data["patients"]
+        self.dedupe.merge(data.get("idempotency"))
+        base = self._decode_patients(self._synced_content)
+        with self._exclusive():
+            merged, _ = merge_patients(self.patients, theirs, base)
+            self.patients = merged
+        self._synced_signature, self._synced_content = signature, content
+    
+    @contextmanager
+    def _exclusive(self):
+        """Hold every stripe, the registry and the schedule, to replace the records and derived state.
+        
+        Waits for every mutation in progress.
+        """
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            with self._registry_lock, self._schedule_lock:
+                yield
+        finally:
+            for lock in self._stripes:
+                lock.release()
+    
+    def _persist(self) -> None:
+        """Save now, or leave it to the flusher when there is one"""
+        deferred = self._deferred
+        if getattr(deferred, "depth", 0):
+            deferred.pending = True
+            return
+        if self._flusher is None:
+            self.save_data()
+            return
+        with self._flush_condition:
+            self._dirty = True
+            self._flush_condition.notify()
+    
+    @contextmanager
+    def _deferred_saves(self):
+        """Hold this thread's saves until the block ends, then save once"""
+        # This thread's state, even if a block in a generator is finished by another thread
+        deferred = self._deferred.__dict__
+        deferred["depth"] = deferred.get("depth", 0) + 1
+        try:
+            yield
+        finally:
+            deferred["depth"] -= 1
+            if not deferred["depth"] and deferred.pop("pending", False):
+                self._persist()
+    
+    def run_idempotent(self, key: Optional[str], operation: str, arguments, call: Callable):
+        """Run call() once per idempotency key and get its result; a repeat gets the original result.
+        
+        arguments tell a retry from a reused key, which raises
+        IdempotencyKeyReused. The changes call() makes and the key are saved
+        together, in one save. Without a key call() just runs.
+        """
+        if key is None:
+            return call()
+        slot, digest = f"{operation}:{key}", fingerprint(arguments)
+        if slot not in self.dedupe:
+            self.refresh()  # another process sharing the file may have run it
+        with self._deferred_saves():
+            repeat, result = self.dedupe.claim(slot, digest)
+            if repeat:
+                return result
+            try:
+                result = call()
+            except BaseException:
+                self.dedupe.release(slot)
+                raise
+            self.dedupe.complete(slot, digest, result)
+            self._persist()
+        return result
+    
+    def stream_idempotent(self, key: Optional[str], operation: str, arguments,
+                          start: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Like run_idempotent for a reply streamed in sections; a repeat gets the whole original reply.
+        
+        The saves of this thread wait until the reply ends, so the changes and
+        the key are saved together. If the reader stops part way, the rest of
+        the reply is still made (and not yielded), so the call is finished and
+        a retry gets all of it.
+        """
+        if key is None:
+            yield from start()
+            return
+        slot, digest = f"{operation}:{key}", fingerprint(arguments)
+        if slot not in self.dedupe:
+            self.refresh()
+        with self._deferred_saves():
+            repeat, result = self.dedupe.claim(slot, digest)
+            if repeat:
+                yield result
+                return
+            sections = []
+            iterator = iter(start())
+            try:
+                for section in iterator:
+                    sections.append(section)
+                    try:
+                        yield section
+                    except GeneratorExit:
+                        sections.extend(iterator)  # the reader left; finish without yielding
+                        break
+            except BaseException:
+                self.dedupe.release(slot)
+                raise
+            self.dedupe.complete(slot, digest, "".join(sections))
+            self._persist()
+    
+    def _flush_loop(self) -> None:
+        condition = self._flush_condition
+        while True:
+            with condition:
+                condition.wait_for(lambda: self._dirty or self._closing)
+                if self._closing:
+                    return
+                # Collect the changes of one interval into a single save
+                condition.wait_for(lambda: self._closing, self.flush_interval)
+                if not self._dirty:
+                    continue  # flush() saved them meanwhile
+                self._dirty = False
+            try:
+                self.save_data()
+            except Exception as e:
+                with condition:
+                    self._dirty = True
+                print(f"Gagal menyimpan data pasien: {e}", file=sys.stderr)
+    
+    def flush(self) -> None:
+        """Save pending changes now"""
+        with self._flush_condition:
+            self._dirty = False
+        self.save_data()
+    
+    def close(self) -> None:
+        """Stop the flusher, saving the changes it had not saved yet"""
+        if self._flusher is None:
+            return
+        with self._flush_condition:
+            self._closing = True
+            self._flush_condition.notify()
+        self._flusher.join()
+        self._flusher = None
+        atexit.unregister(self.close)
+        if self._dirty:
+            self.flush()
     
-    def register_patient(self, name: str, phone: str = "", email: str = "") -> None:
-        """Register a new patient"""
-        self.patients[name] = {
+    def _decode_data(self, content: bytes) -> Dict:
+        data = decode_any(content)
+        if data.get("schema_version") != SCHEMA_VERSION:
+            return {"patients": migrate_legacy_patients(data)}
+        return data
+    
+    def _decode_patients(self, content: Optional[bytes]) -> Dict:
+        if content is None:
+            return {}
+        return self._decode_data(content)["patients"]
+    
+    def snapshot(self) -> PatientSnapshot:
+        """Get a consistent point-in-time view of all patient records, in O(1).
+        
+        Use it as a context manager, or call release(), so it stops keeping
+        old versions of records changed meanwhile.
+        """
+        return self._snapshots.take(self.patients)
+    
+    def _patient_lock(self, patient_id: str) -> threading.Lock:
+        """Get the stripe lock that guards changes to a patient's record"""
+        return self._stripes[hash(patient_id) % STRIPES]
+    
+    def _edit(self, patient_id: str, *sections: str) -> Dict:
+        """Get a private copy of a record, with copies of the sections to change.
+        
+        The caller holds the patient's lock until the copy is published.
+        """
+        record = self.patients[patient_id].copy()
+        for section in sections:
+            record[section] = list(record.get(section, []))
+        return record
+    
+    def _touch(self, patient_id: str, record: Dict) -> None:
+        """Bump the version of an edited record, publish it and drop the materialized summary"""
+        record["version"] = record.get("version", 0) + 1
+        if self._search is not None:
+            self._search.update(patient_id, self.patients.get(patient_id), record)
+        self._history.update(patient_id, record)
+        self._snapshots.publish(self.patients, patient_id, record)
+        self._summaries.pop(patient_id, None)
+    
+    def resolve_patient(self, patient_ref: str) -> Optional[str]:
+        """Get the patient ID for a patient ID or a unique patient name"""
+        if patient_ref in self.patients:
+            return patient_ref
+        
+        matches = self.indexes.find_by_name(patient_ref)
+        if len(matches) > 1:
+            raise AmbiguousPatientError(f"Ada {len(matches)} pasien bernama {patient_ref}")
+        return matches[0] if matches else None
+    
+    def _resolve_or_register(self, patient_ref: str) -> str:
+        """Get the patient ID for a reference, registering an unknown name"""
+        patient_id = self.resolve_patient(patient_ref)
+        if patient_id is None:
+            with self._registry_lock:
+                patient_id = self.resolve_patient(patient_ref)
+                if patient_id is None:
+                    patient_id = self._register(patient_ref)
+            self._persist()
+        return patient_id
+    
+    def export_records(self, patient_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Get whole patient records to move to another storage node.
+        
+        The archive blocks of a record point into this node's archive, so
+        the archived entries go inline in the exported record instead.
+        """
+        patients = self.patients
+        records = {}
+        for patient_id in patient_ids:
+            record = patients.get(patient_id)
+            if record is None:
+                continue
+            if record.get("archive"):
+                record = dict(record, archive=dict(record["archive"], blocks=[],
+                                                   entries=self.get_archived_history(patient_id)))
+            records[patient_id] = record
+        return records
+    
+    def import_records(self, records: Dict[str, Dict]) -> None:
+        """Add or replace whole patient records, e.g. ones moved here from another storage node.
+        
+        Archived entries exported inline are written to a segment of this node's archive.
+        """
+        inline = {patient_id: record for patient_id, record in records.items()
+                  if "entries" in record.get("archive", {})}
+        if inline:
+            refs = HistoryArchive(archive_directory(self.data_file)).write_segment(
+                (patient_id, record["archive"]["entries"]) for patient_id, record in inline.items())
+            records = dict(records)
+            for patient_id, record in inline.items():
+                archive = {key: value for key, value in record["archive"].items() if key != "entries"}
+                archive["blocks"] = [refs[patient_id]] if patient_id in refs else []
+                records[patient_id] = dict(record, archive=archive)
+        with self._exclusive():
+            patients = dict(self.patients)
+            patients.update(records)
+            self.patients = patients
+        self._persist()
+    
+    def drop_records(self, patient_ids: Iterable[str]) -> int:
+        """Remove patient records, e.g. ones moved to another storage node, and count the removed"""
+        with self._exclusive():
+            patients = dict(self.patients)
+            removed = sum(patients.pop(patient_id, None) is not None for patient_id in patient_ids)
+            if removed:
+                self.patients = patients
+        if removed:
+            self._persist()
+        return removed
+    
+    def find_by_phone(self, phone: str) -> Optional[str]:
+        """Get the ID of the patient registered with a phone number"""
+        return self.indexes.find_by_phone(phone)
+    
+    def find_by_email(self, email: str) -> Optional[str]:
+        """Get the ID of the patient registered with an email address"""
+        return self.indexes.find_by_email(email)
+    
+    def find_by_name(self, name: str) -> List[str]:
+        """Get the IDs of all patients with a name"""
+        return self.indexes.find_by_name(name)
+    
+    @idempotent
+    def register_patient(self, name: str, phone: str = "", email: str = "",
+                         patient_id: Optional[str] = None) -> str:
+        """Register a new patient and return the patient ID, generated unless one is given.
+        
+        The shard router gives the ID, so it knows the node that owns the patient.
+        """
+        with self._registry_lock:
+            patient_id = self._register(name, phone, email, patient_id)
+        self._persist()
+        return patient_id
+    
+    def _register(self, name: str, phone: str = "", email: str = "",
+                  patient_id: Optional[str] = None) -> str:
+        """Add a new patient record; the caller holds the registry lock"""
+        self.indexes.check_unique(phone, email)
+        
+        if patient_id is None:
+            patient_id = generate_patient_id()
+            while patient_id in self.patients:
+                patient_id = generate_patient_id()
+        elif patient_id in self.patients:
+            raise DuplicatePatientError(f"ID pasien sudah terdaftar: {patient_id}")
+        
+        record = {
             "personal_info": {
+                "patient_id": patient_id,
                 "name": name,
                 "phone": phone,
                 "email": email,
@@ -37,29 +494,42 @@ class PatientDataManager:
             "symptoms_history": [],
             "treatment_plans": [],
             "checkin_history": [],
-            "appointments": []
+            "appointments": [],
+            "version": 0
         }
-        self.save_data()
+        self.indexes.add(patient_id, record["personal_info"])
+        self._touch(patient_id, record)
+        return patient_id
     
-    def add_symptom_report(self, patient_name: str, symptoms: List[str], 
+    @idempotent
+    def add_symptom_report(self, patient_id: str, symptoms: List[str], 
                           body_part: str = "", severity: str = "sedang") -> None:
         """Add a symptom report for a patient"""
-        if patient_name not in self.patients:
-            self.register_patient(patient_name)
+        patient_id = self._resolve_or_register(patient_id)
         
+        now = datetime.datetime.now()
         symptom_entry = {
-            "date": datetime.datetime.now().isoformat(),
+            "date": now.isoformat(),
             "symptoms": symptoms,
             "body_part": body_part,
             "severity": severity
         }
         
-        self.patients[patient_name]["symptoms_history"].append(symptom_entry)
-        self.save_data()
+        with self._patient_lock(patient_id):
+            record = self._edit(patient_id, "symptoms_history")
+            record["symptoms_history"].append(symptom_entry)
+            self.followup_engine.record_report(patient_id, symptoms, severity, now)
+            self.triage.update(patient_id, now)
+            self._touch(patient_id, record)
+        self._persist()
     
-    def generate_treatment_plan(self, patient_name: str, symptoms: List[str], 
+    @idempotent
+    def generate_treatment_plan(self, patient_id: str, symptoms: List[str], 
                                body_part: str = "", severity: str = "sedang") -> str:
         """Generate a treatment plan based on symptoms"""
+        patient_id = self._resolve_or_register(patient_id)
+        patient_name = self.patients[patient_id]["personal_info"]["name"]
+        
         # This is a simplified example - in a real system, this would be more complex
         plan = f"Rencana pengobatan untuk {patient_name}:\n"
         
@@ -91,27 +561,20 @@ class PatientDataManager:
         plan += "- Jika gejala memburuk dalam 2-3 hari, segera kunjungi klinik\n"
         
         # Save the treatment plan
-        treatment_entry = {
-            "date": datetime.datetime.now().isoformat(),
-            "plan": plan,
-            "based_on_symptoms": symptoms,
-            "body_part": body_part,
-            "severity": severity
-        }
-        
-        self.patients[patient_name]["treatment_plans"].append(treatment_entry)
-        self.save_data()
+        self.add_treatment_plan(patient_id, plan, symptoms, body_part, severity)
         
         return plan
     
-    def revise_treatment_plan(self, patient_name: str, symptoms: List[str], 
+    @idempotent
+    def revise_treatment_plan(self, patient_id: str, symptoms: List[str], 
                              body_part: str = "", severity: str = "sedang") -> str:
         """Revise treatment plan based on patient progress"""
-        if patient_name not in self.patients or not self.patients[patient_name]["treatment_plans"]:
-            return self.generate_treatment_plan(patient_name, symptoms, body_part, severity)
+        patient_id = self._resolve_or_register(patient_id)
+        if not self.patients[patient_id]["treatment_plans"]:
+            return self.generate_treatment_plan(patient_id, symptoms, body_part, severity)
         
         # Get the latest treatment plan
-        latest_plan = self.patients[patient_name]["treatment_plans"][-1]["plan"]
+        latest_plan = self.patients[patient_id]["treatment_plans"][-1]["plan"]
         
         # Check if symptoms are improving
         if severity == "ringan" or "membaik" in symptoms:
@@ -122,109 +585,478 @@ class PatientDataManager:
             revised_plan = latest_plan + "\n\nUpdate: Kondisi stabil, lanjutkan pengobatan."
         
         # Save the revised treatment plan
+        self.add_treatment_plan(patient_id, revised_plan, symptoms, body_part, severity,
+                                revision_of=len(self.patients[patient_id]["treatment_plans"]) - 1)
+        
+        return revised_plan
+    
+    @idempotent
+    def add_treatment_plan(self, patient_id: str, plan: str, symptoms: List[str],
+                           body_part: str = "", severity: str = "sedang",
+                           revision_of: Optional[int] = None) -> None:
+        """Store a treatment plan written elsewhere, e.g. by the Rasa actions"""
+        patient_id = self._resolve_or_register(patient_id)
+        
         treatment_entry = {
             "date": datetime.datetime.now().isoformat(),
-            "plan": revised_plan,
+            "plan": plan,
             "based_on_symptoms": symptoms,
             "body_part": body_part,
-            "severity": severity,
-            "revision_of": len(self.patients[patient_name]["treatment_plans"]) - 1
+            "severity": severity
         }
+        if revision_of is not None:
+            treatment_entry["revision_of"] = revision_of
         
-        self.patients[patient_name]["treatment_plans"].append(treatment_entry)
-        self.save_data()
-        
-        return revised_plan
+        with self._patient_lock(patient_id):
+            record = self._edit(patient_id, "treatment_plans")
+            record["treatment_plans"].append(treatment_entry)
+            self._touch(patient_id, record)
+        self._persist()
     
-    def add_daily_checkin(self, patient_name: str, symptoms: List[str], 
+    @idempotent
+    def add_daily_checkin(self, patient_id: str, symptoms: List[str], 
                          body_part: str = "", severity: str = "sedang") -> None:
         """Add a daily checkin entry for a patient"""
-        if patient_name not in self.patients:
-            self.register_patient(patient_name)
+        patient_id = self._resolve_or_register(patient_id)
         
+        now = datetime.datetime.now()
         checkin_entry = {
-            "date": datetime.datetime.now().isoformat(),
+            "date": now.isoformat(),
             "symptoms": symptoms,
             "body_part": body_part,
             "severity": severity
         }
         
-        self.patients[patient_name]["checkin_history"].append(checkin_entry)
-        self.save_data()
+        with self._patient_lock(patient_id):
+            record = self._edit(patient_id, "checkin_history")
+            record["checkin_history"].append(checkin_entry)
+            self.followup_engine.record_checkin(patient_id, symptoms, severity, now)
+            self.triage.update(patient_id, now)
+            self._touch(patient_id, record)
+        self._persist()
     
-    def schedule_appointment(self, patient_name: str, date_time: str, 
-                           reason: str = "Perlu pemeriksaan langsung") -> str:
-        """Schedule an appointment for a patient"""
-        if patient_name not in self.patients:
-            self.register_patient(patient_name)
-        
-        appointment = {
-            "date_time": date_time,
-            "reason": reason,
-            "status": "scheduled",
-            "created_date": datetime.datetime.now().isoformat()
-        }
+    def record_photo(self, patient_id: str, severity: str) -> None:
+        """Update a patient's follow-up statistics and triage score with the severity seen in a symptom photo.
         
-        self.patients[patient_name]["appointments"].append(appointment)
-        self.save_data()
+        The finding itself is not stored (see FollowupEngine.record_photo),
+        but the record's version changes, so summaries and ETags do too.
+        """
+        patient_id = self.resolve_patient(patient_id)
+        if patient_id is None:
+            return
+        
+        now = datetime.datetime.now()
+        with self._patient_lock(patient_id):
+            record = self._edit(patient_id)
+            self.followup_engine.record_photo(patient_id, severity, now)
+            self.triage.update(patient_id, now)
+            self._touch(patient_id, record)
+        self._persist()
+    
+    @idempotent
+    def schedule_appointment(self, patient_id: str, date_time: Optional[str] = None, 
+                           reason: str = "Perlu pemeriksaan langsung", doctor: Optional[str] = None,
+                           duration_minutes: Optional[int] = None) -> str:
+        """Schedule an appointment for a patient.
+        
+        Without date_time the earliest free slot is booked. Raises
+        SchedulingError if the requested time is taken or outside clinic hours.
+        """
+        patient_id = self._resolve_or_register(patient_id)
+        
+        with self._patient_lock(patient_id), self._schedule_lock:
+            if date_time is None:
+                earliest = self.scheduler.find_earliest_slot(duration_minutes=duration_minutes, doctor=doctor)
+                if earliest is None:
+                    raise SchedulingError("Tidak ada jadwal kosong dalam waktu dekat")
+                date_time = earliest[0]
+            booking = self.scheduler.book(patient_id, date_time, duration_minutes, doctor)
+            
+            appointment = {
+                "appointment_id": booking.appointment_id,
+                "date_time": format_date_time(booking.start),
+                "duration_minutes": booking.slots * self.scheduler.hours.slot_minutes,
+                "doctor": booking.doctor,
+                "room": booking.room,
+                "reason": reason,
+                "status": "scheduled",
+                "created_date": datetime.datetime.now().isoformat()
+            }
+            
+            record = self._edit(patient_id, "appointments")
+            record["appointments"].append(appointment)
+            self.appointment_index.add(patient_id, appointment)
+            self._touch(patient_id, record)
+        self._persist()
         
-        return f"Kunjungan Anda telah dijadwalkan untuk {date_time}."
+        return (f"Kunjungan Anda telah dijadwalkan untuk {appointment['date_time']} "
+                f"dengan {booking.doctor} di {booking.room}.")
+    
+    def _find_appointment(self, patient_id: str, appointment_id: str) -> Dict:
+        for appointment in self.patients[patient_id]["appointments"]:
+            if appointment.get("appointment_id") == appointment_id:
+                return appointment
+        raise SchedulingError(f"Janji temu tidak ditemukan: {appointment_id}")
+    
+    def _edit_appointment(self, patient_id: str, appointment_id: str, changes: Dict) -> Tuple[Dict, Dict]:
+        """Get an edited copy of a record with a changed copy of one appointment"""
+        record = self._edit(patient_id, "appointments")
+        appointments = record["appointments"]
+        for position, appointment in enumerate(appointments):
+            if appointment.get("appointment_id") == appointment_id:
+                appointments[position] = dict(appointment, **changes)
+                return record, appointments[position]
+        raise SchedulingError(f"Janji temu tidak ditemukan: {appointment_id}")
+    
+    @idempotent
+    def cancel_appointment(self, patient_id: str, appointment_id: str) -> str:
+        """Cancel a scheduled appointment and free its slot"""
+        patient_id = self.resolve_patient(patient_id)
+        if patient_id is None:
+            raise SchedulingError("Pasien tidak ditemukan")
+        with self._patient_lock(patient_id), self._schedule_lock:
+            appointment = self._find_appointment(patient_id, appointment_id)
+            if appointment["status"] != "scheduled":
+                raise SchedulingError("Janji temu ini tidak aktif")
+            
+            self.scheduler.cancel(appointment_id)
+            record, appointment = self._edit_appointment(patient_id, appointment_id, {
+                "status": "cancelled",
+                "cancelled_date": datetime.datetime.now().isoformat()
+            })
+            self.appointment_index.add(patient_id, appointment)
+            self._touch(patient_id, record)
+        self._persist()
+        
+        return f"Kunjungan Anda pada {appointment['date_time']} telah dibatalkan."
+    
+    @idempotent
+    def reschedule_appointment(self, patient_id: str, appointment_id: str,
+                               date_time: Optional[str] = None) -> str:
+        """Move a scheduled appointment, to the earliest free slot if no time is given"""
+        patient_id = self.resolve_patient(patient_id)
+        if patient_id is None:
+            raise SchedulingError("Pasien tidak ditemukan")
+        with self._patient_lock(patient_id), self._schedule_lock:
+            appointment = self._find_appointment(patient_id, appointment_id)
+            if appointment["status"] != "scheduled":
+                raise SchedulingError("Janji temu ini tidak aktif")
+            
+            if date_time is None:
+                earliest = self.scheduler.find_earliest_slot(duration_minutes=appointment.get("duration_minutes"))
+                if earliest is None:
+                    raise SchedulingError("Tidak ada jadwal kosong dalam waktu dekat")
+                date_time = earliest[0]
+            booking = self.scheduler.reschedule(appointment_id, date_time)
+            
+            record, appointment = self._edit_appointment(patient_id, appointment_id, {
+                "date_time": format_date_time(booking.start),
+                "doctor": booking.doctor,
+                "room": booking.room
+            })
+            self.appointment_index.add(patient_id, appointment)
+            self._touch(patient_id, record)
+        self._persist()
+        
+        return (f"Kunjungan Anda telah dipindahkan ke {appointment['date_time']} "
+                f"dengan {booking.doctor} di {booking.room}.")
+    
+    def get_appointments(self, start=None, end=None,
+                         status: Union[str, Iterable[str], None] = "scheduled",
+                         cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict], Optional[str]]:
+        """Get a page of appointments of all patients in [start, end), in date order.
+        
+        Pass the returned cursor back to get the next page; it is None on the
+        last page. status may be a status, a list of statuses or None for all.
+        """
+        with self._schedule_lock:
+            appointments, next_cursor = self.appointment_index.page(start, end, status, cursor, limit)
+        for appointment in appointments:
+            appointment["patient_name"] = self.patients[appointment["patient_id"]]["personal_info"]["name"]
+        return appointments, next_cursor
+    
+    def count_appointments(self, start=None, end=None,
+                           status: Union[str, Iterable[str], None] = "scheduled") -> int:
+        """Count appointments of all patients in [start, end)"""
+        with self._schedule_lock:
+            return self.appointment_index.count(start, end, status)
     
-    def get_patient_data(self, patient_name: str) -> Optional[Dict]:
+    def get_patient_data(self, patient_id: str) -> Optional[Dict]:
         """Get all data for a specific patient"""
-        return self.patients.get(patient_name)
+        patient_id = self.resolve_patient(patient_id)
+        return self.patients.get(patient_id)
     
-    def get_latest_treatment_plan(self, patient_name: str) -> Optional[str]:
+    def get_latest_treatment_plan(self, patient_id: str) -> Optional[str]:
         """Get the latest treatment plan for a patient"""
-        if patient_name in self.patients and self.patients[patient_name]["treatment_plans"]:
-            return self.patients[patient_name]["treatment_plans"][-1]["plan"]
+        patient_id = self.resolve_patient(patient_id)
+        if patient_id in self.patients and self.patients[patient_id]["treatment_plans"]:
+            return self.patients[patient_id]["treatment_plans"][-1]["plan"]
         return None
     
-    def get_symptom_history(self, patient_name: str, days: int = 7) -> List[Dict]:
+    def get_symptom_history(self, patient_id: str, days: int = 7) -> List[Dict]:
         """Get symptom history for a patient for the last N days"""
-        if patient_name not in self.patients:
+        patient_id = self.resolve_patient(patient_id)
+        if patient_id not in self.patients:
             return []
         
-        history = self.patients[patient_name]["symptoms_history"]
+        record = self.patients[patient_id]
+        history = record["symptoms_history"]
         cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days)
         
+        if self._window_reaches_archive(record, "symptoms_history", cutoff_date):
+            history = self.get_full_history(patient_id, "symptoms_history")
+        elif len(history) > COLUMNAR_HISTORY_MIN:
+            # Longer hot histories are filtered on the columnar timestamps, without parsing their dates
+            return [history[position]
+                    for position in self._history.recent_positions(patient_id, record, "symptoms_history",
+                                                                   cutoff_date)]
+        
         recent_history = [
             entry for entry in history 
             if datetime.datetime.fromisoformat(entry["date"]) > cutoff_date
         ]
         
         return recent_history
+    
+    def _window_reaches_archive(self, record: Dict, section: str, cutoff_date: datetime.datetime) -> bool:
+        """Whether entries after cutoff_date may be archived, so reading them needs the archive"""
+        archive = record.get("archive")
+        if not archive:
+            return False
+        if "newest" in archive:
+            newest = archive["newest"].get(section)
+            return newest is not None and datetime.datetime.fromisoformat(newest) > cutoff_date
+        # Archives compacted before newest dates were kept: go by the oldest hot entry
+        history = record[section]
+        return not history or datetime.datetime.fromisoformat(history[0]["date"]) > cutoff_date
+    
+    def get_archived_history(self, patient_id: str) -> Dict[str, List[Dict]]:
+        """Get the archived entries of a patient per history section"""
+        patient_id = self.resolve_patient(patient_id)
+        record = self.patients.get(patient_id)
+        if not record or not record.get("archive"):
+            return {section: [] for section in ARCHIVED_SECTIONS}
+        return HistoryArchive(archive_directory(self.data_file)).read_patient(record["archive"]["blocks"])
+    
+    def get_full_history(self, patient_id: str, section: str = "symptoms_history") -> List[Dict]:
+        """Get archived and hot entries of one history section, oldest first"""
+        patient_id = self.resolve_patient(patient_id)
+        record = self.patients.get(patient_id)
+        if record is None:
+            return []
+        return self.get_archived_history(patient_id).get(section, []) + record[section]
+    
+    def compact_history(self, horizon_days: int = 90, codec: str = "gzip",
+                        background: bool = False) -> CompactionJob:
+        """Move old and resolved history into the cold archive.
+        
+        With background=True the job runs in its own thread; poll its
+        progress() and wait() for it.
+        """
+        job = CompactionJob(self, horizon_days, codec)
+        return job.start() if background else job.run()
+    
+    def search(self, query: str, since: Optional[datetime.datetime] = None,
+               until: Optional[datetime.datetime] = None) -> List[str]:
+        """Get the IDs of the patients whose history matches a query (see search_index.py).
+        
+        since and until bound the entry dates of terms without their own @range.
+        """
+        if self._search is None:
+            # Building waits for mutations in progress, so none is missed
+            for lock in self._stripes:
+                lock.acquire()
+            try:
+                with self._registry_lock:
+                    if self._search is None:
+                        index = SearchIndex.load(search_index_file(self.data_file))
+                        index.sync(self.patients)
+                        self._search = index
+            finally:
+                for lock in self._stripes:
+                    lock.release()
+            self._checkpoint_search()
+        return self._search.search(query, since, until)
+    
+    def _checkpoint_search(self) -> None:
+        """Save the search index once enough documents were indexed since its checkpoint"""
+        if self._search is not None and self._search.checkpoint_due():
+            self._search.save(search_index_file(self.data_file))
+    
+    def get_patient_summary(self, patient_id: str,
+                            now: Optional[datetime.datetime] = None) -> Optional[Dict]:
+        """Get the materialized summary of a patient, rebuilding it only when stale.
+        
+        The summary carries the patient's data version and an ETag so HTTP
+        clients can send If-None-Match and skip unchanged payloads.
+        """
+        patient_id = self.resolve_patient(patient_id)
+        record = self.patients.get(patient_id)
+        if record is None:
+            return None
+        
+        now = now or datetime.datetime.now()
+        cached = self._summaries.get(patient_id)
+        if (cached is not None and cached["record"] is record
+                and cached["summary"]["version"] == record.get("version", 0)
+                and (cached["valid_until"] is None or now < cached["valid_until"])):
+            return cached["summary"]
+        
+        summary, valid_until = self._build_summary(patient_id, record, now)
+        self._summaries[patient_id] = {"record": record, "summary": summary, "valid_until": valid_until}
+        return summary
+    
+    def get_patient_summary_if_changed(self, patient_id: str, etag: Optional[str]) -> Optional[Dict]:
+        """Get the summary of a patient, or None when it still matches the given ETag"""
+        summary = self.get_patient_summary(patient_id)
+        if summary is not None and etag is not None and summary["etag"] == etag:
+            return None
+        return summary
+    
+    def _build_summary(self, patient_id: str, record: Dict, now: datetime.datetime):
+        """Build a summary and the time at which its 7-day window changes"""
+        plans = record["treatment_plans"]
+        treatment_plan = plans[-1]["plan"] if plans else None
+        
+        cutoff = now - datetime.timedelta(days=7)
+        recent = []
+        for entry in reversed(record["symptoms_history"]):
+            date = datetime.datetime.fromisoformat(entry["date"])
+            if date > cutoff:
+                recent.append((date, entry))
+                if len(recent) == 3:
+                    break
+        recent.reverse()
+        
+        text = f"Ringkasan kondisi Anda, {record['personal_info']['name']}:\n\n"
+        if treatment_plan:
+            text += f"Rencana Pengobatan:\n{treatment_plan[:200]}...\n\n"
+        if recent:
+            text += "Riwayat Gejala (7 hari terakhir):\n"
+            for date, entry in recent:
+                text += f"- {date.strftime('%d %b %Y')}: {', '.join(entry['symptoms'])} ({entry['severity']})\n"
+        
+        version = record.get("version", 0)
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        summary = {
+            "patient": patient_id,
+            "name": record["personal_info"]["name"],
+            "version": version,
+            "etag": f'"v{version}-{digest}"',
+            "treatment_plan": treatment_plan,
+            "recent_symptoms": [
+                {"date": date.isoformat(), "symptoms": entry["symptoms"], "severity": entry["severity"]}
+                for date, entry in recent
+            ],
+            "text": text
+        }
+        
+        # The oldest shown entry leaving the 7-day window changes the summary
+        valid_until = recent[0][0] + datetime.timedelta(days=7) if recent else None
+        return summary, valid_until
+    
+    def check_followup_needed(self, patient_id: str) -> FollowupDecision:
+        """Decide whether a patient needs a follow-up visit"""
+        return self.followup_engine.evaluate(self.resolve_patient(patient_id) or patient_id)
+    
+    def get_followup_candidates(self) -> Dict[str, FollowupDecision]:
+        """Get all patients that currently need a follow-up visit"""
+        return self.followup_engine.evaluate_all(only_needed=True)
+    
+    def get_triage(self, k: int = 10, now: Optional[datetime.datetime] = None) -> List[Dict]:
+        """Get the k patients with an active episode who most urgently need attention, most urgent first"""
+        entries = self.triage.top(k, now)
+        for entry in entries:
+            entry["name"] = self.patients[entry["patient_id"]]["personal_info"]["name"]
+        return entries
+
+
+def generate_patient_id() -> str:
+    """Generate a new random patient ID"""
+    return f"P{uuid.uuid4().hex[:12]}"
+
+
+def migrate_legacy_patients(data: Dict) -> Dict:
+    """Re-key a name-keyed patient file from older versions by patient ID.
+    
+    Records written by the Rasa actions, which only kept the latest symptoms
+    and plan, are converted to the full record shape.
+    """
+    patients = {}
+    for name, record in data.items():
+        if not isinstance(record, dict) or not record:
+            continue
+        
+        if "personal_info" not in record:
+            date = record.get("last_updated") or datetime.datetime.now().isoformat()
+            entry = {
+                "date": date,
+                "symptoms": record.get("symptoms") or [],
+                "body_part": record.get("body_part") or "",
+                "severity": record.get("severity") or "sedang"
+            }
+            record = {
+                "personal_info": {"name": name, "phone": "", "email": "", "registration_date": date},
+                "symptoms_history": [entry] if entry["symptoms"] else [],
+                "treatment_plans": [],
+                "checkin_history": [],
+                "appointments": []
+            }
+            if data[name].get("treatment_plan"):
+                record["treatment_plans"].append({
+                    "date": date,
+                    "plan": data[name]["treatment_plan"],
+                    "based_on_symptoms": entry["symptoms"],
+                    "body_part": entry["body_part"],
+                    "severity": entry["severity"]
+                })
+        
+        patient_id = generate_patient_id()
+        while patient_id in patients:
+            patient_id = generate_patient_id()
+        record["personal_info"]["patient_id"] = patient_id
+        patients[patient_id] = record
+    
+    return patients
+
+
+def migrate_data_file(data_file: str = "patient_data.json") -> int:
+    """Rewrite a data file in the current format, return the number of patients"""
+    manager = PatientDataManager(data_file)
+    manager.save_data()
+    return len(manager.patients)
 
 # Example usage
 if __name__ == "__main__":
     # Create a patient data manager
     pdm = PatientDataManager()
     
-    # Register a patient
-    pdm.register_patient("Budi Santoso", "08123456789", "budi@email.com")
+    # Register a patient, or find them again by phone number
+    patient_id = pdm.find_by_phone("08123456789") or pdm.register_patient("Budi Santoso", "08123456789", "budi@email.com")
+    print(f"Patient ID: {patient_id}")
     
     # Add symptom report
-    pdm.add_symptom_report("Budi Santoso", ["demam", "batuk", "sakit kepala"], "kepala", "sedang")
+    pdm.add_symptom_report(patient_id, ["demam", "batuk", "sakit kepala"], "kepala", "sedang")
     
     # Generate treatment plan
-    plan = pdm.generate_treatment_plan("Budi Santoso", ["demam", "batuk", "sakit kepala"], "kepala", "sedang")
+    plan = pdm.generate_treatment_plan(patient_id, ["demam", "batuk", "sakit kepala"], "kepala", "sedang")
     print("Treatment Plan:")
     print(plan)
     
     # Add daily checkin
-    pdm.add_daily_checkin("Budi Santoso", ["batuk", "membaik"], "dada", "ringan")
+    pdm.add_daily_checkin(patient_id, ["batuk", "membaik"], "dada", "ringan")
     
     # Revise treatment plan
-    revised_plan = pdm.revise_treatment_plan("Budi Santoso", ["batuk", "membaik"], "dada", "ringan")
+    revised_plan = pdm.revise_treatment_plan(patient_id, ["batuk", "membaik"], "dada", "ringan")
     print("\nRevised Treatment Plan:")
     print(revised_plan)
     
     # Schedule appointment
-    appointment = pdm.schedule_appointment("Budi Santoso", "2023-06-15 10:00", "Perlu pemeriksaan langsung")
+    appointment = pdm.schedule_appointment(patient_id, reason="Perlu pemeriksaan langsung")
     print("\nAppointment:")
     print(appointment)
     
     # Get patient data
-    patient_data = pdm.get_patient_data("Budi Santoso")
+    patient_data = pdm.get_patient_data(patient_id)
     print("\nPatient Data:")
     print(json.dumps(patient_data, indent=2))
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Patient Secondary Indexes
+Hash indexes from normalized phone number, email and name to patient IDs.
+Phone and email are unique per patient; names are not, so the name index
+maps to every patient sharing that name.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+
+class DuplicatePatientError(ValueError):
+    """Raised when a phone number or email already belongs to another patient"""
+
+
+class AmbiguousPatientError(ValueError):
+    """Raised when a name matches more than one patient"""
+
+
+def normalize_phone(phone: str) -> str:
+    """Normalize an Indonesian phone number to its international digits (62...)"""
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("0"):
+        digits = "62" + digits[1:]
+    return digits
+
+
+def normalize_email(email: str) -> str:
+    """Normalize an email address for comparison"""
+    return (email or "").strip().lower()
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a display name for comparison"""
+    return " ".join((name or "").split()).casefold()
+
+
+class PatientIndex:
+    def __init__(self):
+        self.by_phone: Dict[str, str] = {}
+        self.by_email: Dict[str, str] = {}
+        self.by_name: Dict[str, List[str]] = {}
+        self.patient_count = 0
+
+    @classmethod
+    def build(cls, patients: Dict) -> "PatientIndex":
+        """Build the indexes from patient records keyed by patient ID"""
+        index = cls()
+        for patient_id, record in patients.items():
+            index.add(patient_id, record["personal_info"], check=False)
+        return index
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PatientIndex":
+        """Restore indexes persisted with to_dict"""
+        index = cls()
+        index.by_phone = dict(data.get("phone", {}))
+        index.by_email = dict(data.get("email", {}))
+        index.by_name = {name: list(ids) for name, ids in data.get("name", {}).items()}
+        index.patient_count = data.get("patient_count", 0)
+        return index
+
+    def to_dict(self) -> Dict:
+        """Get the indexes in a JSON-serializable form"""
+        return {
+            "patient_count": self.patient_count,
+            "phone": self.by_phone,
+            "email": self.by_email,
+            "name": self.by_name
+        }
+
+    def check_unique(self, phone: str = "", email: str = "", patient_id: Optional[str] = None) -> None:
+        """Raise DuplicatePatientError if the phone or email belongs to another patient"""
+        owner = self.by_phone.get(normalize_phone(phone)) if phone else None
+        if owner is not None and owner != patient_id:
+            raise DuplicatePatientError(f"Nomor telepon {phone} sudah terdaftar")
+        owner = self.by_email.get(normalize_email(email)) if email else None
+        if owner is not None and owner != patient_id:
+            raise DuplicatePatientError(f"Email {email} sudah terdaftar")
+
+    def add(self, patient_id: str, personal_info: Dict, check: bool = True) -> None:
+        """Index a patient's personal info"""
+        phone = personal_info.get("phone", "")
+        email = personal_info.get("email", "")
+        if check:
+            self.check_unique(phone, email, patient_id)
+
+        if phone:
+            self.by_phone.setdefault(normalize_phone(phone), patient_id)
+        if email:
+            self.by_email.setdefault(normalize_email(email), patient_id)
+        self.by_name.setdefault(normalize_name(personal_info.get("name", "")), []).append(patient_id)
+        self.patient_count += 1
+
+    def remove(self, patient_id: str, personal_info: Dict) -> None:
+        """Remove a patient's personal info from the indexes"""
+        phone = normalize_phone(personal_info.get("phone", ""))
+        if self.by_phone.get(phone) == patient_id:
+            del self.by_phone[phone]
+        email = normalize_email(personal_info.get("email", ""))
+        if self.by_email.get(email) == patient_id:
+            del self.by_email[email]
+
+        name = normalize_name(personal_info.get("name", ""))
+        ids = self.by_name.get(name, [])
+        if patient_id in ids:
+            ids.remove(patient_id)
+            if not ids:
+                del self.by_name[name]
+            self.patient_count -= 1
+
+    def find_by_phone(self, phone: str) -> Optional[str]:
+        """Get the patient ID registered with a phone number"""
+        return self.by_phone.get(normalize_phone(phone)) if phone else None
+
+    def find_by_email(self, email: str) -> Optional[str]:
+        """Get the patient ID registered with an email address"""
+        return self.by_email.get(normalize_email(email)) if email else None
+
+    def find_by_name(self, name: str) -> List[str]:
+        """Get the IDs of all patients with a name"""
+        return list(self.by_name.get(normalize_name(name), []))
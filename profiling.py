@@ -0,0 +1,213 @@
+"""
+On-demand Profiling for CareLoopAI Entry Points
+Wraps the CLI, demo and server entry points with a sampling CPU profiler and
+tracemalloc allocation tracking, and writes a report per session.
+
+Turn it on with the environment variable or a flag:
+  CARELOOP_PROFILE=1 python cli_chatbot.py
+  python clinic_server.py --profile
+
+Each session writes a directory under CARELOOP_PROFILE_DIR (default
+"profiles") with:
+  cpu.collapsed   one "frame;frame;... count" line per stack, for
+                  flamegraph.pl, speedscope or inferno
+  summary.txt     hottest functions by self and total samples, and the top
+                  allocating source lines from tracemalloc
+
+The sampler reads every thread's stack at a fixed interval
+(CARELOOP_PROFILE_INTERVAL_MS, default 5). Samples of threads waiting for
+input, on a socket or on a lock are counted as idle and left out of the CPU
+profile, so time a patient spends typing does not drown the real work.
+"""
+
+import builtins
+import collections
+import datetime
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+PROFILE_FLAG = "--profile"
+
+# Innermost Python frames (file name, function) of a thread that is blocked
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("queue.py", "get"),
+}
+
+
+def profiling_requested(argv: Optional[List[str]] = None) -> bool:
+    """Check the environment and command line for the profiling switch"""
+    argv = sys.argv if argv is None else argv
+    return os.environ.get("CARELOOP_PROFILE") == "1" or PROFILE_FLAG in argv[1:]
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the Python stacks of all other threads from a background thread"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        # Threads blocked in builtins.input, which shows no Python frame of its own
+        self.waiting_for_input = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self.samples += 1
+                code = frame.f_code
+                if (thread_id in self.waiting_for_input
+                        or (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES):
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Get the samples in the collapsed-stack format used by flame graph tools"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = 20) -> List[tuple]:
+        """Get (function, self samples, total samples), hottest by self samples first"""
+        own: collections.Counter = collections.Counter()
+        total: collections.Counter = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+
+class ProfileSession:
+    """Profiles the code run inside a with block and writes its report on exit"""
+
+    def __init__(self, name: str, output_dir: Optional[str] = None,
+                 interval: Optional[float] = None, traceback_frames: int = 1):
+        self.name = name
+        self.output_dir = output_dir or os.environ.get("CARELOOP_PROFILE_DIR", "profiles")
+        if interval is None:
+            interval = float(os.environ.get("CARELOOP_PROFILE_INTERVAL_MS", "5")) / 1000
+        self.sampler = StackSampler(interval)
+        self.traceback_frames = traceback_frames
+        self.report_dir: Optional[str] = None
+        self._started = 0.0
+        self._input = None
+
+    def __enter__(self) -> "ProfileSession":
+        self._started = time.perf_counter()
+        self._was_tracing = tracemalloc.is_tracing()
+        if not self._was_tracing:
+            tracemalloc.start(self.traceback_frames)
+
+        # Mark threads blocked in input() as idle while they wait
+        self._input = builtins.input
+        original_input, waiting = self._input, self.sampler.waiting_for_input
+
+        @functools.wraps(original_input)
+        def input(*args):
+            waiting.add(threading.get_ident())
+            try:
+                return original_input(*args)
+            finally:
+                waiting.discard(threading.get_ident())
+        builtins.input = input
+
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.sampler.stop()
+        builtins.input = self._input
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not self._was_tracing:
+            tracemalloc.stop()
+        self.write_report(snapshot, peak, time.perf_counter() - self._started)
+
+    def write_report(self, snapshot: tracemalloc.Snapshot, peak: int, elapsed: float) -> str:
+        """Write cpu.collapsed and summary.txt, return the report directory"""
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.report_dir = os.path.join(self.output_dir, f"{self.name}-{stamp}-{os.getpid()}")
+        os.makedirs(self.report_dir, exist_ok=True)
+
+        with open(os.path.join(self.report_dir, "cpu.collapsed"), "w") as f:
+            f.write(self.sampler.collapsed())
+
+        sampler = self.sampler
+        lines = [
+            f"Sesi profil: {self.name}",
+            f"Durasi: {elapsed:.2f} s",
+            f"Sampel: {sampler.samples} ({sampler.samples - sampler.idle_samples} aktif, "
+            f"{sampler.idle_samples} menunggu), interval {sampler.interval * 1000:g} ms",
+            f"Puncak memori tracemalloc: {peak / 1024:.1f} KiB",
+            "",
+            "Fungsi teratas (sampel sendiri / total):",
+        ]
+        for frame, own, total in sampler.top_functions():
+            lines.append(f"  {own:>7} {total:>7}  {frame}")
+
+        lines += ["", "Alokasi teratas (masih hidup di akhir sesi):"]
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        for stat in snapshot.statistics("lineno")[:20]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1024:>9.1f} KiB {stat.count:>8} blok  "
+                         f"{frame.filename}:{frame.lineno}")
+
+        with open(os.path.join(self.report_dir, "summary.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"[profil disimpan di {self.report_dir}]", file=sys.stderr)
+        return self.report_dir
+
+
+def profiled(name: str) -> Callable:
+    """Decorate an entry point so it runs under a ProfileSession when requested.
+
+    The --profile flag is taken out of sys.argv before the entry point
+    parses its own arguments.
+    """
+    def decorate(main: Callable) -> Callable:
+        @functools.wraps(main)
+        def wrapper(*args, **kwargs):
+            if not profiling_requested():
+                return main(*args, **kwargs)
+            while PROFILE_FLAG in sys.argv[1:]:
+                sys.argv.remove(PROFILE_FLAG)
+            with ProfileSession(name):
+                return main(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,291 @@
+"""
+Binary Record Format for Patient Data
+A compact, versioned alternative to the pretty-printed JSON data file.
+
+Layout (all integers little-endian):
+
+    magic "CLPR" | u8 format version
+    u32 header length | header (compact JSON: schema_version, indexes, ...)
+    u32 record count
+    per record:  u32 record length | u16 id length | patient ID
+                 u16 field count | per field: u8 name length | name | u32 value length
+                 field values, each compact UTF-8 JSON
+
+The per-record field table lets a reader decode one field (for example
+personal_info) without parsing the rest of the record, and the record length
+prefix lets it skip whole records. Records loaded from a file are LazyRecord
+mappings that decode fields on first access. Reading a field does not
+change the record: records with no assigned or deleted field are written
+back byte for byte, and the others re-encode only the assigned fields.
+
+Usage:
+  python record_format.py to-binary patient_data.json patient_data.clpr
+  python record_format.py to-json patient_data.clpr patient_data.json
+"""
+
+import json
+import struct
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from file_sync import atomic_write
+
+MAGIC = b"CLPR"
+FORMAT_VERSION = 1
+BINARY_EXTENSION = ".clpr"
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+
+def _encode_value(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=json_default).encode("utf-8")
+
+
+def json_default(value: Any) -> Any:
+    """json.dump default that writes lazy records as plain objects"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+class LazyRecord(MutableMapping):
+    """A patient record whose fields are decoded from the file on first access.
+
+    Only assigning or deleting a field marks it changed, so change a field
+    by assigning a new value, as PatientDataManager._edit does on a copy(),
+    not by editing the decoded value in place.
+    """
+
+    __slots__ = ("_buffer", "_start", "_end", "_fields", "_values", "_assigned", "_deleted")
+
+    def __init__(self, buffer: memoryview, start: int, end: int):
+        self._buffer = buffer
+        self._start = start
+        self._end = end
+        # name -> (start, end) of the encoded value, parsed on first use
+        self._fields: Optional[Dict[str, Tuple[int, int]]] = None
+        # Decoded or assigned values
+        self._values: Dict[str, Any] = {}
+        # Fields assigned since loading; only these are written back re-encoded
+        self._assigned: set = set()
+        self._deleted: set = set()
+
+    def _field_table(self) -> Dict[str, Tuple[int, int]]:
+        if self._fields is None:
+            buffer, position = self._buffer, self._start
+            id_length, = _U16.unpack_from(buffer, position)
+            position += 2 + id_length
+            count, = _U16.unpack_from(buffer, position)
+            position += 2
+            table = []
+            for _ in range(count):
+                name_length = buffer[position]
+                name = bytes(buffer[position + 1:position + 1 + name_length]).decode("utf-8")
+                position += 1 + name_length
+                length, = _U32.unpack_from(buffer, position)
+                position += 4
+                table.append((name, length))
+            fields = {}
+            for name, length in table:
+                fields[name] = (position, position + length)
+                position += length
+            self._fields = fields
+        return self._fields
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._values:
+            return self._values[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        start, end = self._field_table()[key]
+        value = self._values[key] = json.loads(bytes(self._buffer[start:end]))
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._values[key] = value
+        self._assigned.add(key)
+        self._deleted.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._values.pop(key, None)
+        self._assigned.discard(key)
+        self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self._values:
+            return True
+        return key not in self._deleted and key in self._field_table()
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._field_table():
+            if name not in self._deleted:
+                yield name
+        for name in self._values:
+            if name not in self._fields:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"LazyRecord({dict(self)!r})"
+
+    def copy(self) -> "LazyRecord":
+        """Get a copy that shares the stored bytes and the decoded values"""
+        record = LazyRecord(self._buffer, self._start, self._end)
+        record._fields = self._fields
+        record._values = dict(self._values)
+        record._assigned = set(self._assigned)
+        record._deleted = set(self._deleted)
+        return record
+
+    @property
+    def unchanged(self) -> bool:
+        """Whether no field was assigned or deleted, so the stored bytes are still current"""
+        return not self._assigned and not self._deleted
+
+    def raw_bytes(self) -> memoryview:
+        """Get the encoded record as stored in the file"""
+        return self._buffer[self._start:self._end]
+
+    def encoded_fields(self) -> List[Tuple[str, bytes]]:
+        """Get every field encoded, re-encoding only the assigned ones"""
+        fields = []
+        for name in self:
+            if name in self._assigned:
+                fields.append((name, _encode_value(self._values[name])))
+            else:
+                start, end = self._fields[name]
+                fields.append((name, self._buffer[start:end]))
+        return fields
+
+
+def encode_record(patient_id: str, record: Mapping) -> bytes:
+    """Encode one patient record with its field table"""
+    if isinstance(record, LazyRecord):
+        if record.unchanged:
+            return bytes(record.raw_bytes())
+        fields = record.encoded_fields()
+    else:
+        fields = [(name, _encode_value(value)) for name, value in record.items()]
+
+    id_bytes = patient_id.encode("utf-8")
+    parts = [_U16.pack(len(id_bytes)), id_bytes, _U16.pack(len(fields))]
+    for name, value in fields:
+        name_bytes = name.encode("utf-8")
+        parts += [bytes((len(name_bytes),)), name_bytes, _U32.pack(len(value))]
+    parts += [value for _, value in fields]
+    return b"".join(parts)
+
+
+def encode_file(data: Dict) -> bytes:
+    """Encode a data file ({"patients": {...}, ...}) in the binary format"""
+    header = {key: value for key, value in data.items() if key != "patients"}
+    header_bytes = _encode_value(header)
+    patients = data.get("patients", {})
+
+    parts = [MAGIC, bytes((FORMAT_VERSION,)), _U32.pack(len(header_bytes)), header_bytes,
+             _U32.pack(len(patients))]
+    for patient_id, record in patients.items():
+        encoded = encode_record(patient_id, record)
+        parts += [_U32.pack(len(encoded)), encoded]
+    return b"".join(parts)
+
+
+def decode_file(content: bytes) -> Dict:
+    """Decode binary file content, with patient records as LazyRecord mappings"""
+    if content[:4] != MAGIC:
+        raise ValueError("Bukan file data biner CareLoopAI")
+    if content[4] != FORMAT_VERSION:
+        raise ValueError(f"Versi format biner tidak didukung: {content[4]}")
+
+    buffer = memoryview(content)
+    header_length, = _U32.unpack_from(buffer, 5)
+    position = 9 + header_length
+    data = json.loads(bytes(buffer[9:position]).decode("utf-8"))
+
+    count, = _U32.unpack_from(buffer, position)
+    position += 4
+    patients = {}
+    for _ in range(count):
+        length, = _U32.unpack_from(buffer, position)
+        start = position + 4
+        id_length, = _U16.unpack_from(buffer, start)
+        patient_id = bytes(buffer[start + 2:start + 2 + id_length]).decode("utf-8")
+        patients[patient_id] = LazyRecord(buffer, start, start + length)
+        position = start + length
+    data["patients"] = patients
+    return data
+
+
+def is_binary_file(path: str) -> bool:
+    """Check whether a file starts with the binary format's magic bytes"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == MAGIC
+    except OSError:
+        return False
+
+
+def read_file(path: str) -> Dict:
+    """Read a binary data file"""
+    with open(path, "rb") as f:
+        return decode_file(f.read())
+
+
+def write_file(path: str, data: Dict) -> None:
+    """Write a binary data file, replacing the old one atomically"""
+    atomic_write(path, encode_file(data))
+
+
+def decode_any(content: bytes) -> Dict:
+    """Decode data file content in either format"""
+    if content[:4] == MAGIC:
+        return decode_file(content)
+    return json.loads(content)
+
+
+def load_any(path: str) -> Dict:
+    """Read a data file in either format"""
+    with open(path, "rb") as f:
+        return decode_any(f.read())
+
+
+def convert(source: str, target: str) -> int:
+    """Convert a data file between JSON and binary, by the target's extension.
+
+    Returns the number of patients. The converted file is read back and
+    compared with the source, so a lossy conversion raises ValueError.
+    """
+    data = load_any(source)
+    if target.endswith(BINARY_EXTENSION):
+        write_file(target, data)
+    else:
+        with open(target, "w") as f:
+            json.dump(data, f, indent=2, default=json_default)
+
+    original = json.loads(json.dumps(data, default=json_default))
+    if json.loads(json.dumps(load_any(target), default=json_default)) != original:
+        raise ValueError(f"Konversi {source} ke {target} tidak identik")
+    return len(data.get("patients", {}))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Konversi file data pasien antara JSON dan biner")
+    parser.add_argument("direction", choices=["to-binary", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    target_is_binary = args.target.endswith(BINARY_EXTENSION)
+    if (args.direction == "to-binary") != target_is_binary:
+        parser.error(f"File biner harus berakhiran {BINARY_EXTENSION}")
+    count = convert(args.source, args.target)
+    print(f"{count} pasien dikonversi ke {args.target}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Reminder Delivery Pipeline
+Sends the daily check-in reminder to patients outside an open conversation,
+over SMS, email or push, to thousands of patients at the same hour.
+
+Reminders are queued per channel. Each channel has a worker thread that
+sends batches of up to the adapter's batch_size, as fast as the channel's
+token bucket allows. A failed reminder is retried with exponential backoff
+and jitter. It is dead-lettered when the adapter reports a permanent
+failure or after max_attempts tries. Dead letters are appended to a JSON
+lines file for staff to follow up.
+
+The delivery state of every reminder (queued, sent, retrying, dead) is
+saved to a JSON file every save_interval seconds and when a run ends. A reminder's ID is the day plus the
+patient ID, so running the morning job again does not resend reminders
+that already went out. Entries older than state_days are dropped when new
+reminders are queued, so the file only covers recent runs.
+
+Only patients whose symptom episode is still open get a reminder; an
+episode ends EPISODE_GAP after the last report, as in the follow-up engine.
+
+Channel adapters implement send_batch(). FileSink appends messages to a
+local file and stands in for SMS and push gateways during development;
+SmtpChannel sends email, e.g. to a local debugging SMTP server
+(`python -m aiosmtpd -n -l localhost:1025`).
+"""
+
+import datetime
+import heapq
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from file_sync import atomic_write
+from followup_engine import EPISODE_GAP
+
+CHECKIN_REMINDER_TEXT = ("Halo! Ini reminder untuk update kondisi kesehatan Anda hari ini. "
+                         "Bagaimana perasaan Anda? Apakah ada perubahan gejala?")
+
+# Delivery states
+QUEUED = "queued"
+SENT = "sent"
+RETRYING = "retrying"
+DEAD = "dead"
+
+# Days the delivery state of a reminder is kept
+STATE_DAYS = 7
+
+
+class DeliveryError(Exception):
+    """A message that could not be delivered this time"""
+
+
+class PermanentDeliveryError(DeliveryError):
+    """A message that will never be delivered, e.g. to an invalid address"""
+
+
+class Reminder:
+    __slots__ = ("reminder_id", "patient_id", "channel", "address", "text", "attempts", "next_attempt")
+
+    def __init__(self, reminder_id: str, patient_id: str, channel: str, address: str, text: str):
+        self.reminder_id = reminder_id
+        self.patient_id = patient_id
+        self.channel = channel
+        self.address = address
+        self.text = text
+        self.attempts = 0
+        self.next_attempt = 0.0
+
+    def to_dict(self) -> Dict:
+        return {"reminder_id": self.reminder_id, "patient_id": self.patient_id, "channel": self.channel,
+                "address": self.address, "text": self.text}
+
+
+class TokenBucket:
+    """Allows rate sends per second on average, and bursts of up to capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count: int) -> int:
+        """Take up to count whole tokens, return how many were taken"""
+        with self._lock:
+            self._refill()
+            taken = min(count, int(self.tokens))
+            self.tokens -= taken
+            return taken
+
+    def wait_time(self) -> float:
+        """Seconds until the next whole token"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class ChannelAdapter:
+    """Sends batches of reminders over one channel"""
+
+    name = "channel"
+    batch_size = 100
+    rate_per_second = 100.0
+
+    def send_batch(self, reminders: List[Reminder]) -> List[Optional[DeliveryError]]:
+        """Send reminders, return None for each delivered one and the error for each failed one"""
+        raise NotImplementedError
+
+
+class FileSink(ChannelAdapter):
+    """Local stand-in for a gateway: appends each batch to <directory>/<channel>.jsonl.
+
+    failure_rate makes that share of messages fail with a transient error,
+    and addresses in reject fail permanently, for exercising retries.
+    """
+
+    def __init__(self, directory: str, name: str, batch_size: int = 100, rate_per_second: float = 100.0,
+                 failure_rate: float = 0.0, reject: Iterable[str] = (), latency: float = 0.0, seed: int = 0):
+        self.directory = directory
+        self.name = name
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+        self.failure_rate = failure_rate
+        self.reject = set(reject)
+        self.latency = latency
+        self._random = random.Random(seed)
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        os.makedirs(directory, exist_ok=True)
+
+    def send_batch(self, reminders: List[Reminder]) -> List[Optional[DeliveryError]]:
+        if self.latency:
+            time.sleep(self.latency)
+        results: List[Optional[DeliveryError]] = []
+        lines = []
+        for reminder in reminders:
+            if reminder.address in self.reject:
+                results.append(PermanentDeliveryError(f"Alamat {reminder.address} ditolak"))
+            elif self._random.random() < self.failure_rate:
+                results.append(DeliveryError("Gateway sibuk"))
+            else:
+                results.append(None)
+                lines.append(json.dumps(dict(reminder.to_dict(), sent=datetime.datetime.now().isoformat())))
+        if lines:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return results
+
+
+class SmtpChannel(ChannelAdapter):
+    """Sends email reminders, one SMTP connection per batch"""
+
+    name = "email"
+
+    def __init__(self, host: str = "localhost", port: int = 1025, sender: str = "klinik@careloop.ai",
+                 batch_size: int = 50, rate_per_second: float = 20.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+
+    def send_batch(self, reminders: List[Reminder]) -> List[Optional[DeliveryError]]:
+        import smtplib
+        from email.message import EmailMessage
+
+        try:
+            connection = smtplib.SMTP(self.host, self.port, timeout=10)
+        except OSError as e:
+            return [DeliveryError(f"SMTP tidak tersedia: {e}")] * len(reminders)
+        results: List[Optional[DeliveryError]] = []
+        with connection:
+            for reminder in reminders:
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = reminder.address
+                message["Subject"] = "Pengingat checkin harian CareLoopAI"
+                message.set_content(reminder.text)
+                try:
+                    connection.send_message(message)
+                    results.append(None)
+                except smtplib.SMTPRecipientsRefused as e:
+                    results.append(PermanentDeliveryError(str(e)))
+                except (smtplib.SMTPException, OSError) as e:
+                    results.append(DeliveryError(str(e)))
+        return results
+
+
+def daily_reminders(manager, day: Optional[datetime.date] = None,
+                    text: str = CHECKIN_REMINDER_TEXT) -> List[Reminder]:
+    """Reminders for patients with a treatment plan and an open episode who have not checked in on a day.
+
+    Patients with a phone number get an SMS, otherwise an email if they have
+    one, otherwise a push notification to the app.
+    """
+    day = day or datetime.date.today()
+    start = datetime.datetime.combine(day, datetime.time())
+    reminders = []
+    with manager.snapshot() as patients:
+        for patient_id, record in patients.items():
+            if not record.get("treatment_plans"):
+                continue
+            checkins = record.get("checkin_history", [])
+            if checkins and checkins[-1]["date"][:10] == day.isoformat():
+                continue
+            # Archived entries belong to resolved cases, so the hot tails hold the last report
+            reports = [entries[-1]["date"] for entries in (record.get("symptoms_history"), checkins)
+                       if entries]
+            if not reports or start - datetime.datetime.fromisoformat(max(reports)) > EPISODE_GAP:
+                continue
+            info = record["personal_info"]
+            if info.get("phone"):
+                channel, address = "sms", info["phone"]
+            elif info.get("email"):
+                channel, address = "email", info["email"]
+            else:
+                channel, address = "push", patient_id
+            reminders.append(Reminder(f"{day.isoformat()}:{patient_id}", patient_id, channel, address,
+                                      text))
+    return reminders
+
+
+class DeliveryPipeline:
+    """Batched, rate-limited delivery of reminders with retries and dead-lettering"""
+
+    def __init__(self, channels: Iterable[ChannelAdapter], state_file: str = "reminder_state.json",
+                 dead_letter_file: Optional[str] = None, max_attempts: int = 5,
+                 base_backoff: float = 30.0, max_backoff: float = 900.0, save_interval: float = 1.0,
+                 state_days: int = STATE_DAYS,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+                 seed: Optional[int] = None):
+        self.channels = {channel.name: channel for channel in channels}
+        self.buckets = {name: TokenBucket(channel.rate_per_second, max(channel.rate_per_second, 1), clock)
+                        for name, channel in self.channels.items()}
+        self.state_file = state_file
+        self.dead_letter_file = dead_letter_file or os.path.splitext(state_file)[0] + "_dead.jsonl"
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.save_interval = save_interval
+        self.state_days = state_days
+        self.clock = clock
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._queues: Dict[str, Deque[Reminder]] = {name: deque() for name in self.channels}
+        # Per channel: (time of next attempt, sequence, reminder)
+        self._retries: Dict[str, List[Tuple[float, int, Reminder]]] = {name: [] for name in self.channels}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._saved = clock()
+        self.state = self._load_state()
+        # IDs queued since the last run; a reminder queued twice is only sent once
+        self._enqueued: Set[str] = set()
+        self.batches = {name: 0 for name in self.channels}
+
+    def _load_state(self) -> Dict[str, Dict]:
+        try:
+            with open(self.state_file, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self) -> None:
+        # Workers save in turn, so an older copy of the state never overwrites a newer one
+        with self._save_lock:
+            with self._lock:
+                content = json.dumps(self.state, indent=2).encode("utf-8")
+            atomic_write(self.state_file, content)
+            self._saved = self.clock()
+
+    def _prune_state(self) -> None:
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.state_days)).isoformat()
+        with self._lock:
+            self.state = {reminder_id: entry for reminder_id, entry in self.state.items()
+                          if entry["updated"] >= cutoff}
+
+    def _record(self, reminder: Reminder, state: str, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.state[reminder.reminder_id] = {
+                "patient_id": reminder.patient_id,
+                "channel": reminder.channel,
+                "state": state,
+                "attempts": reminder.attempts,
+                "error": str(error) if error else None,
+                "updated": datetime.datetime.now().isoformat()
+            }
+
+    def enqueue(self, reminders: Iterable[Reminder]) -> int:
+        """Queue reminders that are not queued already, sent or dead-lettered, return how many"""
+        self._prune_state()
+        count = 0
+        for reminder in reminders:
+            if reminder.channel not in self.channels:
+                raise ValueError(f"Kanal {reminder.channel} tidak dikonfigurasi")
+            known = self.state.get(reminder.reminder_id)
+            if reminder.reminder_id in self._enqueued or (known is not None and known["state"] in (SENT, DEAD)):
+                continue
+            self._queues[reminder.channel].append(reminder)
+            self._enqueued.add(reminder.reminder_id)
+            self._record(reminder, QUEUED)
+            count += 1
+        self._save_state()
+        return count
+
+    def delivery_state(self, patient_id: str) -> List[Dict]:
+        """Get the delivery state of every reminder to a patient"""
+        with self._lock:
+            return [dict(entry, reminder_id=reminder_id) for reminder_id, entry in self.state.items()
+                    if entry["patient_id"] == patient_id]
+
+    def run(self) -> Dict[str, int]:
+        """Deliver everything queued, one worker thread per channel; return counts per state of those"""
+        workers = [threading.Thread(target=self._work, args=(name,), name=f"reminders-{name}")
+                   for name in self.channels if self._queues[name]]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self._save_state()
+        counts = {SENT: 0, DEAD: 0, RETRYING: 0, QUEUED: 0}
+        for reminder_id in self._enqueued:
+            counts[self.state[reminder_id]["state"]] += 1
+        self._enqueued = set()
+        return counts
+
+    def _next_batch(self, name: str) -> List[Reminder]:
+        channel, queue, retries = self.channels[name], self._queues[name], self._retries[name]
+        now = self.clock()
+        while retries and retries[0][0] <= now:
+            queue.appendleft(heapq.heappop(retries)[2])
+        wanted = min(channel.batch_size, len(queue))
+        granted = self.buckets[name].take(wanted) if wanted else 0
+        return [queue.popleft() for _ in range(granted)]
+
+    def _work(self, name: str) -> None:
+        channel, queue, retries = self.channels[name], self._queues[name], self._retries[name]
+        while queue or retries:
+            batch = self._next_batch(name)
+            if not batch:
+                waits = [self.buckets[name].wait_time()] if queue else []
+                if retries:
+                    waits.append(retries[0][0] - self.clock())
+                self.sleep(max(0.001, min(waits)))
+                continue
+            try:
+                results = channel.send_batch(batch)
+            except Exception as e:
+                results = [DeliveryError(str(e))] * len(batch)
+            self.batches[name] += 1
+            for reminder, error in zip(batch, results):
+                reminder.attempts += 1
+                if error is None:
+                    self._record(reminder, SENT)
+                elif isinstance(error, PermanentDeliveryError) or reminder.attempts >= self.max_attempts:
+                    self._record(reminder, DEAD, error)
+                    self._dead_letter(reminder, error)
+                else:
+                    backoff = min(self.max_backoff, self.base_backoff * 2 ** (reminder.attempts - 1))
+                    reminder.next_attempt = self.clock() + backoff * (0.5 + self._random.random() / 2)
+                    # Workers of all channels share the sequence
+                    with self._lock:
+                        self._sequence += 1
+                        sequence = self._sequence
+                    heapq.heappush(retries, (reminder.next_attempt, sequence, reminder))
+                    self._record(reminder, RETRYING, error)
+            if self.clock() - self._saved >= self.save_interval:
+                self._save_state()
+
+    def _dead_letter(self, reminder: Reminder, error: Exception) -> None:
+        entry = dict(reminder.to_dict(), attempts=reminder.attempts, error=str(error),
+                     dead_lettered=datetime.datetime.now().isoformat())
+        with self._lock, open(self.dead_letter_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
@@ -0,0 +1,488 @@
+"""
+Full-Text Search over Treatment Plans, Symptom Reports and Check-ins
+An inverted index from Indonesian word stems to the history entries that
+contain them, so staff queries such as
+
+    rencana:paracetamol gejala:diare@3d
+
+("patients whose plan mentions paracetamol and who reported diare in the
+last 3 days") look up a few posting lists instead of scanning every record.
+
+Every plan, symptom report and check-in is one document in one field:
+rencana, gejala or checkin. Text is lowercased, split into words, stripped
+of common stopwords and reduced to its stem (membaik and baik match), with
+positions kept for phrase queries.
+
+Query syntax:
+  word, field:word           entries containing the word
+  "two words"                entries containing the phrase
+  term@3d                    ... dated in the last 3 days
+  term@2026-10-01..2026-10-15  ... dated in a range (either end may be left out)
+  a b, a AND b, a DAN b      patients matching both
+  a OR b, a ATAU b           patients matching either
+  NOT a, BUKAN a, -a         patients not matching
+  ( )                        grouping
+
+The manager updates the index from _touch, so each mutation indexes only
+the entries it appended. The index is checkpointed beside the data file
+once CHECKPOINT_DOCS, and a tenth of all, documents were indexed since the
+last checkpoint; on the first search the checkpoint is loaded and only
+patients changed since are reindexed. Entries moved to the cold
+archive are not searched.
+"""
+
+import datetime
+import gc
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+from file_sync import atomic_write
+
+# History section -> search field
+FIELDS = {
+    "treatment_plans": "rencana",
+    "symptoms_history": "gejala",
+    "checkin_history": "checkin",
+}
+
+# Documents indexed since the last checkpoint before the manager writes a new
+# one, and at least this share of all documents, so checkpoints of large
+# indexes stay rare
+CHECKPOINT_DOCS = 1000
+CHECKPOINT_SHARE = 0.1
+
+FORMAT_VERSION = 1
+
+WORD_PATTERN = re.compile(r"[0-9a-z]+")
+QUERY_PATTERN = re.compile(r'\(|\)|-?(?:[a-z]+:)?(?:"[^"]*"|[^\s()"@]+)(?:@[^\s()]+)?')
+
+# Operators, in English or Indonesian
+AND = ("and", "dan")
+OR = ("or", "atau")
+NOT = ("not", "bukan")
+
+STOPWORDS = frozenset("""
+    ada adalah agar akan anda atau bagi bahwa dalam dan dari dengan di jika juga ke
+    kami kita oleh pada per saat saya sebagai sesuai serta tapi tetapi untuk yang ini itu
+""".split())
+
+# Words that look affixed but are roots, mostly symptoms and body parts
+ROOTS = frozenset("""
+    berat sedang ringan diare demam kepala perut dada kulit mata telinga tenggorokan
+    sakit pusing mual muntah batuk pilek flu nyeri gatal ruam lemas sesak napas
+    pelipis dahi paracetamol ibuprofen antasida oralit obat minum makan makanan
+    tidur istirahat kompres hangat cahaya terang kunjungan klinik dokter umum
+    rencana pengobatan kondisi perubahan pemeriksaan
+""".split())
+
+PARTICLES = ("lah", "kah", "pun")
+POSSESSIVES = ("nya", "ku", "mu")
+SUFFIXES = ("kan", "an", "i")
+PREFIXES = ("meng", "meny", "mem", "men", "me", "peng", "peny", "pem", "pen", "pe",
+            "ber", "be", "ter", "te", "di", "ke", "se")
+MIN_STEM = 4
+
+
+class SearchQueryError(ValueError):
+    """A search query that cannot be parsed"""
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Strip Indonesian particles, possessives, suffixes and prefixes from a word"""
+    if word in ROOTS or len(word) <= MIN_STEM or word.isdigit():
+        return word
+    for endings in (PARTICLES, POSSESSIVES, SUFFIXES):
+        for ending in endings:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+                word = word[:-len(ending)]
+                break
+        if word in ROOTS:
+            return word
+    for _ in range(2):
+        for prefix in PREFIXES:
+            if word.startswith(prefix) and len(word) - len(prefix) >= MIN_STEM:
+                word = word[len(prefix):]
+                break
+        else:
+            break
+        if word in ROOTS:
+            break
+    return word
+
+
+def tokenize(text: str, start: int = 0) -> List[Tuple[str, int]]:
+    """Get the (stem, position) of each word that is not a stopword"""
+    return [(stem(word), position) for position, word in enumerate(WORD_PATTERN.findall(text.lower()), start)
+            if word not in STOPWORDS]
+
+
+def entry_tokens(field: str, entry: Dict) -> List[Tuple[str, int]]:
+    """Get the tokens of a history entry; separate items never form a phrase together"""
+    if field == "rencana":
+        return tokenize(entry.get("plan", ""))
+    tokens = []
+    position = 0
+    for text in list(entry.get("symptoms", [])) + [entry.get("body_part", ""), entry.get("severity", "")]:
+        words = tokenize(text, position)
+        tokens += words
+        # Leave a gap between items
+        position += len(WORD_PATTERN.findall(text.lower())) + 1
+    return tokens
+
+
+def fingerprint(record: Dict) -> str:
+    """Identify the indexed content of a record, to tell which patients changed"""
+    return f"{record.get('version', 0)}:" + ":".join(str(len(record.get(section, []))) for section in FIELDS)
+
+
+def search_index_file(data_file: str) -> str:
+    """Get the checkpoint file that belongs to a data file"""
+    return os.path.splitext(data_file)[0] + "_search.json"
+
+
+@contextmanager
+def _gc_paused():
+    """Pause cyclic garbage collection, which would otherwise rescan the posting lists as they grow"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _parse_range(text: str, now: datetime.datetime) -> Tuple[Optional[str], Optional[str]]:
+    """Turn '3d' or 'YYYY-MM-DD..YYYY-MM-DD' into ISO bounds [start, end)"""
+    if text.endswith("d") and text[:-1].isdigit():
+        return (now - datetime.timedelta(days=int(text[:-1]))).isoformat(), None
+    first, dots, last = text.partition("..")
+    try:
+        start = datetime.date.fromisoformat(first).isoformat() if first else None
+        if not dots:
+            last = first
+        end = (datetime.date.fromisoformat(last) + datetime.timedelta(days=1)).isoformat() if last else None
+    except ValueError:
+        raise SearchQueryError(f"Rentang tanggal tidak dikenal: @{text}")
+    return start, end
+
+
+class SearchIndex:
+    def __init__(self):
+        # "field:stem" -> patient ID -> [document, position, document, position, ...]
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+        # document -> entry date, None once its patient is reindexed
+        self.docs: List[Optional[str]] = []
+        self.patient_docs: Dict[str, List[int]] = {}
+        self.patient_terms: Dict[str, Set[str]] = {}
+        self.fingerprints: Dict[str, str] = {}
+        self.changed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def checkpoint_due(self) -> bool:
+        """Whether enough was indexed since the last checkpoint to write a new one"""
+        return self.changed >= max(CHECKPOINT_DOCS, CHECKPOINT_SHARE * len(self.docs))
+
+    @classmethod
+    def build(cls, patients: Dict) -> "SearchIndex":
+        """Index the history of every patient"""
+        index = cls()
+        index.sync(patients)
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "SearchIndex":
+        """Restore a checkpoint written by save, or get an empty index"""
+        index = cls()
+        with _gc_paused():
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return index
+            if data.get("format") != FORMAT_VERSION:
+                return index
+            index.docs = data["docs"]
+            index.patient_docs = data["patient_docs"]
+            index.fingerprints = data["fingerprints"]
+            index.postings = data["postings"]
+            for key, by_patient in index.postings.items():
+                for patient_id in by_patient:
+                    index.patient_terms.setdefault(patient_id, set()).add(key)
+        return index
+
+    def save(self, path: str) -> None:
+        """Write a checkpoint"""
+        with self._lock, _gc_paused():
+            if self.dropped > len(self.docs) // 2:
+                self._renumber()
+            data = {"format": FORMAT_VERSION, "docs": self.docs, "patient_docs": self.patient_docs,
+                    "fingerprints": self.fingerprints, "postings": self.postings}
+            content = json.dumps(data, separators=(",", ":")).encode("utf-8")
+            self.changed = 0
+        atomic_write(path, content)
+
+    def _renumber(self) -> None:
+        """Number the documents again without the dropped ones"""
+        numbers = {}
+        for number, date in enumerate(self.docs):
+            if date is not None:
+                numbers[number] = len(numbers)
+        self.docs = [date for date in self.docs if date is not None]
+        self.patient_docs = {patient_id: [numbers[number] for number in docs]
+                             for patient_id, docs in self.patient_docs.items()}
+        for by_patient in self.postings.values():
+            for occurrences in by_patient.values():
+                for i in range(0, len(occurrences), 2):
+                    occurrences[i] = numbers[occurrences[i]]
+        self.dropped = 0
+
+    def _add_document(self, patient_id: str, field: str, entry: Dict) -> None:
+        number = len(self.docs)
+        self.docs.append(entry.get("date", ""))
+        self.patient_docs.setdefault(patient_id, []).append(number)
+        terms: Dict[str, List[int]] = {}
+        for term, position in entry_tokens(field, entry):
+            key = f"{field}:{term}"
+            if key in terms:
+                terms[key] += (number, position)
+            else:
+                terms[key] = [number, position]
+        postings = self.postings
+        for key, occurrences in terms.items():
+            if key not in postings:
+                postings[key] = {patient_id: occurrences}
+            elif patient_id in postings[key]:
+                postings[key][patient_id] += occurrences
+            else:
+                postings[key][patient_id] = occurrences
+        self.patient_terms.setdefault(patient_id, set()).update(terms)
+        self.changed += 1
+
+    def _drop_patient(self, patient_id: str) -> None:
+        for key in self.patient_terms.pop(patient_id, ()):
+            by_patient = self.postings[key]
+            del by_patient[patient_id]
+            if not by_patient:
+                del self.postings[key]
+        for number in self.patient_docs.pop(patient_id, []):
+            self.docs[number] = None
+            self.dropped += 1
+        self.fingerprints.pop(patient_id, None)
+
+    def _index_patient(self, patient_id: str, record: Dict) -> None:
+        self._drop_patient(patient_id)
+        for section, field in FIELDS.items():
+            for entry in record.get(section, []):
+                self._add_document(patient_id, field, entry)
+        self.fingerprints[patient_id] = fingerprint(record)
+
+    def update(self, patient_id: str, old: Optional[Dict], new: Dict) -> None:
+        """Index a changed record, only its appended entries when nothing else changed"""
+        with self._lock:
+            if old is None or self.fingerprints.get(patient_id) != fingerprint(old):
+                self._index_patient(patient_id, new)
+                return
+            appended = []
+            for section, field in FIELDS.items():
+                before, after = old.get(section, []), new.get(section, [])
+                if after is before:
+                    continue
+                if len(after) < len(before) or any(a is not b for a, b in zip(after, before)):
+                    self._index_patient(patient_id, new)
+                    return
+                appended += [(field, entry) for entry in after[len(before):]]
+            for field, entry in appended:
+                self._add_document(patient_id, field, entry)
+            self.fingerprints[patient_id] = fingerprint(new)
+
+    def sync(self, patients: Dict) -> int:
+        """Reindex the patients whose records changed since they were indexed, return how many"""
+        with self._lock, _gc_paused():
+            for patient_id in [patient_id for patient_id in self.fingerprints if patient_id not in patients]:
+                self._drop_patient(patient_id)
+            stale = [patient_id for patient_id, record in patients.items()
+                     if self.fingerprints.get(patient_id) != fingerprint(record)]
+            for patient_id in stale:
+                self._index_patient(patient_id, patients[patient_id])
+            return len(stale)
+
+    def search(self, query: str, since: Optional[datetime.datetime] = None,
+               until: Optional[datetime.datetime] = None,
+               now: Optional[datetime.datetime] = None) -> List[str]:
+        """Get the IDs of the patients matching a query, sorted.
+
+        since and until bound the entry dates of terms without their own @range.
+        """
+        tree = _QueryParser(query.lower(), now or datetime.datetime.now(),
+                            (since.isoformat() if since else None, until.isoformat() if until else None)).parse()
+        with self._lock:
+            return sorted(self._evaluate(tree, None))
+
+    def _cost(self, node: Tuple) -> float:
+        """Estimate how many patients a query node matches, to evaluate the rarest first"""
+        kind = node[0]
+        if kind == "term":
+            _, field, tokens, _, _ = node
+            if not tokens:
+                return 0
+            fields = [field] if field else FIELDS.values()
+            return min(sum(len(self.postings.get(f"{name}:{term}", ())) for name in fields)
+                       for term, _ in tokens)
+        if kind == "and":
+            return min(self._cost(child) for child in node[1])
+        if kind == "or":
+            return sum(self._cost(child) for child in node[1])
+        return float("inf")
+
+    def _evaluate(self, node: Tuple, candidates: Optional[Set[str]]) -> Set[str]:
+        """Get the patients matching a query node, among the candidates if any"""
+        kind = node[0]
+        if kind == "term":
+            return self._match(*node[1:], candidates)
+        if kind == "or":
+            result = set()
+            for child in node[1]:
+                result |= self._evaluate(child, candidates)
+            return result
+        if kind == "not":
+            everyone = candidates if candidates is not None else set(self.fingerprints)
+            return everyone - self._evaluate(node[1], candidates)
+        for child in sorted(node[1], key=self._cost):
+            candidates = self._evaluate(child, candidates)
+            if not candidates:
+                break
+        return candidates
+
+    def _match(self, field: Optional[str], tokens: List[Tuple[str, int]], start: Optional[str],
+               end: Optional[str], candidates: Optional[Set[str]]) -> Set[str]:
+        """Get the patients with an entry containing the tokens at their relative positions"""
+        found: Set[str] = set()
+        if not tokens:
+            return found
+        for name in ([field] if field else FIELDS.values()):
+            lists = []
+            for term, offset in tokens:
+                by_patient = self.postings.get(f"{name}:{term}")
+                if not by_patient:
+                    break
+                lists.append((by_patient, offset - tokens[0][1]))
+            else:
+                lists.sort(key=lambda item: len(item[0]))
+                patients = set(candidates) if candidates is not None else set(lists[0][0])
+                for by_patient, _ in lists:
+                    patients.intersection_update(by_patient.keys())
+                patients -= found
+                if len(lists) == 1 and start is None and end is None:
+                    found |= patients
+                    continue
+                for patient_id in patients:
+                    if self._matches_entry(patient_id, lists, start, end):
+                        found.add(patient_id)
+        return found
+
+    def _matches_entry(self, patient_id: str, lists: List, start: Optional[str], end: Optional[str]) -> bool:
+        """Whether one entry of a patient is in the date range and has the tokens in order"""
+        rarest, base = lists[0]
+        occurrences = rarest[patient_id]
+        others = []
+        for by_patient, offset in lists[1:]:
+            flat = by_patient[patient_id]
+            others.append((set(zip(flat[0::2], flat[1::2])), offset))
+        for i in range(0, len(occurrences), 2):
+            number = occurrences[i]
+            date = self.docs[number]
+            if (start and date < start) or (end and date >= end):
+                continue
+            # Phrase check: every token at its offset from the first token of the phrase
+            first = occurrences[i + 1] - base
+            if all((number, first + offset) in pairs for pairs, offset in others):
+                return True
+        return False
+
+
+class _QueryParser:
+    """Recursive-descent parser from a query to a tree of and/or/not/term nodes"""
+
+    def __init__(self, query: str, now: datetime.datetime, default_range: Tuple[Optional[str], Optional[str]]):
+        self.now = now
+        self.default_range = default_range
+        self.tokens = QUERY_PATTERN.findall(query)
+        leftover = QUERY_PATTERN.sub("", query).strip()
+        if leftover:
+            raise SearchQueryError(f"Query tidak dikenal: {leftover}")
+        self.position = 0
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> Optional[str]:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> Tuple:
+        if not self.tokens:
+            raise SearchQueryError("Query kosong")
+        tree = self._or()
+        if self._peek() is not None:
+            raise SearchQueryError(f"Query tidak dikenal di '{self._peek()}'")
+        return tree
+
+    def _or(self) -> Tuple:
+        children = [self._and()]
+        while self._peek() in OR:
+            self._next()
+            children.append(self._and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _and(self) -> Tuple:
+        children = [self._not()]
+        while self._peek() not in (None, ")") + OR:
+            if self._peek() in AND:
+                self._next()
+            children.append(self._not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def _not(self) -> Tuple:
+        token = self._peek()
+        if token in NOT:
+            self._next()
+            return ("not", self._not())
+        if token is not None and token.startswith("-") and len(token) > 1:
+            self.tokens[self.position] = token[1:]
+            return ("not", self._not())
+        return self._primary()
+
+    def _primary(self) -> Tuple:
+        token = self._next()
+        if token is None:
+            raise SearchQueryError("Query berakhir terlalu cepat")
+        if token == "(":
+            tree = self._or()
+            if self._next() != ")":
+                raise SearchQueryError("Kurung tidak ditutup")
+            return tree
+        if token == ")":
+            raise SearchQueryError("Kurung tutup tanpa kurung buka")
+        return self._term(token)
+
+    def _term(self, token: str) -> Tuple:
+        field = None
+        name, colon, rest = token.partition(":")
+        if colon and not name.startswith('"'):
+            if name not in FIELDS.values():
+                raise SearchQueryError(f"Kolom tidak dikenal: {name} (pilih {', '.join(FIELDS.values())})")
+            field, token = name, rest
+        start, end = self.default_range
+        text, at, bounds = token.rpartition("@") if token.rfind("@") > token.rfind('"') else (token, "", "")
+        if at:
+            start, end = _parse_range(bounds, self.now)
+        return ("term", field, tokenize(text.strip('"')), start, end)
@@ -49,9 +49,9 @@ def initialize_rasa():
 def create_sample_data():
     """Create sample patient data file"""
     sample_data = {
+        "schema_version": 2,
         "patients": {},
-        "treatment_plans": {},
-        "appointments": {}
+        "indexes": {}
     }
     
     with open("patient_data.json", "w") as f:
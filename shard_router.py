@@ -0,0 +1,384 @@
+"""
+Shard Router for Patient Data on Several Storage Nodes
+Partitions the patients over storage node processes (see storage_node.py)
+with a consistent-hash ring, and forwards PatientDataManager calls to the
+node that owns the patient.
+
+Each node has VNODES points on the ring; a patient belongs to the node of
+the first point at or after the hash of their patient ID. Adding or
+removing a node moves only the patients whose owner changes, about 1/N of
+them, and it is done online: the router moves them in batches while calls
+go on. Calls for the patients of the batch being moved wait until it has
+been copied to the new node (and saved there), then go to the new node;
+the old copy is dropped after that.
+
+Calls about one patient take a patient ID or a unique name, like the
+manager's. Names, phone numbers, email addresses and the clinic-wide views
+(search, follow-up candidates, triage, appointment counts) are answered by
+scatter-gather: every node is asked in parallel and the answers merged.
+
+Registration checks phone and email uniqueness across the nodes and then
+registers the patient, with an ID the router chose, on the node that owns
+the ID; checks and registrations through one router do not race. Each
+node schedules appointments with its own scheduler, so doctor and room
+capacity is enforced among the patients of one node. A moved patient's
+archived history (history_archive.py) goes along inline and is archived
+again on the new node.
+
+Idempotency keys (see idempotency.py) go with the call to the owning node,
+whose dedupe index catches the retries. The index is not moved with the
+patients, so a retry that arrives after its patient moved runs again.
+"""
+
+import bisect
+import hashlib
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from patient_data_manager import PatientDataManager, generate_patient_id
+from patient_index import AmbiguousPatientError, DuplicatePatientError
+from storage_node import NodeClient, PatientNotOnNode
+
+# Points per node on the ring; more spread the patients more evenly
+VNODES = 64
+# Patients moved at once while rebalancing
+MOVE_BATCH = 500
+
+PATIENT_ID = re.compile(r"P[0-9a-f]{12}")
+
+# Calls about one patient; the first argument is the patient ID or name.
+# Those that register an unknown name, like the manager's, say so.
+PATIENT_METHODS = {
+    "add_symptom_report": True,
+    "generate_treatment_plan": True,
+    "revise_treatment_plan": True,
+    "add_treatment_plan": True,
+    "add_daily_checkin": True,
+    "record_photo": False,
+    "schedule_appointment": True,
+    "cancel_appointment": False,
+    "reschedule_appointment": False,
+    "get_patient_data": False,
+    "get_latest_treatment_plan": False,
+    "get_symptom_history": False,
+    "get_archived_history": False,
+    "get_full_history": False,
+    "get_patient_summary": False,
+    "get_patient_summary_if_changed": False,
+    "check_followup_needed": False,
+}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring of node names"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.nodes: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            raise ValueError(f"Node sudah ada di ring: {node}")
+        self.nodes.append(node)
+        for replica in range(self.vnodes):
+            point = _hash(f"{node}#{replica}")
+            position = bisect.bisect(self._points, point)
+            self._points.insert(position, point)
+            self._owners.insert(position, node)
+
+    def remove(self, node: str) -> None:
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def copy(self) -> "HashRing":
+        ring = HashRing(vnodes=self.vnodes)
+        ring.nodes = list(self.nodes)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        return ring
+
+    def node_for(self, key: str) -> str:
+        """Get the node that owns a key"""
+        if not self._points:
+            raise LookupError("Ring tidak memiliki node")
+        position = bisect.bisect_left(self._points, _hash(key))
+        return self._owners[position % len(self._owners)]
+
+
+class ShardedPatientStore:
+    """Routes PatientDataManager calls to the storage node that owns each patient.
+    
+    authkey is the secret key of the cluster, which every node checks (see
+    storage_node.new_cluster_key).
+    """
+
+    def __init__(self, nodes: Dict[str, tuple], authkey: bytes, vnodes: int = VNODES,
+                 move_batch: int = MOVE_BATCH):
+        self.authkey = authkey
+        self.move_batch = move_batch
+        self.clients: Dict[str, NodeClient] = {name: NodeClient(address, authkey) for name, address in nodes.items()}
+        self.ring = HashRing(nodes, vnodes)
+        # While rebalancing: the ring being moved to and the patients already on it
+        self._target: Optional[HashRing] = None
+        self._moved = set()
+        # Patients of the batch being moved, and calls in progress per patient
+        self._moving = set()
+        self._in_flight = Counter()
+        self._routing = threading.Condition()
+        self._registry_lock = threading.Lock()
+        self._rebalance_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="shard-scatter")
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        for client in self.clients.values():
+            client.close()
+
+    def _owner(self, patient_id: str) -> str:
+        """The node that holds a patient now; the caller holds _routing"""
+        if self._target is not None and patient_id in self._moved:
+            return self._target.node_for(patient_id)
+        return self.ring.node_for(patient_id)
+
+    def node_for(self, patient_id: str) -> str:
+        """Get the name of the node that holds a patient"""
+        with self._routing:
+            return self._owner(patient_id)
+
+    def _call_owner(self, patient_id: str, method: str, args=(), kwargs=None, check: bool = True):
+        """Call a method on the node that holds a patient, waiting while the patient is being moved.
+
+        With check the node raises PatientNotOnNode if it does not hold the patient.
+        """
+        kwargs = kwargs or {}
+        with self._routing:
+            self._routing.wait_for(lambda: patient_id not in self._moving)
+            client = self.clients[self._owner(patient_id)]
+            self._in_flight[patient_id] += 1
+        try:
+            if check:
+                return client.request("call_patient", patient_id, method, tuple(args), kwargs)
+            return client.call(method, patient_id, *args, **kwargs)
+        finally:
+            with self._routing:
+                self._in_flight[patient_id] -= 1
+                if not self._in_flight[patient_id]:
+                    del self._in_flight[patient_id]
+                    self._routing.notify_all()
+
+    def _call_patient(self, method: str, patient_ref: str, args, kwargs, register: bool):
+        if PATIENT_ID.fullmatch(patient_ref):
+            try:
+                return self._call_owner(patient_ref, method, args, kwargs)
+            except PatientNotOnNode:
+                pass  # a name shaped like an ID
+        patient_id = self.resolve_patient(patient_ref)
+        if patient_id is None:
+            if not register:
+                # Let a node answer as a manager without the patient does
+                return self._call_owner(patient_ref, method, args, kwargs, check=False)
+            patient_id = self.register_patient(patient_ref)
+        return self._call_owner(patient_id, method, args, kwargs)
+
+    # Scatter-gather
+
+    def scatter(self, method: str, *args, **kwargs) -> Dict[str, object]:
+        """Call a manager method on every node in parallel and get each node's answer"""
+        with self._routing:
+            clients = dict(self.clients)
+        futures = {name: self._pool.submit(client.call, method, *args, **kwargs)
+                   for name, client in clients.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _held_here(self, node: str, patient_id: str) -> bool:
+        """Whether a node's answer about a patient counts; while rebalancing a patient can be on two nodes"""
+        return self._target is None or self.node_for(patient_id) == node
+
+    def resolve_patient(self, patient_ref: str) -> Optional[str]:
+        """Get the patient ID for a patient ID or a unique patient name"""
+        if PATIENT_ID.fullmatch(patient_ref):
+            try:
+                return self._call_owner(patient_ref, "resolve_patient")
+            except PatientNotOnNode:
+                pass
+        matches = self.find_by_name(patient_ref)
+        if len(matches) > 1:
+            raise AmbiguousPatientError(f"Ada {len(matches)} pasien bernama {patient_ref}")
+        return matches[0] if matches else None
+
+    def find_by_name(self, name: str) -> List[str]:
+        """Get the IDs of all patients with a name"""
+        found = self.scatter("find_by_name", name)
+        return sorted({patient_id for node, ids in found.items() for patient_id in ids
+                       if self._held_here(node, patient_id)})
+
+    def find_by_phone(self, phone: str) -> Optional[str]:
+        """Get the ID of the patient registered with a phone number"""
+        return next((found for found in self.scatter("find_by_phone", phone).values() if found), None)
+
+    def find_by_email(self, email: str) -> Optional[str]:
+        """Get the ID of the patient registered with an email address"""
+        return next((found for found in self.scatter("find_by_email", email).values() if found), None)
+
+    def register_patient(self, name: str, phone: str = "", email: str = "",
+                         idempotency_key: Optional[str] = None) -> str:
+        """Register a new patient on the node that owns their new ID.
+        
+        With an idempotency key the ID is made from the key, so a retry goes
+        to the same node, which answers it with the patient of the first.
+        """
+        with self._registry_lock:
+            if idempotency_key is None:
+                patient_id = generate_patient_id()
+            else:
+                patient_id = "P" + hashlib.md5(idempotency_key.encode("utf-8")).hexdigest()[:12]
+            for found in (phone and self.find_by_phone(phone), email and self.find_by_email(email)):
+                if found and found != patient_id:
+                    raise DuplicatePatientError("Nomor telepon atau email sudah terdaftar")
+            with self._routing:
+                if self._target is not None:
+                    # Mid-rebalance, new patients go straight to their node on the new ring
+                    self._moved.add(patient_id)
+                client = self.clients[self._owner(patient_id)]
+            return client.call("register_patient", name, phone, email, patient_id,
+                               idempotency_key=idempotency_key)
+
+    def search(self, query: str, since=None, until=None) -> List[str]:
+        """Get the IDs of the patients whose history matches a query, on every node"""
+        found = self.scatter("search", query, since, until)
+        return sorted({patient_id for node, ids in found.items() for patient_id in ids
+                       if self._held_here(node, patient_id)})
+
+    def get_followup_candidates(self) -> Dict:
+        """Get all patients that currently need a follow-up visit, on every node"""
+        merged = {}
+        for node, candidates in self.scatter("get_followup_candidates").items():
+            merged.update({patient_id: decision for patient_id, decision in candidates.items()
+                           if self._held_here(node, patient_id)})
+        return merged
+
+    def get_triage(self, k: int = 10, now=None) -> List[Dict]:
+        """Get the k most urgent patients of all nodes, from each node's own top k"""
+        entries = [entry for node, top in self.scatter("get_triage", k, now).items() for entry in top
+                   if self._held_here(node, entry["patient_id"])]
+        entries.sort(key=lambda entry: -entry["score"])
+        return entries[:k]
+
+    def count_appointments(self, start=None, end=None, status="scheduled") -> int:
+        """Count appointments of all patients in [start, end)"""
+        return sum(self.scatter("count_appointments", start, end, status).values())
+
+    def patient_counts(self) -> Dict[str, int]:
+        """Get the number of patients each node holds"""
+        with self._routing:
+            clients = dict(self.clients)
+        return {name: client.request("ping") for name, client in clients.items()}
+
+    # Rebalancing
+
+    def add_node(self, name: str, address: tuple) -> int:
+        """Add a node and move the patients it now owns to it, online; returns the number moved"""
+        with self._rebalance_lock:
+            self._check_balanced()
+            client = NodeClient(address, self.authkey)
+            client.request("ping")
+            target = self.ring.copy()
+            target.add(name)
+            with self._routing:
+                self.clients[name] = client
+            return self._rebalance(target)
+
+    def remove_node(self, name: str) -> int:
+        """Move a node's patients to the other nodes, online, and stop using it; returns the number moved"""
+        with self._rebalance_lock:
+            self._check_balanced()
+            if len(self.ring.nodes) == 1:
+                raise ValueError("Node terakhir tidak dapat dilepas")
+            target = self.ring.copy()
+            target.remove(name)
+            moved = self._rebalance(target)
+            with self._routing:
+                client = self.clients.pop(name)
+            client.close()
+            return moved
+
+    def resume_rebalance(self) -> int:
+        """Finish a rebalance that failed part way, e.g. because a node was unreachable"""
+        with self._rebalance_lock:
+            return self._rebalance(self._target) if self._target is not None else 0
+
+    def _check_balanced(self) -> None:
+        if self._target is not None:
+            raise RuntimeError("Rebalancing sebelumnya belum selesai; panggil resume_rebalance()")
+
+    def _rebalance(self, target: HashRing) -> int:
+        """Move every patient to their node on the target ring.
+        
+        If it fails part way, the routing of moved and unmoved patients is kept
+        until resume_rebalance() finishes it.
+        """
+        # A registration that chose its node on the old ring lands before the nodes are listed
+        with self._registry_lock, self._routing:
+            self._target = target
+            clients = dict(self.clients)
+        moved = 0
+        for name, client in clients.items():
+            leaving = [patient_id for patient_id in client.request("patient_ids")
+                       if target.node_for(patient_id) != name]
+            for start in range(0, len(leaving), self.move_batch):
+                moved += self._move(name, leaving[start:start + self.move_batch], target)
+        with self._routing:
+            self.ring = target
+            self._target = None
+            self._moved.clear()
+        return moved
+
+    def _move(self, source: str, batch: List[str], target: HashRing) -> int:
+        """Copy a batch of patients to their nodes on the target ring, switch their calls over, drop the old copies"""
+        with self._routing:
+            self._moving.update(batch)
+            # Calls already sent for these patients finish first
+            self._routing.wait_for(lambda: not any(patient_id in self._in_flight for patient_id in batch))
+        try:
+            # A patient already moved whose old copy was not dropped keeps the newer copy
+            with self._routing:
+                copying = [patient_id for patient_id in batch if patient_id not in self._moved]
+            records = self.clients[source].request("export_records", copying)
+            by_node: Dict[str, Dict[str, Dict]] = {}
+            for patient_id, record in records.items():
+                by_node.setdefault(target.node_for(patient_id), {})[patient_id] = record
+            for node, node_records in by_node.items():
+                self.clients[node].request("import_records", node_records)
+            with self._routing:
+                self._moved.update(records)
+        finally:
+            with self._routing:
+                self._moving.difference_update(batch)
+                self._routing.notify_all()
+        self.clients[source].request("drop_records", batch)
+        return len(records)
+
+
+def _patient_method(name: str, register: bool):
+    def method(self, patient_ref: str, *args, **kwargs):
+        return self._call_patient(name, patient_ref, args, kwargs, register)
+    method.__name__ = name
+    method.__doc__ = getattr(PatientDataManager, name).__doc__
+    return method
+
+
+for _name, _register in PATIENT_METHODS.items():
+    setattr(ShardedPatientStore, _name, _patient_method(_name, _register))
@@ -0,0 +1,112 @@
+"""
+Copy-on-write Snapshots of Patient Records
+Readers such as analytics, exports and compaction get a point-in-time view of
+PatientDataManager.patients without a global lock and without copying it.
+
+Published records are never changed in place. A writer edits a copy of the
+record and publishes it through SnapshotRegistry.publish, which swaps it into
+the live dict; before the swap, every open snapshot that has not yet seen a
+change to that patient keeps a reference to the old record. So:
+
+- taking a snapshot is O(1): it remembers the live dict and its length
+- writers only take a short lock around the swap, never wait for readers
+- a snapshot holds on only to the old versions of records changed while it
+  is open, and lets them go when released (or garbage collected)
+
+Records are only added to or replaced in the live dict, never removed, so
+the keys of a snapshot are the first len(snapshot) keys of the live dict.
+Derived state (indexes, scheduler, follow-up engine) is not covered.
+"""
+
+import threading
+import weakref
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+# Preserved value of a patient registered after the snapshot was taken
+_ABSENT = object()
+
+
+class PatientSnapshot(Mapping):
+    """Read-only point-in-time view of a patients dict"""
+
+    def __init__(self, registry: "SnapshotRegistry", live: Dict[str, Any]):
+        self._registry = registry
+        self._live = live
+        self._length = len(live)
+        # patient ID -> record as it was when the snapshot was taken
+        self._preserved: Dict[str, Any] = {}
+
+    # Snapshots are tracked in a WeakSet, so they compare by identity
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __getitem__(self, patient_id: str) -> Any:
+        with self._registry.lock:
+            record = self._preserved.get(patient_id)
+            if record is None:
+                record = self._live[patient_id]
+        if record is _ABSENT:
+            raise KeyError(patient_id)
+        return record
+
+    def __contains__(self, patient_id: object) -> bool:
+        try:
+            self[patient_id]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        with self._registry.lock:
+            keys = list(self._live)
+        return iter(keys[:self._length])
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def preserved_count(self) -> int:
+        """Number of old record versions this snapshot keeps alive"""
+        return len(self._preserved)
+
+    def release(self) -> None:
+        """Stop tracking changes; the snapshot must not be read afterwards"""
+        self._registry.release(self)
+        self._preserved = {}
+
+    def __enter__(self) -> "PatientSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class SnapshotRegistry:
+    """The open snapshots of one manager and the lock that orders swaps with reads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._open: "weakref.WeakSet[PatientSnapshot]" = weakref.WeakSet()
+
+    def take(self, live: Dict[str, Any]) -> PatientSnapshot:
+        snapshot = PatientSnapshot(self, live)
+        with self.lock:
+            self._open.add(snapshot)
+        return snapshot
+
+    def release(self, snapshot: PatientSnapshot) -> None:
+        with self.lock:
+            self._open.discard(snapshot)
+
+    def publish(self, live: Dict[str, Any], patient_id: str, record: Any) -> None:
+        """Swap a new version of a record into the live dict"""
+        with self.lock:
+            for snapshot in self._open:
+                if snapshot._live is live and patient_id not in snapshot._preserved:
+                    snapshot._preserved[patient_id] = live.get(patient_id, _ABSENT)
+            live[patient_id] = record
+
+    @property
+    def open_count(self) -> int:
+        return len(self._open)
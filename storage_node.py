@@ -0,0 +1,234 @@
+"""
+Storage Node for Sharded Patient Data
+Serves one PatientDataManager, holding one shard of the patients, to the
+shard router (see shard_router.py) over local RPC.
+
+A request is a pickled (operation, arguments) tuple on a
+multiprocessing.connection socket, authenticated with a shared key; each
+connection is served by its own thread, and the manager's stripe locks let
+requests for different patients run in parallel. Besides the manager's
+public methods a node answers the operations the router needs to check
+ownership and to move patients to another node.
+
+Pickled requests run code, so every node of a cluster checks a secret key
+shared with its router: NodeProcess makes a random one (new_cluster_key())
+unless it is given one, and a node started on its own reads it from
+CARELOOP_NODE_KEY, which it requires.
+
+Usage: CARELOOP_NODE_KEY=... python storage_node.py --port 7101 --data-file patient_data_node1.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional, Tuple
+
+from patient_data_manager import PatientDataManager
+
+# Length of the random cluster keys
+KEY_BYTES = 32
+
+
+class NodeUnavailableError(Exception):
+    """Raised when a storage node cannot be reached"""
+    pass
+
+
+class PatientNotOnNode(LookupError):
+    """Raised by a node for a call about a patient it does not hold"""
+    pass
+
+
+def new_cluster_key() -> bytes:
+    """Make a random key for the nodes and router of one cluster"""
+    return os.urandom(KEY_BYTES)
+
+
+class NodeService:
+    """The operations a node answers, on its manager"""
+
+    def __init__(self, manager: PatientDataManager):
+        self.manager = manager
+
+    def ping(self) -> int:
+        return len(self.manager.patients)
+
+    def call(self, method: str, args: Tuple, kwargs: Dict):
+        """Call a public manager method"""
+        if method.startswith("_"):
+            raise AttributeError(f"Operasi tidak dikenal: {method}")
+        return getattr(self.manager, method)(*args, **kwargs)
+
+    def call_patient(self, patient_id: str, method: str, args: Tuple, kwargs: Dict):
+        """Call a manager method about a patient the node must hold"""
+        if patient_id not in self.manager.patients:
+            raise PatientNotOnNode(patient_id)
+        return self.call(method, (patient_id,) + tuple(args), kwargs)
+
+    def patient_ids(self) -> List[str]:
+        return list(self.manager.patients)
+
+    def export_records(self, patient_ids: List[str]) -> Dict[str, Dict]:
+        return self.manager.export_records(patient_ids)
+
+    def import_records(self, records: Dict[str, Dict]) -> int:
+        """Store moved records and save them before the router drops them from their old node"""
+        self.manager.import_records(records)
+        self.manager.flush()
+        return len(records)
+
+    def drop_records(self, patient_ids: List[str]) -> int:
+        removed = self.manager.drop_records(patient_ids)
+        self.manager.flush()
+        return removed
+
+
+def _serve_connection(service: NodeService, connection, stopped: threading.Event) -> None:
+    with connection:
+        while True:
+            try:
+                operation, args = connection.recv()
+            except (EOFError, OSError):
+                return
+            if operation == "shutdown":
+                stopped.set()
+                connection.send(("ok", None))
+                return
+            try:
+                reply = ("ok", getattr(service, operation)(*args))
+            except Exception as e:
+                reply = ("error", e)
+            try:
+                connection.send(reply)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                connection.send(("error", RuntimeError(repr(reply[1]))))
+
+
+def serve_node(data_file: str, authkey: bytes, host: str = "127.0.0.1", port: int = 0,
+               flush_interval: Optional[float] = 0.2, ready=None) -> None:
+    """Serve a data file until a shutdown request, sending the bound address to ready if given"""
+    if not authkey:
+        raise ValueError("Node penyimpanan memerlukan kunci cluster")
+    manager = PatientDataManager(data_file, flush_interval=flush_interval)
+    service = NodeService(manager)
+    stopped = threading.Event()
+    # The router opens a connection per calling thread at once
+    listener = Listener((host, port), backlog=64, authkey=authkey)
+
+    def accept_loop():
+        while not stopped.is_set():
+            try:
+                connection = listener.accept()
+            except (multiprocessing.AuthenticationError, EOFError, OSError):
+                continue  # a client that failed the handshake, or the listener closing
+            threading.Thread(target=_serve_connection, args=(service, connection, stopped),
+                             daemon=True).start()
+
+    threading.Thread(target=accept_loop, name="node-accept", daemon=True).start()
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+        listener.close()
+
+
+class NodeProcess:
+    """A storage node run as a child process, for tests, benchmarks and local deployments"""
+
+    def __init__(self, data_file: str, authkey: Optional[bytes] = None,
+                 flush_interval: Optional[float] = 0.2):
+        self.data_file = data_file
+        # Sent to the child with its arguments over a pipe, not on its command line
+        self.authkey = authkey or new_cluster_key()
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=serve_node, name=f"storage-node:{data_file}",
+                                       args=(data_file, self.authkey, "127.0.0.1", 0, flush_interval, sender),
+                                       daemon=True)
+        self.process.start()
+        sender.close()
+        if not receiver.poll(60):
+            self.process.kill()
+            raise NodeUnavailableError(f"Node {data_file} tidak siap")
+        self.address = receiver.recv()
+        receiver.close()
+
+    def stop(self, timeout: float = 30) -> None:
+        """Ask the node to save and exit, and wait for it"""
+        if self.process.is_alive():
+            try:
+                NodeClient(self.address, self.authkey).request("shutdown")
+            except NodeUnavailableError:
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+
+
+class NodeClient:
+    """Sends requests to a node, over a pool of connections so threads can call it at once"""
+
+    def __init__(self, address, authkey: bytes):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, operation: str, *args):
+        """Run an operation on the node, raising the exception it raised"""
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                connection = Client(self.address, authkey=self.authkey)
+            connection.send((operation, args))
+            status, value = connection.recv()
+        except (EOFError, OSError) as e:
+            if connection is not None:
+                connection.close()
+            raise NodeUnavailableError(f"Node {self.address[0]}:{self.address[1]} tidak dapat dihubungi: {e}")
+        if operation == "shutdown":
+            connection.close()
+        else:
+            with self._lock:
+                self._idle.append(connection)
+        if status == "error":
+            raise value
+        return value
+
+    def call(self, method: str, *args, **kwargs):
+        """Call a PatientDataManager method on the node"""
+        return self.request("call", method, args, kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Node penyimpanan data pasien untuk router shard")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7101)
+    parser.add_argument("--data-file", required=True)
+    parser.add_argument("--flush-interval", type=float, default=0.2,
+                        help="Detik perubahan dikumpulkan sebelum disimpan ke file data")
+    args = parser.parse_args()
+
+    authkey = os.environ.get("CARELOOP_NODE_KEY", "").encode("utf-8")
+    if not authkey:
+        raise SystemExit("Setel CARELOOP_NODE_KEY ke kunci rahasia cluster yang sama dengan router")
+    print(f"Node penyimpanan {args.data_file} berjalan di {args.host}:{args.port}")
+    serve_node(args.data_file, authkey, args.host, args.port, args.flush_interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Columnar Symptom History Store
+This module keeps symptom and checkin histories in compact, interned columns
+instead of one dict per entry. Symptom, body part and severity words are
+interned into integer codes, and entries are only turned back into the dict
+shape used by PatientDataManager when they are read.
+
+PatientDataManager keeps one store of the longer hot histories it reads: a
+patient's rows are loaded on the first read and brought up to date on
+later ones, appending only the entries added since. Windowed reads then
+compare integer timestamps instead of parsing every entry's date.
+"""
+
+import array
+import datetime
+import operator
+import threading
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+HISTORY_SECTIONS = ("symptoms_history", "checkin_history")
+SEVERITY_LEVELS = ("ringan", "sedang", "berat")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_timestamp(value) -> int:
+    """Convert an ISO date string or datetime to microseconds since the epoch"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_timestamp(timestamp: int) -> str:
+    """Convert microseconds since the epoch back to an ISO date string"""
+    return (_EPOCH + datetime.timedelta(microseconds=timestamp)).isoformat()
+
+
+class Vocabulary:
+    """Interns strings into dense integer codes"""
+
+    def __init__(self, words: Iterable[str] = (), max_size: Optional[int] = None):
+        self.codes: Dict[str, int] = {}
+        self.words: List[str] = []
+        self.max_size = max_size
+        for word in words:
+            self.intern(word)
+
+    def intern(self, word: str) -> int:
+        """Return the code for a word, assigning a new one if needed"""
+        code = self.codes.get(word)
+        if code is None:
+            if self.max_size is not None and len(self.words) >= self.max_size:
+                raise ValueError(f"Vocabulary is full ({self.max_size} words)")
+            code = len(self.words)
+            self.codes[word] = code
+            self.words.append(word)
+        return code
+
+    def lookup(self, code: int) -> str:
+        """Return the word for a code"""
+        return self.words[code]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word) -> bool:
+        return word in self.codes
+
+
+class HistoryColumns:
+    """Column storage for history rows of every patient.
+
+    Symptoms are stored as a flat code array plus row offsets, because the
+    symptom vocabulary is free text and grows without bound.
+    """
+
+    __slots__ = ("timestamps", "sections", "severities", "body_parts",
+                 "symptom_offsets", "symptom_codes")
+
+    def __init__(self):
+        self.timestamps = array.array('q')
+        self.sections = array.array('b')
+        self.severities = array.array('b')
+        self.body_parts = array.array('I')
+        self.symptom_offsets = array.array('I', [0])
+        self.symptom_codes = array.array('I')
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: int, section_code: int, symptom_codes: Iterable[int],
+               body_part_code: int, severity_code: int) -> int:
+        """Append one row and return its row number"""
+        self.timestamps.append(timestamp)
+        self.sections.append(section_code)
+        self.severities.append(severity_code)
+        self.body_parts.append(body_part_code)
+        self.symptom_codes.extend(symptom_codes)
+        self.symptom_offsets.append(len(self.symptom_codes))
+        return len(self.timestamps) - 1
+
+    def row_symptoms(self, row: int) -> array.array:
+        """Return the symptom codes of one row"""
+        return self.symptom_codes[self.symptom_offsets[row]:self.symptom_offsets[row + 1]]
+
+    def nbytes(self) -> int:
+        """Return the number of bytes held by the column buffers"""
+        return sum(column.buffer_info()[1] * column.itemsize for column in (
+            self.timestamps, self.sections, self.severities, self.body_parts,
+            self.symptom_offsets, self.symptom_codes))
+
+
+class HistoryView(Sequence):
+    """Read-only list of history entries, decoded to dicts on access"""
+
+    def __init__(self, store: "ColumnarHistoryStore", rows: Iterable[int] = ()):
+        self._store = store
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._store.decode_row(self._rows[index])
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self._rows:
+            yield self._store.decode_row(row)
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"HistoryView({list(self)!r})"
+
+
+class _SyncedPatient:
+    """The history lists a patient's rows were read from, the rows of each section and whether their dates ascend"""
+
+    __slots__ = ("sources", "rows", "ascending")
+
+    def __init__(self):
+        self.sources: Tuple[list, ...] = tuple([] for _ in HISTORY_SECTIONS)
+        self.rows = [array.array('I') for _ in HISTORY_SECTIONS]
+        self.ascending = [True] * len(HISTORY_SECTIONS)
+
+
+class ColumnarHistoryStore:
+    """Interned, column-oriented store for patient symptom and checkin histories"""
+
+    def __init__(self):
+        self.symptoms = Vocabulary()
+        self.body_parts = Vocabulary()
+        # Severity codes are stored as int8, and the known levels keep a
+        # stable ordering (ringan < sedang < berat).
+        self.severities = Vocabulary(SEVERITY_LEVELS, max_size=127)
+        self.columns = HistoryColumns()
+        # Row numbers of each patient's entries, in insertion order
+        self._patient_rows: Dict[str, array.array] = {}
+        # Patients kept in step with PatientDataManager records by sync_patient
+        self._synced: Dict[str, _SyncedPatient] = {}
+        # Rows of dropped patients, reclaimed by _compact
+        self._dead_rows = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_patients(cls, patients: Dict) -> "ColumnarHistoryStore":
+        """Build a store from the dict shape kept by PatientDataManager"""
+        store = cls()
+        for patient, record in patients.items():
+            for section in HISTORY_SECTIONS:
+                for entry in record.get(section, []):
+                    store.append(patient, section, entry)
+        return store
+
+    def append(self, patient: str, section: str, entry: Dict) -> int:
+        """Append a history entry in the PatientDataManager dict shape and return its row number"""
+        return self.add_entry(patient, section, entry["symptoms"], entry.get("body_part", ""),
+                       entry.get("severity", "sedang"), entry["date"])
+
+    def add_entry(self, patient: str, section: str, symptoms: List[str],
+                  body_part: str = "", severity: str = "sedang", date=None) -> int:
+        """Append a history entry from its individual fields and return its row number"""
+        if section not in HISTORY_SECTIONS:
+            raise ValueError(f"Unknown history section: {section}")
+        if date is None:
+            date = datetime.datetime.now()
+
+        row = self.columns.append(
+            to_timestamp(date),
+            HISTORY_SECTIONS.index(section),
+            [self.symptoms.intern(symptom) for symptom in symptoms],
+            self.body_parts.intern(body_part),
+            self.severities.intern(severity),
+        )
+
+        rows = self._patient_rows.get(patient)
+        if rows is None:
+            rows = self._patient_rows[patient] = array.array('I')
+        rows.append(row)
+        return row
+
+    def sync_patient(self, patient: str, record: Dict) -> "_SyncedPatient":
+        """Bring a patient's rows up to date with a record, appending only new entries when it just grew"""
+        current = tuple([record.get(section, []) for section in HISTORY_SECTIONS])
+        with self._lock:
+            synced = self._synced.get(patient)
+            if synced is not None and all(map(operator.is_, synced.sources, current)):
+                return synced
+            if synced is None or any(len(after) < len(before) or any(a is not b for a, b in zip(before, after))
+                                     for before, after in zip(synced.sources, current)):
+                self.drop_patient(patient)
+                synced = self._synced[patient] = _SyncedPatient()
+            timestamps = self.columns.timestamps
+            for index, (section, before, after) in enumerate(zip(HISTORY_SECTIONS, synced.sources, current)):
+                rows = synced.rows[index]
+                for entry in after[len(before):]:
+                    row = self.append(patient, section, entry)
+                    if rows and timestamps[row] < timestamps[rows[-1]]:
+                        synced.ascending[index] = False
+                    rows.append(row)
+            synced.sources = current
+            return synced
+
+    def update(self, patient: str, record: Dict) -> None:
+        """Sync a patient after an edit if its rows are kept, so replaced lists are not held on to"""
+        with self._lock:
+            if patient in self._synced:
+                self.sync_patient(patient, record)
+
+    def recent_positions(self, patient: str, record: Dict, section: str,
+                         since: datetime.datetime) -> Sequence:
+        """Sync a patient, then get the positions in record[section] of the entries after since"""
+        cutoff = to_timestamp(since)
+        index = HISTORY_SECTIONS.index(section)
+        with self._lock:
+            synced = self.sync_patient(patient, record)
+            rows, timestamps = synced.rows[index], self.columns.timestamps
+            if not synced.ascending[index]:
+                return [position for position, row in enumerate(rows) if timestamps[row] > cutoff]
+            low, high = 0, len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                if timestamps[rows[middle]] > cutoff:
+                    high = middle
+                else:
+                    low = middle + 1
+            return range(low, len(rows))
+
+    def drop_patient(self, patient: str) -> None:
+        """Forget a patient's rows"""
+        with self._lock:
+            self._synced.pop(patient, None)
+            rows = self._patient_rows.pop(patient, None)
+            if rows:
+                self._dead_rows += len(rows)
+                if self._dead_rows > len(self.columns) // 2:
+                    self._compact()
+
+    def sync(self, patients: Dict) -> None:
+        """Forget the patients that are gone; the others are brought up to date when next read"""
+        with self._lock:
+            for patient in [patient for patient in self._patient_rows if patient not in patients]:
+                self.drop_patient(patient)
+
+    def _compact(self) -> None:
+        """Copy the live rows to new columns, renumbering them"""
+        old, columns = self.columns, HistoryColumns()
+        for patient, rows in self._patient_rows.items():
+            self._patient_rows[patient] = array.array('I', (
+                columns.append(old.timestamps[row], old.sections[row], old.row_symptoms(row),
+                               old.body_parts[row], old.severities[row]) for row in rows))
+        for patient, synced in self._synced.items():
+            rows = self._patient_rows.get(patient, ())
+            synced.rows = [array.array('I', (row for row in rows if columns.sections[row] == index))
+                           for index in range(len(HISTORY_SECTIONS))]
+        self.columns = columns
+        self._dead_rows = 0
+
+    def decode_row(self, row: int) -> Dict:
+        """Convert one stored row back to the PatientDataManager dict shape"""
+        columns = self.columns
+        return {
+            "date": from_timestamp(columns.timestamps[row]),
+            "symptoms": [self.symptoms.lookup(code) for code in columns.row_symptoms(row)],
+            "body_part": self.body_parts.lookup(columns.body_parts[row]),
+            "severity": self.severities.lookup(columns.severities[row]),
+        }
+
+    def _section_rows(self, patient: str, section: str) -> array.array:
+        section_code = HISTORY_SECTIONS.index(section)
+        sections = self.columns.sections
+        return array.array('I', (row for row in self._patient_rows.get(patient, ())
+                                 if sections[row] == section_code))
+
+    def get_history(self, patient: str, section: str = "symptoms_history") -> HistoryView:
+        """Get a lazily decoded view of a patient's history section"""
+        return HistoryView(self, self._section_rows(patient, section))
+
+    def get_recent_history(self, patient: str, section: str = "symptoms_history",
+                           days: int = 7) -> HistoryView:
+        """Get the entries of the last N days without parsing any dates"""
+        cutoff = to_timestamp(datetime.datetime.now() - datetime.timedelta(days=days))
+        timestamps = self.columns.timestamps
+        rows = [row for row in self._section_rows(patient, section) if timestamps[row] > cutoff]
+        return HistoryView(self, rows)
+
+    def count(self, patient: str, section: str = "symptoms_history") -> int:
+        """Get the number of entries in a patient's history section"""
+        return len(self._section_rows(patient, section))
+
+    def patients(self) -> List[str]:
+        """Get all patients that have at least one history entry"""
+        return list(self._patient_rows)
+
+    def to_patient_histories(self, patient: str) -> Dict[str, List[Dict]]:
+        """Decode every history section of a patient to plain lists of dicts"""
+        return {section: list(self.get_history(patient, section)) for section in HISTORY_SECTIONS}
+
+    def memory_usage(self) -> int:
+        """Estimate the bytes held by the column buffers and vocabularies"""
+        total = self.columns.nbytes()
+        total += sum(rows.buffer_info()[1] * rows.itemsize for rows in self._patient_rows.values())
+        for vocabulary in (self.symptoms, self.body_parts, self.severities):
+            total += sum(len(word.encode("utf-8")) for word in vocabulary.words)
+        return total
+
+# Example usage
+if __name__ == "__main__":
+    import json
+    from patient_data_manager import PatientDataManager
+
+    pdm = PatientDataManager()
+    store = ColumnarHistoryStore.from_patients(pdm.patients)
+
+    for patient in store.patients():
+        print(f"{patient}:")
+        print(json.dumps(store.to_patient_histories(patient), indent=2))
+
+    print(f"\nVocabulary: {len(store.symptoms)} gejala, {len(store.body_parts)} bagian tubuh")
+    print(f"Column memory: {store.memory_usage()} bytes")
@@ -3,11 +3,44 @@ Test suite for CareLoopAI Clinic Chatbot components
 """
 
 import unittest
+import gzip
+import hashlib
 import json
 import os
+import shutil
+import datetime
+import multiprocessing
+import threading
+import urllib.request
+import urllib.error
 from careloopai_clinic import CareLoopAIClinic
 from patient_data_manager import PatientDataManager
 from image_processor import SymptomImageProcessor
+from patient_index import AmbiguousPatientError, DuplicatePatientError
+from symptom_store import ColumnarHistoryStore
+from cohort_analytics import GROUP_KEYS, CohortAnalytics
+from followup_engine import FollowupEngine
+from clinic_server import create_server
+from appointment_scheduler import AppointmentScheduler, SchedulingError
+from appointment_index import AppointmentIndex, day_range, week_range
+from history_archive import HistoryArchive, archivable_counts, archive_directory
+from record_format import LazyRecord, convert, decode_file, encode_file
+from benchmarks.suite import compare, generate_population
+from benchmarks.replay import CliTarget, build_journeys, replay
+from benchmarks.stress_writers import run_stress
+from file_sync import merge_history
+from cli_chatbot import process_user_input, stream_user_input
+from clinic_chatbot_simulator import ClinicChatbotSimulator
+from dialogue_fsm import START, DialogueCompileError, DialogueMachine, check_stories, default_machine, load_stories
+from tracker_store import CARRIED_SLOTS, TrackerEventLog
+from reminders import DeliveryPipeline, FileSink, Reminder, TokenBucket, daily_reminders
+from search_index import SearchIndex, SearchQueryError, search_index_file
+from triage import IndexedHeap, TriageQueue
+from shard_router import HashRing, ShardedPatientStore
+from storage_node import NodeClient, NodeProcess, NodeService, new_cluster_key
+from idempotency import DedupeIndex, IdempotencyKeyReused
+import metrics
+import profiling
 
 class TestPatientDataManager(unittest.TestCase):
     def setUp(self):
@@ -24,16 +57,52 @@ class TestPatientDataManager(unittest.TestCase):
     
     def test_register_patient(self):
         """Test patient registration"""
-        self.pdm.register_patient("Budi Santoso", "08123456789", "budi@email.com")
-        self.assertIn("Budi Santoso", self.pdm.patients)
-        self.assertEqual(self.pdm.patients["Budi Santoso"]["personal_info"]["phone"], "08123456789")
+        patient_id = self.pdm.register_patient("Budi Santoso", "08123456789", "budi@email.com")
+        self.assertIn(patient_id, self.pdm.patients)
+        self.assertEqual(self.pdm.patients[patient_id]["personal_info"]["phone"], "08123456789")
+    
+    def test_patients_with_same_name(self):
+        """Test two patients with the same name keep separate records"""
+        first = self.pdm.register_patient("Budi Santoso", "08123456789")
+        second = self.pdm.register_patient("Budi Santoso", "08987654321")
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(self.pdm.find_by_name("budi  santoso")), sorted([first, second]))
+        with self.assertRaises(AmbiguousPatientError):
+            self.pdm.resolve_patient("Budi Santoso")
+    
+    def test_secondary_indexes(self):
+        """Test lookups by normalized phone and email, and uniqueness"""
+        patient_id = self.pdm.register_patient("Budi Santoso", "0812-3456-789", "Budi@Email.com")
+        self.assertEqual(self.pdm.find_by_phone("+62 812 3456 789"), patient_id)
+        self.assertEqual(self.pdm.find_by_email("budi@email.com"), patient_id)
+        with self.assertRaises(DuplicatePatientError):
+            self.pdm.register_patient("Budi S.", "08123456789")
+    
+    def test_indexes_persisted(self):
+        """Test indexes are saved with the data and reused on load"""
+        patient_id = self.pdm.register_patient("Budi Santoso", "08123456789")
+        reloaded = PatientDataManager(self.test_file)
+        self.assertEqual(reloaded.find_by_phone("08123456789"), patient_id)
+        self.assertEqual(reloaded.indexes.patient_count, 1)
+    
+    def test_legacy_file_migration(self):
+        """Test name-keyed files are re-keyed by patient ID"""
+        with open(self.test_file, "w") as f:
+            json.dump({"Budi Santoso": {
+                "personal_info": {"name": "Budi Santoso", "phone": "08123456789", "email": ""},
+                "symptoms_history": [], "treatment_plans": [], "checkin_history": [], "appointments": []
+            }}, f)
+        migrated = PatientDataManager(self.test_file)
+        patient_id = migrated.find_by_phone("08123456789")
+        self.assertTrue(patient_id.startswith("P"))
+        self.assertEqual(migrated.patients[patient_id]["personal_info"]["patient_id"], patient_id)
     
     def test_add_symptom_report(self):
         """Test adding symptom report"""
-        self.pdm.register_patient("Budi Santoso")
-        self.pdm.add_symptom_report("Budi Santoso", ["demam", "batuk"], "kepala", "sedang")
+        patient_id = self.pdm.register_patient("Budi Santoso")
+        self.pdm.add_symptom_report(patient_id, ["demam", "batuk"], "kepala", "sedang")
         
-        history = self.pdm.patients["Budi Santoso"]["symptoms_history"]
+        history = self.pdm.patients[patient_id]["symptoms_history"]
         self.assertEqual(len(history), 1)
         self.assertIn("demam", history[0]["symptoms"])
     
@@ -91,6 +160,14 @@ class TestCareLoopAIClinic(unittest.TestCase):
         self.assertIn("Terima kasih, Budi Santoso", response)
         self.assertEqual(self.clinic.current_patient, "Budi Santoso")
     
+    def test_returning_patient(self):
+        """Test a returning patient is recognized by phone number"""
+        self.clinic.register_patient("Budi Santoso", "08123456789")
+        first_id = self.clinic.current_patient_id
+        self.clinic.register_patient("Budi", "+62 812-3456-789")
+        self.assertEqual(self.clinic.current_patient_id, first_id)
+        self.assertEqual(len(self.clinic.patient_manager.patients), 1)
+    
     def test_report_symptoms(self):
         """Test symptom reporting"""
         self.clinic.register_patient("Budi Santoso")
@@ -110,6 +187,15 @@ class TestCareLoopAIClinic(unittest.TestCase):
         self.assertIn("Terima kasih atas update harian Anda", response)
         self.assertIn("Update: Kondisi membaik", response)
     
+    def test_check_followup_needed(self):
+        """Test follow-up recommendation after worsening checkins"""
+        self.clinic.register_patient("Budi Santoso")
+        self.clinic.report_symptoms(["demam"], "kepala", "sedang")
+        response = self.clinic.daily_checkin(["demam", "memburuk"], "kepala", "berat")
+        
+        self.assertIn("kami menyarankan kunjungan langsung ke klinik", response)
+        self.assertIn("Tingkat keparahan gejala terakhir berat", self.clinic.check_followup_needed())
+    
     def test_get_treatment_plan(self):
         """Test getting treatment plan"""
         self.clinic.register_patient("Budi Santoso")
@@ -118,6 +204,1636 @@ class TestCareLoopAIClinic(unittest.TestCase):
         
         self.assertIn("Rencana pengobatan Anda saat ini", response)
         self.assertIn("Istirahat yang cukup", response)
+    
+    def test_components_load_on_first_use(self):
+        """Test greeting does not load patient data and warm-up builds the components"""
+        clinic = CareLoopAIClinic()
+        clinic.greet_patient()
+        self.assertIsNone(clinic._patient_manager)
+        self.assertIsNone(clinic._image_processor)
+        
+        clinic = CareLoopAIClinic(warm_up=False)
+        clinic.start_warm_up().join()
+        self.assertIsInstance(clinic._patient_manager, PatientDataManager)
+        self.assertIsInstance(clinic._image_processor, SymptomImageProcessor)
+
+class TestColumnarHistoryStore(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.patients = {
+            "Budi Santoso": {
+                "symptoms_history": [
+                    {"date": "2025-09-04T23:45:44.659473", "symptoms": ["demam", "batuk"],
+                     "body_part": "kepala", "severity": "sedang"}
+                ],
+                "checkin_history": [
+                    {"date": "2025-09-05T08:00:00", "symptoms": ["batuk", "membaik"],
+                     "body_part": "dada", "severity": "ringan"}
+                ]
+            }
+        }
+        self.store = ColumnarHistoryStore.from_patients(self.patients)
+    
+    def test_round_trip(self):
+        """Test entries decode back to the original dict shape"""
+        histories = self.store.to_patient_histories("Budi Santoso")
+        self.assertEqual(histories["symptoms_history"], self.patients["Budi Santoso"]["symptoms_history"])
+        self.assertEqual(histories["checkin_history"], self.patients["Budi Santoso"]["checkin_history"])
+    
+    def test_vocabulary_is_interned(self):
+        """Test repeated words share a single code"""
+        self.store.add_entry("Siti", "checkin_history", ["batuk"], "dada", "ringan")
+        self.assertEqual(len(self.store.symptoms), 3)
+        self.assertEqual(self.store.count("Siti", "checkin_history"), 1)
+        self.assertEqual(self.store.count("Siti", "symptoms_history"), 0)
+    
+    def test_recent_history(self):
+        """Test recent history only returns entries inside the window"""
+        self.store.add_entry("Budi Santoso", "symptoms_history", ["diare"], "perut", "berat")
+        recent = self.store.get_recent_history("Budi Santoso", "symptoms_history", 7)
+        self.assertEqual(len(recent), 1)
+        self.assertEqual(recent[0]["symptoms"], ["diare"])
+        self.assertEqual(recent[-1]["severity"], "berat")
+    
+    def test_sync_appends_only_new_entries(self):
+        """Test a synced patient gets rows for appended entries only, and is reloaded when entries go"""
+        store = ColumnarHistoryStore()
+        record = self.patients["Budi Santoso"]
+        store.sync_patient("Budi Santoso", record)
+        self.assertEqual(len(store.columns), 2)
+        
+        grown = dict(record, symptoms_history=record["symptoms_history"] + [
+            {"date": datetime.datetime.now().isoformat(), "symptoms": ["diare"], "body_part": "perut",
+             "severity": "berat"}])
+        since = datetime.datetime.now() - datetime.timedelta(days=7)
+        self.assertEqual(list(store.recent_positions("Budi Santoso", grown, "symptoms_history", since)), [1])
+        self.assertEqual(len(store.columns), 3)
+        
+        # Dropping the leading entries, as compaction does, reloads the patient and reclaims its old rows
+        compacted = dict(grown, symptoms_history=grown["symptoms_history"][1:], checkin_history=[])
+        store.update("Budi Santoso", compacted)
+        self.assertEqual(len(store.columns), 1)
+        self.assertEqual(store.to_patient_histories("Budi Santoso")["symptoms_history"][0]["symptoms"],
+                         ["diare"])
+    
+    def test_manager_reads_recent_history_from_store(self):
+        """Test get_symptom_history filters long histories through the store, in step with new reports"""
+        test_file = "test_patient_data.json"
+        try:
+            manager = PatientDataManager(test_file)
+            budi = manager.register_patient("Budi")
+            manager.add_symptom_report(budi, ["demam"], "kepala", "sedang")
+            history = manager.patients[budi]["symptoms_history"]
+            now = datetime.datetime.now()
+            history[:0] = [dict(history[0], date=(now - datetime.timedelta(days=20 - day)).isoformat(),
+                                symptoms=["batuk"]) for day in range(20)]
+            recent = manager.get_symptom_history(budi)
+            self.assertEqual([entry["symptoms"] for entry in recent], [["batuk"]] * 6 + [["demam"]])
+            self.assertIs(recent[-1], history[-1])
+            self.assertEqual(manager._history.count(budi), 21)
+            
+            manager.add_symptom_report(budi, ["diare"], "perut", "berat")
+            self.assertEqual(manager._history.count(budi), 22)
+            self.assertEqual(manager.get_symptom_history(budi, 1)[-1]["symptoms"], ["diare"])
+            self.assertEqual(len(manager.get_symptom_history(budi, 30)), 22)
+        finally:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+
+class TestCohortAnalytics(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.pdm = PatientDataManager(self.test_file)
+        self.pdm.patients = {}
+        self.pdm.add_symptom_report("Budi Santoso", ["demam", "batuk"], "kepala", "sedang")
+        self.pdm.add_symptom_report("Siti Aminah", ["demam"], "kepala", "berat")
+        self.pdm.add_daily_checkin("Budi Santoso", ["batuk", "membaik"], "dada", "ringan")
+        self.analytics = CohortAnalytics(self.pdm)
+    
+    def tearDown(self):
+        """Tear down test fixtures after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_group_counts(self):
+        """Test counting patients by symptom and severity"""
+        counts = self.analytics.group_counts(["severity"], unique_patients=True, symptom="demam")
+        self.assertEqual(counts["sedang"], 1)
+        self.assertEqual(counts["berat"], 1)
+    
+    def test_trend_and_recovery(self):
+        """Test trend is derived from consecutive entries"""
+        counts = self.analytics.group_counts(["trend", "recovery_time"], unique_patients=True,
+                                             section="checkin_history")
+        self.assertEqual(counts[("membaik", "0-3 hari")], 1)
+    
+    def test_incremental_refresh(self):
+        """Test only new entries are converted on refresh"""
+        self.assertEqual(self.analytics.refresh(), 3)
+        self.pdm.add_daily_checkin("Siti Aminah", ["demam", "memburuk"], "kepala", "berat")
+        self.assertEqual(self.analytics.refresh(), 1)
+        counts = self.analytics.group_counts(["trend"], symptom="demam")
+        self.assertEqual(counts["memburuk"], 1)
+    
+    def test_empty_clinic(self):
+        """Test every group key answers with no counts for a clinic without reports"""
+        self.pdm.patients = {}
+        analytics = CohortAnalytics(self.pdm)
+        week_ago = datetime.datetime.now() - datetime.timedelta(days=7)
+        for key in GROUP_KEYS:
+            for unique_patients in (False, True):
+                counts = analytics.group_counts([key], unique_patients=unique_patients, since=week_ago)
+                self.assertTrue(counts.empty, key)
+        self.assertEqual(analytics.group_counts([])["total"], 0)
+    
+    def test_refresh_after_compaction(self):
+        """Test entries appended after a compaction are counted, and a rebuild reads the archived ones"""
+        old = (datetime.datetime.now() - datetime.timedelta(days=200)).isoformat()
+        for record in self.pdm.patients.values():
+            for section in ("symptoms_history", "checkin_history"):
+                for entry in record[section]:
+                    entry["date"] = old
+        self.assertEqual(self.analytics.refresh(), 3)
+        try:
+            self.assertEqual(self.pdm.compact_history(horizon_days=90).progress()["entries_moved"], 3)
+            for _ in range(3):
+                self.pdm.add_symptom_report("Budi Santoso", ["diare"], "perut", "sedang")
+            self.assertEqual(self.analytics.refresh(), 3)
+            self.assertEqual(len(self.analytics.select(symptom="diare")), 3)
+            
+            rebuilt = CohortAnalytics(self.pdm)
+            self.assertEqual(rebuilt.refresh(), 6)
+            self.assertEqual(len(rebuilt.select(symptom="demam")), 2)
+        finally:
+            shutil.rmtree(archive_directory(self.test_file), ignore_errors=True)
+
+class TestFollowupEngine(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.engine = FollowupEngine()
+    
+    def test_improving_patient(self):
+        """Test an improving patient does not need a visit"""
+        self.engine.record_report("Budi Santoso", ["demam"], "sedang")
+        self.engine.record_checkin("Budi Santoso", ["membaik"], "ringan")
+        decision = self.engine.evaluate("Budi Santoso")
+        self.assertFalse(decision.needed)
+        self.assertIn("Kondisi membaik", decision.reasons)
+    
+    def test_worsening_streak(self):
+        """Test repeated worsening checkins recommend a visit"""
+        self.engine.record_report("Budi Santoso", ["demam"], "ringan")
+        self.engine.record_checkin("Budi Santoso", ["demam", "memburuk"], "sedang")
+        self.engine.record_checkin("Budi Santoso", ["demam", "memburuk"], "sedang")
+        decision = self.engine.evaluate("Budi Santoso")
+        self.assertTrue(decision.needed)
+        self.assertIn("Kondisi memburuk 2 kali berturut-turut", decision.reasons)
+    
+    def test_manager_records_photos(self):
+        """Test a photo recorded through the manager rescores triage and changes the summary's ETag"""
+        test_file = "test_patient_data.json"
+        try:
+            manager = PatientDataManager(test_file)
+            budi = manager.register_patient("Budi Santoso")
+            manager.add_symptom_report(budi, ["ruam"], "lengan", "sedang")
+            manager.record_photo(budi, "ringan")
+            score = manager.get_triage(1)[0]["score"]
+            etag = manager.get_patient_summary(budi)["etag"]
+            
+            manager.record_photo(budi, "berat")
+            self.assertEqual(manager.followup_engine.get_progress(budi).photo_change_score, 2.0)
+            self.assertGreater(manager.get_triage(1)[0]["score"], score)
+            self.assertNotEqual(manager.get_patient_summary(budi)["etag"], etag)
+            self.assertIsNone(manager.record_photo("Tidak Terdaftar", "berat"))
+        finally:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+    
+    def test_days_since_onset(self):
+        """Test symptoms lasting past the limit recommend a visit"""
+        onset = datetime.datetime(2025, 9, 1)
+        self.engine.record_report("Budi Santoso", ["batuk"], "sedang", onset)
+        decision = self.engine.evaluate("Budi Santoso", onset + datetime.timedelta(days=8))
+        self.assertTrue(decision.needed)
+        self.assertIn("Gejala belum membaik setelah 8 hari", decision.reasons)
+    
+    def test_batch_evaluation(self):
+        """Test batch evaluation returns only patients needing a visit"""
+        self.engine.record_report("Budi Santoso", ["demam"], "berat")
+        self.engine.record_report("Siti Aminah", ["pilek"], "ringan")
+        self.assertEqual(list(self.engine.evaluate_all(only_needed=True)), ["Budi Santoso"])
+    
+    def test_ended_episode_needs_no_visit(self):
+        """Test a severe report older than the episode gap no longer asks for a visit, until a new report"""
+        reported = datetime.datetime(2025, 9, 1)
+        self.engine.record_report("Budi Santoso", ["demam"], "berat", reported)
+        later = reported + datetime.timedelta(days=60)
+        self.assertFalse(self.engine.evaluate("Budi Santoso", later).needed)
+        self.assertEqual(self.engine.evaluate_all(later), {})
+        
+        self.engine.record_report("Budi Santoso", ["demam"], "berat", later)
+        self.assertEqual(list(self.engine.evaluate_all(later, only_needed=True)), ["Budi Santoso"])
+    
+    def test_from_patients(self):
+        """Test statistics are rebuilt from stored histories"""
+        engine = FollowupEngine.from_patients({
+            "Budi Santoso": {
+                "symptoms_history": [{"date": "2025-09-01T08:00:00", "symptoms": ["demam"], "severity": "sedang"}],
+                "checkin_history": [{"date": "2025-09-02T08:00:00", "symptoms": ["memburuk"], "severity": "berat"}]
+            }
+        })
+        progress = engine.get_progress("Budi Santoso")
+        self.assertEqual(list(progress.trajectory), [1, 2])
+        self.assertEqual(progress.worsening_streak, 1)
+
+class TestPatientSummary(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.pdm = PatientDataManager(self.test_file)
+        self.pdm.patients = {}
+        self.pdm.register_patient("Budi Santoso")
+        self.pdm.add_symptom_report("Budi Santoso", ["demam", "batuk"], "kepala", "sedang")
+        self.pdm.generate_treatment_plan("Budi Santoso", ["demam", "batuk"], "kepala", "sedang")
+    
+    def tearDown(self):
+        """Tear down test fixtures after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_summary_is_materialized(self):
+        """Test repeated reads return the cached summary"""
+        summary = self.pdm.get_patient_summary("Budi Santoso")
+        self.assertIs(self.pdm.get_patient_summary("Budi Santoso"), summary)
+        self.assertIn("Riwayat Gejala (7 hari terakhir)", summary["text"])
+        self.assertIsNone(self.pdm.get_patient_summary_if_changed("Budi Santoso", summary["etag"]))
+    
+    def test_summary_invalidated_by_mutation(self):
+        """Test mutations bump the version and rebuild the summary"""
+        before = self.pdm.get_patient_summary("Budi Santoso")
+        self.pdm.add_symptom_report("Budi Santoso", ["diare"], "perut", "berat")
+        after = self.pdm.get_patient_summary("Budi Santoso")
+        self.assertEqual(after["version"], before["version"] + 1)
+        self.assertNotEqual(after["etag"], before["etag"])
+        self.assertIn("diare (berat)", after["text"])
+    
+    def test_summary_expires_with_window(self):
+        """Test the summary is rebuilt once entries leave the 7-day window"""
+        summary = self.pdm.get_patient_summary("Budi Santoso")
+        later = datetime.datetime.now() + datetime.timedelta(days=8)
+        expired = self.pdm.get_patient_summary("Budi Santoso", later)
+        self.assertEqual(expired["recent_symptoms"], [])
+        self.assertNotEqual(expired["etag"], summary["etag"])
+    
+    def test_http_etag(self):
+        """Test the HTTP endpoint answers 304 for a matching ETag"""
+        server = create_server(port=0, patient_manager=self.pdm)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/patients/Budi%20Santoso/summary"
+            with urllib.request.urlopen(url) as response:
+                etag = response.headers["ETag"]
+                self.assertEqual(json.loads(response.read())["etag"], etag)
+            request = urllib.request.Request(url, headers={"If-None-Match": etag})
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(request)
+            self.assertEqual(context.exception.code, 304)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestAppointmentScheduler(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        today = datetime.date.today()
+        # A Monday at least a week ahead, so every slot is in the future
+        self.monday = today + datetime.timedelta(days=7 + (7 - today.weekday()) % 7)
+        self.scheduler = AppointmentScheduler(doctors=["dr. Sari"], rooms=["Ruang 1"])
+    
+    def at(self, hour, minute=0, days=0):
+        return datetime.datetime.combine(self.monday + datetime.timedelta(days=days), datetime.time(hour, minute))
+    
+    def test_conflict_and_capacity(self):
+        """Test a full slot cannot be booked twice"""
+        self.scheduler.book("P1", self.at(9))
+        self.assertFalse(self.scheduler.is_available(self.at(9)))
+        with self.assertRaises(SchedulingError):
+            self.scheduler.book("P2", self.at(9))
+        self.assertTrue(self.scheduler.is_available(self.at(9, 30)))
+    
+    def test_clinic_hours(self):
+        """Test bookings outside opening hours are rejected"""
+        with self.assertRaises(SchedulingError):
+            self.scheduler.book("P1", self.at(12))  # lunch break
+        with self.assertRaises(SchedulingError):
+            self.scheduler.book("P1", self.at(9, days=6))  # Sunday
+        with self.assertRaises(SchedulingError):
+            self.scheduler.book("P1", self.at(15, 30), duration_minutes=60)  # past closing
+    
+    def test_earliest_slot_skips_full_day(self):
+        """Test the earliest free slot moves to the next day once a day is full"""
+        for slot_start in self.scheduler.hours.slot_starts:
+            self.scheduler.book("P1", self.at(slot_start // 60, slot_start % 60))
+        when, doctor, room = self.scheduler.find_earliest_slot(self.at(0))
+        self.assertEqual(when, self.at(8, days=1))
+        self.assertEqual((doctor, room), ("dr. Sari", "Ruang 1"))
+    
+    def test_cancel_and_reschedule(self):
+        """Test cancelling frees the slot and a failed reschedule keeps the booking"""
+        first = self.scheduler.book("P1", self.at(9))
+        second = self.scheduler.book("P2", self.at(10))
+        with self.assertRaises(SchedulingError):
+            self.scheduler.reschedule(second.appointment_id, self.at(9))
+        self.assertEqual(self.scheduler.get_booking(second.appointment_id).start, self.at(10))
+        
+        self.scheduler.cancel(first.appointment_id)
+        moved = self.scheduler.reschedule(second.appointment_id, self.at(9))
+        self.assertEqual(moved.start, self.at(9))
+        self.assertTrue(self.scheduler.is_available(self.at(10)))
+    
+    def test_manager_appointments(self):
+        """Test appointments booked through the manager survive a reload"""
+        test_file = "test_patient_data.json"
+        try:
+            pdm = PatientDataManager(test_file)
+            pdm.patients = {}
+            patient_id = pdm.register_patient("Budi Santoso")
+            message = pdm.schedule_appointment(patient_id, "%s 09:00" % self.monday.isoformat())
+            self.assertIn("dijadwalkan", message)
+            appointment = pdm.patients[patient_id]["appointments"][0]
+            
+            reloaded = PatientDataManager(test_file)
+            self.assertIsNotNone(reloaded.scheduler.get_booking(appointment["appointment_id"]))
+            reloaded.cancel_appointment(patient_id, appointment["appointment_id"])
+            self.assertEqual(reloaded.patients[patient_id]["appointments"][0]["status"], "cancelled")
+            self.assertEqual(len(reloaded.scheduler), 0)
+        finally:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+
+class TestAppointmentIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.patients = {
+            "P1": {"appointments": [
+                {"appointment_id": "A1", "date_time": "2026-10-20 09:00", "status": "scheduled"},
+                {"appointment_id": "A2", "date_time": "2026-10-27 09:00", "status": "cancelled"}
+            ]},
+            "P2": {"appointments": [
+                {"appointment_id": "A3", "date_time": "2026-10-20 08:00", "status": "scheduled"},
+                {"date_time": "2026-10-22 10:00", "status": "scheduled"}
+            ]}
+        }
+        self.index = AppointmentIndex.from_patients(self.patients)
+    
+    def test_day_and_week_ranges(self):
+        """Test day and week views return appointments in date order"""
+        day = [a["appointment_id"] for a in self.index.iter(*day_range("2026-10-20"))]
+        self.assertEqual(day, ["A3", "A1"])
+        week = list(self.index.iter(*week_range("2026-10-22"), status="scheduled"))
+        self.assertEqual([a["patient_id"] for a in week], ["P2", "P1", "P2"])
+        self.assertEqual(self.index.count(*week_range("2026-10-22")), 3)
+    
+    def test_status_updates(self):
+        """Test re-adding an appointment moves it to its new status and time"""
+        appointment = self.patients["P1"]["appointments"][0]
+        appointment.update({"status": "cancelled", "date_time": "2026-10-21 09:00"})
+        self.index.add("P1", appointment)
+        self.assertEqual(self.index.count(status="cancelled"), 2)
+        self.assertEqual(self.index.count(*day_range("2026-10-20"), status="scheduled"), 1)
+        self.assertEqual(len(self.index), 4)
+    
+    def test_pagination(self):
+        """Test cursor pages cover every appointment exactly once"""
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.index.page(status=["scheduled", "cancelled"], cursor=cursor, limit=3)
+            seen.extend(a["appointment_id"] for a in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ["A3", "A1", "P2#1", "A2"])
+    
+    def test_manager_day_view(self):
+        """Test the manager keeps the index in sync with bookings and cancellations"""
+        test_file = "test_patient_data.json"
+        today = datetime.date.today()
+        monday = today + datetime.timedelta(days=7 + (7 - today.weekday()) % 7)
+        try:
+            pdm = PatientDataManager(test_file)
+            pdm.patients = {}
+            budi = pdm.register_patient("Budi Santoso")
+            siti = pdm.register_patient("Siti Aminah")
+            pdm.schedule_appointment(siti, "%s 10:00" % monday.isoformat())
+            pdm.schedule_appointment(budi, "%s 09:00" % monday.isoformat())
+            
+            appointments, cursor = pdm.get_appointments(*day_range(monday))
+            self.assertEqual([a["patient_name"] for a in appointments], ["Budi Santoso", "Siti Aminah"])
+            self.assertIsNone(cursor)
+            
+            pdm.cancel_appointment(budi, appointments[0]["appointment_id"])
+            reloaded = PatientDataManager(test_file)
+            self.assertEqual(reloaded.count_appointments(*day_range(monday)), 1)
+            self.assertEqual(reloaded.count_appointments(*day_range(monday), status="cancelled"), 1)
+        finally:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+
+class TestHistoryArchive(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.now = datetime.datetime.now()
+        self.pdm = PatientDataManager(self.test_file)
+        self.pdm.patients = {}
+        self.patient_id = self.pdm.register_patient("Budi Santoso")
+        record = self.pdm.patients[self.patient_id]
+        # A resolved case 200 days ago and an open one that started 3 days ago
+        for days, severity in [(200, "sedang"), (199, "ringan"), (3, "sedang"), (1, "ringan")]:
+            date = (self.now - datetime.timedelta(days=days)).isoformat()
+            record["symptoms_history"].append({"date": date, "symptoms": ["batuk"], "body_part": "dada", "severity": severity})
+            record["treatment_plans"].append({"date": date, "plan": f"Rencana {days}"})
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+        shutil.rmtree(archive_directory(self.test_file), ignore_errors=True)
+    
+    def test_archivable_counts(self):
+        """Test resolved cases are archivable but the open case and latest plan are not"""
+        record = self.pdm.patients[self.patient_id]
+        self.assertEqual(archivable_counts(record, self.now, horizon_days=365),
+                         {"symptoms_history": 2, "treatment_plans": 2})
+        
+        later = self.now + datetime.timedelta(days=30)
+        self.assertEqual(archivable_counts(record, later, horizon_days=365),
+                         {"symptoms_history": 4, "treatment_plans": 3})
+        
+        record["symptoms_history"][-1]["severity"] = "berat"
+        self.assertEqual(archivable_counts(record, later, horizon_days=365)["symptoms_history"], 2)
+    
+    def test_recent_history_skips_older_archive(self):
+        """Test a window that starts after the newest archived entry reads no archive block"""
+        self.pdm.compact_history(horizon_days=90)
+        archive = self.pdm.patients[self.patient_id]["archive"]
+        self.assertEqual(archive["newest"]["symptoms_history"][:10],
+                         (self.now - datetime.timedelta(days=199)).date().isoformat())
+        
+        reads = []
+        read_block = HistoryArchive.read_block
+        HistoryArchive.read_block = lambda archive, ref: reads.append(ref) or read_block(archive, ref)
+        try:
+            for _ in range(5):
+                self.assertEqual(len(self.pdm.get_symptom_history(self.patient_id, 7)), 2)
+            self.assertEqual(reads, [])
+            self.assertEqual(len(self.pdm.get_symptom_history(self.patient_id, 365)), 4)
+            self.assertEqual(len(reads), 1)
+        finally:
+            HistoryArchive.read_block = read_block
+    
+    def test_moved_record_keeps_archived_history(self):
+        """Test a record moved to another storage node takes its archived entries along"""
+        self.pdm.compact_history(horizon_days=90)
+        full = self.pdm.get_full_history(self.patient_id)
+        target_file = "test_patient_data_target.json"
+        target = PatientDataManager(target_file)
+        try:
+            records = NodeService(self.pdm).export_records([self.patient_id])
+            NodeService(target).import_records(records)
+            NodeService(self.pdm).drop_records([self.patient_id])
+            shutil.rmtree(archive_directory(self.test_file))
+            
+            self.assertEqual(target.get_full_history(self.patient_id), full)
+            self.assertEqual(len(target.get_symptom_history(self.patient_id, 365)), 4)
+            reloaded = PatientDataManager(target_file)
+            archived = reloaded.get_archived_history(self.patient_id)
+            self.assertEqual([plan["plan"] for plan in archived["treatment_plans"]], ["Rencana 200", "Rencana 199"])
+        finally:
+            os.remove(target_file)
+            shutil.rmtree(archive_directory(target_file), ignore_errors=True)
+    
+    def test_compaction_keeps_history_readable(self):
+        """Test compaction shrinks the hot record and reads reach into the archive"""
+        job = self.pdm.compact_history(horizon_days=90, codec="lzma", background=True)
+        self.assertTrue(job.wait(timeout=10))
+        progress = job.progress()
+        self.assertEqual(progress["state"], "done")
+        self.assertEqual(progress["entries_moved"], 4)
+        
+        reloaded = PatientDataManager(self.test_file)
+        record = reloaded.patients[self.patient_id]
+        self.assertEqual(len(record["symptoms_history"]), 2)
+        self.assertEqual(reloaded.get_latest_treatment_plan(self.patient_id), "Rencana 1")
+        self.assertEqual(len(reloaded.get_symptom_history(self.patient_id, 7)), 2)
+        self.assertEqual(len(reloaded.get_symptom_history(self.patient_id, 365)), 4)
+        self.assertEqual([p["plan"] for p in reloaded.get_full_history(self.patient_id, "treatment_plans")],
+                         ["Rencana 200", "Rencana 199", "Rencana 3", "Rencana 1"])
+        
+        # A second run finds nothing new and writes no segment
+        self.assertEqual(reloaded.compact_history().progress()["entries_moved"], 0)
+        self.assertEqual(len(os.listdir(archive_directory(self.test_file))), 1)
+
+class TestRecordFormat(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.data = {
+            "schema_version": 2,
+            "patients": {
+                "P1": {"personal_info": {"name": "Budi Santoso", "phone": "08123456789"},
+                       "symptoms_history": [{"date": "2026-10-19T08:00:00", "symptoms": ["demam"], "severity": "sedang"}],
+                       "treatment_plans": [{"plan": "Minum air putih 🙂"}],
+                       "checkin_history": [], "appointments": []},
+                "P2": {"personal_info": {"name": "Siti Aminah"}, "symptoms_history": []}
+            },
+            "indexes": {}
+        }
+        self.test_files = ["test_patient_data.json", "test_patient_data.clpr"]
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        for test_file in self.test_files:
+            if os.path.exists(test_file):
+                os.remove(test_file)
+    
+    def test_round_trip_and_lazy_fields(self):
+        """Test records decode field by field and unchanged records keep their bytes"""
+        content = encode_file(self.data)
+        decoded = decode_file(content)
+        record = decoded["patients"]["P1"]
+        self.assertIsInstance(record, LazyRecord)
+        self.assertEqual(record["personal_info"]["name"], "Budi Santoso")
+        self.assertEqual(json.loads(json.dumps(decoded, default=dict)), self.data)
+        
+        # Changing one record re-encodes it; the rest are copied as stored
+        untouched = decode_file(content)
+        self.assertEqual(untouched["patients"]["P1"]["personal_info"]["name"], "Budi Santoso")
+        untouched["patients"]["P2"]["symptoms_history"] = [{"date": "2026-10-19T09:00:00"}]
+        self.assertTrue(untouched["patients"]["P1"].unchanged)
+        self.assertFalse(untouched["patients"]["P2"].unchanged)
+        reread = decode_file(encode_file(untouched))
+        self.assertEqual(len(reread["patients"]["P2"]["symptoms_history"]), 1)
+        self.assertEqual(encode_file(decode_file(content)), content)
+        self.assertLess(len(content), len(json.dumps(self.data, indent=2)))
+    
+    def test_manager_and_conversion(self):
+        """Test the manager reads and writes binary files and JSON converts both ways"""
+        with open("test_patient_data.json", "w") as f:
+            json.dump(self.data, f)
+        self.assertEqual(convert("test_patient_data.json", "test_patient_data.clpr"), 2)
+        
+        pdm = PatientDataManager("test_patient_data.clpr")
+        pdm.add_daily_checkin("Budi Santoso", ["membaik"], "kepala", "ringan")
+        reloaded = PatientDataManager("test_patient_data.clpr")
+        self.assertEqual(len(reloaded.patients["P1"]["checkin_history"]), 1)
+        self.assertEqual(reloaded.find_by_phone("08123456789"), "P1")
+        
+        convert("test_patient_data.clpr", "test_patient_data.json")
+        with open("test_patient_data.json") as f:
+            self.assertEqual(json.load(f)["patients"]["P1"]["checkin_history"][0]["severity"], "ringan")
+    
+    def test_manager_resaves_unchanged_records_as_stored(self):
+        """Test records the manager read but did not change keep their bytes, and a changed one its untouched fields"""
+        with open("test_patient_data.clpr", "wb") as f:
+            f.write(encode_file(self.data))
+        with open("test_patient_data.clpr", "rb") as f:
+            before = decode_file(f.read())["patients"]
+        
+        pdm = PatientDataManager("test_patient_data.clpr")
+        # Loading reads every history for the follow-up engine, triage and scheduler
+        self.assertTrue(all(record.unchanged for record in pdm.patients.values()))
+        pdm.add_daily_checkin("P2", ["membaik"], "kepala", "ringan")
+        self.assertTrue(pdm.patients["P1"].unchanged)
+        self.assertEqual(sorted(pdm.patients["P2"]._assigned), ["checkin_history", "version"])
+        
+        with open("test_patient_data.clpr", "rb") as f:
+            after = decode_file(f.read())["patients"]
+        self.assertEqual(bytes(after["P1"].raw_bytes()), bytes(before["P1"].raw_bytes()))
+        self.assertEqual(dict(after["P2"].encoded_fields())["personal_info"],
+                         dict(before["P2"].encoded_fields())["personal_info"])
+        self.assertEqual(after["P2"]["checkin_history"][0]["severity"], "ringan")
+
+class TestBenchmarkSuite(unittest.TestCase):
+    def test_generated_population_loads(self):
+        """Test synthetic patients work with the manager"""
+        pdm = PatientDataManager("test_patient_data.json")
+        pdm.patients = generate_population(20)
+        patient_id = next(iter(pdm.patients))
+        self.assertTrue(pdm.get_patient_summary(patient_id)["text"].startswith("Ringkasan"))
+        self.assertEqual(pdm.find_by_name("Pasien 0"), [patient_id])
+    
+    def test_compare_thresholds(self):
+        """Test only regressions past the threshold and noise floor are reported"""
+        baseline = {"1000/add_symptom_report": {"median_ms": 100.0},
+                    "1000/get_symptom_history": {"median_ms": 0.01}}
+        results = {"1000/add_symptom_report": {"median_ms": 130.0},
+                   "1000/get_symptom_history": {"median_ms": 0.03},
+                   "1000/load_data": {"median_ms": 50.0}}
+        regressions = compare(results, baseline, threshold=0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("1000/add_symptom_report"))
+        self.assertEqual(compare(results, baseline, threshold=0.5), [])
+
+class TestConversationReplay(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_journeys_follow_stories(self):
+        """Test journeys are built from the story and rule intents"""
+        journey = build_journeys(1, 2, 2, appointment_rate=0.0)[0]
+        self.assertEqual(journey.days[0], ["greet", "inform_name", "inform_symptoms"])
+        self.assertEqual(journey.days[1:3], [["daily_checkin"], ["daily_checkin"]])
+        self.assertEqual(journey.days[-1], ["inform_photo", "ask_summary"])
+    
+    def test_replay_through_cli_router(self):
+        """Test concurrent replay stores every journey and reports each turn type"""
+        journeys = build_journeys(4, 1, 2, appointment_rate=0.0)
+        target = CliTarget(self.test_file)
+        report = replay(journeys, target, concurrency=2)
+        target.close()
+        self.assertEqual(report["skipped"], {})
+        self.assertEqual(report["latency_ms"]["inform_name"]["count"], 4)
+        growth = report["storage_growth"]
+        self.assertEqual(growth[-1]["patients"], 4)
+        self.assertGreater(growth[-1]["bytes"], growth[0]["bytes"])
+    
+    def test_cli_router_capitalized_name_and_photo(self):
+        """Test 'Nama saya' with a capital N and 'foto gejala' are routed correctly"""
+        clinic = CareLoopAIClinic(PatientDataManager(self.test_file))
+        self.assertIn("Budi Santoso", process_user_input(clinic, "Nama saya Budi Santoso"))
+        self.assertIn("Temuan", process_user_input(clinic, "foto gejala"))
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        metrics.reset()
+        metrics.enable()
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        metrics.disable()
+        metrics.reset()
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_operations_and_storage_bytes(self):
+        """Test instrumented calls are counted and saves report the bytes written"""
+        clinic = CareLoopAIClinic(PatientDataManager(self.test_file))
+        clinic.register_patient("Budi Santoso")
+        clinic.report_symptoms(["demam"], "kepala", "sedang")
+        
+        self.assertEqual(metrics.operation_duration.count(("clinic", "report_symptoms")), 1)
+        self.assertEqual(metrics.operation_duration.count(("patient_data", "add_symptom_report")), 1)
+        self.assertGreater(metrics.storage_bytes_written.get(), os.path.getsize(self.test_file))
+        
+        text = metrics.render()
+        self.assertIn('careloop_operation_duration_seconds_count{component="clinic",method="report_symptoms"} 1', text)
+        self.assertIn('le="+Inf"', text)
+    
+    def test_disable_restores_methods(self):
+        """Test a disabled process runs the original, unwrapped methods"""
+        self.assertTrue(hasattr(PatientDataManager.save_data, "__wrapped__"))
+        metrics.disable()
+        self.assertFalse(hasattr(PatientDataManager.save_data, "__wrapped__"))
+        PatientDataManager(self.test_file).register_patient("Budi Santoso")
+        self.assertEqual(metrics.operation_duration.count(("patient_data", "register_patient")), 0)
+    
+    def test_server_endpoint(self):
+        """Test the clinic server exposes the Prometheus text format"""
+        manager = PatientDataManager(self.test_file)
+        manager.register_patient("Budi Santoso")
+        server = create_server("127.0.0.1", 0, manager)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+                body = response.read().decode("utf-8")
+            self.assertIn("# TYPE careloop_storage_bytes_written_total counter", body)
+            self.assertIn('method="register_patient"', body)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.profile_dir = "test_profiles"
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+        if os.path.exists(self.profile_dir):
+            shutil.rmtree(self.profile_dir)
+    
+    def test_session_writes_collapsed_stacks_and_allocators(self):
+        """Test a profiling session writes flame graph stacks and the top allocators"""
+        with profiling.ProfileSession("test", self.profile_dir, interval=0.001) as session:
+            manager = PatientDataManager(self.test_file)
+            for i in range(30):
+                manager.register_patient(f"Pasien {i}")
+        
+        with open(os.path.join(session.report_dir, "cpu.collapsed")) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertTrue(any("register_patient (patient_data_manager.py:" in line for line in lines))
+        
+        with open(os.path.join(session.report_dir, "summary.txt")) as f:
+            summary = f.read()
+        self.assertIn("Fungsi teratas", summary)
+        self.assertIn("Alokasi teratas", summary)
+        self.assertIn("KiB", summary)
+    
+    def test_input_wait_is_idle(self):
+        """Test time blocked in input() is not counted as CPU samples"""
+        sampler = profiling.StackSampler(0.001)
+        sampler.waiting_for_input.add(threading.get_ident())
+        sampler.start()
+        threading.Event().wait(0.05)
+        sampler.stop()
+        self.assertGreater(sampler.idle_samples, 0)
+        self.assertEqual(sum(sampler.stacks.values()), 0)
+    
+    def test_switch(self):
+        """Test profiling is off unless the flag or the environment asks for it"""
+        self.assertFalse(profiling.profiling_requested(["demo.py"]))
+        self.assertTrue(profiling.profiling_requested(["demo.py", "--profile"]))
+        
+        calls = []
+        entry = profiling.profiled("test")(lambda: calls.append(1) or "selesai")
+        self.assertEqual(entry(), "selesai")
+        self.assertEqual(calls, [1])
+        self.assertFalse(os.path.exists(self.profile_dir))
+
+class TestFileSync(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_dir = "test_file_sync"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.test_file = os.path.join(self.test_dir, "patients.json")
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        shutil.rmtree(self.test_dir)
+    
+    def test_merge_history(self):
+        """Test appended entries of both sides are kept and removed entries stay removed"""
+        base = [{"date": "2026-01-01"}, {"date": "2026-01-02"}]
+        ours = [{"date": "2026-01-02"}, {"date": "2026-01-05"}]
+        theirs = base + [{"date": "2026-01-04"}]
+        merged = merge_history(base, ours, theirs)
+        self.assertEqual([entry["date"] for entry in merged], ["2026-01-02", "2026-01-04", "2026-01-05"])
+    
+    def test_two_managers_keep_both_updates(self):
+        """Test a stale manager merges instead of overwriting another's save"""
+        first = PatientDataManager(self.test_file)
+        patient_id = first.register_patient("Budi Santoso", "08123456789")
+        second = PatientDataManager(self.test_file)
+        
+        first.add_daily_checkin(patient_id, ["batuk", "membaik"], "dada", "ringan")
+        second.add_symptom_report(patient_id, ["demam"], "kepala", "sedang")
+        second.add_daily_checkin(patient_id, ["batuk", "stabil"], "dada", "sedang")
+        other_id = first.register_patient("Siti Aminah")
+        
+        record = PatientDataManager(self.test_file).patients[patient_id]
+        self.assertEqual([e["symptoms"][1] for e in record["checkin_history"]], ["membaik", "stabil"])
+        self.assertEqual(len(record["symptoms_history"]), 1)
+        
+        self.assertTrue(second.refresh())
+        self.assertIn(other_id, second.patients)
+        self.assertFalse(second.refresh())
+    
+    def test_concurrent_processes_lose_nothing(self):
+        """Test many writer processes on one file lose no check-in"""
+        report = run_stress(self.test_file, processes=4, ops=5, shared=2)
+        self.assertEqual(report["failed_processes"], 0)
+        self.assertEqual(report["patients"], report["expected_patients"])
+        self.assertEqual(report["lost_own_checkins"], 0)
+        self.assertEqual(report["lost_shared_checkins"], 0)
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.pdm = PatientDataManager(self.test_file)
+        self.pdm.patients = {}
+        self.patient_id = self.pdm.register_patient("Budi Santoso", "08123456789")
+        self.pdm.add_symptom_report(self.patient_id, ["demam"], "kepala", "sedang")
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_snapshot_is_point_in_time(self):
+        """Test writes after a snapshot are invisible to it and keep only changed records"""
+        snapshot = self.pdm.snapshot()
+        self.pdm.add_daily_checkin(self.patient_id, ["batuk", "membaik"], "dada", "ringan")
+        self.pdm.schedule_appointment(self.patient_id, reason="Kontrol")
+        other_id = self.pdm.register_patient("Siti Aminah")
+        
+        self.assertEqual(list(snapshot), [self.patient_id])
+        self.assertNotIn(other_id, snapshot)
+        self.assertEqual(snapshot[self.patient_id]["checkin_history"], [])
+        self.assertEqual(snapshot[self.patient_id]["appointments"], [])
+        self.assertEqual(len(self.pdm.patients[self.patient_id]["checkin_history"]), 1)
+        self.assertEqual(snapshot.preserved_count, 2)
+        
+        snapshot.release()
+        self.assertEqual(self.pdm._snapshots.open_count, 0)
+    
+    def test_cancel_does_not_change_snapshot(self):
+        """Test appointment changes copy the appointment instead of editing it"""
+        self.pdm.schedule_appointment(self.patient_id, reason="Kontrol")
+        appointment_id = self.pdm.patients[self.patient_id]["appointments"][0]["appointment_id"]
+        with self.pdm.snapshot() as snapshot:
+            self.pdm.cancel_appointment(self.patient_id, appointment_id)
+            self.assertEqual(snapshot[self.patient_id]["appointments"][0]["status"], "scheduled")
+        self.assertEqual(self.pdm.patients[self.patient_id]["appointments"][0]["status"], "cancelled")
+    
+    def test_concurrent_reader_sees_consistent_totals(self):
+        """Test a reader thread never sees a report change within one snapshot"""
+        torn = []
+        stop = threading.Event()
+        
+        def reader():
+            while not stop.is_set():
+                with self.pdm.snapshot() as patients:
+                    first = sum(len(r["checkin_history"]) for r in patients.values())
+                    second = sum(len(r["checkin_history"]) for r in patients.values())
+                    if first != second:
+                        torn.append((first, second))
+        
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for _ in range(200):
+            record = self.pdm._edit(self.patient_id, "checkin_history")
+            record["checkin_history"].append({"date": "2026-01-01T00:00:00", "symptoms": []})
+            self.pdm._touch(self.patient_id, record)
+        stop.set()
+        thread.join()
+        self.assertEqual(torn, [])
+
+class TestConcurrentWrites(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.pdm = PatientDataManager(self.test_file, flush_interval=0.05)
+        self.pdm.patients = {}
+        self.patient_ids = [self.pdm.register_patient(f"Pasien {i}") for i in range(4)]
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        self.pdm.close()
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def run_threads(self, target, count=8):
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    def test_threads_lose_no_updates(self):
+        """Test checkins and registrations from many threads all reach the file"""
+        def work(number):
+            for i in range(25):
+                self.pdm.add_daily_checkin(self.patient_ids[i % 4], ["batuk"], "dada", "ringan")
+            self.pdm.register_patient(f"Pasien Baru {number}")
+        
+        self.run_threads(work)
+        self.pdm.close()
+        reloaded = PatientDataManager(self.test_file)
+        self.assertEqual(len(reloaded.patients), 12)
+        self.assertEqual(sum(len(reloaded.patients[pid]["checkin_history"]) for pid in self.patient_ids), 200)
+        self.assertEqual(reloaded.patients[self.patient_ids[0]]["version"], 57)
+    
+    def test_flusher_batches_saves(self):
+        """Test changes are saved by the flusher rather than by each mutation"""
+        saves = []
+        save_data = self.pdm.save_data
+        self.pdm.save_data = lambda: (saves.append(1), save_data())
+        for _ in range(20):
+            self.pdm.add_daily_checkin(self.patient_ids[0], ["batuk"], "dada", "ringan")
+        self.pdm.flush()
+        self.assertLess(len(saves), 20)
+        with open(self.test_file) as f:
+            saved = json.load(f)["patients"][self.patient_ids[0]]
+        self.assertEqual(len(saved["checkin_history"]), 20)
+    
+    def test_concurrent_booking_never_double_books(self):
+        """Test threads booking the earliest slot each get a different one"""
+        self.pdm.scheduler_options = {"doctors": ["dr. Andi"], "rooms": ["Ruang 1"]}
+        self.pdm.patients = self.pdm.patients
+        self.run_threads(lambda number: self.pdm.schedule_appointment(self.patient_ids[number % 4]))
+        slots = [a["date_time"] for record in self.pdm.patients.values() for a in record["appointments"]]
+        self.assertEqual(len(slots), 8)
+        self.assertEqual(len(set(slots)), 8)
+
+class TestTrackerStore(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_trackers.db"
+        self.archive_dir = "test_tracker_archive"
+        self.log = TrackerEventLog(self.test_file, tail_turns=2)
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        self.log.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.test_file + suffix):
+                os.remove(self.test_file + suffix)
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+    
+    def add_turns(self, count, start=0, timestamp=1000.0):
+        events = []
+        for i in range(start, start + count):
+            events += [
+                {"event": "action", "name": "action_listen", "timestamp": timestamp + i},
+                {"event": "user", "text": f"checkin {i}", "timestamp": timestamp + i},
+                {"event": "slot", "name": "last_checkin", "value": f"hari {i}", "timestamp": timestamp + i},
+            ]
+        self.log.append("pasien", events)
+    
+    def test_tail_loads_last_turns_with_slots(self):
+        """Test the tail holds the last turns, preceded by the slot values at its start"""
+        self.log.append("pasien", [{"event": "slot", "name": "patient_name", "value": "Budi", "timestamp": 1.0}])
+        self.add_turns(5)
+        events, stored = self.log.tail("pasien")
+        self.assertEqual(stored, 6)
+        self.assertEqual([e["text"] for e in events if e["event"] == "user"], ["checkin 3", "checkin 4"])
+        carried = {e["name"]: e["value"] for e in events if e.get("metadata", {}).get(CARRIED_SLOTS)}
+        self.assertEqual(carried, {"patient_name": "Budi", "last_checkin": "hari 2"})
+        self.assertEqual(self.log.stored_in_tail("pasien"), 6)
+    
+    def test_tail_starts_at_session_and_restart_clears_slots(self):
+        """Test a newer session start limits the tail and a restart drops earlier slots"""
+        self.add_turns(3)
+        self.log.append("pasien", [{"event": "restart", "timestamp": 2000.0},
+                                   {"event": "action", "name": "action_session_start", "timestamp": 2000.0},
+                                   {"event": "session_started", "timestamp": 2000.0}])
+        self.add_turns(1, start=3, timestamp=2000.0)
+        events, stored = self.log.tail("pasien")
+        self.assertEqual(stored, 5)
+        self.assertEqual(events[0], {"event": "action", "name": "action_session_start", "timestamp": 2000.0})
+    
+    def test_prune_archives_old_events_and_keeps_slots(self):
+        """Test pruning moves events before the tail to the archive without changing the tail"""
+        self.log.append("pasien", [{"event": "slot", "name": "patient_name", "value": "Budi", "timestamp": 1.0}])
+        self.add_turns(5)
+        before = self.log.tail("pasien")
+        stats = self.log.prune(retention_days=1, archive_dir=self.archive_dir, now=1000.0 + 2 * 86400)
+        self.assertEqual(stats, {"conversations": 1, "events": 10})
+        self.assertEqual(self.log.count("pasien"), 6)
+        self.assertEqual(self.log.tail("pasien"), before)
+        archived = [os.path.join(self.archive_dir, name) for name in os.listdir(self.archive_dir)]
+        with gzip.open(archived[0], "rt") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(lines[0]["event"]["value"], "Budi")
+
+class TestDialogueMachine(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.machine = default_machine()
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_machine_matches_stories_and_rules(self):
+        """Test every story and rule in the training data runs as written"""
+        stories, rules = load_stories()
+        self.assertEqual(check_stories(self.machine, stories, rules), [])
+        turn = self.machine.step(START, "greet")
+        self.assertEqual(self.machine.step(turn.next_state, "mood_unhappy").actions,
+                         ("utter_cheer_up", "utter_did_that_help"))
+    
+    def test_conflicting_stories_are_rejected(self):
+        """Test stories that do different things after the same intents do not compile"""
+        stories = [
+            {"story": "a", "steps": [{"intent": "greet"}, {"action": "utter_greet"}]},
+            {"story": "b", "steps": [{"intent": "greet"}, {"action": "utter_happy"}]},
+        ]
+        with self.assertRaises(DialogueCompileError):
+            DialogueMachine.compile(stories, [])
+    
+    def test_front_ends_follow_sad_path(self):
+        """Test the CLI and the simulator both answer the sad path story with its responses"""
+        responses = self.machine.responses
+        clinic = CareLoopAIClinic(PatientDataManager(self.test_file))
+        bot = ClinicChatbotSimulator()
+        for text, expected in [("halo", ["utter_greet"]),
+                               ("sedih", ["utter_cheer_up", "utter_did_that_help"]),
+                               ("tidak", ["utter_goodbye"])]:
+            reply = "\n\n".join(responses[name] for name in expected)
+            self.assertEqual(process_user_input(clinic, text), reply)
+            self.assertEqual(bot.respond(text), reply)
+        self.assertEqual(clinic.dialogue_state, START)
+        self.assertEqual(bot.dialogue_state, START)
+
+class TestReminders(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.outbox = "test_reminder_outbox"
+        self.state_file = os.path.join(self.outbox, "state.json")
+        # Simulated time, so backoff and rate limits do not slow the tests down
+        self.now = [0.0]
+        self.clock = lambda: self.now[0]
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+        shutil.rmtree(self.outbox, ignore_errors=True)
+    
+    def sleep(self, seconds):
+        self.now[0] += seconds
+    
+    def pipeline(self, channel, **options):
+        return DeliveryPipeline([channel], self.state_file, clock=self.clock, sleep=self.sleep, seed=1,
+                                **options)
+    
+    def reminders(self, count, channel="sms"):
+        return [Reminder(f"2026-10-19:P{number}", f"P{number}", channel, f"08{number:09d}", "Halo")
+                for number in range(count)]
+    
+    def test_token_bucket_limits_rate(self):
+        """Test batches are held back to the channel's rate after the first burst"""
+        bucket = TokenBucket(10, clock=self.clock)
+        self.assertEqual(bucket.take(25), 10)
+        self.assertEqual(bucket.take(1), 0)
+        self.sleep(0.5)
+        self.assertEqual(bucket.take(25), 5)
+        
+        sink = FileSink(self.outbox, "sms", batch_size=20, rate_per_second=10)
+        pipeline = self.pipeline(sink)
+        pipeline.enqueue(self.reminders(100))
+        self.assertEqual(pipeline.run()["sent"], 100)
+        self.assertGreaterEqual(self.now[0], 9.0)
+        with open(sink.path) as f:
+            self.assertEqual(len(f.readlines()), 100)
+    
+    def test_retries_and_dead_letters(self):
+        """Test transient failures are retried and rejected addresses are dead-lettered"""
+        sink = FileSink(self.outbox, "sms", batch_size=50, rate_per_second=1000, failure_rate=0.3,
+                        reject=["08000000007"])
+        pipeline = self.pipeline(sink, max_attempts=10, base_backoff=5)
+        pipeline.enqueue(self.reminders(200))
+        counts = pipeline.run()
+        self.assertEqual(counts["sent"], 199)
+        self.assertEqual(counts["dead"], 1)
+        self.assertGreater(pipeline.batches["sms"], 4)
+        
+        state = pipeline.delivery_state("P7")[0]
+        self.assertEqual((state["state"], state["attempts"]), ("dead", 1))
+        with open(pipeline.dead_letter_file) as f:
+            self.assertEqual(json.loads(f.readline())["patient_id"], "P7")
+        self.assertTrue(any(entry["attempts"] > 1 for entry in pipeline.state.values()
+                            if entry["state"] == "sent"))
+    
+    def test_daily_reminders_are_sent_once(self):
+        """Test patients get one reminder per day on their channel, even if the job runs again"""
+        manager = PatientDataManager(self.test_file)
+        budi = manager.register_patient("Budi", "08123456789")
+        siti = manager.register_patient("Siti", email="siti@example.com")
+        manager.register_patient("Andi")
+        for patient_id in (budi, siti):
+            manager.add_symptom_report(patient_id, ["demam"], "kepala", "sedang")
+            manager.add_treatment_plan(patient_id, "Istirahat", ["demam"])
+        reminders = daily_reminders(manager)
+        self.assertEqual(sorted(r.channel for r in reminders), ["email", "sms"])
+        
+        channels = [FileSink(self.outbox, name, rate_per_second=100) for name in ("sms", "email")]
+        pipeline = DeliveryPipeline(channels, self.state_file, clock=self.clock, sleep=self.sleep)
+        self.assertEqual(pipeline.enqueue(reminders), 2)
+        self.assertEqual(pipeline.run()["sent"], 2)
+        
+        again = DeliveryPipeline(channels, self.state_file, clock=self.clock, sleep=self.sleep)
+        self.assertEqual(again.enqueue(daily_reminders(manager)), 0)
+        self.assertEqual(again.delivery_state(budi)[0]["state"], "sent")
+    
+    def test_no_reminders_after_episode_ended(self):
+        """Test patients whose last report is older than EPISODE_GAP get no reminder"""
+        manager = PatientDataManager(self.test_file)
+        budi = manager.register_patient("Budi", "08123456789")
+        manager.add_symptom_report(budi, ["demam"], "kepala", "sedang")
+        manager.add_treatment_plan(budi, "Istirahat", ["demam"])
+        today = datetime.date.today()
+        self.assertEqual(len(daily_reminders(manager, today + datetime.timedelta(days=14))), 1)
+        self.assertEqual(daily_reminders(manager, today + datetime.timedelta(days=15)), [])
+        
+        manager.add_treatment_plan(manager.register_patient("Siti", "08129876543"), "Istirahat", [])
+        self.assertEqual([r.patient_id for r in daily_reminders(manager)], [budi])
+    
+    def test_reminder_queued_twice_is_sent_once(self):
+        """Test a reminder queued again before the run, or again in one call, goes out once"""
+        sink = FileSink(self.outbox, "sms", rate_per_second=1000)
+        pipeline = self.pipeline(sink)
+        self.assertEqual(pipeline.enqueue(self.reminders(2)), 2)
+        self.assertEqual(pipeline.enqueue(self.reminders(3) + self.reminders(3)), 1)
+        self.assertEqual(pipeline.run()["sent"], 3)
+        with open(sink.path) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        
+        # A reminder left queued by a run that stopped is queued by the next pipeline
+        pipeline.state["2026-10-19:P3"] = dict(pipeline.state["2026-10-19:P0"], patient_id="P3", state="queued")
+        pipeline._save_state()
+        self.assertEqual(self.pipeline(sink).enqueue(self.reminders(4)), 1)
+    
+    def test_old_delivery_state_is_pruned(self):
+        """Test delivery state older than state_days is dropped when reminders are queued"""
+        sink = FileSink(self.outbox, "sms", rate_per_second=1000)
+        pipeline = self.pipeline(sink)
+        pipeline.enqueue(self.reminders(3))
+        pipeline.run()
+        old = (datetime.datetime.now() - datetime.timedelta(days=8)).isoformat()
+        for reminder_id in ("2026-10-19:P0", "2026-10-19:P1"):
+            pipeline.state[reminder_id]["updated"] = old
+        pipeline._save_state()
+        
+        again = self.pipeline(sink)
+        self.assertEqual(again.enqueue([]), 0)
+        self.assertEqual(sorted(again.state), ["2026-10-19:P2"])
+        with open(self.state_file) as f:
+            self.assertEqual(list(json.load(f)), ["2026-10-19:P2"])
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.manager = PatientDataManager(self.test_file)
+        self.budi = self.manager.register_patient("Budi", "08123456789")
+        self.siti = self.manager.register_patient("Siti", "08129876543")
+        self.manager.add_symptom_report(self.budi, ["diare", "mual"], "perut", "sedang")
+        self.manager.generate_treatment_plan(self.budi, ["diare"], "perut", "sedang")
+        self.manager.add_symptom_report(self.siti, ["demam", "sakit kepala"], "kepala", "berat")
+        self.manager.generate_treatment_plan(self.siti, ["demam"], "kepala", "berat")
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        for path in (self.test_file, search_index_file(self.test_file)):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def test_boolean_and_phrase_queries(self):
+        """Test field, boolean, phrase and stemmed queries against the patients' history"""
+        search = self.manager.search
+        self.assertEqual(search("rencana:paracetamol"), [self.siti])
+        self.assertEqual(search("gejala:diare rencana:pedas"), [self.budi])
+        self.assertEqual(search("gejala:diare AND rencana:paracetamol"), [])
+        self.assertEqual(search("diare ATAU demam"), sorted([self.budi, self.siti]))
+        self.assertEqual(search("rencana:aktivitas -gejala:berat"), [self.budi])
+        self.assertEqual(search('gejala:"sakit kepala"'), [self.siti])
+        self.assertEqual(search('gejala:"kepala sakit"'), [])
+        # Separate symptoms never form a phrase
+        self.assertEqual(search('"diare mual"'), [])
+        # Stems: "makanan pedas" in the plan, "memburuk" in the plan's general advice
+        self.assertEqual(search("rencana:pedasnya rencana:buruk"), [self.budi])
+        with self.assertRaises(SearchQueryError):
+            search("(diare")
+    
+    def test_date_ranges(self):
+        """Test @ranges and since/until bound the dates of matching entries"""
+        now = datetime.datetime(2026, 10, 19, 9, 0)
+        patients = {
+            "P1": {"symptoms_history": [{"date": "2026-10-18T08:00:00", "symptoms": ["diare"]}],
+                   "treatment_plans": [{"date": "2026-09-01T08:00:00", "plan": "Minum paracetamol"}]},
+            "P2": {"symptoms_history": [{"date": "2026-10-01T08:00:00", "symptoms": ["diare"]}],
+                   "treatment_plans": [{"date": "2026-10-01T08:00:00", "plan": "Minum paracetamol"}]},
+        }
+        index = SearchIndex.build(patients)
+        self.assertEqual(index.search("rencana:paracetamol gejala:diare@3d", now=now), ["P1"])
+        self.assertEqual(index.search("gejala:diare@2026-10-01", now=now), ["P2"])
+        self.assertEqual(index.search("gejala:diare@..2026-09-30", now=now), [])
+        self.assertEqual(index.search("diare", since=datetime.datetime(2026, 10, 10), now=now), ["P1"])
+    
+    def test_mutations_update_index_and_checkpoint(self):
+        """Test mutations index only their new entries and a checkpoint is reused on startup"""
+        self.assertEqual(self.manager.search("checkin:memburuk"), [])
+        documents = len(self.manager._search.docs)
+        self.manager.add_daily_checkin(self.budi, ["diare", "memburuk"], "perut", "berat")
+        self.assertEqual(len(self.manager._search.docs), documents + 1)
+        self.assertEqual(self.manager.search("checkin:memburuk"), [self.budi])
+        
+        self.manager._search.save(search_index_file(self.test_file))
+        self.manager.add_daily_checkin(self.siti, ["demam", "membaik"], "kepala", "ringan")
+        reloaded = PatientDataManager(self.test_file)
+        self.assertEqual(reloaded.search("checkin:baik"), [self.siti])
+        checkpoint = SearchIndex.load(search_index_file(self.test_file))
+        self.assertEqual(checkpoint.sync(reloaded.patients), 1)
+
+class TestTriage(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.manager = PatientDataManager(self.test_file)
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_indexed_heap_matches_sorting(self):
+        """Test changed, removed and added keys keep the heap's top k in priority order"""
+        import random
+        rng = random.Random(3)
+        heap = IndexedHeap()
+        expected = {}
+        heap.fill({f"P{i}": float(rng.randrange(100)) for i in range(50)})
+        expected.update({f"P{i}": heap.priority(f"P{i}") for i in range(50)})
+        for _ in range(500):
+            key = f"P{rng.randrange(80)}"
+            if rng.random() < 0.2:
+                heap.remove(key)
+                expected.pop(key, None)
+            else:
+                priority = float(rng.randrange(100))
+                heap.set(key, priority)
+                expected[key] = priority
+        ranked = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+        self.assertEqual(len(heap), len(expected))
+        self.assertEqual(heap.top(10), ranked[:10])
+        self.assertEqual(heap.top(len(expected) + 5), ranked)
+    
+    def test_worsening_patients_rank_first(self):
+        """Test reports and check-ins move patients in the triage ranking"""
+        budi = self.manager.register_patient("Budi")
+        siti = self.manager.register_patient("Siti")
+        self.manager.add_symptom_report(budi, ["demam"], "kepala", "sedang")
+        self.manager.add_symptom_report(siti, ["batuk"], "dada", "ringan")
+        self.manager.add_daily_checkin(budi, ["demam", "memburuk"], "kepala", "berat")
+        
+        top = self.manager.get_triage(2)
+        self.assertEqual([entry["patient_id"] for entry in top], [budi, siti])
+        self.assertEqual(top[0]["name"], "Budi")
+        self.assertIn("Gejala terakhir berat", top[0]["reasons"])
+        
+        self.manager.add_daily_checkin(budi, ["demam", "membaik"], "kepala", "ringan")
+        self.manager.add_daily_checkin(siti, ["batuk", "memburuk"], "dada", "sedang")
+        self.assertEqual([entry["patient_id"] for entry in self.manager.get_triage(2)], [siti, budi])
+    
+    def test_missed_checkins_raise_score_until_episode_ends(self):
+        """Test missed check-ins raise a patient's score over time, and old episodes leave the queue"""
+        start = datetime.datetime(2026, 10, 1, 8, 0)
+        engine = FollowupEngine()
+        engine.record_checkin("P1", ["demam"], "sedang", start)
+        engine.record_checkin("P2", ["demam"], "sedang", start + datetime.timedelta(days=2))
+        queue = TriageQueue.from_engine(engine, now=start + datetime.timedelta(days=2))
+        self.assertEqual(queue.score("P1", start + datetime.timedelta(days=2)), 20)
+        self.assertEqual(queue.score("P2", start + datetime.timedelta(days=2)), 10)
+        
+        later = start + datetime.timedelta(days=2, hours=7)
+        self.assertEqual(queue.score("P1", later), 30)
+        self.assertEqual([entry["patient_id"] for entry in queue.top(2, later)], ["P1", "P2"])
+        self.assertEqual(queue.top(1, later)[0]["reasons"], ["Tidak checkin 2 hari"])
+        
+        engine.record_checkin("P1", ["demam", "membaik"], "ringan", later)
+        queue.update("P1", later)
+        self.assertEqual(queue.score("P1", later), 0)
+        self.assertIsNone(queue.score("P2", start + datetime.timedelta(days=16, hours=2)))
+        self.assertEqual(len(queue), 1)
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.manager = PatientDataManager(self.test_file)
+        self.clinic = CareLoopAIClinic(self.manager)
+        self.clinic.register_patient("Budi Santoso")
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        metrics.disable()
+        metrics.reset()
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_opening_sent_before_saving(self):
+        """Test the first section comes before the report is saved and the sections make up the buffered reply"""
+        metrics.enable()
+        sections = self.clinic.stream_report_symptoms(["demam", "batuk"], "kepala", "sedang")
+        first = next(sections)
+        self.assertEqual(self.manager.patients[self.clinic.current_patient_id]["symptoms_history"], [])
+        streamed = first + "".join(sections)
+        # Streams are timed until their last section
+        self.assertEqual(metrics.operation_duration.count(("clinic", "stream_report_symptoms")), 1)
+        self.assertEqual(metrics.operation_duration.count(("patient_data", "add_symptom_report")), 1)
+        
+        plan = self.manager.get_latest_treatment_plan(self.clinic.current_patient_id)
+        self.assertEqual(streamed, "Berdasarkan gejala yang Anda alami, berikut rencana pengobatan:\n\n"
+                         f"{plan}\n\nSaya akan mengirimkan update rencana pengobatan setiap hari berdasarkan laporan Anda.")
+        self.assertEqual("".join(self.clinic.stream_patient_summary()), self.clinic.get_patient_summary())
+        self.assertEqual("".join(self.clinic.stream_treatment_plan()), self.clinic.get_treatment_plan())
+    
+    def test_streamed_conversation_matches_buffered(self):
+        """Test the streaming router answers every turn like the buffered one"""
+        other = CareLoopAIClinic(PatientDataManager("test_streaming_data.json"))
+        try:
+            for text in ["halo", "Nama saya Budi Santoso", "laporkan gejala demam, batuk",
+                         "checkin harian batuk membaik", "rencana pengobatan", "ringkasan", "apa ini"]:
+                sections = list(stream_user_input(self.clinic, text))
+                self.assertTrue(all(sections))
+                self.assertEqual("".join(sections), process_user_input(other, text))
+        finally:
+            os.remove("test_streaming_data.json")
+    
+    def test_http_stream(self):
+        """Test POST /chat/stream sends the reply as events and keeps the session for POST /chat"""
+        server = create_server(port=0, patient_manager=self.manager)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        def post(path, payload):
+            request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}",
+                                             json.dumps(payload).encode("utf-8"),
+                                             {"Content-Type": "application/json"})
+            return urllib.request.urlopen(request)
+        
+        try:
+            session = json.loads(post("/chat", {"message": "Nama saya Siti Aminah"}).read())["session"]
+            with post("/chat/stream", {"session": session, "message": "laporkan gejala demam"}) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/event-stream"))
+                events = [block.split("\n") for block in response.read().decode("utf-8").strip().split("\n\n")]
+            chunks = [json.loads(data[len("data: "):]) for event, data in events if event == "event: chunk"]
+            self.assertGreater(len(chunks), 1)
+            self.assertTrue(chunks[0].startswith("Berdasarkan gejala"))
+            self.assertIn("Rencana pengobatan untuk Siti Aminah", "".join(chunks))
+            self.assertEqual(events[-1], ["event: done", f'data: {{"session": "{session}"}}'])
+            
+            reply = json.loads(post("/chat", {"session": session, "message": "rencana pengobatan"}).read())
+            self.assertIn("Rencana pengobatan untuk Siti Aminah", reply["reply"])
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                post("/chat/stream", {"session": session, "message": " "})
+            self.assertEqual(context.exception.code, 400)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.directory = "test_shards"
+        os.makedirs(self.directory, exist_ok=True)
+        key = new_cluster_key()
+        self.nodes = {f"node{number}": NodeProcess(os.path.join(self.directory, f"node{number}.json"), key)
+                      for number in range(4)}
+        self.store = ShardedPatientStore({name: self.nodes[name].address for name in ("node0", "node1", "node2")}, key)
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        self.store.close()
+        for node in self.nodes.values():
+            node.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def test_ring_moves_only_new_owners_keys(self):
+        """Test adding a node moves only the keys it now owns, about 1/N of them"""
+        keys = [f"P{number:012x}" for number in range(4000)]
+        ring = HashRing(["node0", "node1", "node2"])
+        before = {key: ring.node_for(key) for key in keys}
+        grown = ring.copy()
+        grown.add("node3")
+        moved = [key for key in keys if grown.node_for(key) != before[key]]
+        self.assertTrue(all(grown.node_for(key) == "node3" for key in moved))
+        self.assertTrue(600 < len(moved) < 1400)
+        grown.remove("node3")
+        self.assertEqual({key: grown.node_for(key) for key in keys}, before)
+    
+    def test_routing_and_scatter_gather(self):
+        """Test patients live on their ring node and cross-patient queries span every node"""
+        ids = [self.store.register_patient(f"Pasien {number}", f"0812{number:06d}") for number in range(30)]
+        twins = [self.store.register_patient("Budi Santoso") for _ in range(2)]
+        self.store.add_symptom_report(ids[0], ["demam"], "kepala", "berat")
+        self.store.add_symptom_report("Pasien 1", ["demam", "batuk"], "dada", "sedang")
+        
+        counts = self.store.patient_counts()
+        self.assertEqual(sum(counts.values()), 32)
+        self.assertEqual(len(counts), 3)
+        held = {name: set(client.request("patient_ids")) for name, client in self.store.clients.items()}
+        for patient_id in ids:
+            self.assertIn(patient_id, held[self.store.ring.node_for(patient_id)])
+        
+        self.assertEqual(self.store.resolve_patient("Pasien 7"), ids[7])
+        self.assertEqual(self.store.find_by_name("Budi Santoso"), sorted(twins))
+        with self.assertRaises(AmbiguousPatientError):
+            self.store.get_patient_data("Budi Santoso")
+        with self.assertRaises(DuplicatePatientError):
+            self.store.register_patient("Siti", "0812000003")
+        self.assertEqual(self.store.search("gejala:demam"), sorted(ids[:2]))
+        self.assertEqual(self.store.get_triage(1)[0]["patient_id"], ids[0])
+        score = lambda: next(entry["score"] for entry in self.store.get_triage(10) if entry["patient_id"] == ids[1])
+        self.store.record_photo(ids[1], "ringan")
+        before = score()
+        self.store.record_photo(ids[1], "berat")
+        self.assertGreater(score(), before)
+        self.assertIn("Rencana pengobatan untuk Pasien 1",
+                      self.store.generate_treatment_plan(ids[1], ["demam"], "dada", "sedang"))
+        
+        # Nodes only answer clients with the cluster's random key
+        with self.assertRaises(multiprocessing.AuthenticationError):
+            NodeClient(self.nodes["node0"].address, b"careloop-local-node").request("ping")
+    
+    def test_online_rebalance_keeps_writes(self):
+        """Test adding and removing nodes while checking in moves patients without losing a write"""
+        ids = [self.store.register_patient(f"Pasien {number}") for number in range(120)]
+        written = []
+        stop = threading.Event()
+        
+        def writer():
+            number = 0
+            while not stop.is_set():
+                patient_id = ids[number % len(ids)]
+                self.store.add_daily_checkin(patient_id, ["batuk", "membaik"], "dada", "ringan")
+                written.append(patient_id)
+                number += 1
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            self.store.move_batch = 10
+            self.assertGreater(self.store.add_node("node3", self.nodes["node3"].address), 0)
+            self.assertGreater(self.store.remove_node("node0"), 0)
+        finally:
+            stop.set()
+            thread.join()
+        
+        self.assertEqual(set(self.store.patient_counts()), {"node1", "node2", "node3"})
+        self.assertEqual(sum(self.store.patient_counts().values()), 120)
+        for patient_id in ids:
+            self.assertEqual(len(self.store.get_patient_data(patient_id)["checkin_history"]),
+                             written.count(patient_id))
+
+    def test_registration_during_rebalance(self):
+        """Test patients registered while a node is added are moved with the rest and stay reachable"""
+        grown = self.store.ring.copy()
+        grown.add("node3")
+        # A key whose patient ID moves to the new node
+        key = next(key for key in (f"pendaftaran-{number}" for number in range(10000))
+                   if grown.node_for("P" + hashlib.md5(key.encode("utf-8")).hexdigest()[:12]) == "node3")
+        listed = {name: threading.Event() for name in self.store.clients}
+        registering = threading.Event()
+        
+        def hold(name, request):
+            def wrapper(operation, *args):
+                if operation == "patient_ids":
+                    listed[name].set()
+                elif operation == "call" and args[0] == "register_patient" and args[2].get("idempotency_key") == key:
+                    # Give the rebalance the chance to list this node before the registration lands
+                    registering.set()
+                    listed[name].wait(1)
+                return request(operation, *args)
+            return wrapper
+        
+        for name, client in self.store.clients.items():
+            client.request = hold(name, client.request)
+        
+        ids = []
+        
+        def register():
+            ids.append(self.store.register_patient("Budi Santoso", idempotency_key=key))
+            ids.extend(self.store.register_patient(f"Pasien {number}") for number in range(20))
+        
+        thread = threading.Thread(target=register)
+        thread.start()
+        try:
+            registering.wait(5)
+            self.store.move_batch = 5
+            self.store.add_node("node3", self.nodes["node3"].address)
+        finally:
+            thread.join()
+        
+        self.assertEqual(sum(self.store.patient_counts().values()), 21)
+        self.assertIn(ids[0], self.store.clients["node3"].request("patient_ids"))
+        for patient_id in ids:
+            self.assertEqual(self.store.get_patient_data(patient_id)["personal_info"]["patient_id"], patient_id)
+
+class TestIdempotency(unittest.TestCase):
+    def setUp(self):
+        """Set up test fixtures before each test method."""
+        self.test_file = "test_patient_data.json"
+        self.manager = PatientDataManager(self.test_file)
+        self.patient_id = self.manager.register_patient("Budi Santoso")
+        self.manager.generate_treatment_plan(self.patient_id, ["batuk"], "dada", "sedang")
+    
+    def tearDown(self):
+        """Clean up after each test method."""
+        if os.path.exists(self.test_file):
+            os.remove(self.test_file)
+    
+    def test_dedupe_index_is_bounded(self):
+        """Test the index drops the least recently used and expired keys, and rejects a reused key"""
+        index = DedupeIndex(max_entries=2, window=datetime.timedelta(hours=1))
+        start = datetime.datetime.now()
+        for number, key in enumerate(["a", "b", "c"]):
+            self.assertEqual(index.claim(key, "digest", start), (False, None))
+            index.complete(key, "digest", number, start)
+        self.assertNotIn("a", index)
+        self.assertEqual(index.claim("b", "digest", start), (True, 1))
+        with self.assertRaises(IdempotencyKeyReused):
+            index.claim("c", "other", start)
+        
+        # Expired keys are forgotten, and not saved
+        later = start + datetime.timedelta(hours=2)
+        self.assertEqual(index.to_dict(later), {"entries": []})
+        self.assertEqual(index.claim("b", "digest", later), (False, None))
+        index.release("b")
+        copy = DedupeIndex.from_dict(index.to_dict(start))
+        self.assertEqual(copy.claim("c", "digest", start), (True, 2))
+        
+        # Only the most recently used results that fit the budget are saved
+        small = DedupeIndex(saved_bytes=100)
+        for number in range(5):
+            small.claim(f"k{number}", "digest")
+            small.complete(f"k{number}", "digest", "x" * 40)
+        self.assertEqual([entry[0] for entry in small.to_dict()["entries"]], ["k3", "k4"])
+        self.assertEqual(len(small), 5)
+    
+    def test_repeated_write_changes_nothing(self):
+        """Test a retried check-in and plan revision are stored once and get the original result, after a reload too"""
+        for _ in range(2):
+            self.manager.add_daily_checkin(self.patient_id, ["batuk", "membaik"], "dada", "ringan",
+                                           idempotency_key="checkin-1")
+            plan = self.manager.revise_treatment_plan(self.patient_id, ["batuk", "membaik"], "dada", "ringan",
+                                                      idempotency_key="revise-1")
+        record = self.manager.get_patient_data(self.patient_id)
+        self.assertEqual(len(record["checkin_history"]), 1)
+        self.assertEqual(len(record["treatment_plans"]), 2)
+        self.assertEqual(plan.count("Update:"), 1)
+        
+        reloaded = PatientDataManager(self.test_file)
+        self.assertEqual(reloaded.revise_treatment_plan(self.patient_id, ["batuk", "membaik"], "dada", "ringan",
+                                                        idempotency_key="revise-1"), plan)
+        self.assertEqual(len(reloaded.get_patient_data(self.patient_id)["treatment_plans"]), 2)
+        with self.assertRaises(IdempotencyKeyReused):
+            reloaded.add_daily_checkin(self.patient_id, ["demam"], idempotency_key="checkin-1")
+        
+        # A call that failed can be retried with its key
+        with self.assertRaises(SchedulingError):
+            self.manager.schedule_appointment(self.patient_id, "2000-01-03 09:00", idempotency_key="visit-1")
+        self.assertIn("dijadwalkan", self.manager.schedule_appointment(self.patient_id, idempotency_key="visit-1"))
+    
+    def test_retried_chat_turn(self):
+        """Test a clinic turn and an HTTP chat turn sent again with their key are answered once, in one save"""
+        clinic = CareLoopAIClinic(self.manager)
+        clinic.register_patient("Budi Santoso")
+        saves = []
+        original_save = self.manager.save_data
+        self.manager.save_data = lambda: saves.append(1) or original_save()
+        reply = clinic.report_symptoms(["demam"], "kepala", idempotency_key="turn-1")
+        self.assertEqual(clinic.report_symptoms(["demam"], "kepala", idempotency_key="turn-1"), reply)
+        self.assertEqual(len(saves), 1)
+        self.assertEqual(len(self.manager.get_patient_data(self.patient_id)["symptoms_history"]), 1)
+        saves.clear()
+        streamed = self.manager.stream_idempotent("turn-2", "stream", [],
+                                                  lambda: clinic.stream_daily_checkin(["batuk"], "dada"))
+        self.assertIn("Terima kasih", "".join(streamed))
+        self.assertEqual(len(saves), 1)
+        
+        server = create_server(port=0, patient_manager=self.manager)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        def post(path, payload, key):
+            request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}",
+                                             json.dumps(payload).encode("utf-8"),
+                                             {"Content-Type": "application/json", "Idempotency-Key": key})
+            return urllib.request.urlopen(request).read()
+        
+        try:
+            first = json.loads(post("/chat", {"message": "Nama saya Siti Aminah"}, "web-1"))
+            # The retry of the turn that started the session gets that session
+            self.assertEqual(json.loads(post("/chat", {"message": "Nama saya Siti Aminah"}, "web-1")), first)
+            turn = {"session": first["session"], "message": "checkin harian batuk membaik"}
+            streamed = post("/chat/stream", turn, "web-2")
+            self.assertEqual(post("/chat/stream", turn, "web-2").count(b"event: chunk"), 1)
+            self.assertEqual(json.loads(post("/chat", turn, "web-2"))["reply"],
+                             "".join(json.loads(line[len(b"data: "):]) for line in streamed.split(b"\n")
+                                     if line.startswith(b"data: \"")))
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                post("/chat", dict(turn, message="ringkasan"), "web-2")
+            self.assertEqual(context.exception.code, 409)
+            self.assertIn("error", json.loads(context.exception.read()))
+        finally:
+            server.shutdown()
+            server.server_close()
+        siti = self.manager.find_by_name("Siti Aminah")[0]
+        self.assertEqual(len(self.manager.get_patient_data(siti)["checkin_history"]), 1)
 
 def run_tests():
     """Run all tests"""
@@ -128,6 +1844,29 @@ def run_tests():
     test_suite.addTest(unittest.makeSuite(TestPatientDataManager))
     test_suite.addTest(unittest.makeSuite(TestSymptomImageProcessor))
     test_suite.addTest(unittest.makeSuite(TestCareLoopAIClinic))
+    test_suite.addTest(unittest.makeSuite(TestColumnarHistoryStore))
+    test_suite.addTest(unittest.makeSuite(TestCohortAnalytics))
+    test_suite.addTest(unittest.makeSuite(TestFollowupEngine))
+    test_suite.addTest(unittest.makeSuite(TestPatientSummary))
+    test_suite.addTest(unittest.makeSuite(TestAppointmentScheduler))
+    test_suite.addTest(unittest.makeSuite(TestAppointmentIndex))
+    test_suite.addTest(unittest.makeSuite(TestHistoryArchive))
+    test_suite.addTest(unittest.makeSuite(TestRecordFormat))
+    test_suite.addTest(unittest.makeSuite(TestBenchmarkSuite))
+    test_suite.addTest(unittest.makeSuite(TestConversationReplay))
+    test_suite.addTest(unittest.makeSuite(TestMetrics))
+    test_suite.addTest(unittest.makeSuite(TestProfiling))
+    test_suite.addTest(unittest.makeSuite(TestFileSync))
+    test_suite.addTest(unittest.makeSuite(TestSnapshot))
+    test_suite.addTest(unittest.makeSuite(TestConcurrentWrites))
+    test_suite.addTest(unittest.makeSuite(TestTrackerStore))
+    test_suite.addTest(unittest.makeSuite(TestDialogueMachine))
+    test_suite.addTest(unittest.makeSuite(TestReminders))
+    test_suite.addTest(unittest.makeSuite(TestSearchIndex))
+    test_suite.addTest(unittest.makeSuite(TestTriage))
+    test_suite.addTest(unittest.makeSuite(TestStreaming))
+    test_suite.addTest(unittest.makeSuite(TestSharding))
+    test_suite.addTest(unittest.makeSuite(TestIdempotency))
     
     # Run the tests
     runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,294 @@
+"""
+SQLite Tracker Store for the Rasa Deployment
+Keeps Rasa conversation events in a local SQLite file, append-only, and
+loads only the part of a conversation the policies look at.
+
+TEDPolicy and UnexpecTEDIntentPolicy featurize the last max_history (5)
+turns, and a patient doing daily check-ins keeps one conversation for
+weeks. So retrieve() loads the events from the start of the last
+tail_turns turns (or from the last session start, if that is later),
+preceded by SlotSet events holding the slot values at that point. Loading
+costs the same on day 60 as on day 1.
+
+Older events stay in the database until pruned. prune() moves the events
+before each conversation's tail that are older than the retention period to
+a gzip JSON lines archive and records the slot values at the cut, so pruned
+conversations still load with their slots. SQLiteTrackerStore prunes every
+prune_interval_hours in a background thread; `python admin_cli.py
+prune-trackers` does it on demand.
+
+Configure it in endpoints.yml:
+
+    tracker_store:
+      type: tracker_store.SQLiteTrackerStore
+      db: trackers.db
+"""
+
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_DB = "trackers.db"
+
+# Turns loaded per conversation: max_history of the policies in config.yml, with a margin
+DEFAULT_TAIL_TURNS = 10
+
+# Metadata key of the SlotSet events retrieve() puts before the tail
+CARRIED_SLOTS = "carried_slots"
+
+# Events after which no earlier slot value applies
+SLOT_RESETS = ("restart", "reset_slots")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sender_id TEXT NOT NULL,
+    type_name TEXT NOT NULL,
+    name TEXT,
+    timestamp REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_sender ON events (sender_id, id);
+CREATE INDEX IF NOT EXISTS events_by_type ON events (sender_id, type_name, name, id);
+CREATE TABLE IF NOT EXISTS conversations (
+    sender_id TEXT PRIMARY KEY,
+    slots TEXT NOT NULL DEFAULT '{}',
+    slot_names TEXT NOT NULL DEFAULT '[]',
+    pruned_events INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _event_name(event: Dict) -> Optional[str]:
+    """Get the name indexed for an event: the slot or action name"""
+    if event.get("event") in ("slot", "action"):
+        return event.get("name")
+    return None
+
+
+class TrackerEventLog:
+    """Append-only conversation events in one SQLite file"""
+
+    def __init__(self, path: str = DEFAULT_DB, tail_turns: int = DEFAULT_TAIL_TURNS):
+        self.path = path
+        self.tail_turns = tail_turns
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def append(self, sender_id: str, events: Iterable[Dict]) -> int:
+        """Store new events of a conversation, return how many were stored"""
+        rows = [(sender_id, event["event"], _event_name(event), event.get("timestamp"), json.dumps(event))
+                for event in events]
+        slot_names = {row[2] for row in rows if row[1] == "slot"}
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR IGNORE INTO conversations (sender_id) VALUES (?)", (sender_id,))
+            if slot_names:
+                known = set(json.loads(self._connection.execute(
+                    "SELECT slot_names FROM conversations WHERE sender_id = ?", (sender_id,)).fetchone()[0]))
+                if not slot_names <= known:
+                    self._connection.execute("UPDATE conversations SET slot_names = ? WHERE sender_id = ?",
+                                             (json.dumps(sorted(known | slot_names)), sender_id))
+            self._connection.executemany(
+                "INSERT INTO events (sender_id, type_name, name, timestamp, data) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def senders(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT sender_id FROM conversations")]
+
+    def count(self, sender_id: str) -> int:
+        """Number of stored (not pruned) events of a conversation"""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM events WHERE sender_id = ?",
+                                            (sender_id,)).fetchone()[0]
+
+    def _last_id(self, sender_id: str, type_name: str, name: Optional[str] = None,
+                 before: Optional[int] = None, offset: int = 0) -> Optional[int]:
+        """Get the ID of the latest event of a type (and name) before an ID, in O(log n)"""
+        query = "SELECT id FROM events WHERE sender_id = ? AND type_name = ?"
+        params: List[Any] = [sender_id, type_name]
+        if name is not None:
+            query += " AND name = ?"
+            params.append(name)
+        else:
+            query += " AND name IS NULL"
+        if before is not None:
+            query += " AND id < ?"
+            params.append(before)
+        query += " ORDER BY id DESC LIMIT 1 OFFSET ?"
+        params.append(offset)
+        row = self._connection.execute(query, params).fetchone()
+        return row[0] if row else None
+
+    def _tail_start(self, sender_id: str) -> Optional[int]:
+        """Get the ID of the first event retrieve() loads; None loads all stored events"""
+        # A turn starts when the bot listens for the user
+        start = self._last_id(sender_id, "action", "action_listen", offset=self.tail_turns - 1)
+        session = self._last_id(sender_id, "session_started")
+        if session is not None:
+            # Rasa loads a conversation from its last session start, including the
+            # action_session_start that began it
+            session = self._last_id(sender_id, "action", "action_session_start", before=session) or session
+            start = session if start is None else max(start, session)
+        return start
+
+    def _slots_before(self, sender_id: str, event_id: Optional[int]) -> Dict[str, Any]:
+        """Get the slot values set before an event, from one indexed lookup per slot"""
+        row = self._connection.execute("SELECT slots, slot_names FROM conversations WHERE sender_id = ?",
+                                       (sender_id,)).fetchone()
+        if row is None:
+            return {}
+        slots = json.loads(row[0])
+        if event_id is None:
+            return slots
+        reset = max((self._last_id(sender_id, type_name, before=event_id) or 0) for type_name in SLOT_RESETS)
+        if reset:
+            slots = {}
+        for name in json.loads(row[1]):
+            slot_id = self._last_id(sender_id, "slot", name, before=event_id)
+            if slot_id is not None and slot_id > reset:
+                value = self._connection.execute("SELECT data FROM events WHERE id = ?", (slot_id,)).fetchone()[0]
+                slots[name] = json.loads(value).get("value")
+        return slots
+
+    def tail(self, sender_id: str) -> Tuple[List[Dict], int]:
+        """Get the events retrieve() loads and how many of them come from the database.
+
+        The events are SlotSet events with the slot values at the start of
+        the tail, marked with CARRIED_SLOTS in their metadata, then the
+        stored events of the tail.
+        """
+        with self._lock:
+            start = self._tail_start(sender_id)
+            slots = self._slots_before(sender_id, start)
+            rows = self._connection.execute(
+                "SELECT data FROM events WHERE sender_id = ? AND id >= ? ORDER BY id",
+                (sender_id, start or 0)).fetchall()
+        events = [json.loads(row[0]) for row in rows]
+        timestamp = events[0].get("timestamp") if events else None
+        carried = [{"event": "slot", "name": name, "value": value, "timestamp": timestamp,
+                    "metadata": {CARRIED_SLOTS: True}}
+                   for name, value in slots.items() if value is not None]
+        return carried + events, len(events)
+
+    def stored_in_tail(self, sender_id: str) -> int:
+        """Number of stored events a tracker from tail() already holds"""
+        with self._lock:
+            start = self._tail_start(sender_id)
+            return self._connection.execute("SELECT COUNT(*) FROM events WHERE sender_id = ? AND id >= ?",
+                                            (sender_id, start or 0)).fetchone()[0]
+
+    def all_events(self, sender_id: str) -> List[Dict]:
+        """Get every stored event of a conversation, after the slots of its pruned part"""
+        with self._lock:
+            slots = self._slots_before(sender_id, None)
+            rows = self._connection.execute("SELECT data FROM events WHERE sender_id = ? ORDER BY id",
+                                            (sender_id,)).fetchall()
+        carried = [{"event": "slot", "name": name, "value": value, "metadata": {CARRIED_SLOTS: True}}
+                   for name, value in slots.items() if value is not None]
+        return carried + [json.loads(row[0]) for row in rows]
+
+    def prune(self, retention_days: float = 7, archive_dir: Optional[str] = None,
+              now: Optional[float] = None) -> Dict[str, int]:
+        """Remove events before each conversation's tail that are older than the retention period.
+
+        With archive_dir, removed events are appended to a gzip JSON lines
+        file there first, one {"sender_id", "event"} object per line.
+        Each conversation is pruned in its own transaction.
+        """
+        cutoff = (now if now is not None else time.time()) - retention_days * 86400
+        stats = {"conversations": 0, "events": 0}
+        archive = None
+        try:
+            for sender_id in self.senders():
+                with self._lock, self._connection:
+                    start = self._tail_start(sender_id)
+                    if start is None:
+                        continue
+                    row = self._connection.execute(
+                        "SELECT MIN(id) FROM events WHERE sender_id = ? AND timestamp >= ?",
+                        (sender_id, cutoff)).fetchone()
+                    end = min(start, row[0]) if row[0] is not None else start
+                    rows = self._connection.execute(
+                        "SELECT data FROM events WHERE sender_id = ? AND id < ? ORDER BY id",
+                        (sender_id, end)).fetchall()
+                    if not rows:
+                        continue
+                    if archive_dir is not None:
+                        if archive is None:
+                            os.makedirs(archive_dir, exist_ok=True)
+                            stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+                            archive = gzip.open(os.path.join(archive_dir, f"trackers-{stamp}.jsonl.gz"), "at")
+                        for (data,) in rows:
+                            archive.write(f'{{"sender_id": {json.dumps(sender_id)}, "event": {data}}}\n')
+                    slots = self._slots_before(sender_id, end)
+                    self._connection.execute("DELETE FROM events WHERE sender_id = ? AND id < ?", (sender_id, end))
+                    self._connection.execute(
+                        "UPDATE conversations SET slots = ?, pruned_events = pruned_events + ? WHERE sender_id = ?",
+                        (json.dumps(slots), len(rows), sender_id))
+                stats["conversations"] += 1
+                stats["events"] += len(rows)
+        finally:
+            if archive is not None:
+                archive.close()
+        return stats
+
+
+try:
+    from rasa.core.tracker_store import TrackerStore
+    from rasa.shared.core.trackers import DialogueStateTracker
+except ImportError:  # Rasa is optional outside the Rasa deployment
+    TrackerStore = None
+
+if TrackerStore is not None:
+    class SQLiteTrackerStore(TrackerStore):
+        """Rasa tracker store over TrackerEventLog"""
+
+        def __init__(self, domain, db: str = DEFAULT_DB, tail_turns: int = DEFAULT_TAIL_TURNS,
+                     retention_days: float = 7, archive_dir: Optional[str] = None,
+                     prune_interval_hours: Optional[float] = 24, event_broker=None, **kwargs):
+            super().__init__(domain, event_broker, **kwargs)
+            self.log = TrackerEventLog(db, tail_turns)
+            self.retention_days = retention_days
+            self.archive_dir = archive_dir
+            if prune_interval_hours:
+                threading.Thread(target=self._prune_loop, args=(prune_interval_hours * 3600,),
+                                 name="tracker-pruner", daemon=True).start()
+
+        def _prune_loop(self, interval: float) -> None:
+            while True:
+                time.sleep(interval)
+                self.log.prune(self.retention_days, self.archive_dir)
+
+        async def save(self, tracker) -> None:
+            await self.stream_events(tracker)
+            events = [event for event in tracker.events
+                      if not (event.metadata or {}).get(CARRIED_SLOTS)]
+            stored = self.log.stored_in_tail(tracker.sender_id)
+            self.log.append(tracker.sender_id, (event.as_dict() for event in events[stored:]))
+
+        async def retrieve(self, sender_id: str):
+            events, stored = self.log.tail(sender_id)
+            if not stored:
+                return None
+            return DialogueStateTracker.from_dict(sender_id, events, self.domain.slots)
+
+        async def retrieve_full_tracker(self, sender_id: str):
+            events = self.log.all_events(sender_id)
+            if not events:
+                return None
+            return DialogueStateTracker.from_dict(sender_id, events, self.domain.slots)
+
+        async def keys(self) -> Iterable[str]:
+            return self.log.senders()
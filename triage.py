@@ -0,0 +1,253 @@
+"""
+Clinic-wide Triage Queue
+Ranks the patients with an active episode by how urgently they need a
+clinician's attention, so the most urgent are seen first without scoring
+every patient on each look.
+
+A patient's score comes from the running statistics FollowupEngine keeps
+(latest severity, worsening and improving streaks, photo changes) and from
+the daily check-ins they missed. Scores live in an indexed max-heap: a new
+report or check-in changes one patient's score in O(log n), and the top k
+are read in O(k log k).
+
+Missed check-ins change scores with time alone. Each patient has a timer
+for the next time their score changes (the next missed check-in, or the
+end of the episode, when they leave the queue); the timers due are run on
+every update or query, each in O(log n).
+"""
+
+import datetime
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from followup_engine import EPISODE_GAP, SEVERITY_RANK, FollowupEngine, PatientProgress
+
+SEVERITY_POINTS = {SEVERITY_RANK["ringan"]: 0, SEVERITY_RANK["sedang"]: 10, SEVERITY_RANK["berat"]: 40}
+WORSENING_POINTS = 15
+IMPROVING_POINTS = 5
+MISSED_CHECKIN_POINTS = 10
+PHOTO_POINTS = 20
+# Streaks and missed check-ins beyond this add nothing more
+MAX_COUNTED = 3
+
+CHECKIN_INTERVAL = datetime.timedelta(days=1)
+# A check-in counts as missed this long after it was due
+CHECKIN_GRACE = datetime.timedelta(hours=6)
+
+
+def missed_checkins(progress: PatientProgress, now: datetime.datetime) -> int:
+    """Count the daily check-ins missed since the patient's last report, up to MAX_COUNTED"""
+    overdue = now - progress.last_report - CHECKIN_INTERVAL - CHECKIN_GRACE
+    if overdue < datetime.timedelta(0):
+        return 0
+    return min(MAX_COUNTED, 1 + overdue // CHECKIN_INTERVAL)
+
+
+def triage_score(progress: PatientProgress, now: datetime.datetime) -> Tuple[float, Optional[datetime.datetime]]:
+    """Score a patient's urgency and get the time the score changes next, None once the episode ended"""
+    if now - progress.last_report > EPISODE_GAP:
+        return 0.0, None
+    missed = missed_checkins(progress, now)
+    score = (SEVERITY_POINTS.get(progress.last_severity, 0)
+             + WORSENING_POINTS * min(progress.worsening_streak, MAX_COUNTED)
+             - IMPROVING_POINTS * min(progress.improving_streak, MAX_COUNTED)
+             + MISSED_CHECKIN_POINTS * missed
+             + PHOTO_POINTS * progress.photo_change_score)
+    if missed < MAX_COUNTED:
+        changes = progress.last_report + CHECKIN_INTERVAL + CHECKIN_GRACE + missed * CHECKIN_INTERVAL
+    else:
+        changes = progress.last_report + EPISODE_GAP
+    return max(0.0, score), changes
+
+
+def triage_reasons(progress: PatientProgress, now: datetime.datetime) -> List[str]:
+    """Explain a patient's score"""
+    reasons = []
+    if progress.last_severity == SEVERITY_RANK["berat"]:
+        reasons.append("Gejala terakhir berat")
+    if progress.worsening_streak:
+        reasons.append(f"Memburuk {progress.worsening_streak} kali berturut-turut")
+    missed = missed_checkins(progress, now)
+    if missed:
+        reasons.append(f"Tidak checkin {missed}{'+' if missed == MAX_COUNTED else ''} hari")
+    if progress.photo_change_score:
+        reasons.append("Foto gejala berubah")
+    if progress.improving_streak:
+        reasons.append(f"Membaik {progress.improving_streak} kali berturut-turut")
+    return reasons or ["Stabil"]
+
+
+class IndexedHeap:
+    """Max-heap of keys by priority that can change or remove any key in O(log n)"""
+
+    def __init__(self):
+        # [(-priority, key)], with each key's position in _positions
+        self._heap: List[Tuple[float, str]] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def priority(self, key: str) -> Optional[float]:
+        position = self._positions.get(key)
+        return -self._heap[position][0] if position is not None else None
+
+    def fill(self, priorities: Dict[str, float]) -> None:
+        """Replace the contents with the given keys and priorities, in O(n)"""
+        self._heap = [(-priority, key) for key, priority in priorities.items()]
+        heapq.heapify(self._heap)
+        self._positions = {key: position for position, (_, key) in enumerate(self._heap)}
+
+    def set(self, key: str, priority: float) -> None:
+        """Add a key, or change its priority"""
+        item = (-priority, key)
+        position = self._positions.get(key)
+        if position is None:
+            self._heap.append(item)
+            self._positions[key] = len(self._heap) - 1
+            self._sift_up(len(self._heap) - 1)
+            return
+        old = self._heap[position]
+        self._heap[position] = item
+        if item < old:
+            self._sift_up(position)
+        else:
+            self._sift_down(position)
+
+    def remove(self, key: str) -> None:
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        last = self._heap.pop()
+        if position < len(self._heap):
+            old = self._heap[position]
+            self._heap[position] = last
+            self._positions[last[1]] = position
+            if last < old:
+                self._sift_up(position)
+            else:
+                self._sift_down(position)
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        """Get the k keys with the highest priority, highest first, without changing the heap"""
+        heap = self._heap
+        result = []
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier and len(result) < k:
+            (priority, key), position = heapq.heappop(frontier)
+            result.append((key, -priority))
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+        return result
+
+    def _swap(self, i: int, j: int) -> None:
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._positions[heap[i][1]] = i
+        self._positions[heap[j][1]] = j
+
+    def _sift_up(self, position: int) -> None:
+        heap = self._heap
+        while position:
+            parent = (position - 1) // 2
+            if heap[position] >= heap[parent]:
+                break
+            self._swap(position, parent)
+            position = parent
+
+    def _sift_down(self, position: int) -> None:
+        heap = self._heap
+        size = len(heap)
+        while True:
+            smallest = position
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < size and heap[child] < heap[smallest]:
+                    smallest = child
+            if smallest == position:
+                return
+            self._swap(position, smallest)
+            position = smallest
+
+
+class TriageQueue:
+    def __init__(self, engine: FollowupEngine):
+        self.engine = engine
+        self.scores = IndexedHeap()
+        # (time the score changes, patient ID), with each patient's current time in _due
+        self._timers: List[Tuple[datetime.datetime, str]] = []
+        self._due: Dict[str, datetime.datetime] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_engine(cls, engine: FollowupEngine, now: Optional[datetime.datetime] = None) -> "TriageQueue":
+        """Score every patient the engine has statistics for"""
+        queue = cls(engine)
+        now = now or datetime.datetime.now()
+        scores = {}
+        for patient_id in engine.patients():
+            score, changes = triage_score(engine.get_progress(patient_id), now)
+            if changes is not None:
+                scores[patient_id] = score
+                queue._due[patient_id] = changes
+        queue.scores.fill(scores)
+        queue._timers = [(changes, patient_id) for patient_id, changes in queue._due.items()]
+        heapq.heapify(queue._timers)
+        return queue
+
+    def _rescore(self, patient_id: str, now: datetime.datetime) -> None:
+        progress = self.engine.get_progress(patient_id)
+        changes = None
+        if progress is not None:
+            score, changes = triage_score(progress, now)
+        if changes is None:
+            self.scores.remove(patient_id)
+            self._due.pop(patient_id, None)
+            return
+        self.scores.set(patient_id, score)
+        if self._due.get(patient_id) != changes:
+            # The old timer stays in the heap and is skipped when it comes due
+            self._due[patient_id] = changes
+            heapq.heappush(self._timers, (changes, patient_id))
+
+    def _run_timers(self, now: datetime.datetime) -> None:
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            due, patient_id = heapq.heappop(timers)
+            if self._due.get(patient_id) == due:
+                self._rescore(patient_id, now)
+
+    def update(self, patient_id: str, now: Optional[datetime.datetime] = None) -> None:
+        """Score a patient again after a new report or check-in"""
+        now = now or datetime.datetime.now()
+        with self._lock:
+            self._run_timers(now)
+            self._rescore(patient_id, now)
+
+    def forget(self, patient_id: str) -> None:
+        with self._lock:
+            self.scores.remove(patient_id)
+            self._due.pop(patient_id, None)
+
+    def top(self, k: int = 10, now: Optional[datetime.datetime] = None) -> List[Dict]:
+        """Get the k most urgent patients with their scores and the reasons"""
+        now = now or datetime.datetime.now()
+        with self._lock:
+            self._run_timers(now)
+            ranked = self.scores.top(k)
+        return [{"patient_id": patient_id, "score": score,
+                 "reasons": triage_reasons(self.engine.get_progress(patient_id), now)}
+                for patient_id, score in ranked]
+
+    def score(self, patient_id: str, now: Optional[datetime.datetime] = None) -> Optional[float]:
+        """Get a patient's current score, None if they have no active episode"""
+        with self._lock:
+            self._run_timers(now or datetime.datetime.now())
+            return self.scores.priority(patient_id)
+
+    def __len__(self) -> int:
+        return len(self.scores)